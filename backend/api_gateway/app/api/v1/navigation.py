@@ -1,11 +1,12 @@
 # backend/api_gateway/app/api/v1/navigation.py
 # [CHANGED] 役割分離：APIを“薄く”。イベント判定は shared の純関数に移動し、リルート計算は Celery 経由で Worker に依頼します。
 # [KEPT]     既存エンドポイント構成（/navigation/location および /location_update の互換）、レスポンスに plan_version を含める仕様は維持。
-# [ADDED]    デバウンス（DBの last_reroute_at / reroute_cooldown_sec）と Celery 起動、TTS の同期生成（dummy）を実装。
+# [ADDED]    デバウンス（ホット状態の reroute_at / reroute_cooldown_sec）と Celery 起動、TTS の同期生成（dummy）を実装。
 
 from __future__ import annotations
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from datetime import datetime, timezone
+import asyncio
 import os
 import base64
 import io
@@ -13,18 +14,29 @@ import math
 import struct
 import wave
 
-from fastapi import APIRouter, Depends, Body, HTTPException, status
-from sqlalchemy.orm import Session as OrmSession, joinedload
+from fastapi import APIRouter, Depends, Body, HTTPException, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError
+from sqlalchemy.orm import Session as OrmSession
+from starlette.concurrency import run_in_threadpool
 
-from api_gateway.app.security import get_current_user_optional
-from shared.app.database import get_db
-from shared.app.models import Session as DbSession, Plan, Stop
+from api_gateway.app.security import get_current_user_id_optional, user_id_from_access_token
+from shared.app.database import SessionLocal, get_db
+from shared.app.models import Session as DbSession, Plan
 from shared.app.schemas import (
+    NavFix,
+    NavLocationBatchIn,
+    NavLocationBatchOut,
     NavLocationUpdateIn,
     NavLocationUpdateOut,
 )
 # [ADDED] イベント判定の純関数（API/Worker 共有）
 from shared.app.services.navigation_events import evaluate_events, Thresholds
+# [ADDED] (plan_id, route_version) 単位のコンパイル済みルート（プロセス内キャッシュ）
+from shared.app.services.route_index import CompiledRoute, RouteProgress, get_compiled_route
+# [ADDED] セッションのホット状態（スナップショット / 進捗 / 接近状態 / デバウンス。Redis ハッシュ）
+from shared.app.services.nav_state import NavState, PlanSnapshot, get_nav_state_store, load_plan_snapshot
+# [ADDED] セッション毎のプッシュ通知（Redis pub/sub。リルート結果など）
+from shared.app.services.nav_channel import get_nav_hub
 
 from shared.app.tasks import enqueue_reroute
 
@@ -39,6 +51,8 @@ NAV_DEVIATION_THRESHOLD_M = float(os.getenv("NAV_DEVIATION_THRESHOLD_M", 120))
 NAV_ARRIVAL_THRESHOLD_M = float(os.getenv("NAV_ARRIVAL_THRESHOLD_M", os.getenv("AV_ARRIVAL_THRESHOLD_M", 60)))
 REROUTE_COOLDOWN_SEC = int(os.getenv("REROUTE_COOLDOWN_SEC", 20))
 TASK_REROUTE = os.getenv("TASK_REROUTE", "navigation.reroute")
+# バッチ位置更新で 1 リクエストに受け付ける測位数の上限
+NAV_BATCH_MAX_FIXES = int(os.getenv("NAV_BATCH_MAX_FIXES", 600))
 
 
 def utcnow() -> datetime:
@@ -100,90 +114,351 @@ def _enqueue_reroute(session_id: str, origin_lat: float, origin_lon: float,
         return False
 
 
-@router.post("/location", response_model=NavLocationUpdateOut)
-@router.post("/location_update", response_model=NavLocationUpdateOut)
-def location_update(
-    payload: NavLocationUpdateIn = Body(...),
-    db: OrmSession = Depends(get_db),
-    user=Depends(get_current_user_optional),
-):
+def compiled_route_for(db: OrmSession, snap: PlanSnapshot) -> CompiledRoute:
     """
-    [CHANGED] 現在地アップデート本実装。
-      - [薄型化] イベント判定は shared の純関数 evaluate_events に委譲（APIからはDB読取のみ）。
-      - [保持] plan_version の返却、TTS音声をレスポンスへ同梱。
-      - [追加] Celery でのリルート起動（楽観ロックのベース版も渡す）。
+    [ADDED] プランのコンパイル済みルート（同じ route_version の間は JSONB の読み出し・解析をしない）。
+    停留所はスナップショットの値をキーに含めるので、停留所の編集は次のスナップショット読み直しで反映される。
     """
-    # 1) セッションとアクティブプランを取得
-    sess: Optional[DbSession] = db.query(DbSession).filter(DbSession.id == payload.session_id).first()
-    if not sess:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="session not found")
 
-    plan: Optional[Plan] = None
-    if sess.active_plan_id:
-        plan = (
-            db.query(Plan)
-            .options(joinedload(Plan.stops).joinedload(Stop.spot))
-            .filter(Plan.id == sess.active_plan_id)
-            .first()
-        )
+    def _load():
+        return db.query(Plan.route_geojson).filter(Plan.id == snap.plan_id).scalar()
+
+    stops = [(s.id, s.latitude, s.longitude) for s in snap.stops]
+    return get_compiled_route(snap.plan_id, snap.route_version, _load, stops)
+
+
+def load_nav_state(db: OrmSession, session_id: str) -> Tuple[NavState, Optional[PlanSnapshot]]:
+    """
+    [ADDED] セッションのホット状態を読む（定常時は Redis の HGETALL 1 回で SQL なし）。
+    スナップショットが無い・古い時だけ DB から作り直して書き戻す。セッションが無ければ (state, None)。
+    """
+    store = get_nav_state_store()
+    state = store.load(session_id)
+    snap = state.snapshot
+    if snap is None or snap.expired():
+        snap = load_plan_snapshot(db, session_id)
+        if snap is not None:
+            store.save(session_id, snapshot=snap)
+        state.snapshot = snap
+    return state, snap
+
+
+def _mark_rerouted(db: OrmSession, session_id: str, at: datetime) -> None:
+    """[ADDED] リルート起動時刻を DB にも残す（位置更新のうち SQL を書くのはここだけ）。"""
+    db.query(DbSession).filter(DbSession.id == session_id).update(
+        {DbSession.last_reroute_at: at}, synchronize_session=False
+    )
+    db.commit()
 
-    if plan is None or not plan.stops:
-        # [KEPT] プランがない場合は空で返す
-        return NavLocationUpdateOut(events=[], actions={}, plan_version=None)
 
-    # 所有権チェック（既存方針に合わせ、user が存在し plan に所有者がいる場合は照合）
-    if user and plan.user_id and user.id != plan.user_id:
+def _authorize(snap: Optional[PlanSnapshot], user_id: Optional[int]) -> None:
+    """[ADDED] セッションが無ければ 404、所有者違いは 403（既存方針通り、user と plan の所有者が両方ある時だけ照合）。"""
+    if snap is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="session not found")
+    if user_id and snap.user_id and user_id != snap.user_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="forbidden")
 
+
+def process_fixes(
+    db: OrmSession,
+    session_id: str,
+    fixes: Sequence[Any],
+    user_id: Optional[int],
+    *,
+    tag_fixes: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """
+    [ADDED] 測位列（古い順。各要素は lat / lon / ts を持つ）を 1 パスで評価する。位置更新 API の本体。
+      - スナップショット・コンパイル済みルート・ホット状態の読み出しは列全体で 1 回。
+      - 逐次マッチの起点と接近状態（ヒステリシス）は測位から測位へ引き継ぐ。
+      - 接近/到着イベントは列全体で発火したものを全て返す。逸脱は最後の測位だけで判定し、
+        リルートの起動（デバウンス込み）も最後の測位を起点に 1 回だけ決める。
+      - tag_fixes=True なら各イベントに fix_index / ts を付ける（バッチ用）。
+    戻り値: NavLocationUpdateOut のフィールド dict（アクティブプランが無ければ None）
+    """
+    # 1) セッションとアクティブプラン（スナップショット）を取得
+    state, snap = load_nav_state(db, session_id)
+    _authorize(snap, user_id)
+
+    if snap.plan_id is None or not snap.stops:
+        return None
+
     # 2) イベント判定（純関数）
     th = Thresholds(
         off_route_m=NAV_DEVIATION_THRESHOLD_M,
         approach_m=NAV_PROXIMITY_RADIUS_M,
         arrival_m=NAV_ARRIVAL_THRESHOLD_M,
     )
-    events, next_stop, offroute_distance = evaluate_events(
-        current=(payload.lat, payload.lon),
-        plan=plan,
-        thresholds=th,
-    )
+    route = compiled_route_for(db, snap)
+    last_progress = stored_progress = state.progress
+    # 全停留所の接近判定（ヒステリシスの状態はセッション毎に保存）
+    zones = state.zones
+    zones_before = dict(zones)
+
+    events: List[Dict[str, Any]] = []
+    next_stop = None
+    progress: Optional[Dict[str, Any]] = None
+    last_index = len(fixes) - 1
+    for i, fix in enumerate(fixes):
+        # 直前のマッチ位置の前後から探す（外れたらルート全体）
+        match = route.match(fix.lat, fix.lon, radius_m=th.off_route_m, last=last_progress)
+        fix_events, next_stop, _ = evaluate_events(
+            current=(fix.lat, fix.lon),
+            plan=snap,
+            thresholds=th,
+            route=route,
+            match=match,
+            zones=zones,
+        )
+        if i != last_index:
+            # 途中の測位の逸脱は捨てる（リルートは最後の測位で決める）
+            fix_events = [e for e in fix_events if e.get("type") != "REROUTE_REQUESTED"]
+        if tag_fixes:
+            ts = fix.ts.isoformat() if getattr(fix, "ts", None) else None
+            for e in fix_events:
+                e["fix_index"] = i
+                e["ts"] = ts
+        events.extend(fix_events)
+
+        progress = None
+        if match is not None and match.distance_m <= th.off_route_m:
+            last_progress = RouteProgress(snap.route_version, match.segment_index, match.along_m)
+            progress = route.progress(match, next_stop.id if next_stop else None)
+
+    # ホット状態は変化したフィールドだけ書き戻す（線分が変わらない進捗は書かない）
+    updates: Dict[str, Any] = {}
+    if zones != zones_before:
+        updates["zones"] = zones
+    if last_progress is not None and (
+        stored_progress is None
+        or stored_progress.route_version != last_progress.route_version
+        or stored_progress.segment_index != last_progress.segment_index
+    ):
+        updates["progress"] = last_progress
 
     actions: Dict[str, Any] = {"reroute": {"started": False, "debounced": False}, "tts": []}
 
-    # 3) リルート起動（デバウンス）
+    # 3) リルート起動（デバウンス。直近の起動時刻はホット状態 → 無ければ DB の値）
+    latest = fixes[-1]
     do_reroute = any(e.get("type") == "REROUTE_REQUESTED" for e in events) and next_stop is not None
     if do_reroute:
-        cooldown = sess.reroute_cooldown_sec or REROUTE_COOLDOWN_SEC
-        if should_reroute(sess.last_reroute_at, cooldown):
+        cooldown = snap.reroute_cooldown_sec or REROUTE_COOLDOWN_SEC
+        last_at_ts = state.reroute_at if state.reroute_at is not None else snap.last_reroute_at
+        last_at = datetime.fromtimestamp(last_at_ts, timezone.utc) if last_at_ts is not None else None
+        if should_reroute(last_at, cooldown):
             started = enqueue_reroute(
-                session_id=sess.id,
-                origin_lat=payload.lat,
-                origin_lon=payload.lon,
+                session_id=snap.session_id,
+                origin_lat=latest.lat,
+                origin_lon=latest.lon,
                 target_stop_id=next_stop.id if next_stop else None,
-                base_route_version=plan.route_version,
+                base_route_version=snap.route_version,
             )
             if started:
-                sess.last_reroute_at = utcnow()
+                now = utcnow()
+                updates["reroute_at"] = now.timestamp()
+                _mark_rerouted(db, snap.session_id, now)
                 actions["reroute"]["started"] = True
             else:
                 actions["reroute"]["debounced"] = True  # 起動失敗時は抑止扱い
         else:
             actions["reroute"]["debounced"] = True
 
+    if updates:
+        get_nav_state_store().save(snap.session_id, **updates)
+
     # 4) TTS：接近/到着イベントに対して合成（ガイド文は簡易にスポット名）
+    stops_by_id = {s.id: s for s in snap.stops}
     for e in events:
         if e["type"].startswith("PROXIMITY"):
-            spot_name = next_stop.spot.official_name if (next_stop and next_stop.spot) else "次の目的地"
+            stop = stops_by_id.get(e.get("stop_id"))
+            spot_name = stop.official_name if (stop and stop.official_name) else "次の目的地"
             guide_text = f"{spot_name} が近づいてきました。"
             audio_b64 = synthesize_tts_base64(guide_text, voice="ja-JP")
             actions["tts"].append(
                 {"stop_id": e.get("stop_id"), "voice": "ja-JP", "mime": "audio/wav", "audio_base64": audio_b64}
             )
 
-    db.commit()
+    return {
+        "events": events,
+        "actions": actions,
+        "plan_version": snap.route_version,
+        "progress": progress,
+    }
 
-    # 5) 応答
-    return NavLocationUpdateOut(
-        events=events,
-        actions=actions,
-        plan_version=plan.route_version if plan else None,
-    )
+
+@router.post("/location", response_model=NavLocationUpdateOut)
+@router.post("/location_update", response_model=NavLocationUpdateOut)
+def location_update(
+    payload: NavLocationUpdateIn = Body(...),
+    db: OrmSession = Depends(get_db),
+    user_id: Optional[int] = Depends(get_current_user_id_optional),
+):
+    """
+    [CHANGED] 現在地アップデート本実装。
+      - [薄型化] イベント判定は shared の純関数 evaluate_events に委譲（process_fixes）。
+      - [ホット状態] セッション / プラン / 進捗 / 接近状態 / デバウンスは Redis のハッシュから読み、
+        定常時（イベント無し）は SQL を発行しない。DB を読むのはスナップショットの期限切れ・
+        コンパイル済みルートのキャッシュミス時、書くのはリルート起動時だけ。
+      - [保持] plan_version の返却、TTS音声をレスポンスへ同梱。
+      - [追加] Celery でのリルート起動（楽観ロックのベース版も渡す）。
+    """
+    out = process_fixes(db, payload.session_id, [payload], user_id)
+    if out is None:
+        # [KEPT] プランがない場合は空で返す
+        return NavLocationUpdateOut(events=[], actions={}, plan_version=None)
+    return NavLocationUpdateOut(**out)
+
+
+def _order_fixes(fixes: List[NavFix]) -> List[NavFix]:
+    """全件に ts があれば ts 順（同時刻は送信順）。naive な ts は UTC とみなす。"""
+    if fixes and all(f.ts is not None for f in fixes):
+        fixes.sort(key=lambda f: f.ts if f.ts.tzinfo else f.ts.replace(tzinfo=timezone.utc))
+    return fixes
+
+
+@router.post("/location_batch", response_model=NavLocationBatchOut)
+def location_batch(
+    payload: NavLocationBatchIn = Body(...),
+    db: OrmSession = Depends(get_db),
+    user_id: Optional[int] = Depends(get_current_user_id_optional),
+):
+    """
+    [ADDED] 端末に溜まった測位をまとめて受け取る。
+      - 全件に ts があれば ts 順に並べ直す（同時刻は送信順）。無い物が混ざれば送信順のまま。
+      - 列全体で発火した接近/到着イベントを返し、リルートは最新の測位で 1 回だけ判定する。
+    """
+    fixes = list(payload.fixes)
+    if len(fixes) > NAV_BATCH_MAX_FIXES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"too many fixes (max {NAV_BATCH_MAX_FIXES})",
+        )
+    fixes = _order_fixes(fixes)
+
+    out = process_fixes(db, payload.session_id, fixes, user_id, tag_fixes=True)
+    if out is None:
+        return NavLocationBatchOut(events=[], actions={}, plan_version=None, fixes=len(fixes))
+    return NavLocationBatchOut(**out, fixes=len(fixes))
+
+
+# ---------------------------
+# WebSocket（位置の送信とプッシュを 1 本の接続で）
+# ---------------------------
+def _process_fixes_in_thread(
+    session_id: str, fixes: List[NavFix], user_id: Optional[int], tag_fixes: bool
+) -> Optional[Dict[str, Any]]:
+    """スレッドプールから呼ぶ（DB セッションはメッセージ毎に取り、スレッドに残さない）。"""
+    db = SessionLocal()
+    try:
+        return process_fixes(db, session_id, fixes, user_id, tag_fixes=tag_fixes)
+    finally:
+        SessionLocal.remove()
+
+
+def _user_id_in_thread(token: str) -> int:
+    """スレッドプールから呼ぶ。クエリの token を検証してユーザー ID を返す（user_id_from_access_token と同じ例外）。"""
+    db = SessionLocal()
+    try:
+        return user_id_from_access_token(token, db)
+    finally:
+        SessionLocal.remove()
+
+
+def _authorize_in_thread(session_id: str, user_id: Optional[int]) -> None:
+    """スレッドプールから呼ぶ。接続を受け付ける前のセッション / 所有者の確認（_authorize と同じ例外）。"""
+    db = SessionLocal()
+    try:
+        _, snap = load_nav_state(db, session_id)
+    finally:
+        SessionLocal.remove()
+    _authorize(snap, user_id)
+
+
+@router.websocket("/ws/{session_id}")
+async def navigation_ws(websocket: WebSocket, session_id: str, token: Optional[str] = None):
+    """
+    [ADDED] ナビセッションの常時接続チャネル。
+    端末 → サーバ:
+      {"type": "fix", "lat": .., "lon": .., "ts": ..}        … location_update と同じ判定
+      {"type": "fixes", "fixes": [{"lat": .., "lon": .., "ts": ..}, ...]} … location_batch と同じ判定
+    サーバ → 端末:
+      {"type": "update", "events": [...], "actions": {...}, "plan_version": .., "progress": ..}
+      {"type": "ROUTE_UPDATED", "plan_id": .., "route_version": .., "route": {...polyline6}}  … Worker から pub/sub 経由
+      {"type": "error", "status": .., "detail": ..}
+    認証はクエリの token（アクセストークン）。無ければ未ログイン扱い（HTTP の位置更新と同じ）で、
+    プッシュ（ROUTE_UPDATED）はトークン付きの接続にだけ流す。
+    セッションが無い / 所有者違いなら、購読する前に error を送って閉じる（4404 / 4403）。
+    プッシュはプロセス共有の NavHub（redis.asyncio）から受け取り、スレッドは位置の判定にだけ使う。
+    """
+    user_id: Optional[int] = None
+    if token:
+        try:
+            user_id = await run_in_threadpool(_user_id_in_thread, token)
+        except HTTPException:
+            await websocket.close(code=4401)
+            return
+
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+
+    async def send(message: Dict[str, Any]) -> None:
+        async with send_lock:
+            await websocket.send_json(message)
+
+    try:
+        await run_in_threadpool(_authorize_in_thread, session_id, user_id)
+    except HTTPException as e:
+        await send({"type": "error", "status": e.status_code, "detail": e.detail})
+        await websocket.close(code=4000 + e.status_code)
+        return
+
+    hub = get_nav_hub()
+    queue = await hub.subscribe(session_id) if user_id is not None else None
+
+    async def pump() -> None:
+        # NavHub → 端末
+        while True:
+            await send(await queue.get())
+
+    pump_task = asyncio.create_task(pump()) if queue is not None else None
+    try:
+        await send({"type": "ready", "session_id": session_id, "push": queue is not None})
+        while True:
+            data = await websocket.receive_json()
+            kind = data.get("type") if isinstance(data, dict) else None
+            try:
+                if kind == "fix":
+                    fixes = [NavFix.model_validate(data)]
+                elif kind == "fixes":
+                    fixes = _order_fixes([NavFix.model_validate(f) for f in data.get("fixes") or []])
+                else:
+                    await send({"type": "error", "status": 400, "detail": f"unknown message type: {kind}"})
+                    continue
+            except (ValidationError, AttributeError, TypeError) as e:
+                await send({"type": "error", "status": 422, "detail": str(e)})
+                continue
+            if not fixes:
+                await send({"type": "error", "status": 422, "detail": "fixes must not be empty"})
+                continue
+            if len(fixes) > NAV_BATCH_MAX_FIXES:
+                await send({"type": "error", "status": 413, "detail": f"too many fixes (max {NAV_BATCH_MAX_FIXES})"})
+                continue
+
+            try:
+                out = await run_in_threadpool(_process_fixes_in_thread, session_id, fixes, user_id, kind == "fixes")
+            except HTTPException as e:
+                # セッション無し / 所有者違いはこの接続では回復しないので閉じる
+                await send({"type": "error", "status": e.status_code, "detail": e.detail})
+                await websocket.close(code=4000 + e.status_code)
+                return
+            if out is None:
+                out = {"events": [], "actions": {}, "plan_version": None, "progress": None}
+            await send({"type": "update", **out})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if pump_task is not None:
+            pump_task.cancel()
+            await asyncio.gather(pump_task, return_exceptions=True)
+        if queue is not None:
+            hub.unsubscribe(session_id, queue)
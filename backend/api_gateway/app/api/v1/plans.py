@@ -1,17 +1,19 @@
 # backend/api_gateway/app/api/v1/plans.py
 # 目的：GET /api/v1/plans/{id}/summary を本実装し、最新の route_geojson / plan_version を返却
+#       ?resolution=full|high|medium|low&format=geojson|polyline6 で形状の解像度/形式を選べる
 
 from __future__ import annotations
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session as OrmSession, joinedload
 
 from api_gateway.app.security import get_current_user_optional
 from shared.app.database import get_db
 from shared.app.models import Plan, Stop, Spot
 from shared.app.schemas import PlanSummaryResponse, PlanSummaryStop
+from shared.app.services.route_geometry import RESOLUTION_TOLERANCES_M, ROUTE_FORMATS, render_route
 
 router = APIRouter(prefix="/plans", tags=["plans"])
 
@@ -38,9 +40,16 @@ def _collect_totals(route_geojson: Optional[dict]) -> tuple[Optional[float], Opt
 @router.get("/{plan_id}/summary", response_model=PlanSummaryResponse)
 def get_plan_summary(
     plan_id: int,
+    resolution: str = Query("full", description="形状の解像度: full / high / medium / low（地図のズームに合わせて選ぶ）"),
+    fmt: str = Query("geojson", alias="format", description="形状の形式: geojson / polyline6（encoded polyline, 精度 6）"),
     db: OrmSession = Depends(get_db),
     user = Depends(get_current_user_optional),
 ):
+    if resolution not in RESOLUTION_TOLERANCES_M:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"unknown resolution: {resolution}")
+    if fmt not in ROUTE_FORMATS:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"unknown format: {fmt}")
+
     plan: Plan | None = db.query(Plan).options(joinedload(Plan.stops).joinedload(Stop.spot)).filter(Plan.id == plan_id).first()
     if not plan:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="plan not found")
@@ -64,7 +73,9 @@ def get_plan_summary(
     return PlanSummaryResponse(
         plan_id=plan.id,
         plan_version=plan.route_version or 1,
-        route_geojson=plan.route_geojson,
+        route_geojson=render_route(plan.route_geojson, resolution=resolution, fmt=fmt),
+        route_resolution=resolution,
+        route_format=fmt,
         route_updated_at=plan.route_updated_at,
         stops=stops,
         distance_km=distance_km,
@@ -10,6 +10,7 @@
 from __future__ import annotations
 
 import os
+import threading
 import time
 import uuid
 from typing import Optional, Dict, Any
@@ -30,6 +31,9 @@ JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret")
 JWT_ALGO = os.getenv("JWT_ALGO", "HS256")
 ACCESS_TTL_SEC = int(os.getenv("ACCESS_TOKEN_TTL_SEC", "3600"))       # 1h
 REFRESH_TTL_SEC = int(os.getenv("REFRESH_TOKEN_TTL_SEC", "86400"))    # 24h
+# ユーザー ID だけを返す認証（ナビの位置更新など）で、ユーザー行の存在確認を使い回す秒数 / 保持件数
+AUTH_USER_CACHE_SEC = float(os.getenv("AUTH_USER_CACHE_SEC", "60"))
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -78,20 +82,15 @@ def decode_token(token: str) -> Dict[str, Any]:
     return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGO])
 
 # =========================
-# Depends: 認証ユーザー（必須）
+# アクセストークンの検証（共通）
 # =========================
-def get_current_user(
-    cred: HTTPAuthorizationCredentials = Depends(auth_scheme),
-    db: Session = Depends(get_db),
-) -> models.User:
+def _access_token_user_id(token: str) -> int:
     """
-    Authorization ヘッダが必須。アクセストークンの検証を行い、ユーザーを返す。
+    アクセストークンを検証し、sub（ユーザー ID）を返す。不正なら 401。
+    - 署名 / 期限、type=access、sub の有無と形式を確認する（ユーザー行の存在は呼び出し側で確認）
     """
-    if not cred or not cred.credentials:
-        raise HTTPException(status_code=401, detail="not authenticated")
-
     try:
-        decoded = decode_token(cred.credentials)
+        decoded = decode_token(token)
     except Exception:
         raise HTTPException(status_code=401, detail="invalid token")
 
@@ -102,12 +101,33 @@ def get_current_user(
     if not uid:
         raise HTTPException(status_code=401, detail="invalid token (no sub)")
 
-    user = db.query(models.User).filter(models.User.id == int(uid)).first()
+    try:
+        return int(uid)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=401, detail="invalid token (bad sub)")
+
+def _load_user(db: Session, uid: int) -> models.User:
+    user = db.query(models.User).filter(models.User.id == uid).first()
     if not user:
+        # トークンはあるが該当ユーザーがいない → 不正扱い
         raise HTTPException(status_code=401, detail="user not found")
-
+    _remember_user(uid)
     return user
 
+# =========================
+# Depends: 認証ユーザー（必須）
+# =========================
+def get_current_user(
+    cred: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    db: Session = Depends(get_db),
+) -> models.User:
+    """
+    Authorization ヘッダが必須。アクセストークンの検証を行い、ユーザーを返す。
+    """
+    if not cred or not cred.credentials:
+        raise HTTPException(status_code=401, detail="not authenticated")
+    return _load_user(db, _access_token_user_id(cred.credentials))
+
 # =========================
 # Depends: 認証ユーザー（任意）
 # =========================
@@ -122,23 +142,50 @@ def get_current_user_optional(
     # ヘッダなし → 未ログインとして None を返す
     if cred is None or not cred.credentials:
         return None
-
     # ヘッダあり → 通常の検証（不正なら 401）
-    try:
-        decoded = decode_token(cred.credentials)
-    except Exception:
-        raise HTTPException(status_code=401, detail="invalid token")
+    return _load_user(db, _access_token_user_id(cred.credentials))
 
-    if decoded.get("type") != "access":
-        raise HTTPException(status_code=401, detail="access token required")
-
-    uid = decoded.get("sub")
-    if not uid:
-        raise HTTPException(status_code=401, detail="invalid token (no sub)")
-
-    user = db.query(models.User).filter(models.User.id == int(uid)).first()
-    if not user:
-        # トークンはあるが該当ユーザーがいない → 不正扱い
+# =========================
+# 認証ユーザー ID（ユーザー行の存在だけをキャッシュ付きで確認）
+# =========================
+# 存在を確認済みのユーザー ID → 有効期限（monotonic 秒）。削除されたユーザーは最大この秒数だけ通る
+_user_seen: Dict[int, float] = {}
+_user_seen_lock = threading.Lock()
+
+def _remember_user(uid: int) -> None:
+    with _user_seen_lock:
+        if len(_user_seen) >= AUTH_USER_CACHE_SIZE:
+            _user_seen.clear()
+        _user_seen[uid] = time.monotonic() + AUTH_USER_CACHE_SEC
+
+def _ensure_user_exists(db: Session, uid: int) -> None:
+    """ユーザー行が無ければ 401（get_current_user_optional と同じ規則）。確認結果は AUTH_USER_CACHE_SEC 秒使い回す。"""
+    with _user_seen_lock:
+        expires = _user_seen.get(uid)
+    if expires is not None and expires > time.monotonic():
+        return
+    if db.query(models.User.id).filter(models.User.id == uid).first() is None:
         raise HTTPException(status_code=401, detail="user not found")
+    _remember_user(uid)
+
+def user_id_from_access_token(token: str, db: Session) -> int:
+    """
+    get_current_user_optional と同じ検証（ユーザーの存在確認を含む）で sub（ユーザー ID）を返す。不正なら 401。
+    - ユーザー行は読み込まず、存在確認はキャッシュする
+    - WebSocket（ヘッダを付けられないためクエリの token）からも利用
+    """
+    uid = _access_token_user_id(token)
+    _ensure_user_exists(db, uid)
+    return uid
 
-    return user
\ No newline at end of file
+def get_current_user_id_optional(
+    cred: Optional[HTTPAuthorizationCredentials] = Depends(auth_scheme_optional),
+    db: Session = Depends(get_db),
+) -> Optional[int]:
+    """
+    get_current_user_optional と同じ検証で、ユーザー行は引かずに sub（ユーザー ID）だけを返す。
+    - 高頻度のエンドポイント（ナビの位置更新など）から利用。所有権の照合は ID で足りる
+    """
+    if cred is None or not cred.credentials:
+        return None
+    return user_id_from_access_token(cred.credentials, db)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+## backend/scripts/bench_routing.py
+"""
+ルーティングのスループット計測（オフライン。scripts.fake_osrm_server を内部で起動する）
+- 同じ乱数のレグ群を、同期クライアント（スレッドプール）と非同期クライアント（asyncio）で取得し、
+  件数/秒と p50/p95 レイテンシを出す。偽サーバーの遅延・エラー率で OSRM の状態を模擬する。
+- 実行例:
+    python -m scripts.bench_routing --legs 500 --concurrency 32 --latency-ms 30 --jitter-ms 20 --error-rate 0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from scripts.fake_osrm_server import FakeOSRMServer
+
+# 鳥海山周辺（スポットが集まる範囲）
+_BBOX = (38.95, 139.85, 39.25, 140.15)
+
+
+def _pairs(n: int, seed: int) -> List[Tuple[Tuple[float, float], Tuple[float, float]]]:
+    rng = random.Random(seed)
+
+    def pt() -> Tuple[float, float]:
+        return (round(rng.uniform(_BBOX[0], _BBOX[2]), 6), round(rng.uniform(_BBOX[1], _BBOX[3]), 6))
+
+    return [(pt(), pt()) for _ in range(n)]
+
+
+def _report(name: str, elapsed: float, latencies: List[float], failed: int) -> None:
+    lat = sorted(latencies) or [0.0]
+    p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+    print(
+        f"[bench_routing] {name:<6} {len(latencies) / elapsed:8.1f} legs/s  "
+        f"p50={statistics.median(lat) * 1000:6.1f}ms  p95={p95 * 1000:6.1f}ms  failed={failed}"
+    )
+
+
+def bench_sync(pairs, concurrency: int, detail: str) -> None:
+    from worker.app.services.routing.client import OSRMClient
+
+    client = OSRMClient(backoff_sec=0.05)
+    client.snap_index = None
+
+    def one(pair) -> float | None:
+        t0 = time.monotonic()
+        try:
+            client.fetch_route(list(pair), "car", detail=detail)
+        except Exception:
+            return None
+        return time.monotonic() - t0
+
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, pairs))
+    ok = [r for r in results if r is not None]
+    _report("sync", time.monotonic() - t0, ok, len(results) - len(ok))
+
+
+def bench_async(pairs, concurrency: int, detail: str) -> None:
+    from worker.app.services.routing.async_client import AsyncOSRMClient
+
+    async def run() -> List[float | None]:
+        sem = asyncio.Semaphore(concurrency)
+        async with AsyncOSRMClient(backoff_sec=0.05) as client:
+            client.snap_index = None
+
+            async def one(pair) -> float | None:
+                async with sem:
+                    t0 = time.monotonic()
+                    try:
+                        await client.fetch_route(list(pair), "car", detail=detail)
+                    except Exception:
+                        return None
+                    return time.monotonic() - t0
+
+            return await asyncio.gather(*(one(p) for p in pairs))
+
+    t0 = time.monotonic()
+    results = asyncio.run(run())
+    ok = [r for r in results if r is not None]
+    _report("async", time.monotonic() - t0, ok, len(results) - len(ok))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Routing throughput benchmark against a fake OSRM")
+    ap.add_argument("--legs", type=int, default=300)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--replicas", type=int, default=1)
+    ap.add_argument("--latency-ms", type=float, default=20.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--detail", choices=["distance", "simplified", "full"], default="full")
+    ap.add_argument("--mode", choices=["sync", "async", "both"], default="both")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    servers = [
+        FakeOSRMServer("car", latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                       error_rate=args.error_rate, seed=args.seed + i).start()
+        for i in range(max(1, args.replicas))
+    ]
+    os.environ["OSRM_CAR_HOSTS"] = ",".join(s.url for s in servers)
+    pairs = _pairs(args.legs, args.seed)
+    try:
+        if args.mode in ("sync", "both"):
+            bench_sync(pairs, args.concurrency, args.detail)
+        if args.mode in ("async", "both"):
+            bench_async(pairs, args.concurrency, args.detail)
+    finally:
+        for s in servers:
+            s.stop()
+        print(f"[bench_routing] served: {[s.requests for s in servers]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+## backend/scripts/build_spot_access_assignments.py
+"""
+スポット → アクセスポイント事前割当の再構築（冪等実行）
+- 各スポットの直行可否（drive_rules）と最寄りの駐車場/登山口を求め、spot_access_assignments を作り直す
+- load_spots.py / load_access_points.py の最後でも自動実行される。単独実行は:
+    python -m scripts.build_spot_access_assignments
+"""
+
+from shared.app.database import SessionLocal
+from worker.app.services.routing.spot_access import SPOT_AP_SEARCH_KM, rebuild_spot_access_assignments
+
+
+def main() -> None:
+    db = SessionLocal()
+    try:
+        n = rebuild_spot_access_assignments(db, search_km=SPOT_AP_SEARCH_KM)
+        print(f"[build_spot_access_assignments] rows={n} search_km={SPOT_AP_SEARCH_KM:g}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
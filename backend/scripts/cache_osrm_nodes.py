@@ -1,45 +1,29 @@
-# backend/scripts/cache_osrm_nodes.py
-import requests
-from backend.shared.app.database import session_scope
-from backend.shared.app.models import AccessPoint
+# -*- coding: utf-8 -*-
+## backend/scripts/cache_osrm_nodes.py
+"""
+OSRM スナップ結果（/nearest の座標と hint）のキャッシュ再構築（冪等実行）
+- 全スポット / アクセスポイントを car / foot でスナップし、osrm_snaps を作り直す
+- OSRM データ（osrm-extract）を更新したら OSRM_DATASET_VERSION を上げてから再実行する
+- 実行（接続先は OSRM_CAR_HOST(S) / OSRM_FOOT_HOST(S)。ホストからなら http://localhost:5001 等を指定）:
+    python -m scripts.cache_osrm_nodes
+"""
 
-def cache_osrm_nodes():
-    """AccessPointテーブルの各レコードについて、OSRMの最近傍ノードIDを取得してキャッシュする。"""
-    print("Caching OSRM nearest node IDs...")
-    
-    osrm_urls = {
-        "car": "http://localhost:5001/nearest/v1/driving/", # ホストマシンからアクセスする際のポート
-        "foot": "http://localhost:5002/nearest/v1/foot/"  # ホストマシンからアクセスする際のポート
-    }
+from shared.app.database import SessionLocal
+from worker.app.services.routing.client import OSRMClient
+from worker.app.services.routing.snapping import OSRM_SNAP_WORKERS, rebuild_osrm_snaps
 
-    with session_scope() as db:
-        access_points = db.query(AccessPoint).all()
-        updates = []
-        
-        for ap in access_points:
-            update_data = {'id': ap.id}
-            for profile, base_url in osrm_urls.items():
-                try:
-                    url = f"{base_url}{ap.longitude},{ap.latitude}"
-                    response = requests.get(url, timeout=5)
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    if data.get("code") == "Ok" and data.get("waypoints"):
-                        node_id = data["waypoints"][0].get("nodes")[0] # OSRM v5.22+
-                        update_data[f'{profile}_osrm_node_id'] = node_id
-                        print(f"Cached {profile} node for {ap.name or ap.osm_id}")
 
-                except requests.RequestException as e:
-                    print(f"Could not cache {profile} node for {ap.osm_id}: {e}")
-            
-            updates.append(update_data)
-        
-        if updates:
-            db.bulk_update_mappings(AccessPoint, updates)
-            db.commit()
-    
-    print("Finished caching OSRM nodes.")
+def main() -> None:
+    db = SessionLocal()
+    try:
+        # スナップ結果を作る側なので、既存の hint は使わない
+        client = OSRMClient(timeout_sec=5.0, max_retries=1)
+        client.snap_index = None
+        result = rebuild_osrm_snaps(db, client, max_workers=OSRM_SNAP_WORKERS)
+        print(f"[cache_osrm_nodes] {result}")
+    finally:
+        db.close()
+
 
 if __name__ == "__main__":
-    cache_osrm_nodes()
\ No newline at end of file
+    main()
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+## backend/scripts/fake_osrm_server.py
+"""
+ローカル用の OSRM 代替 HTTP サーバー（負荷試験・ベンチマーク・並行性テスト用）
+- /route・/table・/nearest を OSRM と同じ形の JSON で返す。経路は大円（直線）を補間した形状で、
+  距離 = 大円距離 × 迂回係数、所要時間 = 距離 / 速度（プロファイル毎）。道路網は持たない。
+- 応答遅延（latency_ms + 0〜jitter_ms の一様乱数）と、一定確率の 503（error_rate）を注入できる。
+  fail_next(n) で次の n リクエストを確実に 503 にできる（フェイルオーバーのテスト用）。
+- 標準ライブラリのみで動く（ThreadingHTTPServer）。テストからは FakeOSRMServer を with で使う:
+
+    with FakeOSRMServer("car", latency_ms=20) as car:
+        os.environ["OSRM_CAR_HOST"] = car.url
+
+- 単独起動（docker の osrm-car / osrm-foot の代わり。ホストの 5001 / 5002 に合わせる例）:
+    python -m scripts.fake_osrm_server --profile car --port 5001 --latency-ms 15 --error-rate 0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# プロファイル毎の (速度 km/h, 迂回係数)
+PROFILE_MODELS: Dict[str, Tuple[float, float]] = {
+    "car": (40.0, 1.3),
+    "foot": (4.5, 1.15),
+}
+# OSRM URL 上のプロファイル名 → 内部名
+_URL_PROFILES = {"driving": "car", "car": "car", "foot": "foot", "walking": "foot"}
+
+_EARTH_RADIUS_M = 6371000.0
+# 形状の補間間隔（m）
+_STEP_M = 50.0
+
+
+def _haversine_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """(lon, lat) 2 点間の大円距離（m）。"""
+    lon1, lat1, lon2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * _EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(h)))
+
+
+def _great_circle(a: Tuple[float, float], b: Tuple[float, float], n: int) -> List[List[float]]:
+    """(lon, lat) a→b の大円上を n 区間に分けた n+1 点（[lon, lat]）。"""
+    lon1, lat1, lon2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    d = _haversine_m(a, b) / _EARTH_RADIUS_M
+    if n <= 1 or d < 1e-12:
+        return [[a[0], a[1]], [b[0], b[1]]]
+    out = []
+    for i in range(n + 1):
+        f = i / n
+        s1, s2 = math.sin((1 - f) * d) / math.sin(d), math.sin(f * d) / math.sin(d)
+        x = s1 * math.cos(lat1) * math.cos(lon1) + s2 * math.cos(lat2) * math.cos(lon2)
+        y = s1 * math.cos(lat1) * math.sin(lon1) + s2 * math.cos(lat2) * math.sin(lon2)
+        z = s1 * math.sin(lat1) + s2 * math.sin(lat2)
+        out.append([math.degrees(math.atan2(y, x)), math.degrees(math.atan2(z, math.hypot(x, y)))])
+    return out
+
+
+def _hint(pt: Tuple[float, float]) -> str:
+    return base64.urlsafe_b64encode(f"{pt[0]:.6f},{pt[1]:.6f}".encode()).decode()
+
+
+class FakeOSRM:
+    """応答の計算部分（HTTP に依存しない）。"""
+
+    def __init__(self, profile: str = "car") -> None:
+        if profile not in PROFILE_MODELS:
+            raise ValueError(f"unknown profile: {profile}")
+        self.profile = profile
+        self.speed_kmh, self.detour = PROFILE_MODELS[profile]
+
+    def _cost(self, a: Tuple[float, float], b: Tuple[float, float]) -> Tuple[float, float]:
+        """(distance_m, duration_s)"""
+        dist = _haversine_m(a, b) * self.detour
+        return dist, dist / (self.speed_kmh / 3.6)
+
+    def _waypoint(self, pt: Tuple[float, float]) -> Dict[str, Any]:
+        return {"location": [pt[0], pt[1]], "hint": _hint(pt), "distance": 0.0, "name": ""}
+
+    def route(self, coords: List[Tuple[float, float]], params: Dict[str, str]) -> Dict[str, Any]:
+        overview = params.get("overview", "simplified")
+        annotations = params.get("annotations", "false")
+        want = set() if annotations in ("false", "") else (
+            {"distance", "duration"} if annotations == "true" else set(annotations.split(","))
+        )
+
+        legs: List[Dict[str, Any]] = []
+        line: List[List[float]] = []
+        total_d = total_t = 0.0
+        for a, b in zip(coords, coords[1:]):
+            dist, dur = self._cost(a, b)
+            n = max(1, int(_haversine_m(a, b) // _STEP_M)) if overview == "full" else 1
+            pts = _great_circle(a, b, n)
+            line.extend(pts if not line else pts[1:])
+            leg: Dict[str, Any] = {"distance": dist, "duration": dur, "weight": dur, "summary": "", "steps": []}
+            if want:
+                seg = len(pts) - 1
+                ann: Dict[str, Any] = {}
+                if "distance" in want:
+                    ann["distance"] = [dist / seg] * seg
+                if "duration" in want:
+                    ann["duration"] = [dur / seg] * seg
+                leg["annotation"] = ann
+            legs.append(leg)
+            total_d += dist
+            total_t += dur
+
+        route: Dict[str, Any] = {"distance": total_d, "duration": total_t, "weight": total_t,
+                                 "weight_name": "duration", "legs": legs}
+        if overview != "false":
+            route["geometry"] = {"type": "LineString", "coordinates": line}
+        return {"code": "Ok", "routes": [route], "waypoints": [self._waypoint(p) for p in coords]}
+
+    def table(self, coords: List[Tuple[float, float]], params: Dict[str, str]) -> Dict[str, Any]:
+        def _idx(key: str) -> List[int]:
+            raw = params.get(key)
+            if not raw or raw == "all":
+                return list(range(len(coords)))
+            return [int(x) for x in raw.split(";")]
+
+        src, dst = _idx("sources"), _idx("destinations")
+        annotations = params.get("annotations", "duration").split(",")
+        out: Dict[str, Any] = {"code": "Ok",
+                               "sources": [self._waypoint(coords[i]) for i in src],
+                               "destinations": [self._waypoint(coords[j]) for j in dst]}
+        cells = [[self._cost(coords[i], coords[j]) for j in dst] for i in src]
+        if "duration" in annotations:
+            out["durations"] = [[c[1] for c in row] for row in cells]
+        if "distance" in annotations:
+            out["distances"] = [[c[0] for c in row] for row in cells]
+        return out
+
+    def nearest(self, coords: List[Tuple[float, float]], params: Dict[str, str]) -> Dict[str, Any]:
+        return {"code": "Ok", "waypoints": [self._waypoint(coords[0])]}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # 既定の listen backlog（5）では同時接続時に SYN 再送（1 秒）待ちが起きる
+    request_queue_size = 128
+
+
+class FakeOSRMServer:
+    """
+    FakeOSRM を HTTP で公開するサーバー（バックグラウンドスレッド）。
+    port=0 なら空いているポートを使う（url 属性で参照）。
+    """
+
+    def __init__(
+        self,
+        profile: str = "car",
+        *,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.engine = FakeOSRM(profile)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._fail_next = 0
+        self.requests: Dict[str, int] = {"route": 0, "table": 0, "nearest": 0, "errors": 0}
+        self._httpd = _Server((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, n: int = 1) -> None:
+        """次の n リクエストを 503 にする。"""
+        with self._lock:
+            self._fail_next += n
+
+    def start(self) -> "FakeOSRMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-osrm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "FakeOSRMServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    # ---------- 内部 ----------
+    def _should_fail(self) -> bool:
+        with self._lock:
+            if self._fail_next > 0:
+                self._fail_next -= 1
+                return True
+            return self.error_rate > 0 and self._rng.random() < self.error_rate
+
+    def _delay_sec(self) -> float:
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter_ms) if self.jitter_ms > 0 else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000.0
+
+    def _handle(self, path: str, query: str) -> Tuple[int, Dict[str, Any]]:
+        # /{service}/v1/{profile}/{lon,lat;lon,lat...}
+        parts = path.strip("/").split("/")
+        if len(parts) != 4 or parts[1] != "v1" or parts[0] not in ("route", "table", "nearest"):
+            return 400, {"code": "InvalidUrl", "message": f"unsupported path: {path}"}
+        service, url_profile, raw = parts[0], parts[2], parts[3]
+        if _URL_PROFILES.get(url_profile) != self.engine.profile:
+            return 400, {"code": "InvalidService", "message": f"profile {url_profile} is not served here"}
+        try:
+            coords = [(float(lon), float(lat)) for lon, lat in (c.split(",") for c in raw.split(";"))]
+        except ValueError:
+            return 400, {"code": "InvalidQuery", "message": "bad coordinates"}
+        params = {k: v[-1] for k, v in parse_qs(query, keep_blank_values=True).items()}
+
+        with self._lock:
+            self.requests[service] += 1
+        if (service == "nearest" and len(coords) != 1) or (service != "nearest" and len(coords) < 2):
+            return 400, {"code": "InvalidQuery", "message": "wrong number of coordinates"}
+        return 200, getattr(self.engine, service)(coords, params)
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive（クライアントの接続プールを効かせる）
+
+            def do_GET(self) -> None:  # noqa: N802
+                u = urlsplit(self.path)  # urlparse は ; 以降を params として切り離すため使わない
+                delay = server._delay_sec()
+                if delay:
+                    time.sleep(delay)
+                if server._should_fail():
+                    with server._lock:
+                        server.requests["errors"] += 1
+                    status, body = 503, {"code": "ServiceUnavailable", "message": "injected error"}
+                else:
+                    status, body = server._handle(unquote(u.path), u.query)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        return _Handler
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fake OSRM server (great-circle routes)")
+    ap.add_argument("--profile", choices=sorted(PROFILE_MODELS), default="car")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=5001)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+
+    server = FakeOSRMServer(
+        args.profile, host=args.host, port=args.port, latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms, error_rate=args.error_rate, seed=args.seed,
+    )
+    print(f"[fake_osrm_server] {args.profile} listening on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,7 @@ from typing import Any, Dict, Iterable, Tuple
 from sqlalchemy import text  # 追加: geom 一括更新に使用
 from shared.app.database import SessionLocal
 from shared.app.models import AccessPoint
+from worker.app.services.routing.spot_access import rebuild_spot_access_assignments
 
 # 変更点A: 既定パスをスクリプトのあるディレクトリに変更し、ENVで上書き可能に
 DEFAULT_GEOJSON = Path(__file__).parent / "access_points.geojson"
@@ -161,6 +162,10 @@ def main() -> None:
         db.commit()
         print(f"[load_access_points] upserted={upserted} skipped={skipped}")
 
+        # スポット→AP 事前割当を作り直す（spots / access_points のどちらが変わっても必要）
+        n = rebuild_spot_access_assignments(db)
+        print(f"[load_access_points] spot_access_assignments rebuilt rows={n}")
+
     finally:
         db.close()
 
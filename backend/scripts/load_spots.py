@@ -19,6 +19,7 @@ from sqlalchemy.dialects.postgresql import JSONB
 
 from shared.app.database import SessionLocal
 from shared.app.models import Spot, SpotType  # Spot スキーマに official_name/spot_type/tags/lat/lon 等が定義済み
+from worker.app.services.routing.spot_access import rebuild_spot_access_assignments
 
 # === 入力 JSON の既定パス（docker-compose で backend が /app/backend にマウントされる） ===
 POI_JSON = Path("/app/backend/worker/data/POI.json")
@@ -227,6 +228,10 @@ def main() -> None:
         db.commit()
         print(f"[load_spots] inserted={inserted} updated={updated} skipped={skipped}")
 
+        # スポット→AP 事前割当を作り直す（spots / access_points のどちらが変わっても必要）
+        n = rebuild_spot_access_assignments(db)
+        print(f"[load_spots] spot_access_assignments rebuilt rows={n}")
+
     finally:
         db.close()
 
@@ -9,6 +9,7 @@ from __future__ import annotations
 
 import os
 from celery import Celery
+from celery.schedules import crontab
 
 BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
 RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/1")
@@ -39,3 +40,26 @@ celery_app.conf.update(
     # 必要に応じてキューを分ける場合は routes を追加:
     # task_routes = {"orchestrate.*": {"queue": "orchestrate"}, ...}
 )
+
+# 定期実行（celery beat）
+# - routing.warmup_popular_legs: 人気スポット間レグの夜間事前計算（OSRM 負荷をオフピークへ寄せる）
+# - routing.prune_route_legs: route_legs から長く使われていないレグを削除（保持日数は ROUTE_LEG_RETENTION_DAYS）
+#   タスク名は shared.app.tasks.TASK_ROUTING_WARMUP / TASK_ROUTING_PRUNE_LEGS と同じ文字列（循環 import を避けて直書き）
+ROUTE_WARMUP_ENABLED = os.getenv("ROUTE_WARMUP_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+ROUTE_WARMUP_HOUR = int(os.getenv("ROUTE_WARMUP_HOUR", "3"))
+ROUTE_WARMUP_MINUTE = int(os.getenv("ROUTE_WARMUP_MINUTE", "15"))
+ROUTE_LEG_PRUNE_ENABLED = os.getenv("ROUTE_LEG_PRUNE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+ROUTE_LEG_PRUNE_HOUR = int(os.getenv("ROUTE_LEG_PRUNE_HOUR", "2"))
+ROUTE_LEG_PRUNE_MINUTE = int(os.getenv("ROUTE_LEG_PRUNE_MINUTE", "45"))
+
+celery_app.conf.beat_schedule = {}
+if ROUTE_WARMUP_ENABLED:
+    celery_app.conf.beat_schedule["routing-warmup-popular-legs"] = {
+        "task": "routing.warmup_popular_legs",
+        "schedule": crontab(hour=ROUTE_WARMUP_HOUR, minute=ROUTE_WARMUP_MINUTE),
+    }
+if ROUTE_LEG_PRUNE_ENABLED:
+    celery_app.conf.beat_schedule["routing-prune-route-legs"] = {
+        "task": "routing.prune_route_legs",
+        "schedule": crontab(hour=ROUTE_LEG_PRUNE_HOUR, minute=ROUTE_LEG_PRUNE_MINUTE),
+    }
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Create spot_access_assignments (precomputed spot -> access point mapping)
+
+Revision ID: 0014_spot_access_assignments
+Revises: 0013_navigation_route_fields
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0014_spot_access_assignments"
+down_revision = "0013_navigation_route_fields"
+branch_labels = None
+depends_on = None
+
+TABLE = "spot_access_assignments"
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = inspector.get_table_names()
+
+    if TABLE not in tables:
+        op.create_table(
+            TABLE,
+            sa.Column("spot_id", sa.Integer(), primary_key=True, nullable=False),
+            sa.Column("car_direct", sa.Boolean(), nullable=False),
+            sa.Column("access_point_id", sa.Integer(), nullable=True),
+            sa.Column("ap_name", sa.String(length=255), nullable=True),
+            sa.Column("ap_type", sa.String(length=32), nullable=True),
+            sa.Column("ap_latitude", sa.Float(), nullable=True),
+            sa.Column("ap_longitude", sa.Float(), nullable=True),
+            sa.Column("ap_distance_km", sa.Float(), nullable=True),
+            sa.Column("ap_search_km", sa.Float(), nullable=False),
+            sa.Column("computed_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        )
+        if "spots" in tables:
+            op.create_foreign_key(
+                "fk_spot_access_spot_id_spots",
+                source_table=TABLE,
+                referent_table="spots",
+                local_cols=["spot_id"],
+                remote_cols=["id"],
+                ondelete="CASCADE",
+            )
+        if "access_points" in tables:
+            op.create_foreign_key(
+                "fk_spot_access_ap_id_access_points",
+                source_table=TABLE,
+                referent_table="access_points",
+                local_cols=["access_point_id"],
+                remote_cols=["id"],
+                ondelete="SET NULL",
+            )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if TABLE in inspector.get_table_names():
+        op.drop_table(TABLE)
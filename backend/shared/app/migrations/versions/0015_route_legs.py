@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Create route_legs (durable store of computed route legs)
+
+Revision ID: 0015_route_legs
+Revises: 0014_spot_access_assignments
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql as pg
+
+
+revision = "0015_route_legs"
+down_revision = "0014_spot_access_assignments"
+branch_labels = None
+depends_on = None
+
+TABLE = "route_legs"
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if TABLE not in inspector.get_table_names():
+        op.create_table(
+            TABLE,
+            sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+            sa.Column("profile", sa.String(length=16), nullable=False),
+            sa.Column("from_lat", sa.Float(), nullable=False),
+            sa.Column("from_lon", sa.Float(), nullable=False),
+            sa.Column("to_lat", sa.Float(), nullable=False),
+            sa.Column("to_lon", sa.Float(), nullable=False),
+            sa.Column("via_ap_id", sa.Integer(), server_default=sa.text("0"), nullable=False),
+            sa.Column("piston", sa.Boolean(), server_default=sa.text("false"), nullable=False),
+            sa.Column("osrm_dataset_version", sa.String(length=32), nullable=False),
+            sa.Column("geometry", pg.JSONB(astext_type=sa.Text()), nullable=True),
+            sa.Column("distance_km", sa.Float(), nullable=False),
+            sa.Column("duration_min", sa.Float(), nullable=False),
+            sa.Column("used_ap", pg.JSONB(astext_type=sa.Text()), nullable=True),
+            sa.Column("hit_count", sa.Integer(), server_default=sa.text("0"), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            sa.Column("last_used_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            sa.UniqueConstraint(
+                "profile", "from_lat", "from_lon", "to_lat", "to_lon", "via_ap_id", "piston", "osrm_dataset_version",
+                name="uq_route_legs_key",
+            ),
+        )
+
+    indexes = {ix["name"] for ix in sa.inspect(bind).get_indexes(TABLE)}
+    if "ix_route_legs_hits" not in indexes:
+        op.create_index("ix_route_legs_hits", TABLE, ["osrm_dataset_version", "hit_count"])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if TABLE in inspector.get_table_names():
+        op.drop_table(TABLE)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Create osrm_snaps (cached /nearest results and hints per profile)
+
+Revision ID: 0016_osrm_snaps
+Revises: 0015_route_legs
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0016_osrm_snaps"
+down_revision = "0015_route_legs"
+branch_labels = None
+depends_on = None
+
+TABLE = "osrm_snaps"
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    if TABLE not in inspector.get_table_names():
+        op.create_table(
+            TABLE,
+            sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+            sa.Column("profile", sa.String(length=16), nullable=False),
+            sa.Column("lat", sa.Float(), nullable=False),
+            sa.Column("lon", sa.Float(), nullable=False),
+            sa.Column("osrm_dataset_version", sa.String(length=32), nullable=False),
+            sa.Column("snapped_lat", sa.Float(), nullable=False),
+            sa.Column("snapped_lon", sa.Float(), nullable=False),
+            sa.Column("snap_distance_m", sa.Float(), nullable=True),
+            sa.Column("hint", sa.Text(), nullable=False),
+            sa.Column("source", sa.String(length=16), nullable=True),
+            sa.Column("source_id", sa.Integer(), nullable=True),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            sa.UniqueConstraint("profile", "lat", "lon", "osrm_dataset_version", name="uq_osrm_snaps_key"),
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if TABLE in inspector.get_table_names():
+        op.drop_table(TABLE)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Index route_legs.last_used_at (daily prune of idle legs)
+
+Revision ID: 0017_route_legs_last_used
+Revises: 0016_osrm_snaps
+Create Date: 2026-10-16 00:00:00.000000
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0017_route_legs_last_used"
+down_revision = "0016_osrm_snaps"
+branch_labels = None
+depends_on = None
+
+TABLE = "route_legs"
+INDEX = "ix_route_legs_last_used_at"
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if TABLE not in inspector.get_table_names():
+        return
+    if INDEX not in {ix["name"] for ix in inspector.get_indexes(TABLE)}:
+        op.create_index(INDEX, TABLE, ["last_used_at"])
+
+
+def downgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    if TABLE in inspector.get_table_names() and INDEX in {ix["name"] for ix in inspector.get_indexes(TABLE)}:
+        op.drop_index(INDEX, table_name=TABLE)
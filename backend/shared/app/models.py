@@ -129,10 +129,6 @@ class Session(Base):
     active_plan = relationship("Plan", foreign_keys=[active_plan_id])
     histories = relationship("ConversationHistory", back_populates="session", cascade="all, delete-orphan")
 
-    route_geojson = Column(JSONB, nullable=True)
-    route_version = Column(Integer, nullable=False, server_default=text("1"))
-    route_updated_at = Column(DateTime(timezone=True), nullable=True)
-
     def __repr__(self) -> str:
         return f"<Session id={self.id} user_id={self.user_id} app_status={self.app_status}>"
     
@@ -294,6 +290,109 @@ class AccessPoint(Base):
         Index("ix_access_points_geom", "geom", postgresql_using="gist"),
     )
 
+class SpotAccessAssignment(Base):
+    """
+    スポット → 最寄りアクセスポイントの事前計算結果（1 スポット 1 行）。
+    - scripts/build_spot_access_assignments.py がスポット/AP のロード後に再構築する
+    - ルーティングは spot_id の主キー検索 1 回で「車で直行できるか」と「経由 AP」を得る
+    """
+    __tablename__ = "spot_access_assignments"
+
+    spot_id = Column(Integer, ForeignKey("spots.id", ondelete="CASCADE"), primary_key=True)
+    car_direct = Column(Boolean, nullable=False)
+
+    # 経由 AP（car_direct=True または探索半径内に AP が無い場合は NULL）
+    access_point_id = Column(Integer, ForeignKey("access_points.id", ondelete="SET NULL"), nullable=True)
+    ap_name = Column(String(255), nullable=True)
+    ap_type = Column(String(32), nullable=True)
+    ap_latitude = Column(Float, nullable=True)
+    ap_longitude = Column(Float, nullable=True)
+    ap_distance_km = Column(Float, nullable=True)
+    # 計算時の AP 探索半径（これより広い半径での問い合わせには使わない）
+    ap_search_km = Column(Float, nullable=False)
+
+    computed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<SpotAccessAssignment spot_id={self.spot_id} car_direct={self.car_direct} ap={self.access_point_id}>"
+
+
+class RouteLeg(Base):
+    """
+    レグ経路の永続ストア（全ユーザー共有。LRU/Redis キャッシュの下段）。
+    - キー: (profile, 起点, 終点, 経由 AP, piston, OSRM データセット版)。座標は小数 5 桁に丸めて保持
+    - profile: car / foot は OSRM の 1 区間、hybrid は car→AP→foot を合成したレグ（via_ap_id=0 は AP なし）
+    - geometry は polyline6 に圧縮した FeatureCollection（shared.app.services.route_geometry）
+    - hit_count / last_used_at はよく使われるレグの棚卸し（事前計算の対象選び）に使う
+    - last_used_at が古い行は routing.prune_route_legs が削除する
+    """
+    __tablename__ = "route_legs"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    profile = Column(String(16), nullable=False)
+    from_lat = Column(Float, nullable=False)
+    from_lon = Column(Float, nullable=False)
+    to_lat = Column(Float, nullable=False)
+    to_lon = Column(Float, nullable=False)
+    via_ap_id = Column(Integer, nullable=False, server_default=text("0"))
+    piston = Column(Boolean, nullable=False, server_default=text("false"))
+    osrm_dataset_version = Column(String(32), nullable=False)
+
+    geometry = Column(JSONB, nullable=True)
+    distance_km = Column(Float, nullable=False)
+    duration_min = Column(Float, nullable=False)
+    used_ap = Column(JSONB, nullable=True)
+
+    hit_count = Column(Integer, nullable=False, server_default=text("0"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "profile", "from_lat", "from_lon", "to_lat", "to_lon", "via_ap_id", "piston", "osrm_dataset_version",
+            name="uq_route_legs_key",
+        ),
+        Index("ix_route_legs_hits", "osrm_dataset_version", "hit_count"),
+        Index("ix_route_legs_last_used_at", "last_used_at"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<RouteLeg id={self.id} profile={self.profile} via_ap={self.via_ap_id} v={self.osrm_dataset_version}>"
+
+
+class OSRMSnap(Base):
+    """
+    OSRM のスナップ結果（/nearest）のキャッシュ。スポット / アクセスポイント毎・プロファイル毎に 1 行。
+    - キー: (profile, 入力座標, OSRM データセット版)。座標は OSRM の内部精度に合わせ小数 6 桁に丸めて保持
+    - hint を /route・/table の hints に渡すと、OSRM 側の最近傍探索（スナップ）を省略できる
+    - 作成: scripts/cache_osrm_nodes.py（worker.app.services.routing.snapping.rebuild_osrm_snaps）
+    """
+    __tablename__ = "osrm_snaps"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    profile = Column(String(16), nullable=False)
+    lat = Column(Float, nullable=False)
+    lon = Column(Float, nullable=False)
+    osrm_dataset_version = Column(String(32), nullable=False)
+
+    snapped_lat = Column(Float, nullable=False)
+    snapped_lon = Column(Float, nullable=False)
+    snap_distance_m = Column(Float, nullable=True)
+    hint = Column(Text, nullable=False)
+
+    # 出所（"spot" / "access_point"）と ID（調査用）
+    source = Column(String(16), nullable=True)
+    source_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("profile", "lat", "lon", "osrm_dataset_version", name="uq_osrm_snaps_key"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<OSRMSnap id={self.id} profile={self.profile} {self.source}:{self.source_id} v={self.osrm_dataset_version}>"
+
+
 # ------------------------------------------------------------
 # 計画（Plan）/ 立寄り順序（Stop）
 # ------------------------------------------------------------
@@ -317,6 +416,11 @@ class Plan(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
+    # ナビ用ルート（0013 で追加）。LineString は polyline6 で圧縮して保存する（shared.app.services.route_geometry）
+    route_geojson = Column(JSONB, nullable=True)
+    route_version = Column(Integer, nullable=False, server_default=text("1"))
+    route_updated_at = Column(DateTime(timezone=True), nullable=True)
+
     user = relationship("User", back_populates="plans")
     stops = relationship("Stop", back_populates="plan", order_by="Stop.order_index", cascade="all, delete-orphan")
 
@@ -0,0 +1,39 @@
+# backend/shared/app/redis_client.py
+# ------------------------------------------------------------
+# Redis 接続（Gateway/Worker 共通）
+#  - Celery のブローカーとは DB 番号を分けたアプリ用の Redis を返す
+#  - redis パッケージ未導入 / 接続不可の場合は None を返し、呼び出し側はキャッシュ無しで動く
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Optional
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/2")
+
+_lock = threading.Lock()
+_client: Optional[Any] = None
+
+
+def get_redis() -> Optional[Any]:
+    """
+    プロセス内で共有する redis.Redis を返す（遅延生成）。
+    - 生成に失敗した場合は None（以降の呼び出しで再試行する）
+    """
+    global _client
+    if _client is not None:
+        return _client
+    with _lock:
+        if _client is None:
+            try:
+                import redis  # type: ignore
+
+                _client = redis.Redis.from_url(
+                    REDIS_URL,
+                    socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT_SEC", "0.5")),
+                    socket_connect_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT_SEC", "0.5")),
+                )
+            except Exception:
+                _client = None
+    return _client
@@ -222,6 +222,24 @@ class NavLocationUpdateOut(BaseModel):
     events: list[dict]
     actions: dict
     plan_version: int | None = None
+    # ルート上の進捗（along_m / route_length_m / remaining_m / fraction / next_stop_remaining_m）。逸脱中は None
+    progress: dict | None = None
+
+# [ADDED] 電波の悪い区間で端末に溜めた測位をまとめて送るバッチ I/O
+class NavFix(BaseModel):
+    lat: float
+    lon: float
+    heading: float | None = None
+    speed_mps: float | None = None
+    ts: datetime | None = None
+
+class NavLocationBatchIn(BaseModel):
+    session_id: str
+    fixes: list[NavFix] = Field(..., min_items=1, description="測位の配列（古い順。全件に ts があれば ts 順に並べ直す）")
+
+class NavLocationBatchOut(NavLocationUpdateOut):
+    # 処理した測位数（events の各要素には fix_index / ts が付く）
+    fixes: int = 0
 
 class PlanSummaryStop(BaseModel):
     stop_id: int
@@ -235,6 +253,9 @@ class PlanSummaryResponse(BaseModel):
     plan_id: int
     plan_version: int
     route_geojson: dict | None = None
+    # route_geojson の解像度（full/high/medium/low）と形式（geojson/polyline6）
+    route_resolution: str = "full"
+    route_format: str = "geojson"
     route_updated_at: datetime | None = None
     stops: list[PlanSummaryStop] = []
     distance_km: float | None = None
@@ -0,0 +1,192 @@
+# backend/shared/app/services/nav_channel.py
+# [NEW] API/Worker共通：ナビセッション毎のプッシュ通知チャネル（Redis pub/sub）。
+#
+# - チャネル名は nav:<session_id>。メッセージは {"type": ..., ...} の JSON。
+#     ROUTE_UPDATED : Worker のリルートが CAS に勝った直後（plan_id / route_version / route）
+# - API の WebSocket（/navigation/ws/{session_id}）は NavHub から受け取り、そのまま端末へ流す。
+#   これで新しいルートは次のポーリングを待たずに届く。
+# - NavHub: プロセスに 1 つの redis.asyncio 接続で nav:* を psubscribe し、セッション毎の asyncio.Queue へ
+#   振り分ける。イベントループ上で待つのでスレッドを使わず、接続数もソケット数に比例しない。
+#   購読者がいなくなれば接続を閉じ、切れた時は NAV_PUBSUB_RETRY_SEC 毎に繋ぎ直す。
+# - Redis が無い・落ちている時は publish は False を返すだけ（端末は plan_version の変化で追従できる）。
+
+from __future__ import annotations
+from typing import Any, Dict, Optional, Set
+import asyncio
+import json
+import logging
+import os
+
+from shared.app.redis_client import REDIS_URL, get_redis
+
+logger = logging.getLogger(__name__)
+
+# NavHub: 受信を待つ 1 回あたりの秒数（購読者がいなくなったことに気付く粒度）
+NAV_PUBSUB_POLL_SEC = float(os.getenv("NAV_PUBSUB_POLL_SEC", "1.0"))
+# NavHub: 接続が切れた時に繋ぎ直すまでの秒数
+NAV_PUBSUB_RETRY_SEC = float(os.getenv("NAV_PUBSUB_RETRY_SEC", "2.0"))
+# NavHub: 1 接続（WebSocket）あたりの未送信メッセージの上限（溢れたら古い物から捨てる）
+NAV_PUBSUB_QUEUE_SIZE = int(os.getenv("NAV_PUBSUB_QUEUE_SIZE", "16"))
+
+_CHANNEL_PREFIX = "nav"
+
+ROUTE_UPDATED = "ROUTE_UPDATED"
+
+
+def channel_name(session_id: str) -> str:
+    return f"{_CHANNEL_PREFIX}:{session_id}"
+
+
+def publish(session_id: str, message: Dict[str, Any], *, redis_client: Any = None) -> bool:
+    """セッションのチャネルへ送る。送れたら True（購読者がいなくても True）。"""
+    r = redis_client if redis_client is not None else get_redis()
+    if r is None:
+        return False
+    try:
+        r.publish(channel_name(session_id), json.dumps(message, ensure_ascii=False))
+        return True
+    except Exception as e:
+        logger.warning("nav publish failed (session=%s): %s", session_id, e)
+        return False
+
+
+def _decode(raw: Any) -> Optional[Dict[str, Any]]:
+    """メッセージ本文を dict に（壊れた JSON は None）。"""
+    try:
+        out = json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+    return out if isinstance(out, dict) else None
+
+
+async def _close_pubsub(ps: Any) -> None:
+    try:
+        await ps.punsubscribe()
+        await ps.aclose()
+    except Exception:
+        pass
+
+
+class NavHub:
+    """
+    プロセス共有の非同期購読。subscribe(session_id) でキューを受け取り、使い終わったら unsubscribe する。
+    1 つのイベントループの中で使う（別のループから呼ばれたら状態を作り直す）。
+    redis_client には redis.asyncio.Redis を渡せる（未指定なら REDIS_URL から作る）。
+    """
+
+    def __init__(self, *, redis_client: Any = None) -> None:
+        self._redis = redis_client
+        self._own_client = redis_client is None
+        self._queues: Dict[str, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._queues = {}
+        self._task = None
+        self._lock = asyncio.Lock()
+        if self._own_client:
+            self._redis = None
+
+    def _client(self) -> Any:
+        if self._redis is None:
+            try:
+                import redis.asyncio as aioredis  # type: ignore
+
+                self._redis = aioredis.Redis.from_url(
+                    REDIS_URL, socket_connect_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT_SEC", "0.5"))
+                )
+            except Exception:
+                return None
+        return self._redis
+
+    async def _connect(self) -> Any:
+        r = self._client()
+        if r is None:
+            return None
+        ps = None
+        try:
+            ps = r.pubsub(ignore_subscribe_messages=True)
+            await ps.psubscribe(f"{_CHANNEL_PREFIX}:*")
+            return ps
+        except Exception as e:
+            logger.warning("nav hub subscribe failed: %s", e)
+            if ps is not None:
+                await _close_pubsub(ps)
+            return None
+
+    async def subscribe(self, session_id: str) -> Optional[asyncio.Queue]:
+        """セッションのメッセージが届くキュー（Redis に繋がらなければ None）。戻った時点で購読済み。"""
+        self._bind_loop()
+        async with self._lock:
+            if self._task is None or self._task.done():
+                ps = await self._connect()
+                if ps is None:
+                    return None
+                self._task = asyncio.create_task(self._run(ps))
+            q: asyncio.Queue = asyncio.Queue(maxsize=max(1, NAV_PUBSUB_QUEUE_SIZE))
+            self._queues.setdefault(session_id, set()).add(q)
+            return q
+
+    def unsubscribe(self, session_id: str, queue: asyncio.Queue) -> None:
+        qs = self._queues.get(session_id)
+        if qs is None:
+            return
+        qs.discard(queue)
+        if not qs:
+            del self._queues[session_id]
+
+    def _dispatch(self, msg: Dict[str, Any]) -> None:
+        channel = msg.get("channel")
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        if not isinstance(channel, str) or not channel.startswith(f"{_CHANNEL_PREFIX}:"):
+            return
+        qs = self._queues.get(channel[len(_CHANNEL_PREFIX) + 1:])
+        if not qs:
+            return
+        data = _decode(msg.get("data"))
+        if data is None:
+            return
+        for q in qs:
+            if q.full():
+                q.get_nowait()
+            q.put_nowait(data)
+
+    async def _run(self, ps: Any) -> None:
+        """受信ループ。購読者がいなくなったら接続を閉じて終わる（次の subscribe で繋ぎ直す）。"""
+        try:
+            while self._queues:
+                if ps is None:
+                    await asyncio.sleep(NAV_PUBSUB_RETRY_SEC)
+                    ps = await self._connect()
+                    continue
+                try:
+                    msg = await ps.get_message(ignore_subscribe_messages=True, timeout=NAV_PUBSUB_POLL_SEC)
+                except Exception as e:
+                    logger.warning("nav hub subscription lost: %s", e)
+                    await _close_pubsub(ps)
+                    ps = None
+                    continue
+                if msg and msg.get("type") in ("message", "pmessage"):
+                    self._dispatch(msg)
+            # ここまで await を挟まないので、この後の subscribe は新しい接続を作る
+            self._task = None
+        finally:
+            if ps is not None:
+                await _close_pubsub(ps)
+
+
+_HUB: Optional[NavHub] = None
+
+
+def get_nav_hub() -> NavHub:
+    global _HUB
+    if _HUB is None:
+        _HUB = NavHub()
+    return _HUB
@@ -0,0 +1,289 @@
+# backend/shared/app/services/nav_state.py
+# [NEW] API/Worker共通：ナビ中セッションのホット状態（Redis ハッシュ nav_state:<session_id>）。
+#
+# 位置更新（毎秒）を SQL なしで処理するため、判定に要る状態を 1 つのハッシュに置き、HGETALL 1 回で読む。
+#   snap       : PlanSnapshot（セッション → プラン / 所有者 / route_version / クールダウン / 停留所）の JSON。
+#                NAV_STATE_SNAPSHOT_TTL_SEC を過ぎたら DB から読み直す（停留所の編集などはこの間隔で反映）。
+#                リルートで route_version が上がった時は Worker が snap を消す（invalidate_snapshot）。
+#   progress   : ルート上の直前のマッチ（RouteProgress.dumps()）。線分が変わった時だけ書く
+#   zones      : 停留所の接近状態（proximity の zones）の JSON。変化した時だけ書く
+#   reroute_at : 直近のリルート起動時刻（epoch 秒）。DB の sessions.last_reroute_at はリルート起動時だけ更新する
+# - コンパイル済みルート本体はプロセス内キャッシュ（route_index）にあり、ここには (plan_id, route_version) だけを持つ。
+# - Redis が無い・落ちている間はプロセス内 LRU で同じ形のまま動く（プロセス間では共有されない）。
+
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session as OrmSession, joinedload
+
+from shared.app.models import Plan, Session as DbSession, Stop
+from shared.app.redis_client import get_redis
+from shared.app.services.route_index import RouteProgress
+
+NAV_STATE_TTL_SEC = int(os.getenv("NAV_STATE_TTL_SEC", str(6 * 3600)))
+NAV_STATE_SNAPSHOT_TTL_SEC = float(os.getenv("NAV_STATE_SNAPSHOT_TTL_SEC", "60"))
+NAV_STATE_LRU_SIZE = int(os.getenv("NAV_STATE_LRU_SIZE", "4096"))
+# Redis エラー後、この秒数は Redis を叩かず LRU のみで動く
+NAV_STATE_REDIS_RETRY_SEC = float(os.getenv("NAV_STATE_REDIS_RETRY_SEC", "30"))
+
+_KEY_PREFIX = "nav_state"
+
+
+# ------------------------------------------------------------
+# セッション / プランのスナップショット
+# ------------------------------------------------------------
+@dataclass
+class StopSnapshot:
+    """停留所（evaluate_events からは Stop と同じように id / spot.latitude 等で読める）。"""
+    id: int
+    spot_id: int
+    official_name: Optional[str]
+    latitude: float
+    longitude: float
+
+    @property
+    def spot(self) -> "StopSnapshot":
+        return self
+
+
+@dataclass
+class PlanSnapshot:
+    """位置更新の判定に要るセッション / プランの情報。plan_id が None ならアクティブプラン無し。"""
+    session_id: str
+    plan_id: Optional[int]
+    user_id: Optional[int] = None
+    route_version: Optional[int] = None
+    reroute_cooldown_sec: Optional[int] = None
+    last_reroute_at: Optional[float] = None  # DB 上の値（epoch 秒）
+    stops: List[StopSnapshot] = field(default_factory=list)
+    loaded_at: float = 0.0
+
+    # evaluate_events が Plan と同じ属性名で読めるように
+    @property
+    def id(self) -> Optional[int]:
+        return self.plan_id
+
+    @property
+    def route_geojson(self) -> None:
+        return None
+
+    def expired(self, ttl_sec: float = NAV_STATE_SNAPSHOT_TTL_SEC) -> bool:
+        return time.time() - self.loaded_at > ttl_sec
+
+    def dumps(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def loads(cls, raw: Any) -> Optional["PlanSnapshot"]:
+        try:
+            d = json.loads(raw)
+            d["stops"] = [StopSnapshot(**s) for s in d.get("stops") or []]
+            return cls(**d)
+        except (TypeError, ValueError, KeyError):
+            return None
+
+
+def load_plan_snapshot(db: OrmSession, session_id: str) -> Optional[PlanSnapshot]:
+    """DB からスナップショットを作る（セッションが無ければ None）。"""
+    sess: Optional[DbSession] = db.query(DbSession).filter(DbSession.id == session_id).first()
+    if sess is None:
+        return None
+    snap = PlanSnapshot(
+        session_id=session_id,
+        plan_id=None,
+        reroute_cooldown_sec=sess.reroute_cooldown_sec,
+        last_reroute_at=sess.last_reroute_at.timestamp() if sess.last_reroute_at else None,
+        loaded_at=time.time(),
+    )
+    if not sess.active_plan_id:
+        return snap
+    plan: Optional[Plan] = (
+        db.query(Plan)
+        .options(joinedload(Plan.stops).joinedload(Stop.spot))
+        .filter(Plan.id == sess.active_plan_id)
+        .first()
+    )
+    if plan is None:
+        return snap
+    snap.plan_id = plan.id
+    snap.user_id = plan.user_id
+    snap.route_version = plan.route_version
+    snap.stops = [
+        StopSnapshot(s.id, s.spot_id, s.spot.official_name, float(s.spot.latitude), float(s.spot.longitude))
+        for s in plan.stops
+        if s.spot is not None
+    ]
+    return snap
+
+
+# ------------------------------------------------------------
+# ホット状態
+# ------------------------------------------------------------
+@dataclass
+class NavState:
+    snapshot: Optional[PlanSnapshot] = None
+    progress: Optional[RouteProgress] = None
+    zones: Dict[str, str] = field(default_factory=dict)
+    reroute_at: Optional[float] = None
+
+    @classmethod
+    def from_fields(cls, fields: Dict[str, Any]) -> "NavState":
+        f = {(k.decode() if isinstance(k, bytes) else k): v for k, v in (fields or {}).items()}
+        state = cls()
+        if f.get("snap"):
+            state.snapshot = PlanSnapshot.loads(f["snap"])
+        if f.get("progress"):
+            state.progress = RouteProgress.loads(f["progress"])
+        if f.get("zones"):
+            try:
+                state.zones = dict(json.loads(f["zones"]))
+            except (TypeError, ValueError):
+                state.zones = {}
+        if f.get("reroute_at"):
+            try:
+                state.reroute_at = float(f["reroute_at"])
+            except (TypeError, ValueError):
+                pass
+        return state
+
+
+def _encode_fields(
+    snapshot: Optional[PlanSnapshot] = None,
+    progress: Optional[RouteProgress] = None,
+    zones: Optional[Dict[str, str]] = None,
+    reroute_at: Optional[float] = None,
+) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    if snapshot is not None:
+        out["snap"] = snapshot.dumps()
+    if progress is not None:
+        out["progress"] = progress.dumps()
+    if zones is not None:
+        out["zones"] = json.dumps(zones)
+    if reroute_at is not None:
+        out["reroute_at"] = f"{reroute_at:.3f}"
+    return out
+
+
+class NavStateStore:
+    """session_id → NavState（Redis ハッシュ + プロセス内 LRU）。"""
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = NAV_STATE_LRU_SIZE,
+        ttl_sec: int = NAV_STATE_TTL_SEC,
+        redis_client: Any = None,
+        use_redis: bool = True,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_sec = ttl_sec
+        self._redis = redis_client
+        self._use_redis = use_redis
+        self._lru: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis_down_until = 0.0
+        self._stats: Dict[str, int] = {"loads": 0, "writes": 0, "redis_errors": 0}
+
+    def _client(self) -> Any:
+        if not self._use_redis or time.monotonic() < self._redis_down_until:
+            return None
+        return self._redis if self._redis is not None else get_redis()
+
+    def _redis_failed(self) -> None:
+        self._redis_down_until = time.monotonic() + NAV_STATE_REDIS_RETRY_SEC
+        with self._lock:
+            self._stats["redis_errors"] += 1
+
+    def _local_update(self, session_id: str, fields: Dict[str, str], drop: Tuple[str, ...] = ()) -> None:
+        with self._lock:
+            cur = self._lru.setdefault(session_id, {})
+            cur.update(fields)
+            for k in drop:
+                cur.pop(k, None)
+            self._lru.move_to_end(session_id)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def load(self, session_id: str) -> NavState:
+        """状態を読む（Redis なら HGETALL 1 回）。無ければ空の NavState。"""
+        with self._lock:
+            self._stats["loads"] += 1
+        r = self._client()
+        if r is not None:
+            try:
+                return NavState.from_fields(r.hgetall(f"{_KEY_PREFIX}:{session_id}"))
+            except Exception:
+                self._redis_failed()
+        with self._lock:
+            return NavState.from_fields(dict(self._lru.get(session_id) or {}))
+
+    def save(
+        self,
+        session_id: str,
+        *,
+        snapshot: Optional[PlanSnapshot] = None,
+        progress: Optional[RouteProgress] = None,
+        zones: Optional[Dict[str, str]] = None,
+        reroute_at: Optional[float] = None,
+    ) -> None:
+        """渡したフィールドだけを書く（何も無ければ何もしない）。"""
+        fields = _encode_fields(snapshot, progress, zones, reroute_at)
+        if not fields:
+            return
+        with self._lock:
+            self._stats["writes"] += 1
+        self._local_update(session_id, fields)
+        r = self._client()
+        if r is not None:
+            key = f"{_KEY_PREFIX}:{session_id}"
+            try:
+                pipe = r.pipeline(transaction=False)
+                pipe.hset(key, mapping=fields)
+                pipe.expire(key, self.ttl_sec)
+                pipe.execute()
+            except Exception:
+                self._redis_failed()
+
+    def invalidate_snapshot(self, session_id: str) -> None:
+        """スナップショットだけを消す（次の位置更新で DB から読み直す）。"""
+        self._local_update(session_id, {}, drop=("snap",))
+        r = self._client()
+        if r is not None:
+            try:
+                r.hdel(f"{_KEY_PREFIX}:{session_id}", "snap")
+            except Exception:
+                self._redis_failed()
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._lru.pop(session_id, None)
+        r = self._client()
+        if r is not None:
+            try:
+                r.delete(f"{_KEY_PREFIX}:{session_id}")
+            except Exception:
+                self._redis_failed()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "lru_entries": len(self._lru)}
+
+
+_STORE: Optional[NavStateStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_nav_state_store() -> NavStateStore:
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = NavStateStore()
+    return _STORE
@@ -4,11 +4,10 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from typing import List, Tuple, Optional, Dict, Any
-import math
 
 from shared.app.models import Plan, Stop
-
-EARTH_RADIUS_M = 6371000.0
+from shared.app.services.proximity import ARRIVAL, haversine_m
+from shared.app.services.route_index import CompiledRoute, RouteGeometry, RouteMatch
 
 
 @dataclass(frozen=True)
@@ -18,57 +17,21 @@ class Thresholds:
     arrival_m: float
 
 
-def haversine_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
-    lat1, lon1 = a
-    lat2, lon2 = b
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dl = math.radians(lon2 - lon1)
-    s = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dl / 2) ** 2
-    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(s))
-
-
-def _project_local_m(lat0: float, lon0: float, lat: float, lon: float) -> tuple[float, float]:
-    x = math.radians(lon - lon0) * EARTH_RADIUS_M * math.cos(math.radians(lat0))
-    y = math.radians(lat - lat0) * EARTH_RADIUS_M
-    return x, y
-
-
-def _point_segment_distance_m(lat: float, lon: float, a: Tuple[float, float], b: Tuple[float, float]) -> float:
-    lat0 = (a[0] + b[0]) / 2.0
-    x1, y1 = _project_local_m(lat0, lon, a[0], a[1])
-    x2, y2 = _project_local_m(lat0, lon, b[0], b[1])
-    xp, yp = _project_local_m(lat0, lon, lat, lon)
-    dx = x2 - x1
-    dy = y2 - y1
-    if dx == 0 and dy == 0:
-        return math.hypot(xp - x1, yp - y1)
-    t = ((xp - x1) * dx + (yp - y1) * dy) / (dx * dx + dy * dy)
-    t = max(0.0, min(1.0, t))
-    xn = x1 + t * dx
-    yn = y1 + t * dy
-    return math.hypot(xp - xn, yp - yn)
-
-
-def distance_to_polyline_m(point: Tuple[float, float], route_geojson: Optional[dict]) -> Optional[float]:
-    if not route_geojson:
-        return None
-    lat, lon = point
-    features = route_geojson.get("features") or []
-    best = None
-    for f in features:
-        geom = f.get("geometry") or {}
-        if geom.get("type") != "LineString":
-            continue
-        coords = geom.get("coordinates") or []
-        for i in range(len(coords) - 1):
-            lon1, lat1 = coords[i][0], coords[i][1]
-            lon2, lat2 = coords[i + 1][0], coords[i + 1][1]
-            d = _point_segment_distance_m(lat, lon, (lat1, lon1), (lat2, lon2))
-            if best is None or (d is not None and d < best):
-                best = d
-    return best
+def distance_to_polyline_m(
+    point: Tuple[float, float],
+    route_geojson: Optional[dict],
+    geometry: Optional[RouteGeometry] = None,
+) -> Optional[float]:
+    """
+    現在地とルートの最短距離（m）。ルートが無ければ None。
+    - 逸脱判定は常にフル解像度（保存形式の polyline6 も復号して使う）
+    - 投影済みの geometry を渡せばそれを使う（ルートの解析・投影を省く）
+    """
+    if geometry is None:
+        if not route_geojson:
+            return None
+        geometry = RouteGeometry.from_geojson(route_geojson)
+    return geometry.distance_m(point[0], point[1])
 
 
 def _find_next_stop(plan: Plan) -> Optional[Stop]:
@@ -82,19 +45,31 @@ def evaluate_events(
     current: Tuple[float, float],
     plan: Plan,
     thresholds: Thresholds,
+    route: Optional[CompiledRoute] = None,
+    match: Optional[RouteMatch] = None,
+    zones: Optional[Dict[str, str]] = None,
 ) -> tuple[list[dict], Optional[Stop], Optional[float]]:
     """
     [ADDED] 現在地に対するイベント判定の純関数。
       - 逸脱（REROUTE_REQUESTED）
       - 接近（PROXIMITY_APPROACH）
       - 到着（PROXIMITY_ARRIVAL）
+    route: plan のコンパイル済みルート（route_index.get_compiled_route）。渡せば plan.route_geojson は読まない。
+    match: 呼び出し側で逐次マッチ済み（CompiledRoute.match）ならその結果。逸脱距離に使う。
+    zones: 接近状態（proximity.ProximityIndex.update_zones）。route と一緒に渡すと全停留所をグリッドで判定し、
+           同じ停留所では半径を出るまで再発火しない（dict はその場で更新される。保存は呼び出し側）。
     戻り値: (events, next_stop, offroute_distance_m)
     """
     events: List[Dict[str, Any]] = []
     next_stop = _find_next_stop(plan)
 
     # 逸脱判定（ルートが未設定なら None）
-    offroute = distance_to_polyline_m(current, plan.route_geojson)
+    if match is not None:
+        offroute = match.distance_m
+    elif route is not None:
+        offroute = route.distance_m(current[0], current[1], radius_m=thresholds.off_route_m)
+    else:
+        offroute = distance_to_polyline_m(current, plan.route_geojson)
     if offroute is None or offroute > thresholds.off_route_m:
         events.append(
             {
@@ -105,7 +80,17 @@ def evaluate_events(
         )
 
     # 接近/到着
-    if next_stop and next_stop.spot:
+    if route is not None and zones is not None:
+        fired = route.proximity.update_zones(
+            current[0], current[1], zones, approach_m=thresholds.approach_m, arrival_m=thresholds.arrival_m
+        )
+        for target, level, d in fired:
+            events.append({
+                "type": "PROXIMITY_ARRIVAL" if level == ARRIVAL else "PROXIMITY_APPROACH",
+                "stop_id": target.data.get("stop_id"),
+                "distance_m": int(d),
+            })
+    elif next_stop and next_stop.spot:
         d = haversine_m(current, (next_stop.spot.latitude, next_stop.spot.longitude))
         if d < thresholds.arrival_m:
             events.append({"type": "PROXIMITY_ARRIVAL", "stop_id": next_stop.id, "distance_m": int(d)})
@@ -0,0 +1,156 @@
+# backend/shared/app/services/proximity.py
+# [NEW] API/Worker共通：スポット / 停留所への接近判定（一様グリッド索引 + ヒステリシス）。
+#
+# - 対象点をローカル平面（正距円筒近似, m）に投影し、セル一辺 NAV_PROXIMITY_GRID_CELL_M のグリッドに入れる。
+#   判定は現在地の周囲（到達し得る半径）のセルに入っている候補だけをハバースインで測る。
+# - 半径は対象毎に持てる（radius_m / arrival_m。未指定なら呼び出し側の既定値）。
+# - ヒステリシス: 半径に入ったら 1 回だけ発火し、半径 × NAV_PROXIMITY_EXIT_FACTOR を出るまで
+#   同じ対象では再発火しない（境界付近の GPS の揺れで何度も鳴らない）。
+#   状態は {対象キー: "approach" | "arrival"} の dict で、呼び出し側が保存する。
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+import os
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+NAV_PROXIMITY_GRID_CELL_M = float(os.getenv("NAV_PROXIMITY_GRID_CELL_M", "250"))
+NAV_PROXIMITY_EXIT_FACTOR = float(os.getenv("NAV_PROXIMITY_EXIT_FACTOR", "1.2"))
+
+APPROACH = "approach"
+ARRIVAL = "arrival"
+
+
+def haversine_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """2 点 (lat, lon) 間の大円距離（m）。navigation_events からも使う（navigation_events が本モジュールを import するため、こちらに置く）。"""
+    lat1, lon1 = a
+    lat2, lon2 = b
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dl = math.radians(lon2 - lon1)
+    s = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(s))
+
+
+@dataclass(frozen=True)
+class ProximityTarget:
+    """接近判定の対象。key は状態 dict のキー（例: "stop:12", "spot:34"）。"""
+    key: str
+    lat: float
+    lon: float
+    radius_m: Optional[float] = None    # 接近半径（None なら既定値）
+    arrival_m: Optional[float] = None   # 到着半径（None なら既定値）
+    data: Dict[str, Any] = field(default_factory=dict, compare=False)
+
+
+class ProximityIndex:
+    """対象点の一様グリッド索引。"""
+
+    def __init__(self, targets: Sequence[ProximityTarget], cell_m: float = NAV_PROXIMITY_GRID_CELL_M) -> None:
+        self.targets = list(targets)
+        self.cell_m = max(1.0, float(cell_m))
+        self.by_key = {t.key: t for t in self.targets}
+        # 対象毎の半径（接近 / 到着）のうち最大（周囲何セルを見るかの下限に使う）
+        self.max_radius_m = max(
+            (max(t.radius_m or 0.0, t.arrival_m or 0.0) for t in self.targets), default=0.0
+        )
+
+        if self.targets:
+            lats = np.array([t.lat for t in self.targets], dtype=np.float64)
+            lons = np.array([t.lon for t in self.targets], dtype=np.float64)
+            self.lat0, self.lon0 = float((lats.min() + lats.max()) / 2), float((lons.min() + lons.max()) / 2)
+        else:
+            lats = lons = np.empty(0)
+            self.lat0 = self.lon0 = 0.0
+        self._kx = math.radians(1.0) * EARTH_RADIUS_M * math.cos(math.radians(self.lat0))
+        self._ky = math.radians(1.0) * EARTH_RADIUS_M
+
+        cx = np.floor((lons - self.lon0) * self._kx / self.cell_m).astype(np.int64)
+        cy = np.floor((lats - self.lat0) * self._ky / self.cell_m).astype(np.int64)
+        buckets: Dict[Tuple[int, int], List[int]] = {}
+        for i in range(len(self.targets)):
+            buckets.setdefault((int(cx[i]), int(cy[i])), []).append(i)
+        self.cells = buckets
+
+    @classmethod
+    def from_guide_spots(cls, guide_spots: Iterable[Dict[str, Any]], **kw: Any) -> "ProximityIndex":
+        """NavigationService.check_for_proximity の guide_spots 形式から作る。"""
+        targets = []
+        for s in guide_spots:
+            try:
+                lat, lon = float(s["lat"]), float(s["lon"])
+            except (KeyError, ValueError, TypeError):
+                continue
+            radius = s.get("radius_m")
+            targets.append(ProximityTarget(
+                key=f"spot:{s.get('spot_id')}", lat=lat, lon=lon,
+                radius_m=float(radius) if radius is not None else None, data=dict(s),
+            ))
+        return cls(targets, **kw)
+
+    def nearby(self, lat: float, lon: float, reach_m: float) -> List[Tuple[ProximityTarget, float]]:
+        """現在地から reach_m 以内の対象と距離（m）。周囲のセルの候補だけを測る。"""
+        if not self.targets:
+            return []
+        px = (lon - self.lon0) * self._kx
+        py = (lat - self.lat0) * self._ky
+        c = self.cell_m
+        out: List[Tuple[ProximityTarget, float]] = []
+        for cx in range(int(math.floor((px - reach_m) / c)), int(math.floor((px + reach_m) / c)) + 1):
+            for cy in range(int(math.floor((py - reach_m) / c)), int(math.floor((py + reach_m) / c)) + 1):
+                for i in self.cells.get((cx, cy), ()):
+                    t = self.targets[i]
+                    d = haversine_m((lat, lon), (t.lat, t.lon))
+                    if d <= reach_m:
+                        out.append((t, d))
+        out.sort(key=lambda td: td[1])
+        return out
+
+    def within(self, lat: float, lon: float, default_radius_m: float) -> List[Tuple[ProximityTarget, float]]:
+        """各対象の半径（未指定なら default_radius_m）に入っている対象と距離。"""
+        reach = max(default_radius_m, self.max_radius_m)
+        return [(t, d) for t, d in self.nearby(lat, lon, reach) if d <= (t.radius_m or default_radius_m)]
+
+    def update_zones(
+        self,
+        lat: float,
+        lon: float,
+        zones: Dict[str, str],
+        *,
+        approach_m: float,
+        arrival_m: float,
+        exit_factor: float = NAV_PROXIMITY_EXIT_FACTOR,
+    ) -> List[Tuple[ProximityTarget, str, float]]:
+        """
+        ヒステリシス付きの判定。zones（呼び出し側が保存する状態）をその場で更新し、
+        今回新たに発火した (対象, "approach" | "arrival", 距離) を近い順に返す。
+        - 到着半径に入った: 到着済みでなければ arrival を発火
+        - 接近半径に入った: 状態が無ければ approach を発火
+        - 接近半径 × exit_factor の外に出た: 状態を消す（次に入ったら再び発火）
+        """
+        reach = max(approach_m, arrival_m, self.max_radius_m) * max(1.0, exit_factor)
+        seen = set()
+        fired: List[Tuple[ProximityTarget, str, float]] = []
+        for t, d in self.nearby(lat, lon, reach):
+            r_in = t.radius_m or approach_m
+            r_arr = t.arrival_m or arrival_m
+            prev = zones.get(t.key)
+            seen.add(t.key)
+            if d <= r_arr:
+                if prev != ARRIVAL:
+                    zones[t.key] = ARRIVAL
+                    fired.append((t, ARRIVAL, d))
+            elif d <= r_in:
+                if prev is None:
+                    zones[t.key] = APPROACH
+                    fired.append((t, APPROACH, d))
+            elif d > r_in * exit_factor:
+                zones.pop(t.key, None)
+        # 周囲に居ない（= 十分遠い）対象の状態は消す。索引に無いキー（別プランの残り等）も消す
+        for key in [k for k in zones if k not in seen]:
+            del zones[key]
+        return fired
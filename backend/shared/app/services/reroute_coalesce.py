@@ -0,0 +1,98 @@
+# backend/shared/app/services/reroute_coalesce.py
+# [NEW] API/Worker共通：リルート要求の後勝ち（latest-wins）合流。
+#
+# - enqueue_reroute は送信前に register_request でセッション毎の連番を採る（Redis ハッシュ nav_reroute:<session_id> の seq）。
+#   連番は payload の seq としてタスクに渡る。
+# - Worker は開始前に is_superseded で自分より新しい要求が来ていないかを見て、来ていれば何もせず終わる。
+# - 計算中は StaleCheck を OSRM クライアントの abort フックに渡し、追い越された時点で以降の OSRM 要求を
+#   送らずに失敗させる（捨てられるルートのために OSRM を使わない）。CAS の直前にも確認する。
+# - Redis が無い・落ちている時は合流しない（従来通り全タスクが走り、CAS で後勝ちになる）。
+
+from __future__ import annotations
+from typing import Any, Optional
+import logging
+import os
+import time
+
+from shared.app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+NAV_REROUTE_LATEST_TTL_SEC = int(os.getenv("NAV_REROUTE_LATEST_TTL_SEC", "600"))
+# 計算中の確認（Redis GET）をこの秒数に 1 回までに抑える（OSRM 要求毎に叩かない）
+NAV_REROUTE_STALE_CHECK_SEC = float(os.getenv("NAV_REROUTE_STALE_CHECK_SEC", "0.25"))
+
+_KEY_PREFIX = "nav_reroute"
+
+
+def _key(session_id: str) -> str:
+    return f"{_KEY_PREFIX}:{session_id}"
+
+
+def register_request(session_id: str, *, redis_client: Any = None) -> Optional[int]:
+    """最新の要求として記録し、採った連番を返す（Redis が無ければ None = 合流しない）。"""
+    r = redis_client if redis_client is not None else get_redis()
+    if r is None:
+        return None
+    key = _key(session_id)
+    try:
+        pipe = r.pipeline(transaction=True)
+        pipe.hincrby(key, "seq", 1)
+        pipe.expire(key, NAV_REROUTE_LATEST_TTL_SEC)
+        seq = pipe.execute()[0]
+        return int(seq)
+    except Exception as e:
+        logger.warning("reroute register failed (session=%s): %s", session_id, e)
+        return None
+
+
+def latest_seq(session_id: str, *, redis_client: Any = None) -> Optional[int]:
+    r = redis_client if redis_client is not None else get_redis()
+    if r is None:
+        return None
+    try:
+        raw = r.hget(_key(session_id), "seq")
+        return int(raw) if raw is not None else None
+    except Exception as e:
+        logger.warning("reroute lookup failed (session=%s): %s", session_id, e)
+        return None
+
+
+def is_superseded(session_id: str, seq: Optional[int], *, redis_client: Any = None) -> bool:
+    """seq より新しい要求が記録されていれば True（seq が無い / 分からない時は False）。"""
+    if seq is None:
+        return False
+    latest = latest_seq(session_id, redis_client=redis_client)
+    return latest is not None and latest > seq
+
+
+class StaleCheck:
+    """
+    計算中の中断判定（OSRMClient の abort フックに渡す callable）。
+    - 確認は min_interval_sec に 1 回まで。一度追い越されたら以降は常に True
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        seq: Optional[int],
+        *,
+        min_interval_sec: float = NAV_REROUTE_STALE_CHECK_SEC,
+        redis_client: Any = None,
+    ) -> None:
+        self.session_id = session_id
+        self.seq = seq
+        self.min_interval_sec = min_interval_sec
+        self._redis = redis_client
+        self._checked_at = float("-inf")
+        self.stale = False
+
+    def __call__(self, force: bool = False) -> bool:
+        if self.stale or self.seq is None:
+            return self.stale
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.min_interval_sec:
+            return False
+        self._checked_at = now
+        self.stale = is_superseded(self.session_id, self.seq, redis_client=self._redis)
+        return self.stale
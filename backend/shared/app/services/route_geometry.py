@@ -0,0 +1,197 @@
+# backend/shared/app/services/route_geometry.py
+# [NEW] API/Worker共通：ルート形状の圧縮（encoded polyline, 精度 6）と多段階の簡略化（Douglas-Peucker）。
+#
+# 保存形式（Plan.route_geojson）:
+#   FeatureCollection の構造・properties はそのまま、LineString の座標列だけを
+#     {"type": "LineString", "encoding": "polyline6", "polyline": "<encoded>"}
+#   に置き換える（精度 1e-6 度 ≒ 0.1m のため、ナビの逸脱判定は復号すれば元の精度のまま使える）。
+#   既存の素の GeoJSON 行もそのまま読める。
+
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Sequence
+import copy
+import math
+
+POLYLINE_ENCODING = "polyline6"
+POLYLINE_PRECISION = 6
+
+# 解像度 → Douglas-Peucker の許容誤差（m）。目安: high≒z15+, medium≒z13, low≒z11 以下
+RESOLUTION_TOLERANCES_M: Dict[str, float] = {
+    "full": 0.0,
+    "high": 5.0,
+    "medium": 20.0,
+    "low": 60.0,
+}
+ROUTE_FORMATS = ("geojson", POLYLINE_ENCODING)
+
+_EARTH_RADIUS_M = 6371000.0
+
+
+# ------------------------------------------------------------
+# encoded polyline（Google 形式。座標順は GeoJSON と同じ [lon, lat] で受け渡す）
+# ------------------------------------------------------------
+def _encode_value(v: int, out: List[str]) -> None:
+    v = ~(v << 1) if v < 0 else (v << 1)
+    while v >= 0x20:
+        out.append(chr((0x20 | (v & 0x1F)) + 63))
+        v >>= 5
+    out.append(chr(v + 63))
+
+
+def encode_polyline(coords: Sequence[Sequence[float]], precision: int = POLYLINE_PRECISION) -> str:
+    """[[lon, lat], ...] を encoded polyline 文字列にする（文字列内の順序は lat, lon）。"""
+    factor = 10 ** precision
+    out: List[str] = []
+    prev_lat = prev_lon = 0
+    for c in coords:
+        lat = int(round(float(c[1]) * factor))
+        lon = int(round(float(c[0]) * factor))
+        _encode_value(lat - prev_lat, out)
+        _encode_value(lon - prev_lon, out)
+        prev_lat, prev_lon = lat, lon
+    return "".join(out)
+
+
+def decode_polyline(encoded: str, precision: int = POLYLINE_PRECISION) -> List[List[float]]:
+    """encoded polyline 文字列を [[lon, lat], ...] に戻す。"""
+    factor = float(10 ** precision)
+    coords: List[List[float]] = []
+    idx = lat = lon = 0
+    n = len(encoded)
+    while idx < n:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                b = ord(encoded[idx]) - 63
+                idx += 1
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else (result >> 1))
+        lat += deltas[0]
+        lon += deltas[1]
+        coords.append([lon / factor, lat / factor])
+    return coords
+
+
+# ------------------------------------------------------------
+# Douglas-Peucker
+# ------------------------------------------------------------
+def simplify_coords(coords: Sequence[Sequence[float]], tolerance_m: float) -> List[List[float]]:
+    """
+    [[lon, lat], ...] を許容誤差 tolerance_m（m）で間引く。始点・終点は必ず残す。
+    - 局所的な正距円筒近似で平面に投影して計算する（ルート 1 本の範囲なら十分な精度）
+    - 再帰ではなくスタックで処理する（長いルートでも再帰上限に当たらない）
+    """
+    pts = [list(c) for c in coords]
+    if tolerance_m <= 0 or len(pts) < 3:
+        return pts
+
+    lat0 = math.radians(sum(p[1] for p in pts) / len(pts))
+    kx = math.radians(1.0) * _EARTH_RADIUS_M * math.cos(lat0)
+    ky = math.radians(1.0) * _EARTH_RADIUS_M
+    xy = [(p[0] * kx, p[1] * ky) for p in pts]
+    tol2 = tolerance_m * tolerance_m
+
+    keep = [False] * len(pts)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        ax, ay = xy[first]
+        bx, by = xy[last]
+        dx, dy = bx - ax, by - ay
+        seg2 = dx * dx + dy * dy
+        best_i, best_d2 = -1, -1.0
+        for i in range(first + 1, last):
+            px, py = xy[i]
+            if seg2 == 0:
+                d2 = (px - ax) ** 2 + (py - ay) ** 2
+            else:
+                t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / seg2))
+                d2 = (px - ax - t * dx) ** 2 + (py - ay - t * dy) ** 2
+            if d2 > best_d2:
+                best_i, best_d2 = i, d2
+        if best_d2 > tol2:
+            keep[best_i] = True
+            stack.append((first, best_i))
+            stack.append((best_i, last))
+
+    return [p for p, k in zip(pts, keep) if k]
+
+
+# ------------------------------------------------------------
+# ルート（FeatureCollection / Feature / geometry）の変換
+# ------------------------------------------------------------
+def line_coords(geometry: Optional[Dict[str, Any]]) -> List[List[float]]:
+    """LineString（素の座標列 / polyline6 どちらでも）の [[lon, lat], ...] を返す。それ以外は []。"""
+    if not geometry or geometry.get("type") != "LineString":
+        return []
+    if geometry.get("encoding") == POLYLINE_ENCODING:
+        return decode_polyline(geometry.get("polyline") or "")
+    return [list(c) for c in geometry.get("coordinates") or []]
+
+
+def _map_linestrings(route: Optional[Dict[str, Any]], fn) -> Optional[Dict[str, Any]]:
+    """route の各 LineString geometry を fn(coords) の結果で置き換えた複製を返す。"""
+    if not route:
+        return route
+    out = copy.deepcopy(route)
+
+    def _geom(g: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if g and g.get("type") == "LineString":
+            return fn(line_coords(g))
+        return g
+
+    t = out.get("type")
+    if t == "FeatureCollection":
+        for f in out.get("features") or []:
+            if isinstance(f, dict):
+                f["geometry"] = _geom(f.get("geometry"))
+    elif t == "Feature":
+        out["geometry"] = _geom(out.get("geometry"))
+    else:
+        out = _geom(out)
+    return out
+
+
+def encode_route(route: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """保存用：LineString を polyline6 に圧縮したルートを返す（properties 等は保持）。"""
+    return _map_linestrings(
+        route,
+        lambda coords: {"type": "LineString", "encoding": POLYLINE_ENCODING, "polyline": encode_polyline(coords)},
+    )
+
+
+def decode_route(route: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """保存形式から素の GeoJSON（coordinates 付き）に戻す。素の GeoJSON はそのまま複製を返す。"""
+    return _map_linestrings(route, lambda coords: {"type": "LineString", "coordinates": coords})
+
+
+def render_route(
+    route: Optional[Dict[str, Any]],
+    *,
+    resolution: str = "full",
+    fmt: str = "geojson",
+) -> Optional[Dict[str, Any]]:
+    """
+    配信用：解像度に応じて簡略化し、fmt（geojson / polyline6）の形で返す。
+    - resolution: RESOLUTION_TOLERANCES_M のキー
+    """
+    if resolution not in RESOLUTION_TOLERANCES_M:
+        raise ValueError(f"unknown resolution: {resolution}")
+    if fmt not in ROUTE_FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    tol = RESOLUTION_TOLERANCES_M[resolution]
+
+    def _fn(coords: List[List[float]]) -> Dict[str, Any]:
+        pts = simplify_coords(coords, tol)
+        if fmt == POLYLINE_ENCODING:
+            return {"type": "LineString", "encoding": POLYLINE_ENCODING, "polyline": encode_polyline(pts)}
+        return {"type": "LineString", "coordinates": pts}
+
+    return _map_linestrings(route, _fn)
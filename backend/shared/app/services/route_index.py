@@ -0,0 +1,424 @@
+# backend/shared/app/services/route_index.py
+# [NEW] API/Worker共通：ナビ用のルート形状インデックス（NumPy）。
+#
+# - ルート（FeatureCollection / Feature / LineString / MultiLineString、polyline6 保存形式も可）を
+#   一度だけローカル平面（正距円筒近似, m）に投影し、線分の始点・方向・長さ・累積距離を float64 配列で持つ。
+# - 点との最短距離は全線分を 1 回のベクトル演算で求め、最近傍の線分番号と沿線距離（始点からの m）も返す。
+# - 投影の基準緯度はルート全体の中点。ナビの閾値（数十〜数百 m）に対して誤差は十分小さい。
+# - LineString 同士（レグの境目など）は線分でつながない。
+# - CompiledRoute: RouteGeometry + 線分の一様グリッド + 停留所の沿線位置。
+#   停留所の接近判定用のグリッド（proximity.ProximityIndex）も一緒に持つ。
+#   (plan_id, route_version, 停留所の指紋) をキーにプロセス内 LRU に保持し、位置更新毎のルート解析・全線分走査を省く。
+#   route_version が上がればキーが変わるので、別プロセスで更新されても古い形状は使われない。
+#   停留所の追加・削除・移動（route_version は変わらない）は指紋が変わり、形状はそのままで停留所部分だけ作り直す。
+# - RouteProgress: セッション毎の直前のマッチ位置。次の位置はその前後（沿線距離の窓）から探し、
+#   外れた時だけ全体を探す（往復ルートで復路に飛ばない効果もある）。
+
+from __future__ import annotations
+from dataclasses import dataclass
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+import os
+import threading
+
+import numpy as np
+
+from shared.app.services.proximity import ProximityIndex, ProximityTarget
+from shared.app.services.route_geometry import line_coords
+
+EARTH_RADIUS_M = 6371000.0
+
+# 線分グリッドのセル一辺（m）。逸脱閾値と同程度にすると 1 回の判定で見るセルが 3x3 前後になる
+NAV_ROUTE_GRID_CELL_M = float(os.getenv("NAV_ROUTE_GRID_CELL_M", "150"))
+# コンパイル済みルートを保持する件数（プロセス毎、ナビ中のプラン数の目安）
+NAV_ROUTE_INDEX_CACHE_SIZE = int(os.getenv("NAV_ROUTE_INDEX_CACHE_SIZE", "512"))
+# 逐次マッチの探索窓（直前のマッチ位置から後方 / 前方の沿線距離 m）
+NAV_MATCH_WINDOW_BACK_M = float(os.getenv("NAV_MATCH_WINDOW_BACK_M", "100"))
+NAV_MATCH_WINDOW_AHEAD_M = float(os.getenv("NAV_MATCH_WINDOW_AHEAD_M", "500"))
+
+
+@dataclass(frozen=True)
+class RouteMatch:
+    """点に対するルート上の最近傍。"""
+    distance_m: float      # 点とルートの最短距離
+    segment_index: int     # 最近傍の線分番号（RouteGeometry 内の通し番号）
+    along_m: float         # ルート始点から最近傍点までの沿線距離
+    fraction: float        # 線分内の位置（0=始点, 1=終点）
+
+
+@dataclass(frozen=True)
+class RouteProgress:
+    """セッションのルート上の進捗（直前のマッチ）。route_version が違えば使わない。"""
+    route_version: int
+    segment_index: int
+    along_m: float
+
+    def dumps(self) -> str:
+        return f"{self.route_version}:{self.segment_index}:{self.along_m:.1f}"
+
+    @classmethod
+    def loads(cls, raw: Any) -> Optional["RouteProgress"]:
+        if isinstance(raw, bytes):
+            raw = raw.decode()
+        try:
+            v, i, a = str(raw).split(":")
+            return cls(int(v), int(i), float(a))
+        except (TypeError, ValueError):
+            return None
+
+
+def iter_route_lines(route: Optional[Dict[str, Any]]) -> Iterable[List[List[float]]]:
+    """ルートの各 LineString を [[lon, lat], ...] で列挙する。"""
+    if not route:
+        return
+    t = route.get("type")
+    if t == "FeatureCollection":
+        for f in route.get("features") or []:
+            if isinstance(f, dict):
+                yield from iter_route_lines(f)
+    elif t == "Feature":
+        yield from iter_route_lines(route.get("geometry"))
+    elif t == "LineString":
+        yield line_coords(route)
+    elif t == "MultiLineString":
+        for part in route.get("coordinates") or []:
+            yield [list(c) for c in part]
+
+
+class RouteGeometry:
+    """
+    投影済みのルート形状。座標列（[[lon, lat], ...] のリスト）か from_geojson で作り、nearest / distance_m で引く。
+    """
+
+    def __init__(self, lines: Sequence[Sequence[Sequence[float]]]) -> None:
+        parts = [np.asarray(line, dtype=np.float64).reshape(-1, 2) for line in lines if len(line) > 0]
+        if parts:
+            allpts = np.concatenate(parts)
+            self.lat0 = float((allpts[:, 1].min() + allpts[:, 1].max()) / 2.0)
+            self.lon0 = float((allpts[:, 0].min() + allpts[:, 0].max()) / 2.0)
+        else:
+            self.lat0 = self.lon0 = 0.0
+        self._kx = math.radians(1.0) * EARTH_RADIUS_M * math.cos(math.radians(self.lat0))
+        self._ky = math.radians(1.0) * EARTH_RADIUS_M
+
+        ax: List[np.ndarray] = []
+        ay: List[np.ndarray] = []
+        bx: List[np.ndarray] = []
+        by: List[np.ndarray] = []
+        singles: List[np.ndarray] = []
+        for p in parts:
+            x = (p[:, 0] - self.lon0) * self._kx
+            y = (p[:, 1] - self.lat0) * self._ky
+            if len(p) == 1:
+                singles.append(np.array([x[0], y[0]]))
+                continue
+            ax.append(x[:-1]); ay.append(y[:-1]); bx.append(x[1:]); by.append(y[1:])
+        if not ax and singles:
+            # 線分が無く点だけのルートは、長さ 0 の線分として扱う
+            pt = singles[0]
+            ax, ay, bx, by = [pt[:1]], [pt[1:]], [pt[:1]], [pt[1:]]
+
+        self.ax = np.concatenate(ax) if ax else np.empty(0)
+        self.ay = np.concatenate(ay) if ay else np.empty(0)
+        self.dx = (np.concatenate(bx) if bx else np.empty(0)) - self.ax
+        self.dy = (np.concatenate(by) if by else np.empty(0)) - self.ay
+        self.len2 = self.dx * self.dx + self.dy * self.dy
+        self.seg_len = np.sqrt(self.len2)
+        # cum[i] = 線分 i の始点までの沿線距離
+        self.cum = np.concatenate(([0.0], np.cumsum(self.seg_len)[:-1])) if len(self.seg_len) else np.empty(0)
+        self._inv_len2 = np.divide(1.0, self.len2, out=np.zeros_like(self.len2), where=self.len2 > 0)
+
+    @classmethod
+    def from_geojson(cls, route: Optional[Dict[str, Any]]) -> "RouteGeometry":
+        return cls(list(iter_route_lines(route)))
+
+    @property
+    def empty(self) -> bool:
+        return len(self.ax) == 0
+
+    @property
+    def n_segments(self) -> int:
+        return len(self.ax)
+
+    @property
+    def length_m(self) -> float:
+        return float(self.seg_len.sum()) if len(self.seg_len) else 0.0
+
+    def project(self, lat: float, lon: float) -> tuple[float, float]:
+        """(lat, lon) をこのルートの平面座標 (x, y)[m] にする。"""
+        return (lon - self.lon0) * self._kx, (lat - self.lat0) * self._ky
+
+    def _match(self, px: float, py: float, sel: Any = slice(None)) -> Optional[RouteMatch]:
+        """sel（slice または線分番号の配列）の範囲で最近傍を求める。"""
+        ax, ay, dx, dy = self.ax[sel], self.ay[sel], self.dx[sel], self.dy[sel]
+        if len(ax) == 0:
+            return None
+        wx = px - ax
+        wy = py - ay
+        t = np.clip((wx * dx + wy * dy) * self._inv_len2[sel], 0.0, 1.0)
+        ex = wx - t * dx
+        ey = wy - t * dy
+        d2 = ex * ex + ey * ey
+        k = int(np.argmin(d2))
+        i = int(sel[k]) if isinstance(sel, np.ndarray) else k + (sel.start or 0)
+        tk = float(t[k])
+        return RouteMatch(
+            distance_m=float(math.sqrt(d2[k])),
+            segment_index=i,
+            along_m=float(self.cum[i] + tk * self.seg_len[i]),
+            fraction=tk,
+        )
+
+    def nearest(self, lat: float, lon: float) -> Optional[RouteMatch]:
+        """全線分から最近傍を求める。ルートが空なら None。"""
+        px, py = self.project(lat, lon)
+        return self._match(px, py)
+
+    def distance_m(self, lat: float, lon: float) -> Optional[float]:
+        m = self.nearest(lat, lon)
+        return m.distance_m if m is not None else None
+
+
+class SegmentGrid:
+    """線分の外接矩形を一様グリッドに登録した索引（セル → 線分番号の配列）。"""
+
+    def __init__(self, geometry: RouteGeometry, cell_m: float = NAV_ROUTE_GRID_CELL_M) -> None:
+        self.cell_m = max(1.0, float(cell_m))
+        buckets: Dict[Tuple[int, int], List[int]] = {}
+        if not geometry.empty:
+            bx = geometry.ax + geometry.dx
+            by = geometry.ay + geometry.dy
+            x0 = np.floor(np.minimum(geometry.ax, bx) / self.cell_m).astype(np.int64)
+            x1 = np.floor(np.maximum(geometry.ax, bx) / self.cell_m).astype(np.int64)
+            y0 = np.floor(np.minimum(geometry.ay, by) / self.cell_m).astype(np.int64)
+            y1 = np.floor(np.maximum(geometry.ay, by) / self.cell_m).astype(np.int64)
+            for i in range(geometry.n_segments):
+                for cx in range(int(x0[i]), int(x1[i]) + 1):
+                    for cy in range(int(y0[i]), int(y1[i]) + 1):
+                        buckets.setdefault((cx, cy), []).append(i)
+        self.cells: Dict[Tuple[int, int], np.ndarray] = {
+            k: np.asarray(v, dtype=np.int64) for k, v in buckets.items()
+        }
+
+    def candidates(self, px: float, py: float, radius_m: float) -> np.ndarray:
+        """点 (px, py) から radius_m 以内に掛かり得る線分番号（重複なし）。"""
+        c = self.cell_m
+        cx0, cx1 = int(math.floor((px - radius_m) / c)), int(math.floor((px + radius_m) / c))
+        cy0, cy1 = int(math.floor((py - radius_m) / c)), int(math.floor((py + radius_m) / c))
+        found = [
+            self.cells[(cx, cy)]
+            for cx in range(cx0, cx1 + 1)
+            for cy in range(cy0, cy1 + 1)
+            if (cx, cy) in self.cells
+        ]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found)) if len(found) > 1 else found[0]
+
+
+StopsKey = Tuple[Tuple[Any, float, float], ...]
+
+
+def stops_fingerprint(stops: Iterable[Tuple[Any, float, float]]) -> StopsKey:
+    """停留所 [(stop_id, lat, lon), ...] の指紋（キャッシュキー用。座標は 1e-6 度に丸める）。"""
+    return tuple((stop_id, round(float(lat), 6), round(float(lon), 6)) for stop_id, lat, lon in stops)
+
+
+class CompiledRoute:
+    """
+    ナビ判定用にコンパイルしたルート（plan_id / route_version / 停留所の組で不変）。
+    - geometry: 投影済み線分と累積距離（RouteGeometry）
+    - grid:     線分グリッド（近傍だけを調べる）
+    - stop_along_m: {stop_id: 停留所スポットをルートに投影した沿線距離}
+    - proximity: 停留所の接近判定索引（キーは "stop:<stop_id>"、data に stop_id）
+    """
+
+    def __init__(
+        self,
+        plan_id: Any,
+        route_version: Any,
+        route_geojson: Optional[Dict[str, Any]],
+        stops: Iterable[Tuple[Any, float, float]] = (),
+        *,
+        cell_m: float = NAV_ROUTE_GRID_CELL_M,
+    ) -> None:
+        self.plan_id = plan_id
+        self.route_version = route_version
+        self.geometry = RouteGeometry.from_geojson(route_geojson)
+        self.grid = SegmentGrid(self.geometry, cell_m)
+        self._set_stops(stops)
+
+    def with_stops(self, stops: Iterable[Tuple[Any, float, float]]) -> "CompiledRoute":
+        """形状・グリッドを共有し、停留所の部分（沿線位置 / 接近判定索引）だけを作り直した複製。"""
+        out = object.__new__(CompiledRoute)
+        out.plan_id = self.plan_id
+        out.route_version = self.route_version
+        out.geometry = self.geometry
+        out.grid = self.grid
+        out._set_stops(stops)
+        return out
+
+    def _set_stops(self, stops: Iterable[Tuple[Any, float, float]]) -> None:
+        self.stop_along_m: Dict[Any, float] = {}
+        targets: List[ProximityTarget] = []
+        for stop_id, lat, lon in stops:
+            m = self.geometry.nearest(float(lat), float(lon))
+            if m is not None:
+                self.stop_along_m[stop_id] = m.along_m
+            targets.append(ProximityTarget(key=f"stop:{stop_id}", lat=float(lat), lon=float(lon), data={"stop_id": stop_id}))
+        self.proximity = ProximityIndex(targets)
+
+    @property
+    def empty(self) -> bool:
+        return self.geometry.empty
+
+    @property
+    def length_m(self) -> float:
+        return self.geometry.length_m
+
+    def nearest(self, lat: float, lon: float, radius_m: Optional[float] = None) -> Optional[RouteMatch]:
+        """
+        最近傍。まず半径 radius_m（未指定ならセル一辺）に掛かるセルの線分だけを調べ、
+        その中で半径以内に見つかればそれが全体の最近傍。見つからなければ全線分を調べる。
+        """
+        if self.geometry.empty:
+            return None
+        px, py = self.geometry.project(lat, lon)
+        r = self.grid.cell_m if radius_m is None else max(0.0, float(radius_m))
+        cand = self.grid.candidates(px, py, r)
+        if len(cand):
+            m = self.geometry._match(px, py, cand)
+            if m is not None and m.distance_m <= r:
+                return m
+        return self.geometry._match(px, py)
+
+    def distance_m(self, lat: float, lon: float, radius_m: Optional[float] = None) -> Optional[float]:
+        m = self.nearest(lat, lon, radius_m)
+        return m.distance_m if m is not None else None
+
+    def match(
+        self,
+        lat: float,
+        lon: float,
+        radius_m: float,
+        last: Optional[RouteProgress] = None,
+        *,
+        back_m: float = NAV_MATCH_WINDOW_BACK_M,
+        ahead_m: float = NAV_MATCH_WINDOW_AHEAD_M,
+    ) -> Optional[RouteMatch]:
+        """
+        逐次マッチ。last（同じ route_version の直前マッチ）があれば、その沿線距離の
+        [-back_m, +ahead_m] に掛かる線分だけを調べ、radius_m 以内ならそれを採用する。
+        窓で見つからない / last が無い場合は nearest と同じ（グリッド → 全体）。
+        """
+        if self.geometry.empty:
+            return None
+        if last is not None and last.route_version == self.route_version:
+            cum = self.geometry.cum
+            lo = max(0, int(np.searchsorted(cum, last.along_m - back_m, side="right")) - 1)
+            hi = int(np.searchsorted(cum, last.along_m + ahead_m, side="right"))
+            if hi > lo:
+                px, py = self.geometry.project(lat, lon)
+                m = self.geometry._match(px, py, slice(lo, hi))
+                if m is not None and m.distance_m <= radius_m:
+                    return m
+        return self.nearest(lat, lon, radius_m)
+
+    def progress(self, match: RouteMatch, next_stop_id: Any = None) -> Dict[str, Any]:
+        """マッチ位置の進捗（ETA 計算用）。next_stop_id があれば次の停留所までの残り沿線距離も返す。"""
+        length = self.length_m
+        out: Dict[str, Any] = {
+            "along_m": round(match.along_m, 1),
+            "route_length_m": round(length, 1),
+            "remaining_m": round(max(0.0, length - match.along_m), 1),
+            "fraction": round(match.along_m / length, 4) if length > 0 else 0.0,
+        }
+        stop_along = self.stop_along_m.get(next_stop_id) if next_stop_id is not None else None
+        if stop_along is not None:
+            out["next_stop_remaining_m"] = round(max(0.0, stop_along - match.along_m), 1)
+        return out
+
+
+class CompiledRouteCache:
+    """(plan_id, route_version, 停留所の指紋) → CompiledRoute の上限付き LRU（スレッドセーフ）。"""
+
+    def __init__(self, max_entries: int = NAV_ROUTE_INDEX_CACHE_SIZE) -> None:
+        self.max_entries = max(1, max_entries)
+        self._lru: "OrderedDict[Tuple[Any, Any, StopsKey], CompiledRoute]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"hits": 0, "misses": 0, "restops": 0, "invalidations": 0}
+
+    def get(
+        self,
+        plan_id: Any,
+        route_version: Any,
+        load: Callable[[], Optional[Dict[str, Any]]],
+        stops: Iterable[Tuple[Any, float, float]] = (),
+    ) -> CompiledRoute:
+        """
+        キャッシュにあればそれを返し、無ければ load() → route_geojson と stops [(stop_id, lat, lon), ...] から作る。
+        - load はルート形状が無い時にしか呼ばれない（呼び出し側は route_geojson の読み出しを遅延させておける）
+        - 同じ版で停留所だけが変わった時は、形状を読み直さずに停留所の部分だけを作り直す
+        """
+        stops = list(stops)
+        key = (plan_id, route_version, stops_fingerprint(stops))
+        with self._lock:
+            hit = self._lru.get(key)
+            if hit is not None:
+                self._lru.move_to_end(key)
+                self._stats["hits"] += 1
+                return hit
+            self._stats["misses"] += 1
+            same_version = next((v for k, v in self._lru.items() if k[:2] == key[:2]), None)
+
+        if same_version is not None:
+            compiled = same_version.with_stops(stops)
+            with self._lock:
+                self._stats["restops"] += 1
+        else:
+            compiled = CompiledRoute(plan_id, route_version, load(), stops)
+        with self._lock:
+            # 同じプランの古い版・古い停留所の組は不要
+            for k in [k for k in self._lru if k[0] == plan_id and k != key]:
+                del self._lru[k]
+            self._lru[key] = compiled
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+        return compiled
+
+    def invalidate(self, plan_id: Any) -> None:
+        with self._lock:
+            for k in [k for k in self._lru if k[0] == plan_id]:
+                del self._lru[k]
+                self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._lru)}
+
+
+_CACHE = CompiledRouteCache()
+
+
+def get_compiled_route(
+    plan_id: Any,
+    route_version: Any,
+    load: Callable[[], Optional[Dict[str, Any]]],
+    stops: Iterable[Tuple[Any, float, float]] = (),
+) -> CompiledRoute:
+    """プロセス共有キャッシュからコンパイル済みルートを得る（load は route_geojson を返す）。"""
+    return _CACHE.get(plan_id, route_version, load, stops)
+
+
+def invalidate_compiled_route(plan_id: Any) -> None:
+    """プランのコンパイル済みルートを破棄する（route_version 更新時。他プロセスはキーの版違いで自然に切り替わる）。"""
+    _CACHE.invalidate(plan_id)
+
+
+def compiled_route_cache_stats() -> Dict[str, int]:
+    return _CACHE.stats()
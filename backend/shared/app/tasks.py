@@ -22,6 +22,8 @@ from typing import Any, Dict, List, Tuple, Optional
 from sqlalchemy import create_engine, text
 from pydantic import BaseModel, Field, ValidationError
 
+from shared.app.services.reroute_coalesce import register_request
+
 # 既存の Celery アプリ（shared 内）を再利用
 try:
     from shared.app.celery_app import celery_app  # [KEPT]
@@ -47,6 +49,9 @@ TASK_TTS_SYNTHESIZE: str = "voice.tts_synthesize"
 TASK_ROUTING_GET_DISTANCE_AND_DURATION: str = "routing.get_distance_and_duration"
 TASK_ROUTING_CALC_FULL_ITINERARY: str = "routing.calculate_full_itinerary_route"
 TASK_ROUTING_CALCULATE_REROUTE: str = "routing.calculate_reroute"
+TASK_ROUTING_CACHE_STATS: str = "routing.cache_stats"
+TASK_ROUTING_WARMUP: str = "routing.warmup_popular_legs"  # celery_app の beat_schedule から夜間に起動
+TASK_ROUTING_PRUNE_LEGS: str = "routing.prune_route_legs"  # celery_app の beat_schedule から日次で起動
 
 # --- Maintenance / Materialized View Refresh ---
 # 既存互換のため、名称は従来のものを維持（他所から参照されている可能性がある）
@@ -70,6 +75,8 @@ class RerouteTaskPayload(BaseModel):
     origin_lon: float
     target_stop_id: Optional[int] = None
     base_route_version: Optional[int] = None
+    # 後勝ち合流の連番（reroute_coalesce.register_request。Redis が無ければ None）
+    seq: Optional[int] = None
   
 # =========================================================
 # enqueue 用ユーティリティ
@@ -87,6 +94,7 @@ def enqueue_reroute(
     - shared 側で payload バリデーションを行い（Pydantic）
     - Celery ブローカーへ送信する
     - ブローカー未接続 / Celery 未初期化時は False を返す（呼び出し元でデバウンス済みのため影響最小）
+    - 送信前にセッションの最新要求として記録し（連番 seq）、古い要求のタスクは Worker 側で捨てる
     """
     try:
         payload = RerouteTaskPayload(
@@ -102,6 +110,7 @@ def enqueue_reroute(
     if celery_app is None:
         return False
 
+    payload["seq"] = register_request(session_id)
     try:
         celery_app.send_task(TASK_NAV_REROUTE, args=[payload])
         return True
@@ -184,7 +193,8 @@ def routing_calculate_full_itinerary_route(self, payload: Dict[str, Any]) -> Dic
       {
         "waypoints": [{"lat": float, "lon": float}, ...],  # 2点以上
         "profile": "car" | "foot",
-        "piston": bool
+        "piston": bool,
+        "detail": "full" | "simplified"   # 任意（既定 full。表示だけなら simplified で応答が小さくなる）
       }
     戻り値:
       {"geojson": dict, "distance_km": float, "duration_min": float}
@@ -195,8 +205,9 @@ def routing_calculate_full_itinerary_route(self, payload: Dict[str, Any]) -> Dic
     waypoints = [(float(c["lat"]), float(c["lon"])) for c in payload["waypoints"]]
     profile = payload["profile"]
     piston = bool(payload.get("piston", False))
+    detail = payload.get("detail") or "full"
 
-    result = svc.calculate_full_itinerary_route(waypoints, profile, piston=piston)
+    result = svc.calculate_full_itinerary_route(waypoints, profile, piston=piston, detail=detail)
     return result
 
 
@@ -221,3 +232,65 @@ def routing_calculate_reroute(self, payload: Dict[str, Any]) -> Dict[str, Any]:
 
     result = svc.calculate_reroute(current_location, remaining_waypoints, profile)
     return result
+
+
+@celery_app.task(name=TASK_ROUTING_CACHE_STATS, bind=True)
+def routing_cache_stats(self) -> Dict[str, Any]:
+    """
+    実行したワーカープロセスのレグ経路キャッシュ統計と、OSRM レプリカのブレーカー状態/トリップ回数を返す。
+    戻り値:
+      {"enabled": bool, "lru_hits": int, "redis_hits": int, "misses": int, "stores": int,
+       "redis_errors": int, "lru_size": int, "hit_ratio": float, "dataset_version": str,
+       "store": {"hits": int, "misses": int, "stores": int, "errors": int, ...} | None,
+       "osrm": [{"profile": str, "rejected": int,
+                 "replicas": [{"base_url", "state", "trips", "successes", "failures", "hedges", "p95_ms", ...}]}],
+       "snaps": {"size": int, "hinted": int, "rejected": int, ...} | None}
+    """
+    from worker.app.services.routing.backends import backend_metrics  # type: ignore
+    from worker.app.services.routing.leg_cache import get_leg_cache  # type: ignore
+    from worker.app.services.routing.leg_store import get_leg_store  # type: ignore
+    from worker.app.services.routing.snapping import get_snap_index  # type: ignore
+
+    cache = get_leg_cache()
+    store = get_leg_store()
+    out: Dict[str, Any] = {"enabled": cache is not None, **(cache.stats() if cache else {})}
+    out["store"] = store.stats() if store else None
+    out["osrm"] = backend_metrics()
+    snaps = get_snap_index()
+    out["snaps"] = snaps.stats() if snaps else None
+    return out
+
+
+@celery_app.task(name=TASK_ROUTING_WARMUP, bind=True, acks_late=True)
+def routing_warmup_popular_legs(self, top_n: Optional[int] = None) -> Dict[str, Any]:
+    """
+    人気上位スポット間の car / foot / hybrid レグを事前計算し、キャッシュと route_legs に載せる。
+    - OSRM へのリクエストは ROUTE_WARMUP_RATE_PER_SEC 件/秒に制限
+    戻り値:
+      {"spots": int, "pairs": int, "legs": int, "errors": int, "osrm_requests": int, "elapsed_sec": float}
+    """
+    from shared.app.database import SessionLocal
+    from worker.app.services.routing.routing_service import RoutingService  # type: ignore
+    from worker.app.services.routing.warmup import ROUTE_WARMUP_TOP_N, run_warmup  # type: ignore
+
+    db = SessionLocal()
+    try:
+        return run_warmup(db, RoutingService(), top_n=top_n or ROUTE_WARMUP_TOP_N)
+    finally:
+        db.close()
+
+
+@celery_app.task(name=TASK_ROUTING_PRUNE_LEGS, bind=True, acks_late=True)
+def routing_prune_route_legs(self, max_idle_days: Optional[float] = None) -> Dict[str, Any]:
+    """
+    route_legs から last_used_at が ROUTE_LEG_RETENTION_DAYS 日より古い行を削除する。
+    戻り値:
+      {"enabled": bool, "deleted": int, "max_idle_days": float}
+    """
+    from worker.app.services.routing.leg_store import ROUTE_LEG_RETENTION_DAYS, get_leg_store  # type: ignore
+
+    days = float(max_idle_days if max_idle_days is not None else ROUTE_LEG_RETENTION_DAYS)
+    store = get_leg_store()
+    if store is None:
+        return {"enabled": False, "deleted": 0, "max_idle_days": days}
+    return {"enabled": True, "deleted": store.prune(days), "max_idle_days": days}
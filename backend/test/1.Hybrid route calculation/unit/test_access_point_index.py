@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import random
+
+from worker.app.services.navigation.geospatial_utils import haversine_distance_m
+from worker.app.services.routing.access_point_index import AccessPointIndex
+
+
+def _rows(n=200, seed=7):
+    rnd = random.Random(seed)
+    return [
+        (i, f"AP{i}", rnd.choice(["parking", "trailhead"]), 38.9 + rnd.random() * 0.5, 139.8 + rnd.random() * 0.5)
+        for i in range(1, n + 1)
+    ]
+
+
+def _km(lat1, lon1, lat2, lon2):
+    return haversine_distance_m(lat1, lon1, lat2, lon2) / 1000.0
+
+
+def _brute(rows, lat, lon, max_km=None):
+    best = min(rows, key=lambda r: (_km(lat, lon, r[3], r[4]), r[0]))
+    if max_km is not None and _km(lat, lon, best[3], best[4]) > max_km:
+        return None
+    return best
+
+
+def test_grid_matches_bruteforce():
+    rows = _rows()
+    idx = AccessPointIndex(cell_deg=0.02)
+    idx.load_rows(rows)
+    rnd = random.Random(1)
+    for _ in range(300):
+        lat = 38.7 + rnd.random() * 0.9
+        lon = 139.6 + rnd.random() * 0.9
+        max_km = rnd.choice([None, 0.5, 2.0, 20.0])
+        assert idx.nearest(lat, lon, max_km=max_km) == _brute(rows, lat, lon, max_km)
+
+
+class _FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+
+class _FakeDb:
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = 0
+
+    def execute(self, stmt, params=None):
+        if "md5" in str(stmt):
+            return _FakeResult([(len(self.rows), str(hash(tuple(self.rows))))])
+        self.loads += 1
+        return _FakeResult(self.rows)
+
+
+def test_refreshes_only_when_table_changes():
+    db = _FakeDb(_rows(10))
+    idx = AccessPointIndex(refresh_sec=0.0)
+    assert idx.ensure_fresh(db) and db.loads == 1
+    assert idx.ensure_fresh(db) and db.loads == 1  # 指紋が同じなら再読込しない
+
+    db.rows = db.rows + [(99, "NEW", "parking", 39.0, 140.0)]
+    assert idx.ensure_fresh(db) and db.loads == 2
+    assert idx.nearest(39.0, 140.0)[0] == 99
+
+
+def test_unloadable_index_reports_unavailable():
+    class _Broken:
+        def execute(self, *a, **k):
+            raise RuntimeError("no table")
+
+    assert AccessPointIndex().ensure_fresh(_Broken()) is False
+
+
+def test_failed_load_rolls_back_to_savepoint():
+    events = []
+
+    class _Savepoint:
+        def __enter__(self):
+            events.append("savepoint")
+
+        def __exit__(self, exc_type, exc, tb):
+            events.append("rollback" if exc_type else "release")
+            return False
+
+    class _Session:
+        def begin_nested(self):
+            return _Savepoint()
+
+        def execute(self, *a, **k):
+            raise RuntimeError("function md5 does not exist")
+
+    # 呼び出し側のトランザクションはセーブポイントまで戻り、PostGIS フォールバックを続けられる
+    assert AccessPointIndex().ensure_fresh(_Session()) is False
+    assert events == ["savepoint", "rollback"]
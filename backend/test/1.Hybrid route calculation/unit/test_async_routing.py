@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+from worker.app.services.routing import client as osrm_client
+from worker.app.services.routing.async_client import AsyncOSRMClient
+from worker.app.services.routing.leg_engine import LegSpec
+from worker.app.services.routing.routing_service import RoutingService
+
+A = (39.10, 140.05)
+B = (39.12, 140.06)
+C = (39.14, 140.08)
+
+
+@pytest.fixture(autouse=True)
+def _replicas(monkeypatch):
+    monkeypatch.setenv("OSRM_CAR_HOSTS", "http://car-a:5000,http://car-b:5000")
+    osrm_client.reset_http_sessions()
+    yield
+    osrm_client.reset_http_sessions()
+
+
+def test_async_client_fails_over_and_parses_table():
+    hosts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        if request.url.host == "car-a":
+            return httpx.Response(503, text="restarting")
+        if request.url.path.startswith("/table/"):
+            return httpx.Response(200, json={
+                "code": "Ok", "durations": [[600.0, 1200.0]], "distances": [[5000.0, 9000.0]],
+            })
+        return httpx.Response(200, json={"code": "Ok", "routes": [{"distance": 2500.0, "duration": 300.0}]})
+
+    async def run():
+        async with AsyncOSRMClient(backoff_sec=0, transport=httpx.MockTransport(handler)) as c:
+            c.snap_index = None
+            dist = await c.fetch_distance_and_duration(A, B, "car")
+            table = await c.fetch_table([A], [B, C], "car")
+            return dist, table
+
+    dist, (km, mins) = asyncio.run(run())
+    assert dist == (2.5, 5.0)
+    assert km == [[5.0, 9.0]] and mins == [[10.0, 20.0]]
+    assert "car-b" in hosts
+
+
+class _FakeSnapIndex:
+    def __init__(self):
+        self.rejected = 0
+
+    def hints_param(self, profile, coords):
+        return "h1;h2"
+
+    def mark_rejected(self):
+        self.rejected += 1
+
+
+@pytest.mark.parametrize("body,resent", [
+    ({"code": "InvalidValue", "message": "Hint parameter is invalid"}, True),
+    ({"code": "NoRoute", "message": "Impossible route between points"}, False),
+])
+def test_async_client_resends_without_hints_only_on_hint_errors(body, resent):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        hinted = "hints" in request.url.params
+        seen.append(hinted)
+        if hinted:
+            return httpx.Response(400, json=body)
+        return httpx.Response(200, json={"code": "Ok", "routes": [{"distance": 2500.0, "duration": 300.0}]})
+
+    snap = _FakeSnapIndex()
+
+    async def run():
+        async with AsyncOSRMClient(backoff_sec=0, transport=httpx.MockTransport(handler)) as c:
+            c.snap_index = snap
+            return await c.fetch_distance_and_duration(A, B, "car")
+
+    if resent:
+        assert asyncio.run(run()) == (2.5, 5.0)
+        assert seen == [True, False] and snap.rejected == 1
+    else:
+        with pytest.raises(osrm_client.OSRMClientError):
+            asyncio.run(run())
+        assert seen == [True] and snap.rejected == 0
+
+
+class _GatedClient:
+    """n 本の fetch_route が同時に待つまで誰も返さない（逐次なら timeout）。"""
+
+    def __init__(self, n):
+        self.n = n
+        self.inflight = 0
+        self.gate = asyncio.Event()
+
+    async def fetch_route(self, waypoints, profile, piston=False, detail="full"):
+        self.inflight += 1
+        if self.inflight >= self.n:
+            self.gate.set()
+        await asyncio.wait_for(self.gate.wait(), timeout=2.0)
+        fc = {"type": "FeatureCollection", "features": []}
+        return fc, 1.0, 2.0
+
+
+def test_async_facade_computes_legs_concurrently():
+    rs = RoutingService(speculative=False)
+    rs.cache = None
+    rs.store = None
+    specs = [LegSpec(origin=A, dest=B), LegSpec(origin=B, dest=C), LegSpec(origin=C, dest=A)]
+
+    async def run():
+        routing = rs.async_facade(client=_GatedClient(len(specs)))
+        # spot_id なし / 直行可の判定だけにする
+        return await routing.compute_hybrid_legs(None, [
+            LegSpec(origin=s.origin, dest=s.dest, dest_spot_type="parking") for s in specs
+        ])
+
+    outcomes = asyncio.run(run())
+    assert [o.index for o in outcomes] == [0, 1, 2]
+    assert all(o.ok and o.result["used_ap"] is None for o in outcomes)
+
+
+class _ThreadRecordingStore:
+    """永続ストアの get / put がどのスレッドで呼ばれたかを記録する。"""
+
+    def __init__(self):
+        self.threads = []
+
+    def get(self, *args, **kwargs):
+        self.threads.append(threading.get_ident())
+        return None
+
+    def put(self, *args, **kwargs):
+        self.threads.append(threading.get_ident())
+
+
+def test_async_facade_keeps_store_io_off_the_event_loop():
+    rs = RoutingService(speculative=False)
+    rs.cache = None
+    rs.store = _ThreadRecordingStore()
+
+    async def run():
+        routing = rs.async_facade(client=_GatedClient(1))
+        await routing.calculate_full_itinerary_route([A, B], "car")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert len(rs.store.threads) == 2
+    assert loop_thread not in rs.store.threads
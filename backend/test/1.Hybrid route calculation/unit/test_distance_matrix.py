@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from worker.app.services.routing.client import OSRMClient
+from worker.app.services.routing.routing_service import RoutingService
+
+A = (39.10, 140.05)
+B = (39.12, 140.06)
+C = (39.14, 140.08)
+
+
+def test_fetch_table_dedups_coords_and_converts_units(monkeypatch):
+    seen = {}
+
+    def fake_table(self, profile, coords, sources, destinations):
+        seen.update(coords=coords, sources=sources, destinations=destinations)
+        # sources=[A,B] destinations=[B,C] → coords=[A,B,C]
+        return {
+            "code": "Ok",
+            "durations": [[600.0, 1200.0], [0.0, None]],
+            "distances": [[5000.0, 9000.0], [0.0, None]],
+        }
+
+    monkeypatch.setattr(OSRMClient, "_table_request", fake_table)
+    dist_km, dur_min = OSRMClient().fetch_table([A, B], [B, C], "car")
+
+    assert seen["coords"] == [A, B, C]
+    assert seen["sources"] == [0, 1] and seen["destinations"] == [1, 2]
+    assert dist_km == [[5.0, 9.0], [0.0, None]]
+    assert dur_min == [[10.0, 20.0], [0.0, None]]
+
+
+def test_pair_distances_single_request(monkeypatch):
+    calls = []
+
+    def fake_matrix(self, origins, destinations, profile):
+        calls.append((origins, destinations, profile))
+        return {
+            "distances_km": [[1.0, 2.0], [3.0, None]],
+            "durations_min": [[10.0, 20.0], [30.0, None]],
+        }
+
+    monkeypatch.setattr(RoutingService, "get_distance_matrix", fake_matrix)
+    out = RoutingService().get_pair_distances([(A, B), (B, C), (A, C)], "car")
+
+    assert len(calls) == 1
+    assert calls[0][0] == [A, B] and calls[0][1] == [B, C]
+    assert out[0] == {"distance_km": 1.0, "duration_min": 10.0}
+    assert out[1] is None
+    assert out[2] == {"distance_km": 2.0, "duration_min": 20.0}
+
+
+def test_distance_only_route_request_skips_geometry(monkeypatch, osrm_response):
+    import requests
+
+    from worker.app.services.routing import client as osrm_client
+
+    seen = {}
+
+    def fake_get(self, url, params=None, timeout=None):
+        seen.update(params)
+        return osrm_response(200, {"code": "Ok", "routes": [{"distance": 2500.0, "duration": 300.0, "legs": []}]})
+
+    osrm_client.reset_http_sessions()
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    client = OSRMClient()
+    client.snap_index = None  # hints は付けない
+    assert client.fetch_distance_and_duration(A, B, "car") == (2.5, 5.0)
+    assert seen["overview"] == "false"
+    assert "geometries" not in seen and "annotations" not in seen
+    osrm_client.reset_http_sessions()
+
+
+def test_invalid_json_raises_client_error_without_orjson(monkeypatch):
+    import pytest
+
+    from worker.app.services.routing import client
+
+    monkeypatch.setattr(client, "orjson", None)
+    with pytest.raises(client.OSRMClientError):
+        client.decode_json_bytes(b'{"code": "Ok"')
+    assert client.decode_json_bytes(b'{"code": "Ok"}') == {"code": "Ok"}
+
+
+def test_matrix_summary_reports_unresolved_legs(monkeypatch):
+    from worker.app.services.itinerary import itinerary_service as its
+
+    monkeypatch.setattr(its, "lookup_spot_access", lambda db, spot_id, ap_max_km: None)
+    monkeypatch.setattr(its, "is_car_direct_accessible", lambda kind, tags: True)
+
+    class _Routing:
+        def get_pair_distances(self, pairs, profile):
+            if profile == "foot":
+                raise RuntimeError("foot table down")
+            return [{"distance_km": 1.0, "duration_min": 10.0} if p == (A, B) else None for p in pairs]
+
+    legs, total_min = its._summarize_legs_by_matrix(None, _Routing(), [A, B, C], [("", None)] * 3, [1, 2, 3])
+
+    assert legs[0]["distance_km"] == 1.0 and "error" not in legs[0]
+    # car で解決できず foot の /table も落ちた区間は 0km ではなくエラー扱い、合計にも入れない
+    assert legs[1]["distance_km"] is None and legs[1]["error"] == "foot table down"
+    assert total_min == 10.0
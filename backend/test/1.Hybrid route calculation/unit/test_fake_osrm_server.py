@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+import pytest
+
+from scripts.fake_osrm_server import FakeOSRMServer
+from worker.app.services.routing import client as osrm_client
+from worker.app.services.routing.client import OSRMClient
+
+A = (39.10, 140.05)
+B = (39.12, 140.06)
+C = (39.14, 140.08)
+
+
+def _client(**kw):
+    c = OSRMClient(backoff_sec=0, **kw)
+    c.snap_index = None
+    return c
+
+
+def test_route_legs_table_and_nearest_match_osrm_shapes(fake_osrm):
+    c = _client()
+
+    legs = c.fetch_route_legs([A, B, C], "car")
+    assert len(legs) == 2
+    first = legs[0][0]["features"][0]["geometry"]["coordinates"]
+    second = legs[1][0]["features"][0]["geometry"]["coordinates"]
+    # 大円の補間形状が waypoint でつながる（[lon, lat]）
+    assert first[0] == pytest.approx([A[1], A[0]]) and first[-1] == second[0]
+    assert second[-1] == pytest.approx([C[1], C[0]])
+
+    km, mins = c.fetch_distance_and_duration(A, C, "car")
+    assert km == pytest.approx(legs[0][1] + legs[1][1], rel=0.05)
+    assert mins == pytest.approx(km / 40.0 * 60.0)
+
+    dist, dur = c.fetch_table([A], [B, C], "foot")
+    assert dist[0][0] < dist[0][1] and dur[0][0] == pytest.approx(dist[0][0] / 4.5 * 60.0)
+
+    snap = c.fetch_nearest(B, "foot")
+    assert (snap["lat"], snap["lon"]) == B and snap["hint"]
+    assert fake_osrm["car"].requests["route"] == 2 and fake_osrm["foot"].requests["table"] == 1
+
+
+def test_injected_errors_fail_over_to_healthy_replica(monkeypatch):
+    with FakeOSRMServer("car", error_rate=1.0) as bad, FakeOSRMServer("car") as good:
+        monkeypatch.setenv("OSRM_CAR_HOSTS", f"{bad.url},{good.url}")
+        osrm_client.reset_http_sessions()
+        try:
+            c = _client()
+            for _ in range(4):
+                c.fetch_distance_and_duration(A, B, "car")
+            good.fail_next(1)
+            c.fetch_distance_and_duration(A, B, "car")
+        finally:
+            osrm_client.reset_http_sessions()
+    assert bad.requests["errors"] >= 1
+    assert good.requests["errors"] == 1 and good.requests["route"] >= 4
+
+
+def test_latency_overlaps_across_async_requests(fake_osrm):
+    from worker.app.services.routing.async_client import AsyncOSRMClient
+
+    fake_osrm["car"].latency_ms = 200
+
+    async def run():
+        async with AsyncOSRMClient(backoff_sec=0) as c:
+            c.snap_index = None
+            return await asyncio.gather(*(c.fetch_distance_and_duration(A, B, "car") for _ in range(8)))
+
+    t0 = time.monotonic()
+    results = asyncio.run(run())
+    assert len(results) == 8
+    # 逐次なら 1.6 秒かかる
+    assert time.monotonic() - t0 < 1.0
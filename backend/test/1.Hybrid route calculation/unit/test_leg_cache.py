@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from worker.app.services.routing.client import OSRMClient
+from worker.app.services.routing.leg_cache import LegCache, build_leg_key
+from worker.app.services.routing.routing_service import RoutingService
+
+
+def test_key_rounds_coords_and_separates_profile_and_piston():
+    k1 = build_leg_key("car", [(39.1310001, 140.069), (39.134, 140.072)])
+    k2 = build_leg_key("car", [(39.1310004, 140.069), (39.134, 140.072)])
+    assert k1 == k2
+    assert k1 != build_leg_key("foot", [(39.131, 140.069), (39.134, 140.072)])
+    assert k1 != build_leg_key("car", [(39.131, 140.069), (39.134, 140.072)], piston=True)
+    assert k1 != build_leg_key("car", [(39.131, 140.069), (39.134, 140.072)], dataset_version="other")
+
+
+def test_lru_evicts_and_redis_backfills(fake_redis):
+    cache = LegCache(max_entries=1, redis_client=fake_redis)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})  # a は LRU から追い出されるが Redis には残る
+
+    assert cache.get("a") == {"v": 1}
+    assert cache.get("zzz") is None
+    stats = cache.stats()
+    assert stats["redis_hits"] == 1 and stats["misses"] == 1 and stats["lru_size"] == 1
+
+
+def test_routing_service_reads_through_cache(monkeypatch):
+    calls = []
+
+    def fake_fetch_route(self, waypoints, profile, piston=False, detail="full"):
+        calls.append(profile)
+        return {"type": "FeatureCollection", "features": []}, 1.0, 2.0
+
+    monkeypatch.setattr(OSRMClient, "fetch_route", fake_fetch_route)
+    rs = RoutingService(cache=LegCache(use_redis=False))
+
+    r1 = rs.calculate_full_itinerary_route([(39.0, 140.0), (39.1, 140.1)], profile="car")
+    r1["used_ap"] = None  # 呼び出し側の書き換えがキャッシュへ漏れないこと
+    r2 = rs.calculate_full_itinerary_route([(39.0, 140.0), (39.1, 140.1)], profile="car")
+
+    assert calls == ["car"]
+    assert "used_ap" not in r2
+    assert rs.cache.stats()["lru_hits"] == 1
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import time
+
+from worker.app.services.routing.leg_engine import LegSpec, compute_hybrid_legs
+
+
+class _SlowRouting:
+    """レグ毎に待ち時間を持つダミー。dest[0] が負ならエラーにする。"""
+
+    def calculate_hybrid_leg(self, db, *, origin, dest, dest_spot_type, dest_tags, ap_max_km, piston, dest_spot_id=None):
+        time.sleep(0.2)
+        if dest[0] < 0:
+            raise RuntimeError("no route")
+        db.execute("SELECT 1")
+        return {"distance_km": float(dest[0]), "duration_min": 1.0, "geojson": None, "used_ap": None}
+
+
+class _Db:
+    def __init__(self):
+        self.calls = 0
+
+    def execute(self, sql):
+        self.calls += 1
+
+
+def test_legs_run_concurrently_in_order_with_per_leg_errors():
+    specs = [LegSpec(origin=(0.0, 0.0), dest=(float(i), 0.0)) for i in range(1, 9)]
+    specs[3] = LegSpec(origin=(0.0, 0.0), dest=(-1.0, 0.0))
+    db = _Db()
+
+    t0 = time.monotonic()
+    outcomes = compute_hybrid_legs(_SlowRouting(), db, specs, max_workers=8)
+    elapsed = time.monotonic() - t0
+
+    # 8 本 × 0.2 秒を直列なら 1.6 秒。並列なら最遅レグ程度
+    assert elapsed < 0.8
+    assert [o.index for o in outcomes] == list(range(8))
+    assert not outcomes[3].ok and "no route" in str(outcomes[3].error)
+    assert [o.result["distance_km"] for o in outcomes if o.ok] == [1.0, 2.0, 3.0, 5.0, 6.0, 7.0, 8.0]
+    assert db.calls == 7
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from worker.app.services.routing.client import OSRMClient, OSRMNoRouteError, route_params
+from worker.app.services.routing.leg_engine import LegSpec
+from worker.app.services.routing.leg_planner import compute_planned_legs
+
+P = [(39.0 + i * 0.01, 140.0) for i in range(5)]
+AP = (7, "AP", "parking", 39.035, 140.01)
+
+
+class _FakeRouting:
+    """P3 だけ AP 経由（car→AP→foot）、他は直行。"""
+
+    def __init__(self, fail_car=False):
+        self.requests = []
+        self.fallbacks = []
+        self.fail_car = fail_car
+
+    def resolve_leg_access(self, db, *, dest, dest_spot_type, dest_tags, ap_max_km, dest_spot_id):
+        return (False, AP) if dest == P[3] else (True, None)
+
+    def calculate_route_legs(self, waypoints, profile):
+        self.requests.append((profile, list(waypoints)))
+        if self.fail_car and profile == "car":
+            raise OSRMNoRouteError("no route")
+        return [
+            {"geojson": {"type": "FeatureCollection", "features": [{"id": f"{profile}{k}"}]},
+             "distance_km": 1.0, "duration_min": 2.0}
+            for k in range(len(waypoints) - 1)
+        ]
+
+    def calculate_hybrid_leg(self, db, *, origin, dest, **kw):
+        self.fallbacks.append(dest)
+        return {"geojson": None, "distance_km": 9.0, "duration_min": 9.0, "used_ap": None}
+
+
+def _specs():
+    return [LegSpec(origin=P[i], dest=P[i + 1]) for i in range(4)]
+
+
+def test_same_profile_runs_share_one_request():
+    routing = _FakeRouting()
+    outcomes = compute_planned_legs(routing, None, _specs(), max_workers=1)
+
+    # car: P0→P1→P2→AP を 1 回、foot: AP→P3、car: P3→P4（AP で切り替わる所だけ分かれる）
+    ap_pt = (AP[3], AP[4])
+    assert routing.requests == [
+        ("car", [P[0], P[1], P[2], ap_pt]),
+        ("foot", [ap_pt, P[3]]),
+        ("car", [P[3], P[4]]),
+    ]
+    assert [o.index for o in outcomes] == [0, 1, 2, 3] and all(o.ok for o in outcomes)
+    via_ap = outcomes[2].result
+    assert via_ap["distance_km"] == 2.0 and via_ap["used_ap"]["id"] == 7
+    assert [f["id"] for f in via_ap["geojson"]["features"]] == ["car2", "foot0"]
+    assert outcomes[0].result["used_ap"] is None
+
+
+def test_failed_run_falls_back_to_per_leg_routing():
+    routing = _FakeRouting(fail_car=True)
+    outcomes = compute_planned_legs(routing, None, _specs(), max_workers=1)
+    assert sorted(routing.fallbacks) == sorted(P[1:])
+    assert [o.result["distance_km"] for o in outcomes] == [9.0, 9.0, 9.0, 9.0]
+
+
+def test_fetch_route_legs_splits_geometry_by_annotation(monkeypatch):
+    coords = [[140.0, 39.0], [140.0, 39.005], [140.0, 39.01], [140.0, 39.02]]
+    payload = {"routes": [{
+        "geometry": {"type": "LineString", "coordinates": coords},
+        "legs": [
+            {"distance": 1000.0, "duration": 60.0, "annotation": {"distance": [500.0, 500.0]}},
+            {"distance": 1100.0, "duration": 120.0, "annotation": {"distance": [1100.0]}},
+        ],
+    }]}
+    monkeypatch.setattr(OSRMClient, "_route_request", lambda self, profile, wps, **kw: payload)
+    legs = OSRMClient().fetch_route_legs([P[0], P[1], P[2]], "car")
+
+    (g1, km1, min1), (g2, km2, min2) = legs
+    assert (km1, min1, km2, min2) == (1.0, 1.0, 1.1, 2.0)
+    assert g1["features"][0]["geometry"]["coordinates"] == coords[:3]
+    assert g2["features"][0]["geometry"]["coordinates"] == coords[2:]
+
+
+def test_multi_waypoint_route_allows_u_turns_at_vias():
+    # まとめたレグは 2 点のキーでもキャッシュされるため、経由点で折り返せる 2 点経路と揃える
+    assert "continue_straight" not in route_params("full", waypoints=2)
+    assert route_params("full", "distance", waypoints=3)["continue_straight"] == "false"
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from worker.app.services.routing.leg_store import RouteLegStore
+
+# JSONB は SQLite で DDL を出せないため、テスト用に同じ列構成の表を直接作る
+_DDL = """
+CREATE TABLE route_legs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    profile VARCHAR(16) NOT NULL,
+    from_lat FLOAT NOT NULL, from_lon FLOAT NOT NULL,
+    to_lat FLOAT NOT NULL, to_lon FLOAT NOT NULL,
+    via_ap_id INTEGER NOT NULL DEFAULT 0,
+    piston BOOLEAN NOT NULL DEFAULT 0,
+    osrm_dataset_version VARCHAR(32) NOT NULL,
+    geometry JSON, distance_km FLOAT NOT NULL, duration_min FLOAT NOT NULL, used_ap JSON,
+    hit_count INTEGER NOT NULL DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    last_used_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (profile, from_lat, from_lon, to_lat, to_lon, via_ap_id, piston, osrm_dataset_version)
+)
+"""
+
+
+# スポット / アクセスポイントの座標（これ以外が端点のレグは保存しない）
+_KNOWN = [(39.0, 140.0), (39.01, 140.01), (39.1, 140.1)]
+
+
+def _store(version="v1"):
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(_DDL)
+    return RouteLegStore(sessionmaker(bind=engine), dataset_version=version, known_points=lambda: _KNOWN), engine
+
+
+def _leg(km):
+    return {
+        "geojson": {"type": "FeatureCollection", "features": [
+            {"type": "Feature", "properties": {"profile": "car"},
+             "geometry": {"type": "LineString", "coordinates": [[140.0, 39.0], [140.01, 39.01]]}},
+        ]},
+        "distance_km": km,
+        "duration_min": 3.0,
+    }
+
+
+def test_put_then_get_round_trips_geometry_and_counts_hits():
+    store, engine = _store()
+    a, b = (39.0000001, 140.0), (39.01, 140.01)
+
+    assert store.get("car", a, b) is None
+    store.put("car", a, b, _leg(1.5))
+    store.put("car", a, b, _leg(2.5))  # 同じキーは上書き
+
+    hit = store.get("car", (39.0, 140.0), b)  # 丸め後に一致
+    assert hit["distance_km"] == 2.5
+    assert hit["geojson"]["features"][0]["geometry"]["coordinates"] == [[140.0, 39.0], [140.01, 39.01]]
+    assert store.get("car", a, b, via_ap_id=7) is None
+    store.get("car", a, b)
+    # 利用回数は読み出しの度には書かず、まとめて書き出す
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT COUNT(*), MAX(hit_count) FROM route_legs").fetchone() == (1, 0)
+    assert store.stats()["pending_hits"] == 1
+    assert store.flush_hits() == 1
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT MAX(hit_count) FROM route_legs").scalar() == 2
+    assert store.stats()["hits"] == 2
+
+
+def test_free_form_endpoints_are_not_stored():
+    store, engine = _store()
+    gps = (39.00321, 140.00456)  # リルート時の現在地
+    store.put("car", gps, (39.01, 140.01), _leg(1.0))
+    assert store.get("car", gps, (39.01, 140.01)) is None
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT COUNT(*) FROM route_legs").scalar() == 0
+    assert store.stats()["skipped"] == 1
+
+
+def test_prune_deletes_only_idle_legs():
+    store, engine = _store()
+    store.put("car", (39.0, 140.0), (39.01, 140.01), _leg(1.0))
+    store.put("car", (39.01, 140.01), (39.1, 140.1), _leg(2.0))
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "UPDATE route_legs SET last_used_at = '2000-01-01 00:00:00' WHERE from_lat = 39.0"
+        )
+    assert store.prune(30) == 1
+    assert store.get("car", (39.0, 140.0), (39.01, 140.01)) is None
+    assert store.get("car", (39.01, 140.01), (39.1, 140.1))["distance_km"] == 2.0
+
+
+def test_dataset_version_isolates_rows_and_errors_back_off():
+    store, _ = _store("v1")
+    store.put("foot", (39.0, 140.0), (39.1, 140.1), _leg(1.0))
+    other = RouteLegStore(store._session_factory, dataset_version="v2", known_points=lambda: _KNOWN)
+    assert other.get("foot", (39.0, 140.0), (39.1, 140.1)) is None
+
+    broken = RouteLegStore(sessionmaker(bind=create_engine("sqlite://")))  # 表なし
+    assert broken.get("car", (0.0, 0.0), (1.0, 1.0)) is None
+    assert broken.stats()["errors"] == 1
+    assert not broken._available()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from shared.app.services.nav_channel import ROUTE_UPDATED, NavHub, channel_name, publish
+
+
+def test_hub_fans_out_one_subscription_to_each_sessions_queues(fake_redis):
+    msg = {"type": ROUTE_UPDATED, "plan_id": 7, "route_version": 3, "route": None}
+
+    async def run():
+        hub = NavHub(redis_client=fake_redis.as_async())
+        mine_a = await hub.subscribe("s1")
+        mine_b = await hub.subscribe("s1")
+        other = await hub.subscribe("s2")
+        # ソケットが何本あっても Redis の購読は 1 つ
+        assert len(fake_redis._subs) == 1 and fake_redis._subs[0].patterns == {"nav:*"}
+
+        assert publish("s1", msg, redis_client=fake_redis)
+        got = await asyncio.wait_for(asyncio.gather(mine_a.get(), mine_b.get()), timeout=1.0)
+        assert got == [msg, msg] and other.empty()
+
+        # 壊れたメッセージは捨てる
+        fake_redis.publish("nav:s2", "not json")
+        await asyncio.sleep(0.05)
+        assert other.empty()
+
+        # 購読者がいなくなれば接続を閉じる
+        for sid, q in (("s1", mine_a), ("s1", mine_b), ("s2", other)):
+            hub.unsubscribe(sid, q)
+        await asyncio.wait_for(hub._task, timeout=2.0)
+        return fake_redis._subs[0]
+
+    ps = asyncio.run(run())
+    assert channel_name("s1") == "nav:s1"
+    assert ps.closed and not ps.patterns
+
+
+def test_hub_without_redis_returns_no_queue():
+    class _Down:
+        def pubsub(self, ignore_subscribe_messages=False):
+            raise ConnectionError("redis down")
+
+    async def run():
+        return await NavHub(redis_client=_Down()).subscribe("s1")
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import time
+
+from shared.app.services.nav_state import NavStateStore, PlanSnapshot, StopSnapshot
+from shared.app.services.route_index import RouteProgress
+
+
+def _snapshot():
+    return PlanSnapshot(
+        session_id="s1", plan_id=7, user_id=3, route_version=2, reroute_cooldown_sec=20,
+        stops=[StopSnapshot(11, 101, "法体の滝", 39.1, 140.0)], loaded_at=time.time(),
+    )
+
+
+def test_nav_state_single_read_and_partial_writes(fake_redis):
+    r = fake_redis
+    store = NavStateStore(redis_client=r)
+    assert store.load("s1").snapshot is None
+
+    store.save("s1", snapshot=_snapshot())
+    store.save("s1", progress=RouteProgress(2, 10, 123.4), zones={"stop:11": "approach"}, reroute_at=1000.0)
+    r.calls.clear()
+    state = store.load("s1")
+    assert r.calls == ["hgetall"]  # 1 回の往復で全部読める
+    assert state.snapshot.plan_id == 7 and state.snapshot.stops[0].spot.official_name == "法体の滝"
+    assert state.progress == RouteProgress(2, 10, 123.4)
+    assert state.zones == {"stop:11": "approach"} and state.reroute_at == 1000.0
+
+    # 渡したフィールドだけを書き、何も無ければ書かない
+    store.save("s1")
+    assert "hset" not in r.calls
+    store.save("s1", progress=RouteProgress(2, 11, 140.0))
+    assert store.load("s1").zones == {"stop:11": "approach"}
+
+
+def test_nav_state_invalidate_snapshot_and_expiry(fake_redis):
+    store = NavStateStore(redis_client=fake_redis)
+    store.save("s1", snapshot=_snapshot(), progress=RouteProgress(2, 1, 5.0))
+    store.invalidate_snapshot("s1")
+    state = store.load("s1")
+    assert state.snapshot is None and state.progress is not None
+
+    old = _snapshot()
+    old.loaded_at = time.time() - 120
+    assert old.expired(60) and not _snapshot().expired(60)
+
+
+def test_nav_state_without_redis_uses_local_lru():
+    store = NavStateStore(use_redis=False, max_entries=1)
+    store.save("s1", zones={"stop:1": "arrival"})
+    assert store.load("s1").zones == {"stop:1": "arrival"}
+    store.save("s2", zones={})
+    assert store.load("s1").zones == {}  # LRU から追い出された
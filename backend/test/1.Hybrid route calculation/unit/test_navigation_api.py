@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("jwt")
+os.environ.setdefault("DATABASE_URL", "sqlite:///./test.db")
+
+from fastapi import HTTPException, WebSocketDisconnect  # noqa: E402
+
+from api_gateway.app.api.v1 import navigation as nav  # noqa: E402
+from shared.app.schemas import NavFix, NavLocationBatchIn  # noqa: E402
+from shared.app.services.nav_channel import ROUTE_UPDATED, NavHub, publish  # noqa: E402
+from shared.app.services.nav_state import NavStateStore, PlanSnapshot, StopSnapshot  # noqa: E402
+from shared.app.services.proximity import APPROACH  # noqa: E402
+from shared.app.services.route_index import CompiledRoute  # noqa: E402
+
+SID = "s1"
+STOP_PT = (39.1, 140.05)
+LINE = {"type": "LineString", "coordinates": [[140.0, 39.1], [140.1, 39.1]]}
+T0 = datetime(2026, 5, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def _west_of(pt, meters):
+    """pt からルート（東西の直線）に沿って西へ meters の点。"""
+    return (pt[0], pt[1] - meters / 86_300.0)
+
+
+def _north_of(pt, meters):
+    return (pt[0] + meters / 111_195.0, pt[1])
+
+
+def _fix(pt, ts=None):
+    return NavFix(lat=pt[0], lon=pt[1], ts=ts)
+
+
+@pytest.fixture
+def nav_env(monkeypatch):
+    """ホット状態はプロセス内、ルートは固定、リルートの起動は記録だけ（DB / Redis / Celery なし）。"""
+    store = NavStateStore(use_redis=False)
+    store.save(SID, snapshot=PlanSnapshot(
+        session_id=SID, plan_id=7, user_id=3, route_version=2, reroute_cooldown_sec=20,
+        stops=[StopSnapshot(11, 101, "法体の滝", *STOP_PT)], loaded_at=time.time(),
+    ))
+    route = CompiledRoute(7, 2, LINE, stops=[(11, *STOP_PT)])
+    reroutes = []
+
+    def _enqueue(**kw):
+        reroutes.append(kw)
+        return True
+
+    monkeypatch.setattr(nav, "get_nav_state_store", lambda: store)
+    monkeypatch.setattr(nav, "compiled_route_for", lambda db, snap: route)
+    monkeypatch.setattr(nav, "enqueue_reroute", _enqueue)
+    monkeypatch.setattr(nav, "_mark_rerouted", lambda db, session_id, at: None)
+    monkeypatch.setattr(nav, "synthesize_tts_base64", lambda text, voice="ja-JP": "")
+    return SimpleNamespace(store=store, reroutes=reroutes)
+
+
+def test_order_fixes_sorts_by_ts_only_when_every_fix_has_one():
+    a = _fix(STOP_PT, T0 + timedelta(seconds=2))
+    b = _fix(STOP_PT, (T0 + timedelta(seconds=1)).replace(tzinfo=None))  # naive は UTC とみなす
+    c = _fix(STOP_PT, T0 + timedelta(seconds=2))
+    assert nav._order_fixes([a, b, c]) == [b, a, c]  # 同時刻は送信順
+    # ts の無い測位が混ざれば送信順のまま
+    d = _fix(STOP_PT)
+    assert nav._order_fixes([a, d, b]) == [a, d, b]
+
+
+def test_location_batch_rejects_too_many_fixes(nav_env, monkeypatch):
+    monkeypatch.setattr(nav, "NAV_BATCH_MAX_FIXES", 2)
+    payload = NavLocationBatchIn(session_id=SID, fixes=[_fix(STOP_PT)] * 3)
+    with pytest.raises(HTTPException) as e:
+        nav.location_batch(payload=payload, db=None, user_id=None)
+    assert e.value.status_code == 413
+
+
+def test_location_batch_tags_events_with_fix_index_and_ts(nav_env):
+    fixes = [
+        _fix(_west_of(STOP_PT, 40), T0 + timedelta(seconds=20)),
+        _fix(_west_of(STOP_PT, 500), T0),
+        _fix(_west_of(STOP_PT, 150), T0 + timedelta(seconds=10)),
+    ]
+    out = nav.location_batch(payload=NavLocationBatchIn(session_id=SID, fixes=fixes), db=None, user_id=None)
+    # ts 順（500m → 150m → 40m）に評価される
+    assert out.fixes == 3
+    assert [(e["type"], e["fix_index"], e["ts"]) for e in out.events] == [
+        ("PROXIMITY_APPROACH", 1, (T0 + timedelta(seconds=10)).isoformat()),
+        ("PROXIMITY_ARRIVAL", 2, (T0 + timedelta(seconds=20)).isoformat()),
+    ]
+    assert [t["stop_id"] for t in out.actions["tts"]] == [11, 11]
+
+
+def test_only_the_latest_fix_decides_reroute(nav_env):
+    off = _north_of(_west_of(STOP_PT, 1000), 500)
+    on = _west_of(STOP_PT, 900)
+
+    out = nav.process_fixes(None, SID, [_fix(off), _fix(on)], None, tag_fixes=True)
+    assert out["events"] == [] and nav_env.reroutes == []
+    assert out["actions"]["reroute"] == {"started": False, "debounced": False}
+
+    out = nav.process_fixes(None, SID, [_fix(on), _fix(off)], None, tag_fixes=True)
+    assert [(e["type"], e["fix_index"]) for e in out["events"]] == [("REROUTE_REQUESTED", 1)]
+    assert out["actions"]["reroute"]["started"] is True
+    assert len(nav_env.reroutes) == 1
+    assert (nav_env.reroutes[0]["origin_lat"], nav_env.reroutes[0]["origin_lon"]) == off
+
+
+def test_zone_hysteresis_carries_across_fixes_and_requests(nav_env):
+    # 半径 200m の境界付近の揺れでは 1 回しか鳴らない
+    fixes = [_fix(_west_of(STOP_PT, m)) for m in (190, 210, 195, 230)]
+    out = nav.process_fixes(None, SID, fixes, None)
+    assert [e["type"] for e in out["events"]] == ["PROXIMITY_APPROACH"]
+    assert nav_env.store.load(SID).zones == {"stop:11": APPROACH}
+
+    # 次のリクエストにも引き継がれる
+    assert nav.process_fixes(None, SID, [_fix(_west_of(STOP_PT, 199))], None)["events"] == []
+
+
+def test_token_user_id_rejects_deleted_users_and_caches_lookups(monkeypatch):
+    from api_gateway.app import security
+
+    class _Db:
+        def __init__(self, users):
+            self.users, self.queries = users, 0
+
+        def query(self, *cols):
+            db = self
+
+            class _Q:
+                def filter(self, cond):
+                    self.uid = cond.right.value
+                    return self
+
+                def first(self):
+                    db.queries += 1
+                    return (self.uid,) if self.uid in db.users else None
+
+            return _Q()
+
+    monkeypatch.setattr(security, "_user_seen", {})
+    token = security.create_access_token(sub="3")
+    db = _Db({3})
+    assert security.user_id_from_access_token(token, db) == 3
+    assert security.user_id_from_access_token(token, db) == 3
+    assert db.queries == 1  # 存在確認は使い回す
+
+    with pytest.raises(HTTPException) as e:
+        security.user_id_from_access_token(security.create_access_token(sub="4"), db)
+    assert e.value.detail == "user not found"
+    with pytest.raises(HTTPException) as e:
+        security.user_id_from_access_token(security.create_refresh_token(sub="3"), db)
+    assert e.value.detail == "access token required"
+
+
+# ---------------------------
+# WebSocket
+# ---------------------------
+@pytest.fixture
+def ws_client(nav_env, monkeypatch, fake_redis):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    def _user(token, db):
+        if token != "good":
+            raise HTTPException(status_code=401, detail="invalid token")
+        return 3
+
+    monkeypatch.setattr(nav, "user_id_from_access_token", _user)
+    hub = NavHub(redis_client=fake_redis.as_async())
+    monkeypatch.setattr(nav, "get_nav_hub", lambda: hub)
+    app = FastAPI()
+    app.include_router(nav.router)
+    with TestClient(app) as client:
+        yield client
+
+
+def test_ws_round_trip_and_route_updated_push(ws_client, fake_redis):
+    with ws_client.websocket_connect(f"/navigation/ws/{SID}?token=good") as ws:
+        assert ws.receive_json() == {"type": "ready", "session_id": SID, "push": True}
+
+        pt = _west_of(STOP_PT, 40)
+        ws.send_json({"type": "fix", "lat": pt[0], "lon": pt[1]})
+        out = ws.receive_json()
+        assert out["type"] == "update" and out["plan_version"] == 2
+        assert [e["type"] for e in out["events"]] == ["PROXIMITY_ARRIVAL"]
+
+        ws.send_json({"type": "nope"})
+        assert ws.receive_json() == {"type": "error", "status": 400, "detail": "unknown message type: nope"}
+        ws.send_json({"type": "fixes", "fixes": []})
+        assert ws.receive_json()["status"] == 422
+
+        msg = {"type": ROUTE_UPDATED, "plan_id": 7, "route_version": 3, "route": None}
+        publish(SID, msg, redis_client=fake_redis)
+        assert ws.receive_json() == msg
+
+
+def test_ws_checks_session_owner_before_subscribing(ws_client, nav_env, fake_redis):
+    # トークン無しでも位置の判定はできるが、プッシュは流さない
+    with ws_client.websocket_connect(f"/navigation/ws/{SID}") as ws:
+        assert ws.receive_json()["push"] is False
+    assert fake_redis._subs == []
+
+    snap = nav_env.store.load(SID).snapshot
+    snap.user_id = 99
+    nav_env.store.save(SID, snapshot=snap)
+    with ws_client.websocket_connect(f"/navigation/ws/{SID}?token=good") as ws:
+        assert ws.receive_json() == {"type": "error", "status": 403, "detail": "forbidden"}
+        with pytest.raises(WebSocketDisconnect) as e:
+            ws.receive_json()
+    assert e.value.code == 4403 and fake_redis._subs == []
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+import requests
+
+from worker.app.services.routing import backends
+from worker.app.services.routing import client as osrm_client
+from worker.app.services.routing.backends import CircuitBreaker
+from worker.app.services.routing.client import OSRMClient, OSRMClientError
+
+OK = {"routes": [{"distance": 1000.0, "duration": 60.0}]}
+
+
+@pytest.fixture(autouse=True)
+def _replicas(monkeypatch):
+    monkeypatch.setenv("OSRM_CAR_HOSTS", "http://car-a:5000,http://car-b:5000")
+    monkeypatch.setattr(osrm_client.time, "sleep", lambda s: None)
+    osrm_client.reset_http_sessions()
+    yield
+    osrm_client.reset_http_sessions()
+
+
+def test_breaker_opens_half_opens_and_closes():
+    now = [0.0]
+    b = CircuitBreaker(failure_threshold=2, reset_sec=10, clock=lambda: now[0])
+    b.record_failure()
+    assert b.allow()
+    b.record_failure()
+    assert b.state == "open" and b.trips == 1 and not b.allow()
+    now[0] = 11
+    assert b.allow()          # half-open の試行 1 本
+    assert not b.allow()      # 2 本目は不可
+    b.record_success()
+    assert b.state == "closed"
+
+
+def test_fails_over_to_healthy_replica_and_fails_fast_when_all_open(monkeypatch, osrm_response):
+    calls = []
+
+    def fake_get(self, url, params=None, timeout=None):
+        calls.append(url)
+        if url.startswith("http://car-a"):
+            raise requests.ConnectionError("down")
+        return osrm_response(200, OK)
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    c = OSRMClient(max_retries=2)
+    for _ in range(6):
+        assert c.fetch_distance_and_duration((39.0, 140.0), (39.1, 140.1), "car") == (1.0, 1.0)
+
+    metrics = {r["base_url"]: r for r in backends.backend_metrics()[0]["replicas"]}
+    assert metrics["http://car-a:5000"]["state"] == "open"
+    assert metrics["http://car-a:5000"]["trips"] == 1
+    # ブレーカーが開いた後は car-a を叩かない
+    assert sum(u.startswith("http://car-a") for u in calls) == backends.OSRM_BREAKER_FAILURE_THRESHOLD
+
+    # 全台ダウン → 閾値到達後はネットワークに出ずに即失敗
+    monkeypatch.setattr(requests.Session, "get", lambda *a, **k: (_ for _ in ()).throw(requests.Timeout("t")))
+    for _ in range(5):
+        with pytest.raises(OSRMClientError):
+            c.fetch_distance_and_duration((39.0, 140.0), (39.1, 140.1), "car")
+    calls.clear()
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    with pytest.raises(OSRMClientError, match="circuit open"):
+        c.fetch_distance_and_duration((39.0, 140.0), (39.1, 140.1), "car")
+    assert calls == []
+
+
+def test_hedged_request_returns_faster_replica(monkeypatch, osrm_response):
+    monkeypatch.setattr(backends, "OSRM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(backends, "OSRM_HEDGE_MIN_SAMPLES", 1)
+    release = threading.Event()
+
+    def fake_get(self, url, params=None, timeout=None):
+        if url.startswith("http://car-a"):
+            release.wait(2)  # 遅いレプリカ
+        return osrm_response(200, {"routes": [{"distance": 2000.0 if url.startswith("http://car-a") else 1000.0,
+                                       "duration": 60.0}]})
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    c = OSRMClient()
+    pool = c._pool("car")
+    for r in pool.replicas:
+        r._latencies.append(0.01)
+    b = next(r for r in pool.replicas if r.base_url.endswith("car-b:5000"))
+    b.inflight = 1  # 最初は car-a が選ばれるようにする
+    km, _ = c.fetch_distance_and_duration((39.0, 140.0), (39.1, 140.1), "car")
+    release.set()
+    assert km == 1.0
+    assert b.hedges == 1
+
+
+def test_replica_counters_are_consistent_under_concurrency():
+    pool = backends.BackendPool("car", ["http://car-a:5000"])
+    r = pool.replicas[0]
+
+    def work():
+        for _ in range(2000):
+            r.begin()
+            r.record_hedge()
+            r.end(True, 0.01)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    m = pool.metrics()["replicas"][0]
+    assert (m["successes"], m["hedges"], m["inflight"]) == (8000, 8000, 0)
+    assert r.load() == (0, pytest.approx(0.01))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import pytest
+import requests
+
+from worker.app.services.routing import client as osrm_client
+from worker.app.services.routing.client import OSRMClient, OSRMClientError
+
+
+@pytest.fixture(autouse=True)
+def _fresh_pool():
+    osrm_client.reset_http_sessions()
+    yield
+    osrm_client.reset_http_sessions()
+
+
+def test_session_is_shared_across_clients():
+    c1 = OSRMClient()
+    c2 = OSRMClient()
+    s1 = osrm_client.get_http_session(c1.car_base, "car")
+    s2 = osrm_client.get_http_session(c2.car_base, "car")
+    assert s1 is s2
+    assert s1 is not osrm_client.get_http_session(c1.foot_base, "foot")
+
+
+def test_pool_size_per_profile_from_env(monkeypatch):
+    monkeypatch.setenv("OSRM_POOL_MAXSIZE", "4")
+    monkeypatch.setenv("OSRM_FOOT_POOL_MAXSIZE", "9")
+    assert osrm_client._pool_settings("car")[1] == 4
+    assert osrm_client._pool_settings("foot")[1] == 9
+
+
+def test_retry_semantics_kept(monkeypatch, osrm_response):
+    calls = []
+    ok = {"routes": [{"distance": 1500.0, "duration": 120.0}]}
+
+    def fake_get(self, url, params=None, timeout=None):
+        calls.append(url)
+        if len(calls) == 1:
+            raise requests.ConnectionError("boom")
+        return osrm_response(200, ok)
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    monkeypatch.setattr(osrm_client.time, "sleep", lambda s: None)
+
+    km, minutes = OSRMClient(max_retries=2).fetch_distance_and_duration((39.0, 140.0), (39.1, 140.1), "car")
+    assert len(calls) == 2
+    assert km == 1.5 and minutes == 2.0
+
+
+def test_4xx_is_not_retried(monkeypatch, osrm_response):
+    calls = []
+
+    def fake_get(self, url, params=None, timeout=None):
+        calls.append(url)
+        return osrm_response(400)
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    with pytest.raises(OSRMClientError):
+        OSRMClient(max_retries=2).fetch_distance_and_duration((39.0, 140.0), (39.1, 140.1), "foot")
+    assert len(calls) == 1
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import pytest
+import requests
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from shared.app.models import OSRMSnap
+from worker.app.services.routing import client as osrm_client
+from worker.app.services.routing import snapping
+from worker.app.services.routing.client import OSRMClient
+from worker.app.services.routing.snapping import SnapIndex, rebuild_osrm_snaps
+
+A = (39.1, 140.05)
+B = (39.2, 140.06)
+C = (39.3, 140.07)  # 道路に乗らない点
+
+# BigInteger の主キーは SQLite で自動採番されないため、同じ列構成の表を直接作る
+_DDL = """
+CREATE TABLE osrm_snaps (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    profile VARCHAR(16) NOT NULL, lat FLOAT NOT NULL, lon FLOAT NOT NULL,
+    osrm_dataset_version VARCHAR(32) NOT NULL,
+    snapped_lat FLOAT NOT NULL, snapped_lon FLOAT NOT NULL, snap_distance_m FLOAT,
+    hint TEXT NOT NULL, source VARCHAR(16), source_id INTEGER,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (profile, lat, lon, osrm_dataset_version)
+)
+"""
+
+
+class _FakeNearestClient:
+    def fetch_nearest(self, pt, profile):
+        if pt == C:
+            raise osrm_client.OSRMNoRouteError("no segment")
+        return {"lat": pt[0] + 0.0001, "lon": pt[1], "hint": f"{profile}-{pt[0]}", "distance_m": 11.1}
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(_DDL)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture(autouse=True)
+def _reset_sessions():
+    osrm_client.reset_http_sessions()
+    yield
+    osrm_client.reset_http_sessions()
+
+
+def test_rebuild_persists_hints_and_index_builds_param(monkeypatch, session_factory):
+    targets = [
+        {"source": "spot", "source_id": 1, "lat": A[0], "lon": A[1]},
+        {"source": "access_point", "source_id": 7, "lat": B[0], "lon": B[1]},
+        {"source": "spot", "source_id": 2, "lat": C[0], "lon": C[1]},
+    ]
+    monkeypatch.setattr(snapping, "collect_snap_targets", lambda db: targets)
+
+    with session_factory() as db:
+        out = rebuild_osrm_snaps(db, _FakeNearestClient(), max_workers=4, dataset_version="v9")
+        # 再実行しても重複しない（プロファイル毎に置き換え）
+        rebuild_osrm_snaps(db, _FakeNearestClient(), max_workers=4, dataset_version="v9")
+        assert db.query(OSRMSnap).count() == 4
+    assert out["points"] == 3 and out["car"] == 2 and out["car_failed"] == 1
+
+    index = SnapIndex(session_factory, dataset_version="v9")
+    assert index.hint_for("foot", B) == "foot-39.2"
+    assert index.hints_param("car", [A, (35.0, 135.0), B]) == "car-39.1;;car-39.2"
+    assert index.hints_param("car", [(35.0, 135.0), C]) is None
+    # データセット版が違う hint は使わない
+    assert SnapIndex(session_factory, dataset_version="v10").hints_param("car", [A, B]) is None
+
+
+def test_client_sends_hints_and_retries_without_on_400(monkeypatch, session_factory, osrm_response):
+    monkeypatch.setattr(snapping, "collect_snap_targets", lambda db: [
+        {"source": "spot", "source_id": 1, "lat": A[0], "lon": A[1]},
+    ])
+    with session_factory() as db:
+        rebuild_osrm_snaps(db, _FakeNearestClient(), profiles=("car",), dataset_version="v1")
+    index = SnapIndex(session_factory, dataset_version="v1")
+
+    seen = []
+    reject = [True]
+
+    def fake_get(self, url, params=None, timeout=None):
+        seen.append(dict(params))
+        if "hints" in params and reject[0]:
+            reject[0] = False
+            return osrm_response(400, {"code": "InvalidValue", "message": "Hint parameter is invalid"})
+        return osrm_response(200, {"routes": [{"distance": 2000.0, "duration": 120.0}]})
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    client = OSRMClient(snap_index=index)
+    assert client.fetch_distance_and_duration(A, B, "car") == (2.0, 2.0)
+    assert seen[0]["hints"] == "car-39.1;"
+    assert "hints" not in seen[1]
+    assert index.stats()["rejected"] == 1
+
+    # 拒否後は読み直した hint で再び送る
+    seen.clear()
+    client.fetch_distance_and_duration(A, B, "car")
+    assert len(seen) == 1 and seen[0]["hints"] == "car-39.1;"
+
+
+def test_client_does_not_drop_hints_on_no_route(monkeypatch, session_factory, osrm_response):
+    monkeypatch.setattr(snapping, "collect_snap_targets", lambda db: [
+        {"source": "spot", "source_id": 1, "lat": A[0], "lon": A[1]},
+    ])
+    with session_factory() as db:
+        rebuild_osrm_snaps(db, _FakeNearestClient(), profiles=("car",), dataset_version="v1")
+    index = SnapIndex(session_factory, dataset_version="v1")
+
+    seen = []
+
+    def fake_get(self, url, params=None, timeout=None):
+        seen.append(dict(params))
+        return osrm_response(400, {"code": "NoRoute", "message": "Impossible route between points"})
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    client = OSRMClient(snap_index=index)
+    with pytest.raises(osrm_client.OSRMClientError):
+        client.fetch_distance_and_duration(A, B, "car")
+    # hint と無関係な 400 では送り直さず、hint も捨てない
+    assert len(seen) == 1 and seen[0]["hints"] == "car-39.1;"
+    assert index.stats()["rejected"] == 0
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from shared.app.services.navigation_events import Thresholds, evaluate_events, haversine_m
+from shared.app.services.proximity import APPROACH, ARRIVAL, ProximityIndex, ProximityTarget
+from shared.app.services.route_index import CompiledRoute, CompiledRouteCache
+from worker.app.services.navigation.navigation_service import NavigationService
+
+STOP_PT = (39.1, 140.05)
+
+
+def _north_of(pt, meters):
+    return (pt[0] + meters / 111_195.0, pt[1])
+
+
+def test_grid_candidates_match_brute_force_with_per_target_radii():
+    rng = random.Random(1)
+    targets = [
+        ProximityTarget(f"spot:{i}", 39.0 + rng.random() * 0.2, 140.0 + rng.random() * 0.2,
+                        radius_m=rng.choice([None, 80.0, 600.0]))
+        for i in range(500)
+    ]
+    index = ProximityIndex(targets, cell_m=200)
+    for _ in range(50):
+        lat, lon = 39.0 + rng.random() * 0.2, 140.0 + rng.random() * 0.2
+        got = {t.key for t, _ in index.within(lat, lon, 200.0)}
+        want = {t.key for t in targets if haversine_m((lat, lon), (t.lat, t.lon)) <= (t.radius_m or 200.0)}
+        assert got == want
+
+
+def test_per_target_arrival_radius_wider_than_approach_is_reached():
+    # 到着半径だけを広く取った対象も、周囲セルの探索範囲に入る
+    index = ProximityIndex([ProximityTarget("stop:1", *STOP_PT, arrival_m=900.0)], cell_m=100)
+    assert index.max_radius_m == 900.0
+    fired = index.update_zones(*_north_of(STOP_PT, 700), {}, approach_m=200, arrival_m=50, exit_factor=1.0)
+    assert [lvl for _, lvl, _ in fired] == [ARRIVAL]
+
+
+def test_zones_fire_once_until_exit_band_is_left():
+    index = ProximityIndex([ProximityTarget("stop:1", *STOP_PT, data={"stop_id": 1})])
+    zones = {}
+    kw = dict(approach_m=200, arrival_m=50, exit_factor=1.2)
+
+    assert [lvl for _, lvl, _ in index.update_zones(*_north_of(STOP_PT, 190), zones, **kw)] == [APPROACH]
+    # 境界付近の揺れ（半径の外 〜 ×1.2 の内側）では再発火しない
+    for m in (210, 195, 230, 199):
+        assert index.update_zones(*_north_of(STOP_PT, m), zones, **kw) == []
+    assert [lvl for _, lvl, _ in index.update_zones(*_north_of(STOP_PT, 30), zones, **kw)] == [ARRIVAL]
+    assert index.update_zones(*_north_of(STOP_PT, 40), zones, **kw) == []
+    # 十分離れたら状態が消え、再び近づけば再発火する
+    index.update_zones(*_north_of(STOP_PT, 400), zones, **kw)
+    assert zones == {}
+    assert len(index.update_zones(*_north_of(STOP_PT, 150), zones, **kw)) == 1
+
+
+def test_evaluate_events_checks_every_stop_with_zones():
+    stops = [
+        SimpleNamespace(id=1, spot=SimpleNamespace(latitude=39.2, longitude=140.2)),
+        SimpleNamespace(id=2, spot=SimpleNamespace(latitude=STOP_PT[0], longitude=STOP_PT[1])),
+    ]
+    plan = SimpleNamespace(stops=stops, route_geojson=None)
+    route = CompiledRoute(9, 1, {"type": "LineString", "coordinates": [[140.0, 39.1], [140.1, 39.1]]},
+                          stops=[(s.id, s.spot.latitude, s.spot.longitude) for s in stops])
+    th = Thresholds(off_route_m=100, approach_m=200, arrival_m=50)
+
+    zones = {}
+    events, next_stop, _ = evaluate_events(_north_of(STOP_PT, 20), plan, th, route=route, zones=zones)
+    assert [(e["type"], e["stop_id"]) for e in events] == [("PROXIMITY_ARRIVAL", 2)]
+    assert next_stop.id == 1 and zones == {"stop:2": ARRIVAL}
+    events, _, _ = evaluate_events(_north_of(STOP_PT, 25), plan, th, route=route, zones=zones)
+    assert events == []
+
+
+def test_proximity_index_follows_stop_edits_within_same_route_version():
+    line = {"type": "LineString", "coordinates": [[140.0, 39.1], [140.1, 39.1]]}
+    other_pt = (39.1, 140.08)
+    cache = CompiledRouteCache()
+    th = Thresholds(off_route_m=100, approach_m=200, arrival_m=50)
+
+    def _plan(*stops):
+        return SimpleNamespace(stops=[
+            SimpleNamespace(id=i, spot=SimpleNamespace(latitude=lat, longitude=lon)) for i, lat, lon in stops
+        ], route_geojson=None)
+
+    before = _plan((1, *STOP_PT))
+    route = cache.get(9, 1, lambda: line, [(1, *STOP_PT)])
+    events, _, _ = evaluate_events(_north_of(STOP_PT, 20), before, th, route=route, zones={})
+    assert [e["stop_id"] for e in events] == [1]
+
+    # 停留所 1 を消して 2 を足す（route_version はそのまま）
+    after = _plan((2, *other_pt))
+    route = cache.get(9, 1, lambda: line, [(2, *other_pt)])
+    zones = {}
+    assert evaluate_events(_north_of(STOP_PT, 20), after, th, route=route, zones=zones)[0] == []
+    events, _, _ = evaluate_events(_north_of(other_pt, 20), after, th, route=route, zones=zones)
+    assert [(e["type"], e["stop_id"]) for e in events] == [("PROXIMITY_ARRIVAL", 2)]
+
+
+def test_check_for_proximity_accepts_prebuilt_index():
+    spots = [
+        {"spot_id": 1, "lat": STOP_PT[0], "lon": STOP_PT[1], "spot_type": "tourist_spot"},
+        {"spot_id": 2, "lat": 39.3, "lon": 140.3, "spot_type": "tourist_spot"},
+        {"spot_id": 3, "lat": STOP_PT[0], "lon": STOP_PT[1], "spot_type": "parking"},
+    ]
+    svc = NavigationService(default_proximity_radius_m=100)
+    here = {"lat": _north_of(STOP_PT, 60)[0], "lon": STOP_PT[1]}
+    triggered = set()
+    fired = svc.check_for_proximity(here, ProximityIndex.from_guide_spots(spots), already_triggered=triggered)
+    assert [f["data"]["spot_id"] for f in fired] == [1] and triggered == {1}
+    assert fired[0]["data"]["distance_m"] == pytest.approx(60, abs=0.5)
+    assert svc.check_for_proximity(here, spots, already_triggered=triggered) == []
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from shared.app.services.reroute_coalesce import StaleCheck, is_superseded, register_request
+from worker.app.services.routing.client import OSRMAbortedError, OSRMClient
+
+A = (39.10, 140.05)
+B = (39.12, 140.06)
+
+
+def test_latest_request_wins(fake_redis):
+    r = fake_redis
+    s1 = register_request("s1", redis_client=r)
+    s2 = register_request("s1", redis_client=r)
+    assert (s1, s2) == (1, 2)
+    assert is_superseded("s1", s1, redis_client=r) and not is_superseded("s1", s2, redis_client=r)
+    # 連番が無い（Redis 無しで送られた）タスクは合流しない
+    assert not is_superseded("s1", None, redis_client=r)
+
+
+def test_stale_check_is_throttled_and_sticky(fake_redis):
+    r = fake_redis
+    seq = register_request("s1", redis_client=r)
+    check = StaleCheck("s1", seq, min_interval_sec=60, redis_client=r)
+    assert not check() and not check()
+    assert r.calls.count("hget") == 1  # 間隔内は Redis を見ない
+    register_request("s1", redis_client=r)
+    assert not check()
+    assert check(force=True) and check() and r.calls.count("hget") == 2
+
+
+def test_abort_hook_stops_osrm_requests(fake_osrm):
+    calls = []
+    c = OSRMClient(backoff_sec=0, abort=lambda: bool(calls.append(1)) or len(calls) > 1)
+    c.snap_index = None
+    c.fetch_route([A, B], "car")
+    with pytest.raises(OSRMAbortedError):
+        c.fetch_route([A, B], "car")
+    assert fake_osrm["car"].requests["route"] == 1
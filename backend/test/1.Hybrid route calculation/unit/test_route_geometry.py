@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import math
+
+from shared.app.services.route_geometry import (
+    decode_polyline,
+    decode_route,
+    encode_polyline,
+    encode_route,
+    line_coords,
+    render_route,
+    simplify_coords,
+)
+
+
+def _fc(coords):
+    return {
+        "type": "FeatureCollection",
+        "properties": {"distance_m": 1234.0},
+        "features": [
+            {"type": "Feature", "properties": {"profile": "car"},
+             "geometry": {"type": "LineString", "coordinates": coords}},
+        ],
+    }
+
+
+def test_polyline6_round_trip():
+    coords = [[140.049, 39.099], [140.0491234, 39.0995678], [139.9, 39.2]]
+    enc = encode_polyline(coords)
+    # アルゴリズムの公式例（精度 5）
+    assert encode_polyline([[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]], precision=5) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    dec = decode_polyline(enc)
+    for a, b in zip(coords, dec):
+        assert math.isclose(a[0], b[0], abs_tol=1e-6) and math.isclose(a[1], b[1], abs_tol=1e-6)
+
+
+def test_encode_route_keeps_properties_and_decodes_to_full_resolution():
+    coords = [[140.0 + i * 1e-4, 39.0 + (i % 3) * 1e-5] for i in range(50)]
+    stored = encode_route(_fc(coords))
+    geom = stored["features"][0]["geometry"]
+    assert geom["encoding"] == "polyline6" and "coordinates" not in geom
+    assert stored["properties"] == {"distance_m": 1234.0}
+    assert len(line_coords(geom)) == 50
+    assert decode_route(stored)["features"][0]["geometry"]["coordinates"] == line_coords(geom)
+
+
+def test_simplify_straight_line_keeps_endpoints():
+    coords = [[140.0 + i * 1e-4, 39.0] for i in range(100)]
+    assert simplify_coords(coords, 5.0) == [coords[0], coords[-1]]
+
+
+def test_render_route_resolutions_shrink_payload():
+    # 約 1m 振幅のジグザグ + 大きな曲がり角 1 つ
+    coords = [[140.0 + i * 1e-4, 39.0 + (1e-5 if i % 2 else 0.0)] for i in range(200)]
+    coords += [[140.02, 39.0 + i * 1e-4] for i in range(1, 100)]
+    full = render_route(encode_route(_fc(coords)), resolution="full")
+    low = render_route(encode_route(_fc(coords)), resolution="low", fmt="polyline6")
+    assert len(full["features"][0]["geometry"]["coordinates"]) == len(coords)
+    low_pts = line_coords(low["features"][0]["geometry"])
+    assert 3 <= len(low_pts) < 10
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import math
+
+import pytest
+
+from shared.app.services.navigation_events import distance_to_polyline_m
+from shared.app.services.route_geometry import encode_route
+from shared.app.services.route_index import CompiledRoute, CompiledRouteCache, RouteGeometry, RouteProgress
+from worker.app.services.navigation.geospatial_utils import haversine_distance_m
+
+# 東西 2 本の LineString（レグの境目はつながない）
+ROUTE = {
+    "type": "FeatureCollection",
+    "features": [
+        {"type": "Feature", "geometry": {"type": "LineString", "coordinates": [[140.00, 39.10], [140.01, 39.10], [140.02, 39.10]]}},
+        {"type": "Feature", "geometry": {"type": "LineString", "coordinates": [[140.02, 39.11], [140.03, 39.11]]}},
+    ],
+}
+LON_STEP_M = haversine_distance_m(39.10, 140.00, 39.10, 140.01)
+
+
+def _brute_force(lat, lon):
+    """点から各線分への距離を 1 本ずつ数えた参照実装（点の緯度を基準に投影）。"""
+    kx = math.radians(1) * 6371000.0 * math.cos(math.radians(lat))
+    ky = math.radians(1) * 6371000.0
+    best = math.inf
+    for f in ROUTE["features"]:
+        c = f["geometry"]["coordinates"]
+        for (x1, y1), (x2, y2) in zip(c, c[1:]):
+            ax, ay, bx, by = (x1 - lon) * kx, (y1 - lat) * ky, (x2 - lon) * kx, (y2 - lat) * ky
+            dx, dy = bx - ax, by - ay
+            t = max(0.0, min(1.0, (-ax * dx - ay * dy) / (dx * dx + dy * dy)))
+            best = min(best, math.hypot(ax + t * dx, ay + t * dy))
+    return best
+
+
+def test_nearest_segment_and_along_track():
+    g = RouteGeometry.from_geojson(ROUTE)
+    assert g.n_segments == 3  # 2 + 1（境目の 140.02,39.10→140.02,39.11 は線分にしない）
+
+    m = g.nearest(39.1005, 140.015)
+    assert m.segment_index == 1
+    assert m.fraction == pytest.approx(0.5, abs=1e-3)
+    assert m.along_m == pytest.approx(1.5 * LON_STEP_M, rel=1e-3)
+    assert m.distance_m == pytest.approx(55.6, abs=0.5)
+
+    # 2 本目の中間付近
+    m2 = g.nearest(39.1102, 140.025)
+    assert m2.segment_index == 2 and m2.distance_m == pytest.approx(22.2, abs=0.5)
+
+
+@pytest.mark.parametrize("pt", [(39.1005, 140.015), (39.105, 140.021), (39.12, 139.99), (39.1102, 140.025)])
+def test_matches_reference_and_polyline6_storage(pt):
+    ref = _brute_force(*pt)
+    assert RouteGeometry.from_geojson(ROUTE).distance_m(*pt) == pytest.approx(ref, rel=2e-3, abs=0.05)
+    assert distance_to_polyline_m(pt, encode_route(ROUTE)) == pytest.approx(ref, rel=2e-3, abs=0.1)
+
+
+def test_empty_and_degenerate_routes():
+    assert distance_to_polyline_m((39.1, 140.0), None) is None
+    assert RouteGeometry.from_geojson({"type": "FeatureCollection", "features": []}).empty
+    single = RouteGeometry([[[140.0, 39.1]]])
+    assert single.distance_m(39.1, 140.01) == pytest.approx(LON_STEP_M, rel=1e-3)
+
+
+def _zigzag(n):
+    """東向きに n 点（約 8.6m 間隔）の長いルート。"""
+    return {"type": "LineString", "coordinates": [[140.0 + i * 1e-4, 39.1 + (i % 2) * 2e-5] for i in range(n)]}
+
+
+@pytest.mark.parametrize("pt", [(39.1003, 140.05), (39.1, 140.0), (39.13, 140.2), (39.1, 140.5)])
+def test_compiled_grid_search_matches_full_scan(pt):
+    route = _zigzag(5000)
+    compiled = CompiledRoute(1, 1, route, stops=[(10, 39.1, 140.25)], cell_m=100)
+    full = RouteGeometry.from_geojson(route).nearest(*pt)
+    got = compiled.nearest(*pt, radius_m=120)
+    assert got.segment_index == full.segment_index
+    assert got.distance_m == pytest.approx(full.distance_m)
+    assert compiled.stop_along_m[10] == pytest.approx(compiled.nearest(39.1, 140.25).along_m)
+
+
+def test_cache_keys_on_route_version_and_invalidates():
+    cache = CompiledRouteCache(max_entries=2)
+    loads = []
+
+    def loader(route):
+        def _load():
+            loads.append(route)
+            return route
+        return _load
+
+    a = cache.get(7, 1, loader(_zigzag(10)))
+    assert cache.get(7, 1, loader(None)) is a and len(loads) == 1
+    # 版が上がれば作り直し、古い版は捨てる
+    b = cache.get(7, 2, loader(_zigzag(20)))
+    assert b is not a and b.geometry.n_segments == 19 and cache.stats()["entries"] == 1
+    cache.invalidate(7)
+    cache.get(7, 2, loader(_zigzag(20)))
+    assert len(loads) == 3 and cache.stats()["invalidations"] == 1
+
+
+def test_cache_rebuilds_stop_positions_when_stops_change():
+    cache = CompiledRouteCache()
+    loads = []
+
+    def _load():
+        loads.append(1)
+        return _zigzag(10)
+
+    a = cache.get(7, 1, _load, [(1, 39.1, 140.0002)])
+    assert cache.get(7, 1, _load, [(1, 39.1, 140.0002)]) is a
+    # 同じ版のまま停留所が追加・移動されたら停留所の部分だけ作り直す（形状は読み直さない）
+    b = cache.get(7, 1, _load, [(1, 39.1, 140.0005), (2, 39.1, 140.0008)])
+    assert b is not a and b.geometry is a.geometry and len(loads) == 1
+    assert set(b.stop_along_m) == {1, 2} and b.stop_along_m[1] > a.stop_along_m[1]
+    assert cache.stats()["restops"] == 1 and cache.stats()["entries"] == 1
+
+
+def test_incremental_match_stays_on_return_leg_of_out_and_back_route():
+    # 往路（東へ）と復路（西へ, 5m 北）をつないだピストンルート
+    out = [[140.0 + i * 1e-4, 39.1] for i in range(101)]
+    back = [[140.01 - i * 1e-4, 39.10005] for i in range(101)]
+    compiled = CompiledRoute(1, 3, {"type": "LineString", "coordinates": out + back}, stops=[(5, 39.10005, 140.0)])
+
+    # 往路に近い点でも、直前が復路なら復路にマッチし続ける
+    pt = (39.10001, 140.005)
+    assert compiled.match(*pt, radius_m=50).along_m < compiled.length_m / 2
+    last = RouteProgress(3, 140, compiled.geometry.cum[140])
+    m = compiled.match(*pt, radius_m=50, last=last)
+    assert m.along_m > compiled.length_m / 2
+    prog = compiled.progress(m, next_stop_id=5)
+    assert prog["next_stop_remaining_m"] == pytest.approx(prog["remaining_m"], abs=1.0)
+
+    # 版が違う / 窓の外に出た場合は全体から探す
+    assert compiled.match(*pt, radius_m=50, last=RouteProgress(2, 140, last.along_m)).along_m < compiled.length_m / 2
+    far = compiled.match(39.1, 140.0005, radius_m=50, last=RouteProgress(3, 100, compiled.geometry.cum[100]))
+    assert far.segment_index in (4, 5, 195, 196)
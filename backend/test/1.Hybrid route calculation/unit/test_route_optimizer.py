@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import itertools
+import random
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from shared.app.models import Stop
+from worker.app.services.itinerary import route_optimizer
+from worker.app.services.itinerary.crud_plan import reorder_stops
+from worker.app.services.itinerary.route_optimizer import route_cost, solve_visit_order
+
+
+def _line_matrix(xs):
+    """一直線上の地点（座標 xs）の距離行列。"""
+    return [[abs(a - b) for b in xs] for a in xs]
+
+
+def _brute_force(matrix, piston=False, fix_end=False):
+    n = len(matrix)
+    inner = list(range(1, n - 1 if fix_end else n))
+    best = None
+    for perm in itertools.permutations(inner):
+        order = [0, *perm] + ([n - 1] if fix_end else [])
+        c = route_cost(order, matrix, piston=piston)
+        if best is None or c < best:
+            best = c
+    return best
+
+
+def test_zigzag_is_untangled_with_fixed_start():
+    xs = [0, 5, 1, 4, 2, 3]
+    order = solve_visit_order(_line_matrix(xs))
+    assert order[0] == 0
+    assert [xs[i] for i in order] == [0, 1, 2, 3, 4, 5]
+
+
+def test_exact_solver_matches_brute_force_with_end_and_piston():
+    rng = random.Random(7)
+    n = 7
+    m = [[0 if i == j else rng.randint(1, 50) for j in range(n)] for i in range(n)]  # 非対称
+
+    order = solve_visit_order(m, fix_end=True)
+    assert order[0] == 0 and order[-1] == n - 1
+    assert route_cost(order, m) == _brute_force(m, fix_end=True)
+
+    order = solve_visit_order(m, piston=True)
+    assert order[0] == 0
+    assert route_cost(order, m, piston=True) == _brute_force(m, piston=True)
+
+
+def test_heuristic_for_large_n_keeps_endpoints_and_improves(monkeypatch):
+    monkeypatch.setattr(route_optimizer, "TSP_EXACT_MAX_FREE", 4)
+    rng = random.Random(3)
+    xs = [0] + rng.sample(range(1, 100), 20) + [100]
+    m = _line_matrix(xs)
+
+    order = solve_visit_order(m, fix_end=True)
+    assert order[0] == 0 and order[-1] == len(xs) - 1
+    assert sorted(order) == list(range(len(xs)))
+    assert route_cost(order, m) == 100  # 一直線なら単調な並びが最適
+
+
+def test_keeps_current_order_when_already_optimal():
+    assert solve_visit_order(_line_matrix([0, 1, 2, 3])) == [0, 1, 2, 3]
+
+
+def test_reorder_stops_swaps_under_unique_order_constraint():
+    engine = create_engine("sqlite://")
+    Stop.__table__.create(engine)
+    with Session(engine) as db:
+        db.add_all([Stop(id=i, plan_id=1, spot_id=10 + i, order_index=i) for i in (1, 2, 3)])
+        db.commit()
+
+        # (plan_id, order_index) の一意制約に途中で当たらない
+        reorder_stops(db, plan_id=1, ordered_stop_ids=[3, 1, 2])
+        db.commit()
+        got = db.execute(Stop.__table__.select().order_by(Stop.order_index)).all()
+        assert [r.id for r in got] == [3, 1, 2] and [r.order_index for r in got] == [1, 2, 3]
+
+        with pytest.raises(ValueError):
+            reorder_stops(db, plan_id=1, ordered_stop_ids=[3, 1])
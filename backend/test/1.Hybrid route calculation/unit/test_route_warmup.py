@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from worker.app.services.routing.warmup import RateLimiter, warm_popular_legs
+
+
+class _Clock:
+    def __init__(self):
+        self.t = 0.0
+
+    def now(self):
+        return self.t
+
+    def sleep(self, sec):
+        self.t += sec
+
+
+def test_rate_limiter_spaces_requests():
+    clock = _Clock()
+    limiter = RateLimiter(2.0, clock=clock.now, sleep=clock.sleep)
+    for _ in range(6):
+        limiter.acquire()
+    # 初期バースト 2 件 + 以降 0.5 秒毎
+    assert abs(clock.t - 2.0) < 1e-9
+
+
+class _Client:
+    def __init__(self):
+        self.calls = 0
+
+    def fetch_route(self, *a, **k):
+        self.calls += 1
+        return {}, 1.0, 1.0
+
+
+class _Routing:
+    """car/foot は client を叩き、hybrid は 2 回目以降キャッシュ済み扱いで叩かない。"""
+
+    def __init__(self):
+        self.client = _Client()
+        self.hybrid = []
+
+    def calculate_full_itinerary_route(self, waypoints, profile, piston=False):
+        return self.client.fetch_route(waypoints, profile)
+
+    def calculate_hybrid_leg(self, db, *, origin, dest, dest_spot_type, dest_tags, dest_spot_id):
+        self.hybrid.append(dest_spot_id)
+
+
+def test_warm_popular_legs_counts_and_throttles_only_osrm_calls():
+    spots = [
+        {"id": 1, "lat": 39.0, "lon": 140.0},
+        {"id": 2, "lat": 39.1, "lon": 140.0},
+        {"id": 3, "lat": 39.2, "lon": 140.0},
+        {"id": 9, "lat": 60.0, "lon": 140.0},  # 遠すぎる → 対象外
+    ]
+    clock = _Clock()
+    routing = _Routing()
+    out = warm_popular_legs(None, routing, spots, limiter=RateLimiter(1000.0, clock=clock.now, sleep=clock.sleep))
+
+    assert out["pairs"] == 6
+    assert out["legs"] == 18 and out["errors"] == 0
+    assert out["osrm_requests"] == 12 == routing.client._client.calls
+    assert sorted(set(routing.hybrid)) == [1, 2, 3]
+
+    capped = warm_popular_legs(None, _Routing(), spots, max_legs=4)
+    assert capped["legs"] == 6 and capped["pairs"] == 2
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from worker.app.services.routing.client import OSRMNoRouteError
+from worker.app.services.routing.routing_service import RoutingService
+
+O = (39.10, 140.05)
+D = (39.12, 140.06)
+
+
+def _service(monkeypatch, speculative, car_ok=True):
+    calls = []
+    started = {"car": threading.Event(), "foot": threading.Event()}
+
+    def fake_route(self, waypoints, profile="car", piston=False):
+        calls.append(profile)
+        started[profile].set()
+        if speculative:
+            # 同時に投げられていれば相手も開始済みのはず（逐次なら待ちぼうけで False）
+            other = "foot" if profile == "car" else "car"
+            assert started[other].wait(timeout=2.0)
+        if profile == "car" and not car_ok:
+            raise OSRMNoRouteError("no car route")
+        return {"geojson": {"type": "FeatureCollection", "features": []},
+                "distance_km": 1.0 if profile == "car" else 2.0, "duration_min": 1.0}
+
+    monkeypatch.setattr(RoutingService, "calculate_full_itinerary_route", fake_route)
+    rs = RoutingService(speculative=speculative)
+    rs.cache = None
+    return rs, calls
+
+
+def test_speculative_issues_both_and_prefers_car(monkeypatch):
+    rs, calls = _service(monkeypatch, speculative=True)
+    r = rs._car_or_foot(O, D, False)
+    assert r["distance_km"] == 1.0 and r["used_ap"] is None
+    assert sorted(calls) == ["car", "foot"]
+
+
+def test_speculative_falls_back_to_foot_without_second_round_trip(monkeypatch):
+    rs, calls = _service(monkeypatch, speculative=True, car_ok=False)
+    r = rs._car_or_foot(O, D, False)
+    assert r["distance_km"] == 2.0
+    assert sorted(calls) == ["car", "foot"]
+
+
+def test_sequential_mode_skips_foot_when_car_succeeds(monkeypatch):
+    rs, calls = _service(monkeypatch, speculative=False)
+    assert rs._car_or_foot(O, D, False)["distance_km"] == 1.0
+    assert calls == ["car"]
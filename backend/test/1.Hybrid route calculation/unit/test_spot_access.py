@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+from worker.app.services.routing import routing_service, spot_access
+from worker.app.services.routing.routing_service import RoutingService
+from worker.app.services.routing.spot_access import lookup_spot_access
+
+
+class _Db:
+    """spot_access_assignments の主キー検索だけを返すダミー。"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get(self, model, pk):
+        return self.rows.get(pk)
+
+
+def _row(**kw):
+    base = dict(
+        car_direct=False, access_point_id=7, ap_name="AP-7", ap_type="parking",
+        ap_latitude=39.0, ap_longitude=140.0, ap_distance_km=3.0, ap_search_km=20.0,
+    )
+    base.update(kw)
+    return SimpleNamespace(**base)
+
+
+def test_lookup_respects_radius(monkeypatch):
+    monkeypatch.setattr(spot_access, "_table_available", True)
+    db = _Db({1: _row(), 2: _row(ap_distance_km=15.0), 3: _row(car_direct=True, access_point_id=None)})
+
+    assert lookup_spot_access(db, 1, ap_max_km=20.0) == (False, (7, "AP-7", "parking", 39.0, 140.0))
+    # 割当済み AP が問い合わせ半径の外 → AP なし
+    assert lookup_spot_access(db, 2, ap_max_km=10.0) == (False, None)
+    assert lookup_spot_access(db, 3, ap_max_km=20.0) == (True, None)
+    # 事前計算より広い半径・未割当・spot_id なし → 従来の判定に任せる
+    assert lookup_spot_access(db, 1, ap_max_km=30.0) is None
+    assert lookup_spot_access(db, 99, ap_max_km=20.0) is None
+    assert lookup_spot_access(db, None, ap_max_km=20.0) is None
+
+
+def test_hybrid_leg_uses_assignment_without_knn(monkeypatch):
+    monkeypatch.setattr(spot_access, "_table_available", True)
+
+    def _no_knn(*a, **k):
+        raise AssertionError("KNN should not be called")
+
+    monkeypatch.setattr(routing_service, "find_nearest_access_point", _no_knn)
+
+    def fake_route(self, coords, profile="car", piston=False):
+        return {"geojson": {"type": "FeatureCollection", "features": []},
+                "distance_km": 1.0, "duration_min": 2.0}
+
+    monkeypatch.setattr(RoutingService, "calculate_full_itinerary_route", fake_route)
+
+    rs = RoutingService()
+    rs.cache = None
+    leg = rs.calculate_hybrid_leg(
+        _Db({5: _row()}), origin=(39.1, 140.1), dest=(39.01, 140.01),
+        dest_spot_type="mountain", dest_tags=None, dest_spot_id=5,
+    )
+    assert leg["used_ap"]["name"] == "AP-7"
+    assert leg["distance_km"] == 2.0
+
+
+def test_hybrid_cache_key_follows_the_resolved_access_point(monkeypatch):
+    from worker.app.services.routing.leg_cache import LegCache
+
+    monkeypatch.setattr(spot_access, "_table_available", False)
+    aps = [(7, "AP-7", "parking", 39.0, 140.0)]
+    monkeypatch.setattr(routing_service, "find_nearest_access_point", lambda db, lat, lon, max_km: aps[0])
+
+    def fake_route(self, coords, profile="car", piston=False):
+        return {"geojson": {"type": "FeatureCollection", "features": []},
+                "distance_km": 1.0, "duration_min": 2.0}
+
+    monkeypatch.setattr(RoutingService, "calculate_full_itinerary_route", fake_route)
+
+    rs = RoutingService()
+    rs.store = None
+    rs.cache = LegCache(use_redis=False)
+    kw = dict(origin=(39.1, 140.1), dest=(39.01, 140.01), dest_spot_type="mountain", dest_tags=None)
+    assert rs.calculate_hybrid_leg(None, **kw)["used_ap"]["id"] == 7
+    # 近傍 AP が変われば（追加・削除）キャッシュ済みのレグは使わない
+    aps[0] = (8, "AP-8", "trailhead", 39.005, 140.005)
+    assert rs.calculate_hybrid_leg(None, **kw)["used_ap"]["id"] == 8
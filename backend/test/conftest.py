@@ -4,9 +4,12 @@
 - DBセッション（ロールバック保証）
 - OSRM到達性チェック
 - 近傍AP 1点取得ヘルパ
+- ローカルの偽 OSRM サーバー / 偽 Redis / requests の偽レスポンス
 """
 from __future__ import annotations
 
+import asyncio
+import fnmatch
 import os
 import socket
 import contextlib
@@ -115,3 +118,193 @@ def any_access_point(db_session: Session) -> Optional[tuple[int, str, str, float
     if not row:
         return None
     return (int(row[0]), str(row[1]), str(row[2]), float(row[3]), float(row[4]))
+
+# -------- ローカルの偽 OSRM（大円経路。オフラインの並行性テスト用） --------
+@pytest.fixture(scope="function")
+def fake_osrm(monkeypatch):
+    """
+    scripts.fake_osrm_server を car / foot 1 台ずつ起動し、OSRM_CAR_HOSTS / OSRM_FOOT_HOSTS を向ける。
+    戻り値: {"car": FakeOSRMServer, "foot": FakeOSRMServer}（latency_ms / error_rate / fail_next を調整可）
+    """
+    from scripts.fake_osrm_server import FakeOSRMServer
+    from worker.app.services.routing.client import reset_http_sessions
+
+    with FakeOSRMServer("car", seed=0) as car, FakeOSRMServer("foot", seed=0) as foot:
+        monkeypatch.setenv("OSRM_CAR_HOSTS", car.url)
+        monkeypatch.setenv("OSRM_FOOT_HOSTS", foot.url)
+        reset_http_sessions()
+        try:
+            yield {"car": car, "foot": foot}
+        finally:
+            reset_http_sessions()
+
+
+# -------- インメモリの偽 Redis（キャッシュ / ナビ状態 / pub/sub のユニットテスト用） --------
+def _b(v) -> bytes:
+    """redis-py と同じく値は bytes で返す。"""
+    if isinstance(v, bytes):
+        return v
+    return str(v).encode("utf-8")
+
+
+class FakeRedis:
+    """
+    本物の redis.Redis のうちアプリが使うコマンドだけを持つ最小実装。
+    - 文字列: get / set / delete / expire、ハッシュ: hget / hgetall / hset / hdel / hincrby
+    - pipeline（execute でまとめて実行）、publish（同一プロセス内で配送）
+    - as_async(): redis.asyncio 側の pub/sub（psubscribe / get_message）を同じブローカーで使う
+    - calls: 実行したコマンド名の列（往復回数の確認用。pipeline 内のコマンドも含む）
+    """
+
+    def __init__(self):
+        self.data: dict = {}
+        self.calls: list = []
+        self._subs: list = []
+
+    def get(self, key):
+        self.calls.append("get")
+        v = self.data.get(key)
+        return v if isinstance(v, bytes) else None
+
+    def set(self, key, value, ex=None):
+        self.calls.append("set")
+        self.data[key] = _b(value)
+        return True
+
+    def delete(self, *keys):
+        self.calls.append("delete")
+        return sum(self.data.pop(k, None) is not None for k in keys)
+
+    def expire(self, key, sec):
+        self.calls.append("expire")
+        return key in self.data
+
+    def hget(self, key, field):
+        self.calls.append("hget")
+        return (self.data.get(key) or {}).get(field)
+
+    def hgetall(self, key):
+        self.calls.append("hgetall")
+        return {f.encode(): v for f, v in (self.data.get(key) or {}).items()}
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        self.calls.append("hset")
+        h = self.data.setdefault(key, {})
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        h.update({f: _b(v) for f, v in items.items()})
+        return len(items)
+
+    def hdel(self, key, *fields):
+        self.calls.append("hdel")
+        h = self.data.get(key) or {}
+        return sum(h.pop(f, None) is not None for f in fields)
+
+    def hincrby(self, key, field, amount=1):
+        self.calls.append("hincrby")
+        h = self.data.setdefault(key, {})
+        h[field] = _b(int(h.get(field, b"0")) + amount)
+        return int(h[field])
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+    def publish(self, channel, message):
+        self.calls.append("publish")
+        n = 0
+        for ps in self._subs:
+            for pattern in ps.patterns:
+                if fnmatch.fnmatchcase(channel, pattern):
+                    ps.queue.append({
+                        "type": "pmessage", "pattern": _b(pattern), "channel": _b(channel), "data": _b(message),
+                    })
+                    n += 1
+        return n
+
+    def as_async(self) -> "_FakeAsyncRedis":
+        return _FakeAsyncRedis(self)
+
+
+class _FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self._redis, self._ops = redis, []
+
+    def __getattr__(self, name):
+        def _queue(*args, **kwargs):
+            self._ops.append((name, args, kwargs))
+            return self
+        return _queue
+
+    def execute(self):
+        ops, self._ops = self._ops, []
+        return [getattr(self._redis, name)(*a, **kw) for name, a, kw in ops]
+
+
+class _FakeAsyncRedis:
+    def __init__(self, redis: FakeRedis):
+        self._redis = redis
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        ps = _FakePubSub()
+        self._redis._subs.append(ps)
+        return ps
+
+
+class _FakePubSub:
+    """redis.asyncio の PubSub のうち psubscribe / get_message / aclose だけ。"""
+
+    def __init__(self):
+        self.patterns: set = set()
+        self.queue: list = []
+        self.closed = False
+
+    async def psubscribe(self, *patterns):
+        self.patterns.update(patterns)
+
+    async def punsubscribe(self, *patterns):
+        if patterns:
+            self.patterns.difference_update(patterns)
+        else:
+            self.patterns.clear()
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        if not self.queue:
+            await asyncio.sleep(min(timeout or 0.0, 0.01))
+        return self.queue.pop(0) if self.queue else None
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture(scope="function")
+def fake_redis() -> FakeRedis:
+    return FakeRedis()
+
+
+# -------- requests の偽レスポンス（OSRM クライアントのユニットテスト用） --------
+class FakeResponse:
+    """requests.Response の代わり。raise_for_status は 4xx/5xx で response 付きの HTTPError を送出する。"""
+
+    def __init__(self, status_code: int = 200, payload: Optional[dict] = None):
+        import json
+
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.text = json.dumps(self._payload)
+        self.response = self
+
+    def raise_for_status(self):
+        import requests
+
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code), response=self)
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture(scope="session")
+def osrm_response():
+    """FakeResponse クラス（fake_get から osrm_response(200, payload) のように返す）。"""
+    return FakeResponse
@@ -274,6 +274,7 @@ class InformationService:
 
         # まずルーティング評価のために距離/所要時間の基準（正規化用 max）を求める
         # 全日ではなく “代表1日” で近似し、スポットの総移動距離・時間の上限を計算
+        # ※ 経路は日付に依存しないため、1 回求めた値を全日で使い回す（OSRM 呼び出しは 1 回）
         rep_date = start_date
         rep_distance_km, rep_duration_min = self._estimate_trip_distance_duration(
             spots=spots, origin_lat=origin_lat, origin_lon=origin_lon, date_hint=rep_date
@@ -282,10 +283,8 @@ class InformationService:
         max_duration_min = max(rep_duration_min, 1.0)
 
         for d in _daterange_inclusive(start_date, end_date):
-            # 1) ルーティング
-            distance_km, duration_min = self._estimate_trip_distance_duration(
-                spots=spots, origin_lat=origin_lat, origin_lon=origin_lon, date_hint=d
-            )
+            # 1) ルーティング（代表値を流用）
+            distance_km, duration_min = rep_distance_km, rep_duration_min
             dist_score = _normalize_distance_km(distance_km, max_distance_km)
             dur_score = _normalize_duration_min(duration_min, max_duration_min)
 
@@ -375,44 +374,22 @@ class InformationService:
         total_min = 0.0
 
         if routing is not None:
-            # ルーティング API 仕様に幅を持たせる（存在するメソッドへフォールバック）
-            def _first_callable(obj, names: List[str]):
-                for nm in names:
-                    fn = getattr(obj, nm, None)
-                    if callable(fn):
-                        return fn
-                return None
+            # 全セグメントの距離/時間を OSRM /table の 1 リクエストでまとめて取得
+            segments = [
+                ((lat1, lon1), (lat2, lon2))
+                for (lat1, lon1), (lat2, lon2) in zip(waypoints[:-1], waypoints[1:])
+                if None not in (lat1, lon1, lat2, lon2)
+            ]
+            try:
+                results = routing.get_pair_distances(segments, "car")
+            except Exception:
+                results = [None] * len(segments)
 
-            # 1セグメントずつ問い合わせ
-            for (lat1, lon1), (lat2, lon2) in zip(waypoints[:-1], waypoints[1:]):
-                if None in (lat1, lon1, lat2, lon2):
-                    continue
-                # 候補メソッド
-                fn = _first_callable(
-                    routing,
-                    [
-                        "estimate_route",         # (lat1,lon1,lat2,lon2)-> {distance_km, duration_min}
-                        "route",                  # 返却に distance_m, duration_s が含まれる等
-                        "get_route",
-                        "compute_route",
-                    ],
-                )
-                seg_km, seg_min = None, None
-                if fn:
-                    try:
-                        resp = fn(lat1, lon1, lat2, lon2)
-                        # 返却形に幅を持たせて読み取る
-                        if isinstance(resp, dict):
-                            if "distance_km" in resp and "duration_min" in resp:
-                                seg_km = float(resp["distance_km"])
-                                seg_min = float(resp["duration_min"])
-                            elif "distance_m" in resp and "duration_s" in resp:
-                                seg_km = float(resp["distance_m"]) / 1000.0
-                                seg_min = float(resp["duration_s"]) / 60.0
-                    except Exception:
-                        seg_km, seg_min = None, None
-
-                if seg_km is None or seg_min is None:
+            for ((lat1, lon1), (lat2, lon2)), resp in zip(segments, results):
+                if resp is not None:
+                    seg_km = float(resp["distance_km"])
+                    seg_min = float(resp["duration_min"])
+                else:
                     # ルーティングが無い/読めないときはハバースィン＋簡易速度（徒歩4.5km/h）
                     seg_km = _haversine_km(lat1, lon1, lat2, lon2)
                     seg_min = (seg_km / 4.5) * 60.0
@@ -17,6 +17,8 @@ from sqlalchemy.exc import IntegrityError
 
 from shared.app.models import Plan, Stop, Spot, Session as UserSession
 from shared.app.database import SessionLocal
+from shared.app.services.route_geometry import encode_route
+from shared.app.services.route_index import invalidate_compiled_route
 
 
 # --- ユーティリティ ---------------------------------------------------------
@@ -247,14 +249,32 @@ def list_stops_for_plan(db: Session, *, plan_id: int) -> list[Stop]:
     )
 
 def reorder_stops(db: Session, *, plan_id: int, ordered_stop_ids: list[int]) -> None:
+    """
+    計画内の全 Stop の order_index を ordered_stop_ids の順に 1..N で振り直す（コミットは呼び出し側）。
+    - 一意制約 (plan_id, order_index) に途中で当たらないよう、一旦負の値へ退避してから振る
+    - ordered_stop_ids は計画内の Stop.id を過不足なく含む必要がある（違えば ValueError）
+    """
+    current = set(
+        db.execute(select(Stop.id).where(Stop.plan_id == plan_id).with_for_update()).scalars().all()
+    )
+    if current != set(ordered_stop_ids) or len(ordered_stop_ids) != len(current):
+        raise ValueError("ordered_stop_ids must contain every stop of the plan exactly once")
     if not ordered_stop_ids:
         return
+
+    db.execute(
+        update(Stop)
+        .where(Stop.plan_id == plan_id)
+        .values(order_index=-Stop.order_index - 1)
+        .execution_options(synchronize_session=False)
+    )
     # 1 から連番で order_index を振り直す
     for i, sid in enumerate(ordered_stop_ids, start=1):
         db.execute(
             update(Stop)
             .where(Stop.id == sid, Stop.plan_id == plan_id)
             .values(order_index=i)
+            .execution_options(synchronize_session=False)
         )
 
 def add_spot_to_plan(
@@ -303,7 +323,9 @@ def update_plan_route_with_version(
       - base_version が None の場合は無条件更新（初回設定など）
       - base_version が指定されていれば WHERE route_version=base_version で更新し、route_version = route_version + 1
     戻り値: (updated: bool, new_version: int)
+    ルート形状は polyline6 に圧縮して保存する（JSONB の行サイズ削減）。
     """
+    new_geojson = encode_route(new_geojson)
     if base_version is None:
         # 無条件更新（既存データがない/不整合時の初期設定など）
         stmt = (
@@ -318,6 +340,7 @@ def update_plan_route_with_version(
         )
         res = db.execute(stmt).first()
         db.commit()
+        invalidate_compiled_route(plan_id)
         # returning は更新後の値なので、そのまま返す
         return True, int(res[0]) if res and res[0] is not None else 0
 
@@ -339,4 +362,5 @@ def update_plan_route_with_version(
         current = db.query(Plan.route_version).filter(Plan.id == plan_id).scalar() or base_version
         return False, int(current)
     db.commit()
+    invalidate_compiled_route(plan_id)
     return True, int(res[0])
\ No newline at end of file
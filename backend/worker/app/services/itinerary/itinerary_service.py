@@ -1,18 +1,23 @@
 # /app/backend/worker/app/services/itinerary/itinerary_service.py
 
 from datetime import date
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 
 from worker.app.services.itinerary import crud_plan
+from worker.app.services.itinerary.route_optimizer import route_cost, solve_visit_order
+from worker.app.services.navigation.geospatial_utils import haversine_distance_m
 from worker.app.services.routing.routing_service import RoutingService
+from worker.app.services.routing.leg_engine import LegSpec
+from worker.app.services.routing.leg_planner import compute_planned_legs
 
 from worker.app.services.routing.client import OSRMNoRouteError
 from worker.app.services.routing.access_points_repo import find_nearest_access_point
 from worker.app.services.routing.drive_rules import is_car_direct_accessible
+from worker.app.services.routing.spot_access import lookup_spot_access
 
 from shared.app.models import Spot, Stop
 
@@ -28,7 +33,8 @@ def create_plan_for_user(
         db, user_id=user_id, session_id=session_id, title=title, start_date=start_date
     )
     # 作成直後だが、将来的な拡張性のためサマリー関数経由で返す
-    return summarize_plan(db, plan_id=new_plan.id)
+    # （ルート形状はプレビュー計算ノードで改めて求めるため、ここでは距離/時間のみ）
+    return summarize_plan(db, plan_id=new_plan.id, include_geometry=False)
 
 def add_spot_to_user_plan(
     db: Session, *, plan_id: int, spot_id: int, position: Optional[int] = None
@@ -37,7 +43,7 @@ def add_spot_to_user_plan(
     既存の計画にスポットを追加し、更新された計画のサマリーを返す。
     """
     crud_plan.add_spot_to_plan(db, plan_id=plan_id, spot_id=spot_id, position=position)
-    return summarize_plan(db, plan_id=plan_id)
+    return summarize_plan(db, plan_id=plan_id, include_geometry=False)
 
 
 def remove_spot_from_user_plan(db: Session, *, plan_id: int, spot_id: int) -> Dict[str, Any]:
@@ -45,7 +51,7 @@ def remove_spot_from_user_plan(db: Session, *, plan_id: int, spot_id: int) -> Di
     既存の計画からスポットを削除し、更新された計画のサマリーを返す。
     """
     crud_plan.remove_spot_from_plan(db, plan_id=plan_id, spot_id=spot_id)
-    return summarize_plan(db, plan_id=plan_id)
+    return summarize_plan(db, plan_id=plan_id, include_geometry=False)
 
 
 def reorder_user_plan_stops(
@@ -55,10 +61,73 @@ def reorder_user_plan_stops(
     計画の訪問順を並べ替え、更新された計画のサマリーを返す。
     """
     crud_plan.reorder_plan_stops(db, plan_id=plan_id, spot_ids_in_order=spot_ids_in_order)
-    return summarize_plan(db, plan_id=plan_id)
+    return summarize_plan(db, plan_id=plan_id, include_geometry=False)
 
 
-def summarize_plan(db: Session, *, plan_id: int) -> Dict[str, Any]:
+def optimize_plan_order(
+    db: Session,
+    *,
+    plan_id: int,
+    fix_start: bool = True,
+    fix_end: bool = False,
+    piston: bool = False,
+) -> Dict[str, Any]:
+    """
+    計画の訪問順を所要時間が最短になるよう並べ替えて保存し、更新後のサマリーを返す。
+    - 所要時間は OSRM /table（car）の行列 1 回で求める（AP 経由の徒歩区間は近似）
+    - fix_start / fix_end: 先頭 / 末尾の訪問先を固定、piston: 最後に先頭へ戻る前提で最適化
+    サマリーの "optimization" に before/after の合計分と並べ替えの有無を入れる。
+    """
+    stops = (crud_plan.summarize_plan_stops(db, plan_id=plan_id) or {}).get("stops") or []
+    result: Dict[str, Any] = {"changed": False, "before_min": None, "after_min": None}
+
+    if len(stops) >= 3:
+        points = [(float(s["latitude"]), float(s["longitude"])) for s in stops]
+        matrix = _duration_matrix_min(RoutingService(), points)
+        order = solve_visit_order(matrix, fix_start=fix_start, fix_end=fix_end, piston=piston)
+        result["before_min"] = round(route_cost(list(range(len(stops))), matrix, piston=piston), 1)
+        result["after_min"] = round(route_cost(order, matrix, piston=piston), 1)
+        if order != list(range(len(stops))):
+            crud_plan.reorder_stops(
+                db, plan_id=plan_id, ordered_stop_ids=[int(stops[i]["stop_id"]) for i in order]
+            )
+            db.commit()
+            result["changed"] = True
+
+    summary = summarize_plan(db, plan_id=plan_id, include_geometry=False)
+    summary["optimization"] = result
+    return summary
+
+
+# car で到達不能な組に使う推定速度（km/h）。最適化で不当に選ばれないよう遅めに見積もる
+_UNROUTABLE_KMH = 4.5
+
+
+def _duration_matrix_min(rs: RoutingService, points: List[Tuple[float, float]]) -> List[List[float]]:
+    """points 間の所要時間行列（分）。取得できない要素は直線距離の徒歩速度で埋める。"""
+    try:
+        durations = rs.get_distance_matrix(points, points, "car")["durations_min"]
+    except Exception:
+        durations = [[None] * len(points) for _ in points]
+
+    matrix: List[List[float]] = []
+    for i, a in enumerate(points):
+        row: List[float] = []
+        for j, b in enumerate(points):
+            v = durations[i][j] if i != j else 0.0
+            if v is None:
+                v = haversine_distance_m(a[0], a[1], b[0], b[1]) / 1000.0 / _UNROUTABLE_KMH * 60.0
+            row.append(float(v))
+        matrix.append(row)
+    return matrix
+
+
+def summarize_plan(db: Session, *, plan_id: int, include_geometry: bool = True) -> Dict[str, Any]:
+    """
+    計画のサマリー（stops / legs / route_geojson / total_duration_minutes）を返す。
+    include_geometry=False の場合は OSRM /table で各レグの距離/時間だけを求め、
+    route_geojson は None のまま返す（CRUD 直後の中間サマリー向け）。
+    """
     plan_summary = crud_plan.summarize_plan_stops(db, plan_id=plan_id) or {}
     plan_summary.setdefault("route_geojson", None)
     plan_summary.setdefault("total_duration_minutes", 0)
@@ -93,28 +162,46 @@ def summarize_plan(db: Session, *, plan_id: int) -> Dict[str, Any]:
         return plan_summary
 
     rs = RoutingService()
+    if not include_geometry:
+        legs, total_min = _summarize_legs_by_matrix(db, rs, waypoints, kinds_tags, used_spot_ids)
+        plan_summary["legs"] = legs
+        plan_summary["total_duration_minutes"] = int(round(total_min))
+        return plan_summary
+
     features: List[Dict[str, Any]] = []
     legs: List[Dict[str, Any]] = []  # ← 追加：レグを貯める
     total_min: float = 0.0
 
-    for i in range(len(waypoints) - 1):
-        origin = waypoints[i]
-        dest   = waypoints[i + 1]
-        dest_type, dest_tags = kinds_tags[i + 1]
-
-        leg = rs.calculate_hybrid_leg(
-            db,
-            origin=origin,
-            dest=dest,
-            dest_spot_type=dest_type,
-            dest_tags=dest_tags,
+    # 同一プロファイルが続く区間は 1 回の多点 /route にまとめ、残りは並列に計算して入力順で受け取る
+    specs = [
+        LegSpec(
+            origin=waypoints[i],
+            dest=waypoints[i + 1],
+            dest_spot_type=kinds_tags[i + 1][0],
+            dest_tags=kinds_tags[i + 1][1],
             ap_max_km=20.0,
+            dest_spot_id=used_spot_ids[i + 1],
         )
-        print(f"DEBUG: leg return value: {leg}")
+        for i in range(len(waypoints) - 1)
+    ]
+    outcomes = compute_planned_legs(rs, db, specs)
+
+    for i, outcome in enumerate(outcomes):
+        if not outcome.ok:
+            # 失敗したレグも legs の形は保つ（距離なし・エラー理由付き）
+            legs.append({
+                "from_spot_id": used_spot_ids[i],
+                "to_spot_id":   used_spot_ids[i + 1],
+                "distance_km": None,
+                "duration_min": 0,
+                "mode": "hybrid",
+                "used_ap": None,
+                "error": str(outcome.error),
+            })
+            continue
+        leg = outcome.result
 
         # まず legs に格納（GeoJSONの有無に関係なくカウントさせる）
-        # distance_m = leg.get("distance_m") or leg.get("distance_meters")
-        # distance_km = (distance_m / 1000.0) if distance_m is not None else None
         legs.append({
             "from_spot_id": used_spot_ids[i],
             "to_spot_id":   used_spot_ids[i + 1],
@@ -149,6 +236,96 @@ def summarize_plan(db: Session, *, plan_id: int) -> Dict[str, Any]:
 
     return plan_summary
 
+def _summarize_legs_by_matrix(
+    db: Session,
+    rs: RoutingService,
+    waypoints: List[Tuple[float, float]],
+    kinds_tags: List[Tuple[str, Any]],
+    used_spot_ids: List[int],
+) -> Tuple[List[Dict[str, Any]], float]:
+    """
+    形状不要なレグ要約。calculate_hybrid_leg と同じ判断（直行可否 / AP 経由）で区間を組み立て、
+    car / foot それぞれ 1 回の /table で全区間の距離/時間をまとめて取得する。
+    戻り値: (legs, 合計所要時間[分])
+    """
+    # 各レグを (profile, origin, dest) の区間列に分解
+    plans: List[Tuple[List[Tuple[str, Tuple[float, float], Tuple[float, float]]], Optional[Dict[str, Any]]]] = []
+    for i in range(len(waypoints) - 1):
+        origin, dest = waypoints[i], waypoints[i + 1]
+        dest_type, dest_tags = kinds_tags[i + 1]
+        ap = None
+        assignment = lookup_spot_access(db, used_spot_ids[i + 1], ap_max_km=20.0)
+        if assignment is not None:
+            car_direct, ap = assignment
+            if car_direct:
+                ap = None
+        elif not is_car_direct_accessible(dest_type, dest_tags):
+            ap = find_nearest_access_point(db, lat=dest[0], lon=dest[1], max_km=20.0)
+        if ap:
+            ap_id, ap_name, ap_type, ap_lat, ap_lon = ap
+            ap_pt = (ap_lat, ap_lon)
+            used_ap = {"id": ap_id, "name": ap_name, "ap_type": ap_type, "latitude": ap_lat, "longitude": ap_lon}
+            plans.append(([("car", origin, ap_pt), ("foot", ap_pt, dest)], used_ap))
+        else:
+            plans.append(([("car", origin, dest)], None))
+
+    # /table 自体が失敗したプロファイルの理由（区間が解決できなかったレグのエラーに使う）
+    failures: Dict[str, str] = {}
+
+    def _lookup(profile: str, pairs: List[Tuple[Tuple[float, float], Tuple[float, float]]]):
+        pairs = list(dict.fromkeys(pairs))
+        if not pairs:
+            return {}
+        try:
+            return dict(zip(pairs, rs.get_pair_distances(pairs, profile)))
+        except Exception as e:
+            failures[profile] = str(e)
+            return {pair: None for pair in pairs}
+
+    by_car = _lookup("car", [(o, d) for segs, _ in plans for (p, o, d) in segs if p == "car"])
+    # car で到達不能な区間は foot で引き直す（calculate_hybrid_leg のフォールバックと同じ）
+    by_foot = _lookup(
+        "foot", [(o, d) for segs, _ in plans for (p, o, d) in segs if p == "foot" or by_car.get((o, d)) is None]
+    )
+
+    legs: List[Dict[str, Any]] = []
+    total_min = 0.0
+    for i, (segs, used_ap) in enumerate(plans):
+        km = 0.0
+        minutes = 0.0
+        error: Optional[str] = None
+        for p, o, d in segs:
+            r = by_car.get((o, d)) if p == "car" else None
+            if r is None:
+                r = by_foot.get((o, d))
+            if r is None:
+                error = failures.get("foot") or failures.get(p) or f"no route for {p} segment {o} -> {d}"
+                break
+            km += float(r["distance_km"])
+            minutes += float(r["duration_min"])
+        if error is not None:
+            # 形状ありの経路と同じく、解決できなかったレグは距離なし・エラー理由付きで合計に含めない
+            legs.append({
+                "from_spot_id": used_spot_ids[i],
+                "to_spot_id":   used_spot_ids[i + 1],
+                "distance_km": None,
+                "duration_min": 0,
+                "mode": "hybrid",
+                "used_ap": used_ap,
+                "error": error,
+            })
+            continue
+        legs.append({
+            "from_spot_id": used_spot_ids[i],
+            "to_spot_id":   used_spot_ids[i + 1],
+            "distance_km": km,
+            "duration_min": int(round(minutes)),
+            "mode": "hybrid",
+            "used_ap": used_ap,
+        })
+        total_min += minutes
+    return legs, total_min
+
 # --- API for Information Service ---
 
 # 混雑ステータスのしきい値
@@ -160,60 +337,53 @@ def compute_hybrid_polyline_from_origin(
     *,
     origin: Tuple[float, float],
     stops: List[Stop],
+    abort: Optional[Callable[[], bool]] = None,
 ) -> Tuple[Dict[str, Any], float, float]:
     """
     [ADDED] 任意起点 origin から stops を順に辿るハイブリッド経路（car+foot）を算出。
       - 各 leg: P(i) -> P(i+1)
       - 車で到達できない場合は AccessPoint を自動選定して car→AP, AP→dest を連結
+      - abort: True を返したら以降の OSRM 要求を送らない（結果は不完全になる。呼び出し側で破棄する）
     返り値: (FeatureCollection, total_distance_m, total_duration_s)
     """
     fc: Dict[str, Any] = {"type": "FeatureCollection", "features": [], "properties": {}}
     total_dist_m: float = 0.0
     total_dur_s: float = 0.0
 
-    routing = RoutingService()  # [KEPT] 既存のOSRMクライアント／タイムアウト等の設定を内部で持つ前提
-    ap_repo = AccessPointsRepository(db)
-
-    # P0 は origin、P1..Pn は stops のスポット座標
-    prev_lat, prev_lon = origin
+    routing = RoutingService(abort=abort)  # [KEPT] 既存のOSRMクライアント／タイムアウト等の設定を内部で持つ前提
 
-    for idx, stop in enumerate(stops):
+    # P0 は origin、P1..Pn は stops のスポット座標（座標のない Stop は未知データとしてスキップ）
+    specs: List[LegSpec] = []
+    prev = (float(origin[0]), float(origin[1]))
+    for stop in stops:
         latlon = _as_point(stop)
         if not latlon or latlon[0] is None or latlon[1] is None:
-            # Spot に座標がない場合はスキップ（未知データ）
             continue
-        dest_lat, dest_lon = latlon
+        dest = (float(latlon[0]), float(latlon[1]))
+        sp = stop.spot
+        specs.append(
+            LegSpec(
+                origin=prev,
+                dest=dest,
+                dest_spot_type=getattr(sp, "spot_type", None),
+                dest_tags=getattr(sp, "tags", None),
+                ap_max_km=20.0,
+                dest_spot_id=getattr(stop, "spot_id", None),
+            )
+        )
+        # 次 leg の出発点はこの目的地
+        prev = dest
 
-        if can_drive_to_spot(stop):
-            # [KEPT] 既存ルール：車で直接行けるスポット
-            feat, dist_m, dur_s = routing.route_car((prev_lat, prev_lon), (dest_lat, dest_lon))
+    # 車で到達できない場合は calculate_hybrid_leg が AP を選定して car→AP, AP→dest(foot) を連結する
+    for outcome in compute_planned_legs(routing, db, specs):
+        if not outcome.ok:
+            # 1 レグの失敗で全体を止めない（当該区間は線なしで続行）
+            continue
+        leg = outcome.result
+        for feat in (leg.get("geojson") or {}).get("features") or []:
             _append_feature(fc, feat)
-            total_dist_m += dist_m or 0.0
-            total_dur_s += dur_s or 0.0
-        else:
-            # [KEPT] 車では到達不可：最寄り AP を探索して car→AP, AP→dest(foot) で分割
-            ap = ap_repo.find_nearest_access_point_for_spot(stop)
-            if ap is None:
-                # フォールバック：全足（foot）で直結（短距離向け）
-                feat, dist_m, dur_s = routing.route_foot((prev_lat, prev_lon), (dest_lat, dest_lon))
-                _append_feature(fc, feat)
-                total_dist_m += dist_m or 0.0
-                total_dur_s += dur_s or 0.0
-            else:
-                # car leg: prev -> AP
-                feat1, dist1, dur1 = routing.route_car((prev_lat, prev_lon), (ap.latitude, ap.longitude))
-                _append_feature(fc, feat1)
-                total_dist_m += dist1 or 0.0
-                total_dur_s += dur1 or 0.0
-
-                # foot leg: AP -> dest
-                feat2, dist2, dur2 = routing.route_foot((ap.latitude, ap.longitude), (dest_lat, dest_lon))
-                _append_feature(fc, feat2)
-                total_dist_m += dist2 or 0.0
-                total_dur_s += dur2 or 0.0
-
-        # 次 leg の出発点はこの目的地
-        prev_lat, prev_lon = dest_lat, dest_lon
+        total_dist_m += float(leg.get("distance_km") or 0.0) * 1000.0
+        total_dur_s += float(leg.get("duration_min") or 0.0) * 60.0
 
     # properties に合計値を格納
     fc["properties"]["distance_m"] = float(total_dist_m)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+訪問順序の最適化（TSP / 経路版 TSP）
+- 入力は所要時間行列 matrix[i][j]（i → j の分。非対称可）。行列の添字は「現在の訪問順」。
+- 自由に動かせる地点が少なければ Held-Karp（動的計画法）で厳密解、多ければ
+  最近傍法 + 2-opt / Or-opt の局所探索で近似解を求める。
+- fix_start: 先頭を固定 / fix_end: 末尾を固定 / piston: 最後に出発地へ戻る（先頭固定が前提）
+- 現在の順序より良くならなければ現在の順序をそのまま返す（無駄な並べ替えをしない）
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from typing import List, Sequence
+
+# 厳密解を使う「自由に動かせる地点数」の上限（2^N * N^2 の計算量）
+TSP_EXACT_MAX_FREE = int(os.getenv("TSP_EXACT_MAX_FREE", "10"))
+# 局所探索の最大周回数
+TSP_LOCAL_SEARCH_MAX_PASSES = int(os.getenv("TSP_LOCAL_SEARCH_MAX_PASSES", "50"))
+
+_EPS = 1e-9
+
+Matrix = Sequence[Sequence[float]]
+
+
+def route_cost(order: Sequence[int], matrix: Matrix, *, piston: bool = False) -> float:
+    """order の順に巡った時の合計コスト。piston=True なら最後に先頭へ戻る分も加える。"""
+    if len(order) < 2:
+        return 0.0
+    total = sum(float(matrix[a][b]) for a, b in zip(order, order[1:]))
+    if piston:
+        total += float(matrix[order[-1]][order[0]])
+    return total
+
+
+def solve_visit_order(
+    matrix: Matrix,
+    *,
+    fix_start: bool = True,
+    fix_end: bool = False,
+    piston: bool = False,
+) -> List[int]:
+    """
+    訪問順（行列添字の並び）を返す。
+    - piston=True の場合、先頭は常に固定し fix_end は無視する（周回の起点 = 出発地）
+    """
+    n = len(matrix)
+    identity = list(range(n))
+    if n < 3:
+        return identity
+
+    if piston:
+        fix_start, fix_end = True, False
+    head = [0] if fix_start else []
+    tail = [n - 1] if fix_end else []
+    free = [i for i in identity if i not in head and i not in tail]
+    if len(free) < 2:
+        return identity
+
+    if len(free) <= TSP_EXACT_MAX_FREE:
+        best = _held_karp(matrix, head, free, tail, piston=piston)
+    else:
+        best = _local_search(matrix, head, free, tail, piston=piston)
+
+    if route_cost(best, matrix, piston=piston) + _EPS < route_cost(identity, matrix, piston=piston):
+        return best
+    return identity
+
+
+# ==================================================================
+# 厳密解: Held-Karp
+# ==================================================================
+def _held_karp(matrix: Matrix, head: List[int], free: List[int], tail: List[int], *, piston: bool) -> List[int]:
+    m = len(free)
+    full = (1 << m) - 1
+    start = head[0] if head else None
+
+    # dp[mask][j]: start から mask の地点を全て巡り free[j] で終わる最小コスト
+    dp = [[math.inf] * m for _ in range(1 << m)]
+    parent = [[-1] * m for _ in range(1 << m)]
+    for j in range(m):
+        dp[1 << j][j] = float(matrix[start][free[j]]) if start is not None else 0.0
+
+    for mask in range(1, full + 1):
+        row = dp[mask]
+        for j in range(m):
+            cur = row[j]
+            if cur == math.inf or not (mask >> j) & 1:
+                continue
+            a = free[j]
+            for k in range(m):
+                if (mask >> k) & 1:
+                    continue
+                nmask = mask | (1 << k)
+                c = cur + float(matrix[a][free[k]])
+                if c < dp[nmask][k]:
+                    dp[nmask][k] = c
+                    parent[nmask][k] = j
+
+    # 終端コスト（末尾固定へ / 出発地へ戻る / なし）
+    best_j, best_c = 0, math.inf
+    for j in range(m):
+        c = dp[full][j]
+        if tail:
+            c += float(matrix[free[j]][tail[0]])
+        elif piston and start is not None:
+            c += float(matrix[free[j]][start])
+        if c < best_c:
+            best_j, best_c = j, c
+
+    seq: List[int] = []
+    mask, j = full, best_j
+    while j != -1:
+        seq.append(free[j])
+        pj = parent[mask][j]
+        mask ^= 1 << j
+        j = pj
+    seq.reverse()
+    return head + seq + tail
+
+
+# ==================================================================
+# 近似解: 最近傍法 + 2-opt / Or-opt
+# ==================================================================
+def _nearest_neighbour(matrix: Matrix, head: List[int], free: List[int]) -> List[int]:
+    remaining = list(free)
+    seq: List[int] = []
+    cur = head[0] if head else remaining.pop(0)
+    if not head:
+        seq.append(cur)
+    while remaining:
+        nxt = min(remaining, key=lambda k: float(matrix[cur][k]))
+        remaining.remove(nxt)
+        seq.append(nxt)
+        cur = nxt
+    return seq
+
+
+def _local_search(matrix: Matrix, head: List[int], free: List[int], tail: List[int], *, piston: bool) -> List[int]:
+    def cost(seq: List[int]) -> float:
+        return route_cost(head + seq + tail, matrix, piston=piston)
+
+    # 初期解は「現在の順」と「最近傍法」の良い方
+    seq = min([list(free), _nearest_neighbour(matrix, head, free)], key=cost)
+    best = cost(seq)
+    m = len(seq)
+
+    for _ in range(TSP_LOCAL_SEARCH_MAX_PASSES):
+        improved = False
+
+        # 2-opt: 区間 [i, k] を反転（非対称行列でも正しく評価するため全体を再計算）
+        for i in range(m - 1):
+            for k in range(i + 1, m):
+                cand = seq[:i] + seq[i:k + 1][::-1] + seq[k + 1:]
+                c = cost(cand)
+                if c + _EPS < best:
+                    seq, best, improved = cand, c, True
+
+        # Or-opt: 長さ 1〜3 の区間を別の位置へ移す
+        for seg_len in (1, 2, 3):
+            for i in range(m - seg_len + 1):
+                seg = seq[i:i + seg_len]
+                rest = seq[:i] + seq[i + seg_len:]
+                for p in range(len(rest) + 1):
+                    if p == i:
+                        continue
+                    cand = rest[:p] + seg + rest[p:]
+                    c = cost(cand)
+                    if c + _EPS < best:
+                        seq, best, improved = cand, c, True
+                        break
+
+        if not improved:
+            break
+
+    return head + seq + tail
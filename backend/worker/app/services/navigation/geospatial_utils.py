@@ -12,8 +12,8 @@
 #
 # 設計メモ:
 # - 直線距離はハバースイン（球面三角法）
-# - 点-線分距離は Web メルカトル相当の簡易投影（局所近似）での
-#   2D 距離計算（緯度に応じて X のスケーリングのみを調整）
+# - 点-線分距離は shared の RouteGeometry（正距円筒近似で投影した NumPy 配列）で
+#   全線分を一括計算する
 # - 日本国内の観光用途かつ「閾値 50〜200m 程度」の判定なので十分な精度
 # =========================================================
 
@@ -21,6 +21,8 @@ import math
 import os
 from typing import Iterable, Tuple, Dict, Any
 
+from shared.app.services.route_index import RouteGeometry
+
 EARTH_RADIUS_M = 6371000.0  # 地球半径（メートル / WGS84 想定）
 
 
@@ -36,41 +38,6 @@ def haversine_distance_m(lat1: float, lon1: float, lat2: float, lon2: float) ->
     return EARTH_RADIUS_M * c
 
 
-def _latlon_to_local_xy_m(lat: float, lon: float, lat0: float) -> Tuple[float, float]:
-    """
-    緯度 lat0 を基準に、lat/lon をローカル平面（メートル）に近似変換する。
-    - X は経度方向。cos(lat0) でスケールする。
-    - Y は緯度方向。
-    """
-    # 1度あたりの距離（おおよそ）
-    m_per_deg_lat = 111_320.0
-    m_per_deg_lon = 111_320.0 * math.cos(math.radians(lat0))
-    x = (lon) * m_per_deg_lon
-    y = (lat) * m_per_deg_lat
-    return x, y
-
-
-def _point_segment_distance_xy(px: float, py: float, ax: float, ay: float, bx: float, by: float) -> float:
-    """2D 平面上の点と線分 ab の最短距離（メートル）を返す。"""
-    vx = bx - ax
-    vy = by - ay
-    wx = px - ax
-    wy = py - ay
-
-    seg_len2 = vx * vx + vy * vy
-    if seg_len2 == 0.0:
-        # a==b の退化ケースは点距離
-        dx = px - ax
-        dy = py - ay
-        return math.hypot(dx, dy)
-
-    # 射影係数 t を [0,1] にクランプ
-    t = max(0.0, min(1.0, (wx * vx + wy * vy) / seg_len2))
-    proj_x = ax + t * vx
-    proj_y = ay + t * vy
-    return math.hypot(px - proj_x, py - proj_y)
-
-
 def point_to_linestring_distance_m(
     point: Tuple[float, float],
     linestring: Iterable[Tuple[float, float]],
@@ -78,6 +45,7 @@ def point_to_linestring_distance_m(
     """
     緯度経度の点 `point=(lat,lon)` と、ポリライン `linestring=[(lat,lon), ...]`
     の最短距離（メートル）を返す。
+    - 同じ線に何度も問い合わせる場合は RouteGeometry を作って使い回すこと（投影が 1 回で済む）
     """
     lat_p, lon_p = point
     coords = list(linestring)
@@ -88,21 +56,8 @@ def point_to_linestring_distance_m(
             return haversine_distance_m(lat_p, lon_p, lat0, lon0)
         return float("inf")
 
-    # ローカル平面化の基準緯度は点の緯度に合わせる
-    lat0 = lat_p
-    px, py = _latlon_to_local_xy_m(lat_p, lon_p, lat0)
-
-    # 各線分で最小距離を探索
-    min_d = float("inf")
-    # あらかじめ線の各点もローカル平面に
-    xy = [_latlon_to_local_xy_m(lat, lon, lat0) for (lat, lon) in coords]
-    for i in range(len(xy) - 1):
-        ax, ay = xy[i]
-        bx, by = xy[i + 1]
-        d = _point_segment_distance_xy(px, py, ax, ay, bx, by)
-        if d < min_d:
-            min_d = d
-    return min_d
+    geometry = RouteGeometry([[(lon, lat) for (lat, lon) in coords]])
+    return geometry.distance_m(lat_p, lon_p)
 
 
 def get_env_distance_thresholds() -> Dict[str, Any]:
@@ -8,6 +8,7 @@
 # 提供メソッド:
 # - check_for_deviation(current_location, current_route_geojson, threshold_m=None)
 # - check_for_proximity(current_location, guide_spots, default_radius_m=None, already_triggered=None)
+#   （guide_spots は一様グリッドの ProximityIndex に入れ、周囲のセルの候補だけを測る）
 #
 # 返却仕様:
 # - 逸脱あり:
@@ -32,13 +33,8 @@
 # =========================================================
 from __future__ import annotations
 from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
-import math
 
-from worker.app.services.navigation.geospatial_utils import (
-    point_to_linestring_distance_m,
-    haversine_distance_m,
-    get_env_distance_thresholds,
-)
+from worker.app.services.navigation.geospatial_utils import get_env_distance_thresholds
 
 from datetime import datetime, timezone
 
@@ -47,6 +43,12 @@ from sqlalchemy.orm import Session as OrmSession, joinedload
 
 # [ADDED] 既存モデルの再利用
 from shared.app.models import Session as DbSession, Plan, Stop
+from shared.app.services.nav_channel import ROUTE_UPDATED, publish as publish_nav
+from shared.app.services.nav_state import get_nav_state_store
+from shared.app.services.proximity import ProximityIndex
+from shared.app.services.reroute_coalesce import StaleCheck
+from shared.app.services.route_geometry import POLYLINE_ENCODING, render_route
+from shared.app.services.route_index import CompiledRoute, RouteGeometry
 
 # [ADDED] ハイブリッド経路計算（任意起点）＆ 楽観ロック更新のCRUD
 from worker.app.services.itinerary.itinerary_service import compute_hybrid_polyline_from_origin
@@ -59,35 +61,6 @@ def _utcnow() -> datetime:
     """[ADDED] tz-aware 現在時刻（楽観ロックの更新時刻に使用）"""
     return datetime.now(timezone.utc)
 
-def _collect_linestring_coords(geojson: GeoJSON) -> List[List[LatLon]]:
-    """
-    GeoJSON の LineString / MultiLineString から、座標列の配列を返す。
-    - 戻り値: [ [(lat,lon), ...], [(lat,lon), ...], ... ]
-    """
-    if not geojson or "type" not in geojson:
-        return []
-
-    gtype = geojson.get("type")
-    if gtype == "Feature":
-        return _collect_linestring_coords(geojson.get("geometry") or {})
-    if gtype == "FeatureCollection":
-        coords: List[List[LatLon]] = []
-        for feat in geojson.get("features", []):
-            coords.extend(_collect_linestring_coords(feat))
-        return coords
-
-    if gtype == "LineString":
-        # GeoJSONは [lon, lat]、内部では (lat,lon) で統一
-        coords_ll = geojson.get("coordinates", [])
-        return [[(lat, lon) for lon, lat in coords_ll]]
-
-    if gtype == "MultiLineString":
-        multi = geojson.get("coordinates", [])
-        return [[(lat, lon) for lon, lat in part] for part in multi]
-
-    # それ以外は非対応
-    return []
-
 def reorder_from_target(stops: List[Stop], target_stop_id: Optional[int]) -> List[Stop]:
     """
     [ADDED] target_stop_id を起点に、そこで切って末尾までの残区間を返す。
@@ -124,12 +97,12 @@ class NavigationService:
     def check_for_deviation(
         self,
         current_location: Dict[str, float],
-        current_route_geojson: GeoJSON,
+        current_route_geojson: Union[GeoJSON, RouteGeometry, CompiledRoute],
         threshold_m: Optional[float] = None,
     ) -> Optional[Dict[str, Any]]:
         """
         :param current_location: {"lat": float, "lon": float}
-        :param current_route_geojson: LineString/MultiLineString/Feature(...) などの GeoJSON
+        :param current_route_geojson: LineString/MultiLineString/Feature(...) などの GeoJSON（または RouteGeometry / CompiledRoute）
         :param threshold_m: 上書き用の判定閾値（未指定なら環境値）
         :return: 逸脱イベント or None
         """
@@ -137,17 +110,18 @@ class NavigationService:
         lon = float(current_location["lon"])
         th = threshold_m if threshold_m is not None else self.deviation_threshold_m
 
-        # ルート座標列を取得
-        lines = _collect_linestring_coords(current_route_geojson)
-        if not lines:
+        # ルートを投影（投影済みの RouteGeometry / CompiledRoute が渡されればそのまま使う）
+        route = current_route_geojson
+        if not isinstance(route, (RouteGeometry, CompiledRoute)):
+            route = RouteGeometry.from_geojson(route)
+        if route.empty:
             return None  # ルートがない場合は何もしない
 
-        # 複数の LineString があれば最短距離を採用
-        min_dist = math.inf
-        for line in lines:
-            d = point_to_linestring_distance_m((lat, lon), line)
-            if d < min_dist:
-                min_dist = d
+        # 複数の LineString があっても全線分から最短距離を一括で求める（CompiledRoute は閾値内の近傍セルから）
+        if isinstance(route, CompiledRoute):
+            min_dist = route.distance_m(lat, lon, radius_m=th)
+        else:
+            min_dist = route.distance_m(lat, lon)
 
         if min_dist > th:
             return {
@@ -165,7 +139,7 @@ class NavigationService:
     def check_for_proximity(
         self,
         current_location: Dict[str, float],
-        guide_spots: Iterable[Dict[str, Any]],
+        guide_spots: Union[Iterable[Dict[str, Any]], ProximityIndex],
         default_radius_m: Optional[float] = None,
         already_triggered: Optional[Set[Union[int, str]]] = None,
     ) -> List[Dict[str, Any]]:
@@ -174,6 +148,7 @@ class NavigationService:
         :param guide_spots: [{ "spot_id": ID, "lat": float, "lon": float,
                                "spot_type": "tourist_spot", "radius_m": optional }, ...]
                            ※ 呼び出し側で spot_type='tourist_spot' のみ渡すのが理想
+                           毎回同じスポット群なら ProximityIndex.from_guide_spots(...) を作って渡すと索引を使い回せる
         :param default_radius_m: 既定半径（未指定なら環境値）
         :param already_triggered: 既にガイド済みの spot_id 集合（重複通知防止用）
         :return: 発火すべきイベントの配列
@@ -185,7 +160,10 @@ class NavigationService:
         fired: List[Dict[str, Any]] = []
         seen: Set[Union[int, str]] = already_triggered or set()
 
-        for s in guide_spots:
+        # グリッド索引で周囲のセルの候補だけを測る（索引が渡されればそのまま使う）
+        index = guide_spots if isinstance(guide_spots, ProximityIndex) else ProximityIndex.from_guide_spots(guide_spots)
+        for target, dist in index.within(lat, lon, base_radius):
+            s = target.data
             spot_type = s.get("spot_type")
             if spot_type and spot_type != "tourist_spot":
                 # 念のため防御。アプリ設計上は呼び出し前にフィルタ済みのはず。
@@ -196,28 +174,19 @@ class NavigationService:
                 # 重複防止
                 continue
 
-            try:
-                s_lat = float(s["lat"])
-                s_lon = float(s["lon"])
-            except (KeyError, ValueError, TypeError):
-                continue
-
-            radius_m = float(s.get("radius_m", base_radius))
-            dist = haversine_distance_m(lat, lon, s_lat, s_lon)
-            if dist <= radius_m:
-                fired.append(
-                    {
-                        "event": "PROXIMITY_SPOT_ID",
-                        "data": {
-                            "spot_id": spot_id,
-                            "distance_m": float(dist),
-                            "current_location": {"lat": lat, "lon": lon},
-                        },
-                    }
-                )
-                # 呼び出し側の集合も更新して欲しいケースが多いので、参照が来ていれば加える
-                if already_triggered is not None:
-                    already_triggered.add(spot_id)
+            fired.append(
+                {
+                    "event": "PROXIMITY_SPOT_ID",
+                    "data": {
+                        "spot_id": spot_id,
+                        "distance_m": float(dist),
+                        "current_location": {"lat": lat, "lon": lon},
+                    },
+                }
+            )
+            # 呼び出し側の集合も更新して欲しいケースが多いので、参照が来ていれば加える
+            if already_triggered is not None:
+                already_triggered.add(spot_id)
 
         return fired
 
@@ -229,16 +198,18 @@ def reroute(
     origin_lon: float,
     target_stop_id: Optional[int],
     base_route_version: Optional[int],
+    seq: Optional[int] = None,
 ) -> Dict[str, Any]:
     """
     [ADDED] 現在地を“仮想先頭”として差し込み、残区間に対してハイブリッド経路を再計算。
     計算結果は Plan.route_geojson を CAS（route_version の楽観ロック）で更新する。
+    seq: 後勝ち合流の連番（reroute_coalesce）。計算中に新しい要求が来たら OSRM 要求を止め、CAS もしない。
 
     Returns:
         {
           "updated": bool,           # 反映できたか（CAS成功）
           "new_version": int|None,   # 更新後の route_version（CAS失敗時は現行版）
-          "reason": str|None,        # 失敗理由（no_active_plan / no_stops / empty_rest 等）
+          "reason": str|None,        # 失敗理由（no_active_plan / no_stops / empty_rest / superseded 等）
         }
     """
     # 1) セッション → アクティブプラン取得
@@ -274,13 +245,22 @@ def reroute(
     if not rest:
         return {"updated": False, "new_version": plan.route_version, "reason": "empty_rest"}
 
+    # 既に別のリルートが反映済みなら CAS で負けるだけなので計算しない
+    if base_route_version is not None and plan.route_version != base_route_version:
+        return {"updated": False, "new_version": plan.route_version, "reason": "cas_conflict"}
+
     # 3) 任意起点（現在地）からハイブリッド経路を構築
     #    - 既存の Step1 実装に依存：車で到達不可のスポットは AP 自動選定して car→AP, AP→dest(foot)
+    #    - 新しい要求に追い越されたら以降の OSRM 要求は送らない（結果は不完全なので捨てる）
+    stale = StaleCheck(session_id, seq)
     route_fc, total_dist_m, total_dur_s = compute_hybrid_polyline_from_origin(
         db,
         origin=(origin_lat, origin_lon),
         stops=rest,
+        abort=stale,
     )
+    if stale(force=True):
+        return {"updated": False, "new_version": plan.route_version, "reason": "superseded"}
 
     # FeatureCollection.properties に合計距離/時間を格納（なければ）
     props = route_fc.get("properties") or {}
@@ -298,6 +278,16 @@ def reroute(
         new_geojson=route_fc,
         updated_at=_utcnow(),
     )
+    if updated:
+        # API のホット状態に残っている旧版のスナップショットを捨てる（次の位置更新で新しい版を読む）
+        get_nav_state_store().invalidate_snapshot(session_id)
+        # 接続中の端末（WebSocket）へ新しいルートをすぐ届ける
+        publish_nav(session_id, {
+            "type": ROUTE_UPDATED,
+            "plan_id": plan.id,
+            "route_version": new_version,
+            "route": render_route(route_fc, fmt=POLYLINE_ENCODING),
+        })
 
     return {
         "updated": updated,
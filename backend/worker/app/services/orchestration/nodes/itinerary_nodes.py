@@ -108,6 +108,28 @@ def _handle_reorder_stops(state: AgentState, tool_call: Dict[str, Any]) -> Dict[
     return {"plan": updated_plan_summary, "messages": [tool_message]}
 
 
+def _handle_optimize_order(state: AgentState, tool_call: Dict[str, Any]) -> Dict[str, Any]:
+    """'optimize_plan_order' ツールコールを処理する"""
+    plan_id = state.get("plan", {}).get("plan_id")
+    if not plan_id:
+        raise ValueError("計画がアクティブではありません。")
+    fix_end = bool(_get_tool_call_param(tool_call, "fix_end", False))
+    piston = bool(_get_tool_call_param(tool_call, "piston", False))
+
+    with SessionLocal() as db:
+        updated_plan_summary = itinerary_service.optimize_plan_order(
+            db, plan_id=plan_id, fix_start=True, fix_end=fix_end, piston=piston
+        )
+
+    opt = updated_plan_summary.get("optimization") or {}
+    if opt.get("changed"):
+        content = f"訪問順を最適化しました（約{opt.get('before_min')}分 → 約{opt.get('after_min')}分）。"
+    else:
+        content = "現在の訪問順が最短のため、変更はありません。"
+    tool_message = ToolMessage(content=content, tool_call_id=tool_call["id"])
+    return {"plan": updated_plan_summary, "messages": [tool_message]}
+
+
 # =================================================================
 # === 変更点③: ディスパッチャー用のノードをここから追記 ================
 # =================================================================
@@ -118,6 +140,7 @@ _TOOL_DISPATCHER: Dict[str, Callable[[AgentState, Dict], Dict[str, Any]]] = {
     "add_spot_to_plan": _handle_add_spot,
     "remove_spot_from_plan": _handle_remove_spot,
     "reorder_plan_stops": _handle_reorder_stops,
+    "optimize_plan_order": _handle_optimize_order,
 }
 
 
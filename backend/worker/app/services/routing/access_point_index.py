@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+アクセスポイント（駐車場/登山口）のプロセス内空間インデックス
+- access_points は scripts/load_access_points.py で投入される小さく静的なテーブルのため、
+  ワーカー毎に 1 回だけ読み込み、一様グリッド（緯度経度セル）で最近傍を引く。
+- 一定間隔でテーブルの指紋（件数 + 内容ハッシュ）を確認し、変わっていれば再構築する。
+- 読み込みに失敗した場合は呼び出し側（access_points_repo）が PostGIS の KNN にフォールバックする。
+  読み込みはセーブポイント内で行い、失敗しても呼び出し側のトランザクションを中断状態にしない。
+"""
+
+from __future__ import annotations
+
+import contextlib
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from worker.app.services.navigation.geospatial_utils import haversine_distance_m
+
+ACCESS_POINT_INDEX_CELL_DEG = float(os.getenv("ACCESS_POINT_INDEX_CELL_DEG", "0.05"))  # ≒ 5km
+ACCESS_POINT_INDEX_REFRESH_SEC = float(os.getenv("ACCESS_POINT_INDEX_REFRESH_SEC", "300"))
+
+_KM_PER_DEG_LAT = 111.32
+
+APRow = Tuple[int, str, str, float, float]  # (id, name, ap_type, latitude, longitude)
+
+_FINGERPRINT_SQL = text("""
+    SELECT COUNT(*) AS n,
+           COALESCE(md5(string_agg(id::text || ':' || ap_type::text || ':' || latitude::text || ':' || longitude::text,
+                                   ',' ORDER BY id)), '') AS digest
+    FROM access_points
+    WHERE ap_type IN ('parking','trailhead')
+""")
+
+_LOAD_SQL = text("""
+    SELECT id, name, ap_type, latitude, longitude
+    FROM access_points
+    WHERE ap_type IN ('parking','trailhead')
+    ORDER BY id
+""")
+
+
+class _Grid:
+    """構築後は不変のグリッド。差し替えは参照の入れ替えで行う（読み取りはロック不要）。"""
+
+    def __init__(self, rows: List[APRow], cell_deg: float) -> None:
+        self.cell_deg = cell_deg
+        self.cells: Dict[Tuple[int, int], List[APRow]] = {}
+        self.size = len(rows)
+        for r in rows:
+            self.cells.setdefault(self._cell(r[3], r[4]), []).append(r)
+
+        if self.cells:
+            keys = list(self.cells.keys())
+            self.min_i = min(k[0] for k in keys)
+            self.max_i = max(k[0] for k in keys)
+            self.min_j = min(k[1] for k in keys)
+            self.max_j = max(k[1] for k in keys)
+            max_abs_lat = max(abs(r[3]) for r in rows)
+        else:
+            self.min_i = self.max_i = self.min_j = self.max_j = 0
+            max_abs_lat = 0.0
+        # セルの短辺（km）。探索打ち切りの下限距離に使う
+        self.min_cell_km = cell_deg * _KM_PER_DEG_LAT * min(1.0, math.cos(math.radians(min(max_abs_lat + cell_deg, 89.0))))
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg)))
+
+    def nearest(self, lat: float, lon: float, max_km: Optional[float]) -> Optional[APRow]:
+        if not self.cells:
+            return None
+        ci, cj = self._cell(lat, lon)
+        # グリッド全体を覆うのに必要なリング数
+        max_ring = max(abs(ci - self.min_i), abs(ci - self.max_i), abs(cj - self.min_j), abs(cj - self.max_j))
+
+        best: Optional[APRow] = None
+        best_d = math.inf
+        for ring in range(max_ring + 1):
+            # このリングより外側のセルは少なくとも (ring * 短辺) 離れている
+            lower_bound = max(0.0, (ring - 1)) * self.min_cell_km
+            if best is not None and best_d <= lower_bound:
+                break
+            if max_km is not None and lower_bound > max_km:
+                break
+            for i in range(ci - ring, ci + ring + 1):
+                for j in range(cj - ring, cj + ring + 1):
+                    if max(abs(i - ci), abs(j - cj)) != ring:
+                        continue
+                    for r in self.cells.get((i, j), ()):
+                        d = haversine_distance_m(lat, lon, r[3], r[4]) / 1000.0
+                        if d < best_d or (d == best_d and best is not None and r[0] < best[0]):
+                            best, best_d = r, d
+
+        if best is None or (max_km is not None and best_d > max_km):
+            return None
+        return best
+
+
+def _savepoint(db: Any):
+    """Session / Connection ならセーブポイント（SAVEPOINT）を張る。それ以外は何もしない。"""
+    begin_nested = getattr(db, "begin_nested", None)
+    return begin_nested() if begin_nested is not None else contextlib.nullcontext()
+
+
+class AccessPointIndex:
+    """プロセス共有のアクセスポイント索引。ensure_fresh() → nearest() の順で使う。"""
+
+    def __init__(
+        self,
+        *,
+        cell_deg: float = ACCESS_POINT_INDEX_CELL_DEG,
+        refresh_sec: float = ACCESS_POINT_INDEX_REFRESH_SEC,
+    ) -> None:
+        self.cell_deg = cell_deg
+        self.refresh_sec = refresh_sec
+        self._grid: Optional[_Grid] = None
+        self._fingerprint: Optional[Tuple[Any, ...]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._grid is not None
+
+    def load_rows(self, rows: List[APRow], fingerprint: Optional[Tuple[Any, ...]] = None) -> None:
+        """行データから索引を（再）構築する。"""
+        grid = _Grid([(int(r[0]), r[1], str(r[2]), float(r[3]), float(r[4])) for r in rows], self.cell_deg)
+        self._grid = grid
+        self._fingerprint = fingerprint
+        self._checked_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """次回の ensure_fresh() で必ず指紋を確認させる。"""
+        self._checked_at = 0.0
+
+    def ensure_fresh(self, db: Any) -> bool:
+        """
+        必要なら DB から読み込み/再構築する。索引が使える状態なら True。
+        - refresh_sec 以内は DB を見ない
+        - 指紋の取得に失敗しても、既に読み込み済みなら古い索引で続行する
+        """
+        if self._grid is not None and time.monotonic() - self._checked_at < self.refresh_sec:
+            return True
+        with self._lock:
+            if self._grid is not None and time.monotonic() - self._checked_at < self.refresh_sec:
+                return True
+            try:
+                # 失敗時はセーブポイントまで戻す（Postgres では失敗した文がトランザクション全体を
+                # 中断させ、続く PostGIS フォールバックが InFailedSqlTransaction になるため）
+                with _savepoint(db):
+                    fp_row = db.execute(_FINGERPRINT_SQL).fetchone()
+                    fingerprint = (int(fp_row[0]), str(fp_row[1])) if fp_row else None
+                    rows = None
+                    if self._grid is None or fingerprint != self._fingerprint:
+                        rows = db.execute(_LOAD_SQL).fetchall()
+                if rows is not None:
+                    self.load_rows([tuple(r) for r in rows], fingerprint)
+                else:
+                    self._checked_at = time.monotonic()
+            except Exception:
+                if self._grid is None:
+                    return False
+                self._checked_at = time.monotonic()
+        return self._grid is not None
+
+    def nearest(self, lat: float, lon: float, max_km: Optional[float] = None) -> Optional[APRow]:
+        """(lat,lon) の最寄り AP を返す。max_km 指定時はその距離以内のみ。"""
+        grid = self._grid
+        if grid is None:
+            return None
+        return grid.nearest(lat, lon, max_km)
+
+    def stats(self) -> Dict[str, Any]:
+        grid = self._grid
+        return {
+            "loaded": grid is not None,
+            "size": grid.size if grid else 0,
+            "cells": len(grid.cells) if grid else 0,
+            "fingerprint": self._fingerprint,
+        }
+
+
+_index: Optional[AccessPointIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_access_point_index() -> AccessPointIndex:
+    """ワーカープロセス内で共有する索引を返す。"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AccessPointIndex()
+    return _index
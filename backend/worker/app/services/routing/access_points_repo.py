@@ -1,13 +1,35 @@
 # -*- coding: utf-8 -*-
+import os
 from typing import Optional, Tuple
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
+from worker.app.services.routing.access_point_index import get_access_point_index
+
+# プロセス内索引を使うか（false なら常に PostGIS の KNN を使う）
+ACCESS_POINT_INDEX_ENABLED = os.getenv("ACCESS_POINT_INDEX_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+
+
 def find_nearest_access_point(
     db: Session, *, lat: float, lon: float, max_km: float | None = None
 ) -> Optional[tuple[int, str, str, float, float]]:
     """
     駐車場/登山口のうち最寄りを1件返す。max_kmを指定すると、その距離以内のみ許可。
+    - まずプロセス内の空間索引で引き、索引が使えない場合は PostGIS の KNN にフォールバックする。
+    戻り値: (id, name, ap_type, latitude, longitude) or None
+    """
+    if ACCESS_POINT_INDEX_ENABLED:
+        index = get_access_point_index()
+        if index.ensure_fresh(db):
+            return index.nearest(lat, lon, max_km=max_km)
+    return find_nearest_access_point_postgis(db, lat=lat, lon=lon, max_km=max_km)
+
+
+def find_nearest_access_point_postgis(
+    db: Session, *, lat: float, lon: float, max_km: float | None = None
+) -> Optional[tuple[int, str, str, float, float]]:
+    """
+    PostGIS の KNN（geom <-> point）で最寄りの駐車場/登山口を1件返す。
     戻り値: (id, name, ap_type, latitude, longitude) or None
     """
     params = {"lat": lat, "lon": lon}
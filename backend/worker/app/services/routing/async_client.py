@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+OSRM 非同期クライアント（asyncio / httpx）
+- OSRMClient と同じ公開 API（fetch_* を async にしたもの）。オーケストレーション等で
+  1 つの Celery タスク内から多数のルーティング呼び出しをスレッドなしで同時に待てる。
+- レプリカ選択 / サーキットブレーカー / 統計は同期クライアントと共有する（backends.get_backend_pool）。
+  hints（snapping.SnapIndex）とリクエスト組み立て・応答解釈も client.py の関数を共用する。
+- ヘッジ（OSRM_HEDGE_ENABLED）は asyncio のタスクで行い、負けた側はキャンセルする。
+- httpx.AsyncClient はイベントループに紐づくため、インスタンスは 1 つのループ内で使い、
+  最後に aclose()（または async with）で閉じること。Celery タスクからは asyncio.run(...) の中で生成する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import httpx  # 任意依存: 非同期経路を使う場合のみ必要
+except ImportError:  # pragma: no cover
+    httpx = None
+
+from worker.app.services.routing.backends import OPEN, BackendPool, Replica, get_backend_pool, hosts_for_profile
+from worker.app.services.routing.client import (
+    OSRMClientError,
+    OSRMProfile,
+    RouteDetail,
+    _coords_to_path,
+    _pool_settings,
+    decode_json_bytes,
+    is_hint_rejection,
+    parse_distance_duration,
+    parse_nearest,
+    parse_route,
+    parse_route_legs,
+    parse_table,
+    route_params,
+    table_coords,
+    table_params,
+    zero_table,
+)
+from worker.app.services.routing.snapping import SnapIndex, get_snap_index
+
+
+class AsyncOSRMClient:
+    """
+    OSRMClient の asyncio 版。
+    - transport: httpx のトランスポート差し替え（テストで httpx.MockTransport を渡す等）
+    """
+
+    _HINTED_SERVICES = ("route", "table")
+
+    def __init__(
+        self,
+        timeout_sec: float = 10.0,
+        max_retries: int = 2,
+        backoff_sec: float = 1.0,
+        snap_index: Optional[SnapIndex] = None,
+        transport: Any = None,
+    ) -> None:
+        if httpx is None:
+            raise ImportError("AsyncOSRMClient には httpx が必要です（pip install httpx）")
+        self.car_hosts = hosts_for_profile("car")
+        self.foot_hosts = hosts_for_profile("foot")
+        self.timeout_sec = timeout_sec
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self.snap_index = snap_index if snap_index is not None else get_snap_index()
+        self._transport = transport
+        self._clients: Dict[str, "httpx.AsyncClient"] = {}
+
+    async def __aenter__(self) -> "AsyncOSRMClient":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        for c in clients:
+            await c.aclose()
+
+    # =========================
+    # 内部: OSRM API 呼び出し（共通）
+    # =========================
+    def _http(self, profile: OSRMProfile) -> "httpx.AsyncClient":
+        """プロファイル毎の AsyncClient（接続上限は同期側の OSRM_*_POOL_MAXSIZE に合わせる）。"""
+        c = self._clients.get(profile)
+        if c is None:
+            _, maxsize, _ = _pool_settings(profile)
+            hosts = self.car_hosts if profile == "car" else self.foot_hosts
+            limits = httpx.Limits(max_connections=maxsize * len(hosts), max_keepalive_connections=maxsize * len(hosts))
+            c = httpx.AsyncClient(limits=limits, timeout=self.timeout_sec, transport=self._transport)
+            self._clients[profile] = c
+        return c
+
+    def _pool(self, profile: OSRMProfile) -> BackendPool:
+        return get_backend_pool(profile, self.car_hosts if profile == "car" else self.foot_hosts)
+
+    async def _request(
+        self, service: str, profile: OSRMProfile, coords: List[Tuple[float, float]], params: Dict[str, str]
+    ) -> dict:
+        """OSRMClient._request と同じ（hint 付与と、hint を理由にした 400 の時だけ hint なしで再送）。"""
+        osrm_profile = "driving" if profile == "car" else "foot"
+        path = f"/{service}/v1/{osrm_profile}/{_coords_to_path(coords)}"
+
+        hints = None
+        if self.snap_index is not None and service in self._HINTED_SERVICES:
+            hints = self.snap_index.hints_param(profile, coords)
+        if not hints:
+            return await self._request_path(profile, path, params)
+        try:
+            return await self._request_path(profile, path, {**params, "hints": hints})
+        except OSRMClientError as e:
+            cause = e.__cause__
+            if not isinstance(cause, httpx.HTTPStatusError) or not is_hint_rejection(cause.response):
+                raise
+            self.snap_index.mark_rejected()
+        return await self._request_path(profile, path, params)
+
+    async def _request_path(self, profile: OSRMProfile, path: str, params: Dict[str, str]) -> dict:
+        """フェイルオーバー / バックオフ / ブレーカーの扱いは OSRMClient._request_path と同じ。"""
+        pool = self._pool(profile)
+
+        last_exc: Exception | None = None
+        tried: List[Replica] = []
+        for attempt in range(self.max_retries + 1):
+            replica = pool.choose(exclude=tried) or (pool.choose() if tried else None)
+            if replica is None:
+                raise OSRMClientError(f"OSRM {profile}: no available replica (circuit open); last error: {last_exc}")
+            try:
+                return await self._send_hedged(pool, replica, profile, path, params)
+            except httpx.HTTPStatusError as e:
+                # 4xx はそのまま失敗（リトライしない）
+                last_exc = e
+                break
+            except (httpx.TransportError, OSRMClientError) as e:
+                last_exc = e
+                tried.append(replica)
+                if attempt < self.max_retries:
+                    has_alternative = any(
+                        r not in tried and r.breaker.state != OPEN for r in pool.replicas
+                    )
+                    if not has_alternative:
+                        await asyncio.sleep(self.backoff_sec * (attempt + 1))
+                    continue
+                break
+
+        raise OSRMClientError(f"OSRM request failed: {last_exc}") from last_exc
+
+    async def _send_once(self, replica: Replica, profile: OSRMProfile, path: str, params: Dict[str, str]) -> dict:
+        replica.begin()
+        t0 = time.monotonic()
+        try:
+            resp = await self._http(profile).get(replica.base_url + path, params=params)
+        except asyncio.CancelledError:
+            replica.abandon()
+            raise
+        except Exception:
+            replica.end(False, None)
+            raise
+        if resp.status_code >= 500:
+            replica.end(False, None)
+            raise OSRMClientError(f"OSRM 5xx: {resp.status_code} {resp.text}")
+        replica.end(True, time.monotonic() - t0)
+        resp.raise_for_status()
+        return decode_json_bytes(resp.content)
+
+    async def _send_hedged(
+        self, pool: BackendPool, replica: Replica, profile: OSRMProfile, path: str, params: Dict[str, str]
+    ) -> dict:
+        """ヘッジ: 分位点を過ぎても応答が無ければ別レプリカにも投げ、早い方を採用して他方をキャンセルする。"""
+        delay = pool.hedge_delay_sec()
+        if delay is None:
+            return await self._send_once(replica, profile, path, params)
+
+        first = asyncio.ensure_future(self._send_once(replica, profile, path, params))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        backup = pool.choose(exclude=[replica])
+        if backup is None:
+            return await first
+        backup.record_hedge()
+        pending = {first, asyncio.ensure_future(self._send_once(backup, profile, path, params))}
+
+        last_exc: BaseException | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for f in done:
+                    exc = f.exception()
+                    if exc is None:
+                        return f.result()
+                    if isinstance(exc, httpx.HTTPStatusError):
+                        raise exc  # 4xx はどのレプリカでも同じ結果
+                    last_exc = exc
+        finally:
+            for f in pending:
+                f.cancel()
+        assert last_exc is not None
+        raise last_exc
+
+    async def _route_request(
+        self,
+        profile: OSRMProfile,
+        coords: List[Tuple[float, float]],
+        detail: RouteDetail = "full",
+        annotations: Optional[str] = None,
+    ) -> dict:
+        return await self._request("route", profile, coords, route_params(detail, annotations, len(coords)))
+
+    async def _table_request(
+        self, profile: OSRMProfile, coords: List[Tuple[float, float]], sources: List[int], destinations: List[int]
+    ) -> dict:
+        return await self._request("table", profile, coords, table_params(sources, destinations))
+
+    # =========================
+    # 公開（OSRMClient と同じ意味・戻り値）
+    # =========================
+    async def fetch_nearest(self, point: Tuple[float, float], profile: OSRMProfile) -> Dict[str, Any]:
+        data = await self._request("nearest", profile, [point], {"number": "1"})
+        return parse_nearest(data, point)
+
+    async def fetch_distance_and_duration(
+        self,
+        origin: Tuple[float, float],
+        destination: Tuple[float, float],
+        profile: OSRMProfile,
+    ) -> Tuple[float, float]:
+        data = await self._route_request(profile, [origin, destination], detail="distance")
+        return parse_distance_duration(data)
+
+    async def fetch_table(
+        self,
+        origins: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+        profile: OSRMProfile,
+    ) -> Tuple[List[List[Optional[float]]], List[List[Optional[float]]]]:
+        if not origins or not destinations:
+            return [], []
+        coords, src_idx, dst_idx = table_coords(origins, destinations)
+        if len(coords) < 2:
+            return zero_table(origins, destinations)
+        data = await self._table_request(profile, coords, src_idx, dst_idx)
+        return parse_table(data, len(src_idx), len(dst_idx))
+
+    async def fetch_route(
+        self,
+        waypoints: List[Tuple[float, float]],
+        profile: OSRMProfile,
+        piston: bool = False,
+        detail: RouteDetail = "full",
+    ) -> Tuple[dict, float, float]:
+        if piston and len(waypoints) >= 2:
+            waypoints = [*waypoints, waypoints[0]]
+        data = await self._route_request(profile, waypoints, detail=detail)
+        return parse_route(data, profile)
+
+    async def fetch_route_legs(
+        self,
+        waypoints: List[Tuple[float, float]],
+        profile: OSRMProfile,
+    ) -> List[Tuple[dict, float, float]]:
+        data = await self._route_request(profile, waypoints, detail="full", annotations="distance")
+        return parse_route_legs(data, len(waypoints), profile)
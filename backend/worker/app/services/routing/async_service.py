@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Routing Service の非同期ファサード
+- RoutingService と同じ公開メソッドを async で提供する（OSRM 通信は AsyncOSRMClient）。
+- キャッシュ（LegCache）/ 永続ストア（RouteLegStore）/ 投機設定は元の RoutingService と共有する。
+  キャッシュ（Redis）・ストア・AP 探索は同期 I/O なので asyncio.to_thread でスレッドに逃がし、
+  イベントループ（他レグの OSRM 待ち）を止めない。呼び出し元の db（Session）はスレッド間で同時に使えないため、
+  db を使う呼び出しは 1 つずつ実行する。
+- compute_hybrid_legs: 複数レグを 1 つのイベントループ上で同時に計算する（スレッドを使わない）。
+  Celery タスクからの使い方:
+
+    async def _run():
+        async with RoutingService().async_facade() as routing:
+            return await routing.compute_hybrid_legs(db, specs)
+    outcomes = asyncio.run(_run())
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from worker.app.services.routing.client import OSRMNoRouteError, OSRMProfile, RouteDetail
+from worker.app.services.routing.leg_engine import ROUTING_LEG_CONCURRENCY, LegOutcome, LegSpec
+from worker.app.services.routing.routing_service import RoutingService
+
+
+class AsyncRoutingService:
+    """RoutingService の async 版（RoutingService.async_facade() から作る）。"""
+
+    def __init__(self, routing: RoutingService, client: Any = None) -> None:
+        if client is None:
+            from worker.app.services.routing.async_client import AsyncOSRMClient
+
+            client = AsyncOSRMClient()
+        self.routing = routing
+        self.client = client
+        # 呼び出し元の db（Session）を使う同期処理の直列化用
+        self._db_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "AsyncRoutingService":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        close = getattr(self.client, "aclose", None)
+        if close is not None:
+            await close()
+
+    async def _with_db(self, fn: Any, *args: Any, **kwargs: Any) -> Any:
+        """db を使う同期処理をスレッドで実行する（同じ Session を同時に使わないよう 1 つずつ）。"""
+        async with self._db_lock:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+    # ================
+    # 軽量: 距離/時間
+    # ================
+    async def get_distance_and_duration(
+        self, origin: Tuple[float, float], destination: Tuple[float, float], profile: OSRMProfile
+    ) -> dict:
+        distance_km, duration_min = await self.client.fetch_distance_and_duration(origin, destination, profile)
+        return {"distance_km": distance_km, "duration_min": duration_min}
+
+    async def get_distance_matrix(
+        self, origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]], profile: OSRMProfile
+    ) -> dict:
+        distances_km, durations_min = await self.client.fetch_table(origins, destinations, profile)
+        return {"distances_km": distances_km, "durations_min": durations_min}
+
+    async def get_pair_distances(
+        self, pairs: List[Tuple[Tuple[float, float], Tuple[float, float]]], profile: OSRMProfile
+    ) -> List[Optional[dict]]:
+        if not pairs:
+            return []
+        origins = list(dict.fromkeys(p[0] for p in pairs))
+        destinations = list(dict.fromkeys(p[1] for p in pairs))
+        m = await self.get_distance_matrix(origins, destinations, profile)
+        o_idx = {pt: i for i, pt in enumerate(origins)}
+        d_idx = {pt: j for j, pt in enumerate(destinations)}
+
+        out: List[Optional[dict]] = []
+        for o, d in pairs:
+            km = m["distances_km"][o_idx[o]][d_idx[d]]
+            mins = m["durations_min"][o_idx[o]][d_idx[d]]
+            out.append(None if km is None or mins is None else {"distance_km": km, "duration_min": mins})
+        return out
+
+    # =========================
+    # 重量: ルート全体（GeoJSON）
+    # =========================
+    async def calculate_full_itinerary_route(
+        self,
+        waypoints: List[Tuple[float, float]],
+        profile: OSRMProfile,
+        piston: bool = False,
+        detail: RouteDetail = "full",
+    ) -> dict:
+        if len(waypoints) < 2:
+            raise ValueError("waypoints は 2 箇所以上が必要です。")
+        if detail == "distance":
+            raise ValueError("形状が不要な場合は get_distance_and_duration を使ってください。")
+
+        # キャッシュ / 永続ストアの読み書きは同期 I/O なのでスレッドで行う
+        key, hit = await asyncio.to_thread(self.routing._route_lookup, waypoints, profile, piston, detail)
+        if hit is not None:
+            return hit
+        geojson, distance_km, duration_min = await self.client.fetch_route(
+            waypoints, profile, piston=piston, detail=detail
+        )
+        result = {"geojson": geojson, "distance_km": distance_km, "duration_min": duration_min}
+        await asyncio.to_thread(self.routing._route_remember, key, waypoints, profile, piston, detail, result)
+        return result
+
+    async def calculate_reroute(
+        self,
+        current_location: Tuple[float, float],
+        remaining_waypoints: List[Tuple[float, float]],
+        profile: OSRMProfile,
+    ) -> dict:
+        return await self.calculate_full_itinerary_route([current_location, *remaining_waypoints], profile)
+
+    async def calculate_hybrid_leg(
+        self,
+        db,
+        *,
+        origin: Tuple[float, float],
+        dest: Tuple[float, float],
+        dest_spot_type: str | None,
+        dest_tags: dict | None,
+        ap_max_km: float = 20.0,
+        piston: bool = False,
+        dest_spot_id: int | None = None,
+    ) -> Dict[str, Any]:
+        """
+        RoutingService.calculate_hybrid_leg と同じ判断・キャッシュ。AP 経由の car / foot 区間は同時に取得する。
+        事前割当 / AP 探索（Postgres）とキャッシュ・ストアの読み書きは asyncio.to_thread で実行する。
+        """
+        car_ok, ap, key, hit = await self._with_db(
+            self.routing._hybrid_lookup,
+            db, origin=origin, dest=dest, dest_spot_type=dest_spot_type, dest_tags=dest_tags,
+            ap_max_km=ap_max_km, piston=piston, dest_spot_id=dest_spot_id,
+        )
+        if hit is not None:
+            return hit
+
+        if car_ok or not ap:
+            leg = await self._car_or_foot(origin, dest, piston)
+        else:
+            ap_pt = (ap[3], ap[4])
+            car_seg, foot_seg = await asyncio.gather(
+                self.calculate_full_itinerary_route([origin, ap_pt], "car", piston),
+                self.calculate_full_itinerary_route([ap_pt, dest], "foot", piston),
+            )
+            leg = RoutingService._compose_ap_leg(ap, car_seg, foot_seg)
+
+        await asyncio.to_thread(self.routing._hybrid_remember, key, origin, dest, leg, piston)
+        return leg
+
+    async def _car_or_foot(self, origin: Tuple[float, float], dest: Tuple[float, float], piston: bool) -> Dict[str, Any]:
+        """RoutingService._car_or_foot の async 版（投機モードでは foot をタスクで並走させ、不要ならキャンセル）。"""
+        waypoints = [origin, dest]
+        if not self.routing.speculative:
+            try:
+                r = await self.calculate_full_itinerary_route(waypoints, "car", piston)
+            except OSRMNoRouteError:
+                r = await self.calculate_full_itinerary_route(waypoints, "foot", piston)
+        else:
+            hit = await asyncio.to_thread(self.routing._cached, waypoints, "car", piston)
+            if hit is not None:
+                r = hit
+            else:
+                foot_t = asyncio.ensure_future(self.calculate_full_itinerary_route(waypoints, "foot", piston))
+                try:
+                    r = await self.calculate_full_itinerary_route(waypoints, "car", piston)
+                except OSRMNoRouteError:
+                    r = await foot_t
+                finally:
+                    if not foot_t.done():
+                        foot_t.cancel()
+        r["used_ap"] = None
+        return r
+
+    # =========================
+    # 複数レグの同時計算
+    # =========================
+    async def compute_hybrid_legs(
+        self,
+        db: Any,
+        specs: Sequence[LegSpec],
+        *,
+        max_concurrency: Optional[int] = None,
+    ) -> List[LegOutcome]:
+        """
+        leg_engine.compute_hybrid_legs の async 版（入力順の LegOutcome を返す）。
+        同時実行数は max_concurrency（未指定なら ROUTING_LEG_CONCURRENCY）で制限する。
+        """
+        sem = asyncio.Semaphore(max(1, max_concurrency or ROUTING_LEG_CONCURRENCY))
+
+        async def _run(i: int, spec: LegSpec) -> LegOutcome:
+            async with sem:
+                try:
+                    leg = await self.calculate_hybrid_leg(
+                        db,
+                        origin=spec.origin,
+                        dest=spec.dest,
+                        dest_spot_type=spec.dest_spot_type,
+                        dest_tags=spec.dest_tags,
+                        ap_max_km=spec.ap_max_km,
+                        piston=spec.piston,
+                        dest_spot_id=spec.dest_spot_id,
+                    )
+                    return LegOutcome(index=i, result=leg)
+                except Exception as e:
+                    return LegOutcome(index=i, error=e)
+
+        return list(await asyncio.gather(*(_run(i, s) for i, s in enumerate(specs))))
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+OSRM バックエンド（レプリカ）管理
+- プロファイル毎に複数レプリカを持てる（OSRM_CAR_HOSTS / OSRM_FOOT_HOSTS をカンマ区切りで指定。
+  未指定なら従来の OSRM_CAR_HOST / OSRM_FOOT_HOST の 1 台）。
+- レプリカ毎のサーキットブレーカー: 連続失敗が閾値に達したら open にし、一定時間は即座に失敗させる
+  （osrm-car 再起動中に計画タスクが timeout × retries だけ待たされるのを防ぐ）。
+  reset 時間経過後は half-open で 1 リクエストだけ試し、成功すれば closed に戻す。
+- 負荷分散: ブレーカーが許可するレプリカのうち、処理中リクエスト数 → 直近レイテンシの小さい順に選ぶ。
+- ヘッジ: 直近レイテンシの パーセンタイル（OSRM_HEDGE_PERCENTILE）を超えても応答が無ければ、
+  別レプリカへ同じリクエストを投げて早い方を採用する（OSRM_HEDGE_ENABLED で有効化）。
+- metrics(): 状態 / トリップ回数 / 成功・失敗数 / レイテンシ分位をプロセス単位で返す。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+OSRM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("OSRM_BREAKER_FAILURE_THRESHOLD", "3"))
+OSRM_BREAKER_RESET_SEC = float(os.getenv("OSRM_BREAKER_RESET_SEC", "15"))
+OSRM_HEDGE_ENABLED = os.getenv("OSRM_HEDGE_ENABLED", "false").strip().lower() in {"1", "true", "yes", "on"}
+OSRM_HEDGE_PERCENTILE = float(os.getenv("OSRM_HEDGE_PERCENTILE", "95"))
+# ヘッジ待ち時間の下限（秒）と、パーセンタイルを信用するのに必要なサンプル数
+OSRM_HEDGE_MIN_DELAY_SEC = float(os.getenv("OSRM_HEDGE_MIN_DELAY_SEC", "0.05"))
+OSRM_HEDGE_MIN_SAMPLES = int(os.getenv("OSRM_HEDGE_MIN_SAMPLES", "20"))
+
+_LATENCY_WINDOW = 200
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def hosts_for_profile(profile: str) -> List[str]:
+    """env からレプリカのベース URL 一覧を得る（末尾の / は除く）。"""
+    default = "http://osrm-car:5000" if profile == "car" else "http://osrm-foot:5000"
+    raw = os.getenv(f"OSRM_{profile.upper()}_HOSTS") or os.getenv(f"OSRM_{profile.upper()}_HOST", default)
+    hosts = [h.strip().rstrip("/") for h in raw.split(",") if h.strip()]
+    return hosts or [default]
+
+
+class CircuitBreaker:
+    """連続失敗回数ベースのサーキットブレーカー（スレッドセーフ）。"""
+
+    def __init__(
+        self,
+        *,
+        failure_threshold: int = OSRM_BREAKER_FAILURE_THRESHOLD,
+        reset_sec: float = OSRM_BREAKER_RESET_SEC,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_sec = reset_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.reset_sec:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """このレプリカへリクエストしてよいか。half-open では試行を 1 本だけ許す。"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if self._clock() - self._opened_at < self.reset_sec:
+                    return False
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """half-open の試行が結果なしで終わった（取り消し等）。次の試行を許す。"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.trips += 1
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._probe_in_flight = False
+
+
+class Replica:
+    """1 台の OSRM レプリカ（ブレーカー + 統計）。"""
+
+    def __init__(self, base_url: str, breaker: Optional[CircuitBreaker] = None) -> None:
+        self.base_url = base_url
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+        self.inflight = 0
+        self.successes = 0
+        self.failures = 0
+        self.hedges = 0
+
+    def begin(self) -> None:
+        with self._lock:
+            self.inflight += 1
+
+    def end(self, ok: bool, latency_sec: Optional[float]) -> None:
+        with self._lock:
+            self.inflight = max(0, self.inflight - 1)
+            if ok:
+                self.successes += 1
+                if latency_sec is not None:
+                    self._latencies.append(latency_sec)
+            else:
+                self.failures += 1
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def abandon(self) -> None:
+        """結果を待たずに取り消したリクエスト（ヘッジの負け側など）。成否には数えない。"""
+        with self._lock:
+            self.inflight = max(0, self.inflight - 1)
+        self.breaker.release_probe()
+
+    def record_hedge(self) -> None:
+        """このレプリカへヘッジ（予備リクエスト）を投げた。"""
+        with self._lock:
+            self.hedges += 1
+
+    def latencies(self) -> List[float]:
+        with self._lock:
+            return list(self._latencies)
+
+    def mean_latency(self) -> float:
+        lat = self.latencies()
+        return sum(lat) / len(lat) if lat else 0.0
+
+    def load(self) -> Tuple[int, float]:
+        """(処理中数, 平均レイテンシ) を同じ時点の値で返す（choose の並べ替えキー）。"""
+        with self._lock:
+            lat = self._latencies
+            return self.inflight, (sum(lat) / len(lat) if lat else 0.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """統計の一貫したコピー（metrics 用）。"""
+        with self._lock:
+            return {
+                "successes": self.successes,
+                "failures": self.failures,
+                "hedges": self.hedges,
+                "inflight": self.inflight,
+                "latencies": list(self._latencies),
+            }
+
+
+def _percentile(values: Iterable[float], pct: float) -> Optional[float]:
+    xs = sorted(values)
+    if not xs:
+        return None
+    k = min(len(xs) - 1, max(0, int(round(pct / 100.0 * (len(xs) - 1)))))
+    return xs[k]
+
+
+class BackendPool:
+    """プロファイル 1 つ分のレプリカ群。"""
+
+    def __init__(self, profile: str, hosts: List[str], **breaker_kwargs: Any) -> None:
+        self.profile = profile
+        self.replicas = [Replica(h, CircuitBreaker(**breaker_kwargs)) for h in hosts]
+        self._rr = 0
+        self._lock = threading.Lock()
+        self.rejected = 0  # 全レプリカ open で即時失敗させた回数
+
+    def choose(self, exclude: Iterable[Replica] = ()) -> Optional[Replica]:
+        """
+        ブレーカーが許可するレプリカを 1 台返す（無ければ None）。
+        処理中数 → 平均レイテンシの小さい順。同点はラウンドロビンでずらす。
+        """
+        excluded = set(id(r) for r in exclude)
+        with self._lock:
+            self._rr = (self._rr + 1) % max(1, len(self.replicas))
+            start = self._rr
+        n = len(self.replicas)
+        ordered = [self.replicas[(start + i) % n] for i in range(n)]
+        candidates = sorted(
+            (r for r in ordered if id(r) not in excluded and r.breaker.state != OPEN),
+            key=Replica.load,
+        )
+        for r in candidates:
+            if r.breaker.allow():
+                return r
+        if not excluded:
+            with self._lock:
+                self.rejected += 1
+        return None
+
+    def hedge_delay_sec(self) -> Optional[float]:
+        """ヘッジを投げるまでの待ち時間。ヘッジ不可（無効 / 1 台 / サンプル不足）なら None。"""
+        if not OSRM_HEDGE_ENABLED or len(self.replicas) < 2:
+            return None
+        samples = [x for r in self.replicas for x in r.latencies()]
+        if len(samples) < OSRM_HEDGE_MIN_SAMPLES:
+            return None
+        p = _percentile(samples, OSRM_HEDGE_PERCENTILE)
+        return max(OSRM_HEDGE_MIN_DELAY_SEC, p or 0.0)
+
+    def metrics(self) -> Dict[str, Any]:
+        out: List[Dict[str, Any]] = []
+        for r in self.replicas:
+            snap = r.snapshot()
+            lat = snap.pop("latencies")
+            out.append({
+                "base_url": r.base_url,
+                "state": r.breaker.state,
+                "trips": r.breaker.trips,
+                **snap,
+                "p50_ms": round(_percentile(lat, 50) * 1000, 1) if lat else None,
+                "p95_ms": round(_percentile(lat, 95) * 1000, 1) if lat else None,
+            })
+        with self._lock:
+            rejected = self.rejected
+        return {"profile": self.profile, "rejected": rejected, "replicas": out}
+
+
+_POOLS: Dict[Tuple[str, Tuple[str, ...]], BackendPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_backend_pool(profile: str, hosts: Optional[List[str]] = None) -> BackendPool:
+    """(profile, hosts) 毎のプロセス共有 BackendPool を返す。"""
+    hosts = hosts or hosts_for_profile(profile)
+    key = (profile, tuple(hosts))
+    pool = _POOLS.get(key)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(key)
+            if pool is None:
+                pool = BackendPool(profile, list(hosts))
+                _POOLS[key] = pool
+    return pool
+
+
+def reset_backend_pools() -> None:
+    """ブレーカー状態と統計を全て破棄する（設定変更時やテスト用）。"""
+    with _POOLS_LOCK:
+        _POOLS.clear()
+
+
+def backend_metrics() -> List[Dict[str, Any]]:
+    """このプロセスの全 BackendPool のメトリクス。"""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    return [p.metrics() for p in pools]
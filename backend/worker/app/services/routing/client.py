@@ -3,24 +3,65 @@
 OSRM 専用クライアント
 - 車用(osrm-car) / 徒歩用(osrm-foot) へ HTTP で接続してルート情報を取得する。
 - 低レベルな HTTP 通信（URL 構築 / リトライ / タイムアウト / 例外変換）を担う。
+- HTTP 接続はプロセス内で共有するプール（keep-alive）を使い、レグ毎の TCP ハンドシェイクを避ける。
+- 接続先はプロファイル毎のレプリカ群（backends.BackendPool）から選び、サーキットブレーカー /
+  フェイルオーバー / ヘッジ（任意）を適用する。
+- 事前にスナップ済みの地点（snapping.SnapIndex）は /route・/table に hints を付けて送り、
+  OSRM 側の最近傍探索を省く。
+- /route は呼び出し元が必要な分だけを要求する（ROUTE_DETAILS: distance / simplified / full）。
+  応答 JSON は orjson があればそれで復号する（無ければ標準 json）。
 """
 
 from __future__ import annotations
 
+import json
 import os
+import threading
 import time
-from typing import Iterable, List, Literal, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Literal, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson  # 任意依存: 大きな geojson 応答の復号が速い
+except ImportError:  # pragma: no cover
+    orjson = None
+
+from worker.app.services.routing.backends import (
+    OPEN,
+    BackendPool,
+    Replica,
+    get_backend_pool,
+    hosts_for_profile,
+    reset_backend_pools,
+)
+from worker.app.services.routing.snapping import SnapIndex, get_snap_index
 
 
 OSRMProfile = Literal["car", "foot"]
+RouteDetail = Literal["distance", "simplified", "full"]
+
+# /route の要求内容（呼び出し元が選ぶ）
+#  - distance:   距離/時間だけ（形状なし。応答は数百バイト）
+#  - simplified: 表示用の間引いた形状（OSRM の overview=simplified）
+#  - full:       全形状（ナビ・逸脱判定・キャッシュ保存用）
+ROUTE_DETAILS: Dict[str, Dict[str, str]] = {
+    "distance": {"overview": "false", "steps": "false"},
+    "simplified": {"geometries": "geojson", "overview": "simplified", "steps": "false"},
+    "full": {"geometries": "geojson", "overview": "full", "steps": "false"},
+}
 
 
 class OSRMClientError(Exception):
     """OSRM 通信時の一般的なエラー"""
 
 
+class OSRMAbortedError(OSRMClientError):
+    """abort フックが True を返したため送らなかった（呼び出し側の結果が不要になった）"""
+
+
 class OSRMNoRouteError(OSRMClientError):
     """ルートが見つからない場合のエラー"""
 
@@ -36,64 +77,190 @@ def _coords_to_path(coords: Iterable[Tuple[float, float]]) -> str:
     return ";".join(parts)
 
 
+# =========================
+# HTTP 接続プール（ワーカープロセス内で共有）
+# =========================
+# 既定値は env で上書き可能。プロファイル別（OSRM_CAR_* / OSRM_FOOT_*）の指定が優先される。
+#  - *_POOL_CONNECTIONS: ホスト毎に保持するプール数
+#  - *_POOL_MAXSIZE:     1ホストあたりの keep-alive 接続数の上限
+#  - *_POOL_BLOCK:       上限到達時に空きを待つ（=ホスト毎の同時接続数を厳密に制限）
+_POOL_LOCK = threading.Lock()
+_SESSIONS: Dict[str, requests.Session] = {}
+
+
+def _env_for_profile(profile: OSRMProfile, key: str, default: str) -> str:
+    return os.getenv(f"OSRM_{profile.upper()}_{key}", os.getenv(f"OSRM_{key}", default))
+
+
+def _pool_settings(profile: OSRMProfile) -> Tuple[int, int, bool]:
+    """(pool_connections, pool_maxsize, pool_block) を返す。"""
+    connections = int(_env_for_profile(profile, "POOL_CONNECTIONS", "2"))
+    maxsize = int(_env_for_profile(profile, "POOL_MAXSIZE", "16"))
+    block = _env_for_profile(profile, "POOL_BLOCK", "true").strip().lower() in {"1", "true", "yes", "on"}
+    return max(1, connections), max(1, maxsize), block
+
+
+def get_http_session(base_url: str, profile: OSRMProfile) -> requests.Session:
+    """
+    ベース URL（= OSRM ホスト）毎に 1 つの requests.Session をプロセス内で共有して返す。
+    - リトライは OSRMClient 側で行うため、アダプタの max_retries は 0 に固定する。
+    """
+    sess = _SESSIONS.get(base_url)
+    if sess is not None:
+        return sess
+    with _POOL_LOCK:
+        sess = _SESSIONS.get(base_url)
+        if sess is None:
+            connections, maxsize, block = _pool_settings(profile)
+            adapter = HTTPAdapter(
+                pool_connections=connections,
+                pool_maxsize=maxsize,
+                pool_block=block,
+                max_retries=0,
+            )
+            sess = requests.Session()
+            sess.mount("http://", adapter)
+            sess.mount("https://", adapter)
+            sess.headers.update({"Connection": "keep-alive"})
+            _SESSIONS[base_url] = sess
+    return sess
+
+
+def reset_http_sessions() -> None:
+    """共有セッションを全て閉じて破棄する（設定変更時やテスト用）。レプリカのブレーカー状態も初期化する。"""
+    with _POOL_LOCK:
+        for sess in _SESSIONS.values():
+            try:
+                sess.close()
+            except Exception:
+                pass
+        _SESSIONS.clear()
+    reset_backend_pools()
+
+
+# ヘッジ（2 本目の投機的リクエスト）用のスレッドプール。ヘッジ有効時のみ作る
+OSRM_HEDGE_WORKERS = int(os.getenv("OSRM_HEDGE_WORKERS", "8"))
+_HEDGE_EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+
+def _hedge_executor() -> ThreadPoolExecutor:
+    global _HEDGE_EXECUTOR
+    if _HEDGE_EXECUTOR is None:
+        with _POOL_LOCK:
+            if _HEDGE_EXECUTOR is None:
+                _HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=OSRM_HEDGE_WORKERS, thread_name_prefix="osrm-hedge")
+    return _HEDGE_EXECUTOR
+
+
+def _forget_sessions_after_fork() -> None:
+    # fork 後の子プロセスでは親のソケットやスレッドを共有しないよう、閉じずに参照だけ捨てる
+    global _HEDGE_EXECUTOR
+    _SESSIONS.clear()
+    _HEDGE_EXECUTOR = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_sessions_after_fork)
+
+
 class OSRMClient:
     """
     OSRM サーバーへの HTTP 通信をカプセル化したクライアント。
-    - profile='car' -> OSRM_CAR_HOST
-    - profile='foot' -> OSRM_FOOT_HOST
+    - profile='car' -> OSRM_CAR_HOSTS（カンマ区切り） or OSRM_CAR_HOST
+    - profile='foot' -> OSRM_FOOT_HOSTS（カンマ区切り） or OSRM_FOOT_HOST
+    - HTTP 接続は get_http_session() の共有プールを利用する（インスタンス間で共有）
+    - レプリカの健全性（ブレーカー）と統計はプロセス内で共有する（backends.get_backend_pool）
+    - snap_index: /route・/table に付ける hints の供給元（未指定ならプロセス共有の SnapIndex）
+    - abort: 各要求（リトライ含む）の送信前に呼ぶ callable。True なら送らず OSRMAbortedError
     """
 
-    def __init__(self, timeout_sec: float = 10.0, max_retries: int = 2, backoff_sec: float = 1.0) -> None:
-        self.car_base = os.getenv("OSRM_CAR_HOST", "http://osrm-car:5000")
-        self.foot_base = os.getenv("OSRM_FOOT_HOST", "http://osrm-foot:5000")
+    # hints を付けるサービス（/nearest 自体はスナップが目的なので付けない）
+    _HINTED_SERVICES = ("route", "table")
+
+    def __init__(
+        self,
+        timeout_sec: float = 10.0,
+        max_retries: int = 2,
+        backoff_sec: float = 1.0,
+        snap_index: Optional[SnapIndex] = None,
+        abort: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        self.car_hosts = hosts_for_profile("car")
+        self.foot_hosts = hosts_for_profile("foot")
+        self.car_base = self.car_hosts[0]
+        self.foot_base = self.foot_hosts[0]
         self.timeout_sec = timeout_sec
         self.max_retries = max_retries
         self.backoff_sec = backoff_sec
+        self.snap_index = snap_index if snap_index is not None else get_snap_index()
+        self.abort = abort
 
     # =========================
-    # 内部: ルートAPI 呼び出し
+    # 内部: OSRM API 呼び出し（共通）
     # =========================
-    def _route_request(
-        self, profile: OSRMProfile, coords: List[Tuple[float, float]]
+    def _profile_base(self, profile: OSRMProfile) -> Tuple[str, str]:
+        """profile -> (先頭レプリカのベースURL, OSRM 側のプロファイル名)"""
+        if profile == "car":
+            return self.car_base, "driving"
+        return self.foot_base, "foot"
+
+    def _pool(self, profile: OSRMProfile) -> BackendPool:
+        return get_backend_pool(profile, self.car_hosts if profile == "car" else self.foot_hosts)
+
+    def _request(
+        self, service: str, profile: OSRMProfile, coords: List[Tuple[float, float]], params: Dict[str, str]
     ) -> dict:
         """
-        OSRM /route エンドポイントを叩き、JSON を返す。
-        - steps: false（軽量化）
-        - overview: full（Leaflet で描画しやすい）
-        - geometries: geojson
-        - annotations: distance,duration（集約のため）
+        OSRM の {service}/v1/{profile}/{coords} を叩き、JSON を返す。
+        - /route・/table では既知の地点の hint を付ける。OSRM が hint を理由に 400 で拒否した場合
+          （データセット差し替え直後の不正な hint 等）は hint なしで 1 回だけ送り直す。
+          NoRoute / NoSegment 等の 400 は hint と無関係なのでそのまま失敗させる（is_hint_rejection）
         """
-        if profile == "car":
-            base = self.car_base
-            osrm_profile = "driving"
-        else:
-            base = self.foot_base
-            osrm_profile = "foot"
-
-        path = _coords_to_path(coords)  # (lat,lon) -> "lon,lat;lon,lat"
-        url = f"{base}/route/v1/{osrm_profile}/{path}"
-        params = {
-            "geometries": "geojson",
-            "overview": "full",
-            "steps": "false",
-            "annotations": "distance,duration",
-        }
-
-        # 簡易リトライ（タイムアウト・一時的エラー対策）
+        _, osrm_profile = self._profile_base(profile)
+        path = f"/{service}/v1/{osrm_profile}/{_coords_to_path(coords)}"  # (lat,lon) -> "lon,lat;lon,lat"
+
+        hints = None
+        if self.snap_index is not None and service in self._HINTED_SERVICES:
+            hints = self.snap_index.hints_param(profile, coords)
+        if not hints:
+            return self._request_path(profile, path, params)
+        try:
+            return self._request_path(profile, path, {**params, "hints": hints})
+        except OSRMClientError as e:
+            cause = e.__cause__
+            if not isinstance(cause, requests.HTTPError) or not is_hint_rejection(cause.response):
+                raise
+            self.snap_index.mark_rejected()
+        return self._request_path(profile, path, params)
+
+    def _request_path(self, profile: OSRMProfile, path: str, params: Dict[str, str]) -> dict:
+        """
+        リトライ / タイムアウト / 例外変換は全サービス共通。
+        - 一時的エラー（5xx / タイムアウト / 接続失敗）は別の健全なレプリカへ即フェイルオーバーし、
+          代わりが無い場合だけ従来通り線形バックオフで待つ
+        - 全レプリカのブレーカーが open なら待たずに失敗する
+        """
+        pool = self._pool(profile)
+
         last_exc: Exception | None = None
+        tried: List[Replica] = []
         for attempt in range(self.max_retries + 1):
+            if self.abort is not None and self.abort():
+                raise OSRMAbortedError(f"OSRM {profile}: request aborted")
+            replica = pool.choose(exclude=tried) or (pool.choose() if tried else None)
+            if replica is None:
+                raise OSRMClientError(f"OSRM {profile}: no available replica (circuit open); last error: {last_exc}")
             try:
-                resp = requests.get(url, params=params, timeout=self.timeout_sec)
-                if resp.status_code >= 500:
-                    # サーバー側一時障害はリトライ
-                    raise OSRMClientError(f"OSRM 5xx: {resp.status_code} {resp.text}")
-                resp.raise_for_status()
-                data = resp.json()
-                return data
+                return self._send_hedged(pool, replica, profile, path, params)
             except (requests.Timeout, requests.ConnectionError, OSRMClientError) as e:
                 last_exc = e
+                tried.append(replica)
                 if attempt < self.max_retries:
-                    time.sleep(self.backoff_sec * (attempt + 1))
+                    has_alternative = any(
+                        r not in tried and r.breaker.state != OPEN for r in pool.replicas
+                    )
+                    if not has_alternative:
+                        time.sleep(self.backoff_sec * (attempt + 1))
                     continue
                 break
             except requests.HTTPError as e:
@@ -101,7 +268,97 @@ class OSRMClient:
                 last_exc = e
                 break
 
-        raise OSRMClientError(f"OSRM request failed: {last_exc}")
+        raise OSRMClientError(f"OSRM request failed: {last_exc}") from last_exc
+
+    def _send_once(self, replica: Replica, profile: OSRMProfile, path: str, params: Dict[str, str]) -> dict:
+        """1 レプリカへ 1 回だけ送る。結果をレプリカの統計とブレーカーに反映する。"""
+        replica.begin()
+        t0 = time.monotonic()
+        try:
+            resp = get_http_session(replica.base_url, profile).get(
+                replica.base_url + path, params=params, timeout=self.timeout_sec
+            )
+        except Exception:
+            replica.end(False, None)
+            raise
+        if resp.status_code >= 500:
+            # サーバー側一時障害はリトライ
+            replica.end(False, None)
+            raise OSRMClientError(f"OSRM 5xx: {resp.status_code} {resp.text}")
+        # 4xx もサーバーは正常に応答している（ブレーカー上は成功扱い）
+        replica.end(True, time.monotonic() - t0)
+        resp.raise_for_status()
+        return _decode_json(resp)
+
+    def _send_hedged(
+        self, pool: BackendPool, replica: Replica, profile: OSRMProfile, path: str, params: Dict[str, str]
+    ) -> dict:
+        """
+        ヘッジ有効時: 直近レイテンシの分位点を過ぎても応答が無ければ別レプリカにも投げ、早い方を返す。
+        ヘッジ無効 / レプリカ 1 台 / 統計不足ならその場で 1 回送るだけ。
+        """
+        delay = pool.hedge_delay_sec()
+        if delay is None:
+            return self._send_once(replica, profile, path, params)
+
+        executor = _hedge_executor()
+        first = executor.submit(self._send_once, replica, profile, path, params)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        backup = pool.choose(exclude=[replica])
+        if backup is None:
+            return first.result()
+        backup.record_hedge()
+        pending = {first, executor.submit(self._send_once, backup, profile, path, params)}
+
+        last_exc: Exception | None = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                try:
+                    return f.result()
+                except requests.HTTPError:
+                    raise  # 4xx はどのレプリカでも同じ結果
+                except Exception as e:
+                    last_exc = e
+        assert last_exc is not None
+        raise last_exc
+
+    def _route_request(
+        self,
+        profile: OSRMProfile,
+        coords: List[Tuple[float, float]],
+        detail: RouteDetail = "full",
+        annotations: Optional[str] = None,
+    ) -> dict:
+        """
+        OSRM /route エンドポイントを叩き、JSON を返す。
+        - detail: ROUTE_DETAILS のキー（steps は常に false）
+        - annotations: 区間毎の値が必要な時だけ指定する（例: レグ分割の "distance"）
+        """
+        return self._request("route", profile, coords, route_params(detail, annotations, len(coords)))
+
+    def _table_request(
+        self, profile: OSRMProfile, coords: List[Tuple[float, float]], sources: List[int], destinations: List[int]
+    ) -> dict:
+        """
+        OSRM /table エンドポイントを叩き、JSON を返す。
+        - annotations: duration,distance（N×M の所要時間と距離を 1 リクエストで取得）
+        """
+        return self._request("table", profile, coords, table_params(sources, destinations))
+
+    # =========================
+    # 公開: 最近傍スナップ（/nearest）
+    # =========================
+    def fetch_nearest(self, point: Tuple[float, float], profile: OSRMProfile) -> Dict[str, Any]:
+        """
+        point を道路網へスナップした結果を返す。
+        戻り値: {"lat", "lon"（スナップ後）, "hint", "distance_m"（入力点からの距離）}
+        """
+        data = self._request("nearest", profile, [point], {"number": "1"})
+        return parse_nearest(data, point)
 
     # =========================
     # 公開: 2点間の距離/時間
@@ -113,19 +370,33 @@ class OSRMClient:
         profile: OSRMProfile,
     ) -> Tuple[float, float]:
         """
-        2点間の距離(km) と 所要時間(分) を返す。
+        2点間の距離(km) と 所要時間(分) を返す（形状は要求しない）。
         """
-        data = self._route_request(profile, [origin, destination])
-        routes = data.get("routes") or []
-        if not routes:
-            raise OSRMNoRouteError("No route found")
+        data = self._route_request(profile, [origin, destination], detail="distance")
+        return parse_distance_duration(data)
 
-        route = routes[0]
-        distance_m = float(route.get("distance", 0.0))
-        duration_s = float(route.get("duration", 0.0))
-        distance_km = distance_m / 1000.0
-        duration_min = duration_s / 60.0
-        return distance_km, duration_min
+    # =========================
+    # 公開: 多対多の距離/時間（/table）
+    # =========================
+    def fetch_table(
+        self,
+        origins: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]],
+        profile: OSRMProfile,
+    ) -> Tuple[List[List[Optional[float]]], List[List[Optional[float]]]]:
+        """
+        origins × destinations の距離(km) 行列と 所要時間(分) 行列を 1 回の /table で返す。
+        - 同一座標は 1 つの waypoint にまとめて送る（sources/destinations で同じ index を参照）
+        - 到達不能な組は None
+        戻り値: (distances_km[i][j], durations_min[i][j])
+        """
+        if not origins or not destinations:
+            return [], []
+        coords, src_idx, dst_idx = table_coords(origins, destinations)
+        if len(coords) < 2:
+            return zero_table(origins, destinations)
+        data = self._table_request(profile, coords, src_idx, dst_idx)
+        return parse_table(data, len(src_idx), len(dst_idx))
 
     # =========================
     # 公開: 経路全体（GeoJSON）
@@ -135,38 +406,228 @@ class OSRMClient:
         waypoints: List[Tuple[float, float]],
         profile: OSRMProfile,
         piston: bool = False,
+        detail: RouteDetail = "full",
     ) -> Tuple[dict, float, float]:
         """
         経由地を含む全行程の GeoJSON と 集約距離/時間 を返す。
         piston=True の場合、ピストン（出発点へ戻る）にするため先頭座標を終端に追加する。
+        detail="simplified" なら OSRM 側で間引いた形状を受け取る。
         戻り値: (geojson, distance_km, duration_min)
         """
         if piston and len(waypoints) >= 2:
             waypoints = [*waypoints, waypoints[0]]
+        data = self._route_request(profile, waypoints, detail=detail)
+        return parse_route(data, profile)
+
+    # =========================
+    # 公開: 多点ルートをレグ毎に分割
+    # =========================
+    def fetch_route_legs(
+        self,
+        waypoints: List[Tuple[float, float]],
+        profile: OSRMProfile,
+    ) -> List[Tuple[dict, float, float]]:
+        """
+        waypoints を 1 回の /route で結び、隣接 2 点（レグ）毎の (geojson, distance_km, duration_min) を返す。
+        - 距離/時間は OSRM の legs[] をそのまま使う
+        - 形状は overview=full の座標列を legs[].annotation の区間数で切り分ける
+          （レグ境界の座標は前後のレグで共有）。数が合わない応答は OSRMClientError
+        """
+        data = self._route_request(profile, waypoints, detail="full", annotations="distance")
+        return parse_route_legs(data, len(waypoints), profile)
+
+
+# =========================
+# リクエスト組み立て / 応答の解釈（同期・非同期クライアント共通）
+# =========================
+def route_params(
+    detail: RouteDetail = "full", annotations: Optional[str] = None, waypoints: int = 2
+) -> Dict[str, str]:
+    """
+    /route のクエリパラメータ。
+    - 3 点以上では continue_straight=false（car の既定 true だと経由点で U ターンできず、
+      レグ毎に 2 点で引いた経路と食い違う。多点でまとめたレグは 2 点のキーでもキャッシュされる）
+    """
+    if detail not in ROUTE_DETAILS:
+        raise ValueError(f"unknown route detail: {detail}")
+    params = dict(ROUTE_DETAILS[detail])
+    if annotations:
+        params["annotations"] = annotations
+    if waypoints > 2:
+        params["continue_straight"] = "false"
+    return params
+
+
+def table_params(sources: List[int], destinations: List[int]) -> Dict[str, str]:
+    """/table のクエリパラメータ。"""
+    return {
+        "sources": ";".join(str(i) for i in sources),
+        "destinations": ";".join(str(i) for i in destinations),
+        "annotations": "duration,distance",
+    }
+
+
+def table_coords(
+    origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]]
+) -> Tuple[List[Tuple[float, float]], List[int], List[int]]:
+    """同一座標を 1 つの waypoint にまとめた (coords, sources の index, destinations の index)。"""
+    coords: List[Tuple[float, float]] = []
+    index_of: Dict[Tuple[float, float], int] = {}
+
+    def _index(pt: Tuple[float, float]) -> int:
+        key = (float(pt[0]), float(pt[1]))
+        if key not in index_of:
+            index_of[key] = len(coords)
+            coords.append(key)
+        return index_of[key]
+
+    src_idx = [_index(p) for p in origins]
+    dst_idx = [_index(p) for p in destinations]
+    return coords, src_idx, dst_idx
+
+
+def zero_table(
+    origins: List[Tuple[float, float]], destinations: List[Tuple[float, float]]
+) -> Tuple[List[List[Optional[float]]], List[List[Optional[float]]]]:
+    """全て同一点（OSRM は 1 点の table を受け付けないため自前で 0 を返す）。"""
+    zeros: List[List[Optional[float]]] = [[0.0 for _ in destinations] for _ in origins]
+    return zeros, [row[:] for row in zeros]
+
+
+def parse_nearest(data: dict, point: Tuple[float, float]) -> Dict[str, Any]:
+    waypoints = data.get("waypoints") or []
+    if data.get("code", "Ok") != "Ok" or not waypoints:
+        raise OSRMNoRouteError(f"OSRM nearest failed: {data.get('code')}")
+    wp = waypoints[0]
+    lon, lat = wp.get("location") or (point[1], point[0])
+    return {
+        "lat": float(lat),
+        "lon": float(lon),
+        "hint": wp.get("hint") or "",
+        "distance_m": float(wp["distance"]) if wp.get("distance") is not None else None,
+    }
+
+
+def parse_distance_duration(data: dict) -> Tuple[float, float]:
+    """/route 応答の先頭ルートの (distance_km, duration_min)。"""
+    routes = data.get("routes") or []
+    if not routes:
+        raise OSRMNoRouteError("No route found")
+    route = routes[0]
+    return float(route.get("distance", 0.0)) / 1000.0, float(route.get("duration", 0.0)) / 60.0
+
+
+def parse_table(
+    data: dict, n_sources: int, n_destinations: int
+) -> Tuple[List[List[Optional[float]]], List[List[Optional[float]]]]:
+    """/table 応答を (distances_km, durations_min) にする。到達不能は None。"""
+    if data.get("code", "Ok") != "Ok":
+        raise OSRMNoRouteError(f"OSRM table failed: {data.get('code')}")
+
+    raw_dur = data.get("durations") or []
+    raw_dist = data.get("distances") or []
+
+    def _cell(rows: list, i: int, j: int, scale: float) -> Optional[float]:
+        try:
+            v = rows[i][j]
+        except (IndexError, TypeError):
+            return None
+        return None if v is None else float(v) / scale
+
+    distances_km = [[_cell(raw_dist, i, j, 1000.0) for j in range(n_destinations)] for i in range(n_sources)]
+    durations_min = [[_cell(raw_dur, i, j, 60.0) for j in range(n_destinations)] for i in range(n_sources)]
+    return distances_km, durations_min
+
+
+def parse_route(data: dict, profile: OSRMProfile) -> Tuple[dict, float, float]:
+    """/route 応答を (FeatureCollection, distance_km, duration_min) にする。"""
+    distance_km, duration_min = parse_distance_duration(data)
+    geometry = data["routes"][0].get("geometry", {})
+    return _feature_collection(geometry, distance_km, duration_min, profile), distance_km, duration_min
+
+
+def parse_route_legs(data: dict, n_waypoints: int, profile: OSRMProfile) -> List[Tuple[dict, float, float]]:
+    """多点 /route 応答（annotations=distance）をレグ毎の (geojson, distance_km, duration_min) に分ける。"""
+    routes = data.get("routes") or []
+    if not routes:
+        raise OSRMNoRouteError("No route found")
+
+    route = routes[0]
+    coords = (route.get("geometry") or {}).get("coordinates") or []
+    legs = route.get("legs") or []
+    if len(legs) != n_waypoints - 1:
+        raise OSRMClientError(f"OSRM returned {len(legs)} legs for {n_waypoints} waypoints")
+
+    out: List[Tuple[dict, float, float]] = []
+    offset = 0
+    for leg in legs:
+        n_segments = len((leg.get("annotation") or {}).get("distance") or [])
+        leg_coords = coords[offset:offset + n_segments + 1]
+        offset += n_segments
+        distance_km = float(leg.get("distance", 0.0)) / 1000.0
+        duration_min = float(leg.get("duration", 0.0)) / 60.0
+        geometry = {"type": "LineString", "coordinates": leg_coords}
+        out.append((_feature_collection(geometry, distance_km, duration_min, profile), distance_km, duration_min))
+    if coords and offset != len(coords) - 1:
+        raise OSRMClientError("OSRM annotation does not match route geometry")
+    return out
+
+
+def decode_json_bytes(content: bytes) -> dict:
+    """応答本文のバイト列を復号する（orjson があればそれを使う）。不正な JSON は OSRMClientError。"""
+    try:
+        return orjson.loads(content) if orjson is not None else json.loads(content)
+    except ValueError as e:  # orjson.JSONDecodeError / json.JSONDecodeError はどちらも ValueError
+        raise OSRMClientError(f"OSRM returned invalid JSON: {e}") from e
+
+
+# hint の不正で OSRM が返し得るエラーコード（message に hint を含む時だけ hint の拒否とみなす）
+_HINT_ERROR_CODES = frozenset({"InvalidHint", "InvalidValue", "InvalidOptions", "InvalidQuery"})
+
+
+def is_hint_rejection(response: Any) -> bool:
+    """
+    hint 付き要求への 400 応答が hint の拒否かどうか（応答本文の code / message で判定。requests / httpx 共通）。
+    NoRoute / NoSegment 等は hint を外しても結果が変わらないので False。
+    """
+    if getattr(response, "status_code", None) != 400:
+        return False
+    try:
+        body = json.loads(getattr(response, "text", None) or "")
+    except (TypeError, ValueError):
+        return False
+    if not isinstance(body, dict):
+        return False
+    code = str(body.get("code") or "")
+    if code == "InvalidHint":
+        return True
+    return code in _HINT_ERROR_CODES and "hint" in str(body.get("message") or "").lower()
+
+
+def _decode_json(resp: requests.Response) -> dict:
+    """応答本文を復号する。orjson があればバイト列から直接（str への変換と標準 json を避ける）。"""
+    content = getattr(resp, "content", None)
+    if orjson is not None and isinstance(content, (bytes, bytearray)):
+        return decode_json_bytes(content)
+    try:
+        return resp.json()
+    except ValueError as e:
+        raise OSRMClientError(f"OSRM returned invalid JSON: {e}") from e
+
 
-        data = self._route_request(profile, waypoints)
-        routes = data.get("routes") or []
-        if not routes:
-            raise OSRMNoRouteError("No route found")
-
-        route = routes[0]
-        distance_km = float(route.get("distance", 0.0)) / 1000.0
-        duration_min = float(route.get("duration", 0.0)) / 60.0
-        geometry = route.get("geometry", {})
-
-        # Leaflet ですぐ描画できるよう FeatureCollection に整形
-        geojson = {
-            "type": "FeatureCollection",
-            "features": [
-                {
-                    "type": "Feature",
-                    "properties": {
-                        "distance_km": distance_km,
-                        "duration_min": duration_min,
-                        "profile": profile,
-                    },
-                    "geometry": geometry,
-                }
-            ],
-        }
-        return geojson, distance_km, duration_min
+def _feature_collection(geometry: dict, distance_km: float, duration_min: float, profile: OSRMProfile) -> dict:
+    """Leaflet ですぐ描画できるよう 1 本の経路を FeatureCollection に整形する。"""
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {
+                    "distance_km": distance_km,
+                    "duration_min": duration_min,
+                    "profile": profile,
+                },
+                "geometry": geometry,
+            }
+        ],
+    }
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+レグ経路キャッシュ（2 段構成）
+- 1 段目: プロセス内の上限付き LRU（最速、ワーカー毎）
+- 2 段目: Redis（TTL 付き、ワーカー間で共有）
+- キー: OSRM データセット版 / profile / 丸めた座標列 / piston / 追加の判定条件
+  OSRM データは日本の extract を再構築した時しか変わらないため、
+  OSRM_DATASET_VERSION を上げればキャッシュ全体が自然に切り替わる。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from shared.app.redis_client import get_redis
+
+OSRM_DATASET_VERSION = os.getenv("OSRM_DATASET_VERSION", "v1")
+ROUTE_CACHE_ENABLED = os.getenv("ROUTE_CACHE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+ROUTE_CACHE_LRU_SIZE = int(os.getenv("ROUTE_CACHE_LRU_SIZE", "2048"))
+ROUTE_CACHE_TTL_SEC = int(os.getenv("ROUTE_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+# 小数 5 桁 ≒ 1m。GPS 由来の微小な揺れでもキーが一致するように丸める
+ROUTE_CACHE_COORD_DECIMALS = int(os.getenv("ROUTE_CACHE_COORD_DECIMALS", "5"))
+# Redis エラー後、この秒数は Redis を叩かず LRU のみで動く（障害時に毎回タイムアウトを待たない）
+ROUTE_CACHE_REDIS_RETRY_SEC = float(os.getenv("ROUTE_CACHE_REDIS_RETRY_SEC", "30"))
+
+_KEY_PREFIX = "route_leg"
+
+
+def build_leg_key(
+    profile: str,
+    coords: Iterable[Tuple[float, float]],
+    *,
+    piston: bool = False,
+    extra: Optional[str] = None,
+    dataset_version: Optional[str] = None,
+) -> str:
+    """
+    キャッシュキーを組み立てる。coords は (lat,lon) の列。
+    例: route_leg:v1:car:p0:39.13100,140.06900;39.13400,140.07200
+    """
+    nd = ROUTE_CACHE_COORD_DECIMALS
+    path = ";".join(f"{float(lat):.{nd}f},{float(lon):.{nd}f}" for lat, lon in coords)
+    parts = [_KEY_PREFIX, dataset_version or OSRM_DATASET_VERSION, profile, "p1" if piston else "p0"]
+    if extra:
+        parts.append(extra)
+    parts.append(path)
+    return ":".join(parts)
+
+
+class LegCache:
+    """
+    LRU + Redis の 2 段キャッシュ。値は JSON 文字列で保持し、取り出し毎に新しい dict を返す
+    （呼び出し側が結果を書き換えてもキャッシュが汚れない）。
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = ROUTE_CACHE_LRU_SIZE,
+        ttl_sec: int = ROUTE_CACHE_TTL_SEC,
+        redis_client: Any = None,
+        use_redis: bool = True,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_sec = ttl_sec
+        self._redis = redis_client
+        self._use_redis = use_redis
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis_down_until = 0.0
+        self._stats: Dict[str, int] = {
+            "lru_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "redis_errors": 0,
+        }
+
+    # ---------- 内部 ----------
+    def _redis_client(self) -> Any:
+        if not self._use_redis or time.monotonic() < self._redis_down_until:
+            return None
+        return self._redis if self._redis is not None else get_redis()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _redis_failed(self) -> None:
+        self._redis_down_until = time.monotonic() + ROUTE_CACHE_REDIS_RETRY_SEC
+        self._count("redis_errors")
+
+    def _lru_put(self, key: str, raw: str) -> None:
+        with self._lock:
+            self._lru[key] = raw
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    # ---------- 公開 ----------
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            raw = self._lru.get(key)
+            if raw is not None:
+                self._lru.move_to_end(key)
+                self._stats["lru_hits"] += 1
+        if raw is not None:
+            return json.loads(raw)
+
+        r = self._redis_client()
+        if r is not None:
+            try:
+                val = r.get(key)
+            except Exception:
+                val = None
+                self._redis_failed()
+            if val is not None:
+                raw = val.decode("utf-8") if isinstance(val, bytes) else str(val)
+                self._lru_put(key, raw)
+                self._count("redis_hits")
+                return json.loads(raw)
+
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        raw = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        self._lru_put(key, raw)
+        self._count("stores")
+        r = self._redis_client()
+        if r is not None:
+            try:
+                r.set(key, raw, ex=self.ttl_sec)
+            except Exception:
+                self._redis_failed()
+
+    def clear(self) -> None:
+        """プロセス内 LRU と統計をリセット（Redis 側は TTL に任せる）。"""
+        with self._lock:
+            self._lru.clear()
+            for k in self._stats:
+                self._stats[k] = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット/ミス数などのカウンタを返す。"""
+        with self._lock:
+            s: Dict[str, Any] = dict(self._stats)
+            s["lru_size"] = len(self._lru)
+        lookups = s["lru_hits"] + s["redis_hits"] + s["misses"]
+        s["hit_ratio"] = ((s["lru_hits"] + s["redis_hits"]) / lookups) if lookups else 0.0
+        s["dataset_version"] = OSRM_DATASET_VERSION
+        return s
+
+
+_default_cache: Optional[LegCache] = None
+_default_lock = threading.Lock()
+
+
+def get_leg_cache() -> Optional[LegCache]:
+    """プロセス共有の LegCache を返す。ROUTE_CACHE_ENABLED=false なら None。"""
+    global _default_cache
+    if not ROUTE_CACHE_ENABLED:
+        return None
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = LegCache()
+    return _default_cache
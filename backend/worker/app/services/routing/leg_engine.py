@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+並列レグ計算エンジン
+- 各レグ（P(i) -> P(i+1)）は自分の端点だけに依存するため、上限付きスレッドプールで同時に計算する。
+- 結果は入力と同じ順序で返す（決定的）。1 レグの失敗は他のレグに波及させず、LegOutcome.error に格納する。
+- DB セッションはスレッドセーフではないため、AP 探索などの DB アクセスはロックで直列化し、
+  OSRM への HTTP 待ちだけを並列化する。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+ROUTING_LEG_CONCURRENCY = int(os.getenv("ROUTING_LEG_CONCURRENCY", "6"))
+
+
+@dataclass(frozen=True)
+class LegSpec:
+    """calculate_hybrid_leg に渡す 1 レグ分の入力。"""
+    origin: Tuple[float, float]
+    dest: Tuple[float, float]
+    dest_spot_type: Optional[str] = None
+    dest_tags: Optional[dict] = None
+    ap_max_km: float = 20.0
+    piston: bool = False
+    dest_spot_id: Optional[int] = None  # あれば事前割当（spot_access_assignments）を使う
+
+
+@dataclass
+class LegOutcome:
+    """1 レグ分の結果。成功時は result、失敗時は error が入る。"""
+    index: int
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.result is not None
+
+
+class _SerializedSession:
+    """Session の execute 系をロックで直列化する薄いラッパ（その他の属性は素通し）。"""
+
+    def __init__(self, db: Any) -> None:
+        self._db = db
+        self._lock = threading.Lock()
+
+    def execute(self, *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            return self._db.execute(*args, **kwargs)
+
+    def get(self, *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            return self._db.get(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._db, name)
+
+
+def compute_hybrid_legs(
+    routing: Any,
+    db: Any,
+    specs: Sequence[LegSpec],
+    *,
+    max_workers: Optional[int] = None,
+) -> List[LegOutcome]:
+    """
+    specs の各レグを routing.calculate_hybrid_leg で並列に計算し、入力順の LegOutcome を返す。
+    - max_workers 未指定時は ROUTING_LEG_CONCURRENCY（env）を上限とする
+    - レグが 1 本以下ならスレッドを使わずその場で計算する
+    """
+    if not specs:
+        return []
+
+    shared_db = _SerializedSession(db) if db is not None else None
+
+    def _run(i: int, spec: LegSpec) -> LegOutcome:
+        try:
+            leg = routing.calculate_hybrid_leg(
+                shared_db,
+                origin=spec.origin,
+                dest=spec.dest,
+                dest_spot_type=spec.dest_spot_type,
+                dest_tags=spec.dest_tags,
+                ap_max_km=spec.ap_max_km,
+                piston=spec.piston,
+                dest_spot_id=spec.dest_spot_id,
+            )
+            return LegOutcome(index=i, result=leg)
+        except Exception as e:
+            return LegOutcome(index=i, error=e)
+
+    workers = min(len(specs), max(1, max_workers or ROUTING_LEG_CONCURRENCY))
+    if workers == 1:
+        return [_run(i, s) for i, s in enumerate(specs)]
+
+    # 呼び出し毎に専用プールを作る（入れ子の呼び出しでもプール枯渇でデッドロックしない）
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="leg") as pool:
+        futures = [pool.submit(_run, i, s) for i, s in enumerate(specs)]
+        return [f.result() for f in futures]
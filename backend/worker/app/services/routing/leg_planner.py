@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+レグプランナー（同一プロファイルが続く区間を 1 回の多点 /route にまとめる）
+- 計画の各レグ P(i) -> P(i+1) を、calculate_hybrid_leg と同じ判断で区間に分解する
+  （直行: car 1 区間 / AP 経由: car(P(i)→AP) + foot(AP→P(i+1))）。
+- 区間を順に並べ、プロファイルが同じ連続区間（= 切り替わりは AP での car→foot 等だけ）を
+  RoutingService.calculate_route_legs で 1 回の /route として取得し、OSRM の legs[] で分割して戻す。
+- 連続区間の取得に失敗したレグ（car 到達不能など）は、従来のレグ単位計算（compute_hybrid_legs）で
+  計算し直す（car→foot のフォールバックもそちらに任せる）。
+- ROUTING_MERGE_LEGS=false なら常にレグ単位で計算する。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from worker.app.services.routing.leg_engine import (
+    ROUTING_LEG_CONCURRENCY,
+    LegOutcome,
+    LegSpec,
+    compute_hybrid_legs,
+)
+
+logger = logging.getLogger(__name__)
+
+ROUTING_MERGE_LEGS = os.getenv("ROUTING_MERGE_LEGS", "true").strip().lower() in {"1", "true", "yes", "on"}
+
+
+@dataclass(frozen=True)
+class _Segment:
+    """1 レグを構成する区間（プロファイルが 1 つの OSRM 経路）。"""
+    leg: int
+    profile: str
+    origin: Tuple[float, float]
+    dest: Tuple[float, float]
+
+
+def plan_segments(routing: Any, db: Any, specs: Sequence[LegSpec]) -> Tuple[List[_Segment], Dict[int, Any]]:
+    """
+    各レグを区間列に分解する。戻り値: (区間の並び, {レグ番号: used_ap の dict | None})
+    """
+    segments: List[_Segment] = []
+    used_aps: Dict[int, Any] = {}
+    for i, spec in enumerate(specs):
+        _, ap = routing.resolve_leg_access(
+            db,
+            dest=spec.dest,
+            dest_spot_type=spec.dest_spot_type,
+            dest_tags=spec.dest_tags,
+            ap_max_km=spec.ap_max_km,
+            dest_spot_id=spec.dest_spot_id,
+        )
+        if ap:
+            ap_id, ap_name, ap_type, ap_lat, ap_lon = ap
+            ap_pt = (ap_lat, ap_lon)
+            segments.append(_Segment(i, "car", spec.origin, ap_pt))
+            segments.append(_Segment(i, "foot", ap_pt, spec.dest))
+            used_aps[i] = {"id": ap_id, "name": ap_name, "ap_type": ap_type, "latitude": ap_lat, "longitude": ap_lon}
+        else:
+            segments.append(_Segment(i, "car", spec.origin, spec.dest))
+            used_aps[i] = None
+    return segments, used_aps
+
+
+def group_runs(segments: Sequence[_Segment]) -> List[List[_Segment]]:
+    """プロファイルが同じで端点がつながる連続区間ごとにまとめる。"""
+    runs: List[List[_Segment]] = []
+    for seg in segments:
+        if runs and runs[-1][-1].profile == seg.profile and runs[-1][-1].dest == seg.origin:
+            runs[-1].append(seg)
+        else:
+            runs.append([seg])
+    return runs
+
+
+def compute_planned_legs(
+    routing: Any,
+    db: Any,
+    specs: Sequence[LegSpec],
+    *,
+    max_workers: Optional[int] = None,
+) -> List[LegOutcome]:
+    """
+    compute_hybrid_legs と同じ入出力で、同一プロファイルの連続区間をまとめて計算する。
+    - piston のレグを含む / レグが 1 本以下 / 無効設定の場合は compute_hybrid_legs にそのまま任せる
+    """
+    if not ROUTING_MERGE_LEGS or len(specs) < 2 or any(s.piston for s in specs):
+        return compute_hybrid_legs(routing, db, specs, max_workers=max_workers)
+
+    try:
+        segments, used_aps = plan_segments(routing, db, specs)
+    except Exception as e:
+        logger.debug("leg planning failed, falling back to per-leg routing: %s", e)
+        return compute_hybrid_legs(routing, db, specs, max_workers=max_workers)
+    runs = group_runs(segments)
+
+    def _run(run: List[_Segment]) -> Optional[List[Dict[str, Any]]]:
+        waypoints = [run[0].origin] + [seg.dest for seg in run]
+        try:
+            return routing.calculate_route_legs(waypoints, run[0].profile)
+        except Exception as e:
+            logger.debug("merged %s run of %d segments failed: %s", run[0].profile, len(run), e)
+            return None
+
+    workers = min(len(runs), max(1, max_workers or ROUTING_LEG_CONCURRENCY))
+    if workers == 1:
+        run_results = [_run(r) for r in runs]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="leg-run") as pool:
+            run_results = list(pool.map(_run, runs))
+
+    # 区間の結果をレグ毎に集める（失敗した連続区間に属するレグは None で印を付ける）
+    per_leg: Dict[int, Optional[List[Dict[str, Any]]]] = {i: [] for i in range(len(specs))}
+    for run, results in zip(runs, run_results):
+        for k, seg in enumerate(run):
+            if per_leg[seg.leg] is None:
+                continue
+            if results is None or k >= len(results):
+                per_leg[seg.leg] = None
+            else:
+                per_leg[seg.leg].append(results[k])
+
+    outcomes: List[Optional[LegOutcome]] = [None] * len(specs)
+    retry: List[int] = []
+    for i in range(len(specs)):
+        parts = per_leg[i]
+        if not parts:
+            retry.append(i)
+            continue
+        if len(parts) == 1:
+            leg = dict(parts[0])
+        else:
+            leg = {
+                "geojson": {
+                    "type": "FeatureCollection",
+                    "features": [f for p in parts for f in (p.get("geojson") or {}).get("features") or []],
+                },
+                "distance_km": sum(float(p["distance_km"]) for p in parts),
+                "duration_min": sum(float(p["duration_min"]) for p in parts),
+            }
+        leg["used_ap"] = used_aps[i]
+        outcomes[i] = LegOutcome(index=i, result=leg)
+
+    if retry:
+        for i, outcome in zip(retry, compute_hybrid_legs(routing, db, [specs[i] for i in retry], max_workers=max_workers)):
+            outcome.index = i
+            outcomes[i] = outcome
+    return [o for o in outcomes if o is not None]
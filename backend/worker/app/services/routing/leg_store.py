@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+レグ経路の永続ストア（route_legs テーブル）
+- LegCache（LRU + Redis）の下段。Redis のフラッシュやワーカー再起動後も計算済みレグが残る。
+- RoutingService がキャッシュミス時に read-through し、OSRM で計算した結果を write-back する。
+- 呼び出し側の DB セッション（トランザクション）を汚さないよう、専用の短命セッションで読み書きする。
+- DB エラー時は一定時間ストアを使わず OSRM 直行で動く（経路計算そのものは止めない）。
+- 保存するのは両端がスポット / アクセスポイントのレグだけ（GPS 位置からのリルート等は毎回座標が違い再利用されない）。
+- hit_count / last_used_at は読み出しの度に書かず、プロセス内で集計してまとめて更新する。
+- 長く使われていない行は prune()（celery beat の routing.prune_route_legs）で削除する。
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, FrozenSet, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from shared.app.models import RouteLeg
+from shared.app.services.route_geometry import decode_route, encode_route
+from worker.app.services.routing.leg_cache import OSRM_DATASET_VERSION
+
+ROUTE_LEG_STORE_ENABLED = os.getenv("ROUTE_LEG_STORE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+# DB エラー後、この秒数はストアを使わない
+ROUTE_LEG_STORE_RETRY_SEC = float(os.getenv("ROUTE_LEG_STORE_RETRY_SEC", "60"))
+# スポット / アクセスポイント座標（保存対象の判定に使う）を読み直す間隔（秒）
+ROUTE_LEG_STORE_POINTS_TTL_SEC = float(os.getenv("ROUTE_LEG_STORE_POINTS_TTL_SEC", "600"))
+# hit_count / last_used_at をまとめて書き出す間隔（秒）と、溜めるキー数の上限
+ROUTE_LEG_STORE_HIT_FLUSH_SEC = float(os.getenv("ROUTE_LEG_STORE_HIT_FLUSH_SEC", "60"))
+ROUTE_LEG_STORE_HIT_FLUSH_MAX = int(os.getenv("ROUTE_LEG_STORE_HIT_FLUSH_MAX", "500"))
+# routing.prune_route_legs が削除する、最後の利用から経過した日数
+ROUTE_LEG_RETENTION_DAYS = float(os.getenv("ROUTE_LEG_RETENTION_DAYS", "30"))
+# prune() で 1 回の DELETE が消す行数（長いロックを避ける）
+ROUTE_LEG_PRUNE_BATCH = int(os.getenv("ROUTE_LEG_PRUNE_BATCH", "5000"))
+# キーの座標丸め（小数 5 桁 ≒ 1m。LegCache と同じ）
+_COORD_DECIMALS = 5
+_KEY_COLUMNS = ("profile", "from_lat", "from_lon", "to_lat", "to_lon", "via_ap_id", "piston", "osrm_dataset_version")
+
+_KNOWN_POINTS_SQL = text(
+    "SELECT latitude, longitude FROM spots UNION SELECT latitude, longitude FROM access_points"
+)
+
+
+def _round_pt(pt: Tuple[float, float]) -> Tuple[float, float]:
+    return (round(float(pt[0]), _COORD_DECIMALS), round(float(pt[1]), _COORD_DECIMALS))
+
+
+class RouteLegStore:
+    """
+    route_legs の read-through / write-back。session_factory は引数なしで Session を返す callable。
+    known_points はスポット / アクセスポイントの座標を返す callable（省略時は spots / access_points を読む）。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        *,
+        dataset_version: str = OSRM_DATASET_VERSION,
+        known_points: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        self._session_factory = session_factory
+        self.dataset_version = dataset_version
+        self._known_points_loader = known_points or self._load_known_points
+        self._known: FrozenSet[Tuple[float, float]] = frozenset()
+        self._known_until = 0.0
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+        self._pending_hits: Dict[Tuple[Any, ...], int] = {}
+        self._last_flush = time.monotonic()
+        self._stats: Dict[str, int] = {
+            "hits": 0, "misses": 0, "stores": 0, "skipped": 0, "errors": 0, "hit_flushes": 0, "pruned": 0,
+        }
+
+    # ---------- 内部 ----------
+    def _available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _failed(self) -> None:
+        self._down_until = time.monotonic() + ROUTE_LEG_STORE_RETRY_SEC
+        self._count("errors")
+
+    def _load_known_points(self):
+        with self._session_factory() as s:
+            return s.execute(_KNOWN_POINTS_SQL).fetchall()
+
+    def _is_known(self, origin: Tuple[float, float], dest: Tuple[float, float]) -> bool:
+        """両端がスポット / アクセスポイントの座標（丸め後）か。読み込みに失敗したら False。"""
+        now = time.monotonic()
+        if now >= self._known_until:
+            try:
+                known = frozenset(_round_pt(p) for p in self._known_points_loader())
+            except Exception:
+                self._failed()
+                return False
+            with self._lock:
+                self._known, self._known_until = known, now + ROUTE_LEG_STORE_POINTS_TTL_SEC
+        known = self._known
+        return _round_pt(origin) in known and _round_pt(dest) in known
+
+    def _record_hit(self, key: Dict[str, Any]) -> None:
+        ident = tuple(key[c] for c in _KEY_COLUMNS)
+        with self._lock:
+            self._pending_hits[ident] = self._pending_hits.get(ident, 0) + 1
+            due = (
+                len(self._pending_hits) >= ROUTE_LEG_STORE_HIT_FLUSH_MAX
+                or time.monotonic() - self._last_flush >= ROUTE_LEG_STORE_HIT_FLUSH_SEC
+            )
+        if due:
+            self.flush_hits()
+
+    def _key(
+        self, profile: str, origin: Tuple[float, float], dest: Tuple[float, float], via_ap_id: int, piston: bool
+    ) -> Dict[str, Any]:
+        (flat, flon), (tlat, tlon) = _round_pt(origin), _round_pt(dest)
+        return {
+            "profile": profile,
+            "from_lat": flat,
+            "from_lon": flon,
+            "to_lat": tlat,
+            "to_lon": tlon,
+            "via_ap_id": int(via_ap_id or 0),
+            "piston": bool(piston),
+            "osrm_dataset_version": self.dataset_version,
+        }
+
+    # ---------- 公開 ----------
+    def get(
+        self,
+        profile: str,
+        origin: Tuple[float, float],
+        dest: Tuple[float, float],
+        *,
+        via_ap_id: int = 0,
+        piston: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        保存済みレグを {"geojson", "distance_km", "duration_min"(, "used_ap")} で返す。無ければ None。
+        両端がスポット / アクセスポイントでなければ DB を引かずに None（保存もされないため）。
+        """
+        if not self._available() or not self._is_known(origin, dest):
+            return None
+        key = self._key(profile, origin, dest, via_ap_id, piston)
+        cond = and_(*(getattr(RouteLeg, k) == v for k, v in key.items()))
+        try:
+            with self._session_factory() as s:
+                row = s.execute(
+                    select(RouteLeg.geometry, RouteLeg.distance_km, RouteLeg.duration_min, RouteLeg.used_ap).where(cond)
+                ).first()
+        except Exception:
+            self._failed()
+            return None
+
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        self._record_hit(key)
+        result: Dict[str, Any] = {
+            "geojson": decode_route(row.geometry),
+            "distance_km": float(row.distance_km),
+            "duration_min": float(row.duration_min),
+        }
+        if profile == "hybrid":
+            result["used_ap"] = row.used_ap
+        return result
+
+    def put(
+        self,
+        profile: str,
+        origin: Tuple[float, float],
+        dest: Tuple[float, float],
+        result: Dict[str, Any],
+        *,
+        via_ap_id: int = 0,
+        piston: bool = False,
+    ) -> None:
+        """計算済みレグを保存する（同じキーがあれば上書き）。両端がスポット / アクセスポイントでなければ保存しない。"""
+        if not self._available() or result.get("distance_km") is None or result.get("duration_min") is None:
+            return
+        if not self._is_known(origin, dest):
+            self._count("skipped")
+            return
+        values = self._key(profile, origin, dest, via_ap_id, piston)
+        values.update(
+            geometry=encode_route(result.get("geojson")),
+            distance_km=float(result["distance_km"]),
+            duration_min=float(result["duration_min"]),
+            used_ap=result.get("used_ap") if profile == "hybrid" else None,
+        )
+        try:
+            with self._session_factory() as s:
+                dialect_insert = pg_insert if s.get_bind().dialect.name == "postgresql" else sqlite_insert
+                stmt = dialect_insert(RouteLeg).values(**values)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=list(_KEY_COLUMNS),
+                    set_={
+                        "geometry": stmt.excluded.geometry,
+                        "distance_km": stmt.excluded.distance_km,
+                        "duration_min": stmt.excluded.duration_min,
+                        "used_ap": stmt.excluded.used_ap,
+                        "last_used_at": func.now(),
+                    },
+                )
+                s.execute(stmt)
+                s.commit()
+        except Exception:
+            self._failed()
+            return
+        self._count("stores")
+
+    def flush_hits(self) -> int:
+        """溜まった利用回数を hit_count / last_used_at に書き出す。書き出したキー数を返す。"""
+        with self._lock:
+            pending, self._pending_hits = self._pending_hits, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            with self._session_factory() as s:
+                for ident, n in pending.items():
+                    cond = and_(*(getattr(RouteLeg, c) == v for c, v in zip(_KEY_COLUMNS, ident)))
+                    s.execute(
+                        update(RouteLeg).where(cond).values(hit_count=RouteLeg.hit_count + n, last_used_at=func.now())
+                    )
+                s.commit()
+        except Exception:
+            # 利用回数は棚卸し用の目安なので、失敗した分は捨てる
+            self._failed()
+            return 0
+        self._count("hit_flushes")
+        return len(pending)
+
+    def prune(self, max_idle_days: float) -> int:
+        """last_used_at が max_idle_days 日より古い行を ROUTE_LEG_PRUNE_BATCH 件ずつ削除する。削除件数を返す。"""
+        self.flush_hits()
+        cutoff = datetime.now(timezone.utc) - timedelta(days=max_idle_days)
+        total = 0
+        with self._session_factory() as s:
+            while True:
+                ids = select(RouteLeg.id).where(RouteLeg.last_used_at < cutoff).limit(ROUTE_LEG_PRUNE_BATCH)
+                n = s.execute(delete(RouteLeg).where(RouteLeg.id.in_(ids))).rowcount or 0
+                s.commit()
+                total += n
+                if n < ROUTE_LEG_PRUNE_BATCH:
+                    break
+        with self._lock:
+            self._stats["pruned"] += total
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s: Dict[str, Any] = dict(self._stats)
+            s["pending_hits"] = len(self._pending_hits)
+        s["dataset_version"] = self.dataset_version
+        return s
+
+
+_default_store: Optional[RouteLegStore] = None
+_default_lock = threading.Lock()
+
+
+def get_leg_store() -> Optional[RouteLegStore]:
+    """プロセス共有の RouteLegStore を返す。ROUTE_LEG_STORE_ENABLED=false なら None。"""
+    global _default_store
+    if not ROUTE_LEG_STORE_ENABLED:
+        return None
+    if _default_store is None:
+        with _default_lock:
+            if _default_store is None:
+                from sqlalchemy.orm import sessionmaker
+                from shared.app.database import engine  # エンジン生成はストア初回利用時まで遅らせる
+
+                _default_store = RouteLegStore(sessionmaker(bind=engine, autoflush=False, expire_on_commit=False))
+                atexit.register(_default_store.flush_hits)
+    return _default_store
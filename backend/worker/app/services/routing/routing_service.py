@@ -4,16 +4,58 @@ Routing Service（公開インターフェース）
 - オーケストレーターや情報提供サービス部から呼ばれ、
   OSRMClient を用いて距離/時間や GeoJSON を返す。
 - ビジネス判断（どの profile を使うか等）はオーケストレーター側の責務。
+- 投機モード（ROUTING_SPECULATIVE_FALLBACK）: car → foot のフォールバックを逐次ではなく
+  car / foot 同時に投げ、car が取れれば foot は取り消す（実行中なら結果を捨てる）。
+  OSRM への負荷（最大 2 倍）と引き換えに、car が到達不能な時の待ち時間を 1 往復分縮める。
 """
 
 from __future__ import annotations
 
-from typing import List, Tuple, Dict, Any
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from worker.app.services.routing.client import OSRMClient, OSRMNoRouteError, OSRMProfile
+from worker.app.services.routing.client import OSRMClient, OSRMNoRouteError, OSRMProfile, RouteDetail
 
 from worker.app.services.routing.access_points_repo import find_nearest_access_point
 from worker.app.services.routing.drive_rules import is_car_direct_accessible
+from worker.app.services.routing.leg_cache import LegCache, build_leg_key, get_leg_cache
+from worker.app.services.routing.leg_store import RouteLegStore, get_leg_store
+from worker.app.services.routing.spot_access import lookup_spot_access
+
+# _compute_hybrid_leg に「AP 未解決（自前で探索する）」を伝える番兵
+_AP_UNRESOLVED = object()
+
+ROUTING_SPECULATIVE_FALLBACK = (
+    os.getenv("ROUTING_SPECULATIVE_FALLBACK", "false").strip().lower() in {"1", "true", "yes", "on"}
+)
+# 投機リクエスト用スレッド数（leg_engine のレグ並列とは別プール。入れ子で枯渇しないように分ける）
+ROUTING_SPECULATIVE_WORKERS = int(os.getenv("ROUTING_SPECULATIVE_WORKERS", "8"))
+
+_SPECULATIVE_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_SPECULATIVE_LOCK = threading.Lock()
+
+
+def _speculative_executor() -> ThreadPoolExecutor:
+    global _SPECULATIVE_EXECUTOR
+    if _SPECULATIVE_EXECUTOR is None:
+        with _SPECULATIVE_LOCK:
+            if _SPECULATIVE_EXECUTOR is None:
+                _SPECULATIVE_EXECUTOR = ThreadPoolExecutor(
+                    max_workers=max(2, ROUTING_SPECULATIVE_WORKERS), thread_name_prefix="routing-spec"
+                )
+    return _SPECULATIVE_EXECUTOR
+
+
+def _forget_executor_after_fork() -> None:
+    global _SPECULATIVE_EXECUTOR
+    _SPECULATIVE_EXECUTOR = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_executor_after_fork)
+
 
 def _to_tuple(lat: float, lon: float) -> Tuple[float, float]:
     """(lat, lon) -> tuple"""
@@ -21,10 +63,24 @@ def _to_tuple(lat: float, lon: float) -> Tuple[float, float]:
 
 
 class RoutingService:
-    """OSRMClient を内部に抱える薄いファサード"""
+    """
+    OSRMClient を内部に抱える薄いファサード。
+    レグ経路は LegCache（LRU + Redis）→ RouteLegStore（route_legs テーブル）→ OSRM の順に read-through する。
+    speculative: car → foot フォールバックを同時実行するか（未指定なら ROUTING_SPECULATIVE_FALLBACK）
+    abort: OSRMClient の abort フック（結果が不要になったら以降の OSRM 要求を送らない）
+    """
 
-    def __init__(self) -> None:
-        self.client = OSRMClient()
+    def __init__(
+        self,
+        cache: Optional[LegCache] = None,
+        store: Optional[RouteLegStore] = None,
+        speculative: Optional[bool] = None,
+        abort: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        self.client = OSRMClient(abort=abort)
+        self.cache = cache if cache is not None else get_leg_cache()
+        self.store = store if store is not None else get_leg_store()
+        self.speculative = ROUTING_SPECULATIVE_FALLBACK if speculative is None else speculative
 
     # ================
     # 軽量: 距離/時間
@@ -39,22 +95,187 @@ class RoutingService:
         distance_km, duration_min = self.client.fetch_distance_and_duration(origin, destination, profile)
         return {"distance_km": distance_km, "duration_min": duration_min}
 
+    def get_distance_matrix(
+        self,
+        origins: List[tuple[float, float]],
+        destinations: List[tuple[float, float]],
+        profile: OSRMProfile,
+    ) -> dict:
+        """
+        OSRM /table による多対多の距離/時間（1 リクエスト）。
+        入出力は (lat,lon) のタプル列。到達不能な組は None。
+        戻り値: {"distances_km": [[float|None]], "durations_min": [[float|None]]}
+                （行: origins, 列: destinations）
+        """
+        distances_km, durations_min = self.client.fetch_table(origins, destinations, profile)
+        return {"distances_km": distances_km, "durations_min": durations_min}
+
+    def get_pair_distances(
+        self, pairs: List[Tuple[tuple[float, float], tuple[float, float]]], profile: OSRMProfile
+    ) -> List[Optional[dict]]:
+        """
+        (origin, destination) の組ごとの距離/時間を、まとめて 1 回の /table で求める。
+        戻り値は pairs と同じ並びの {"distance_km", "duration_min"}（到達不能は None）。
+        """
+        if not pairs:
+            return []
+        origins = list(dict.fromkeys(p[0] for p in pairs))
+        destinations = list(dict.fromkeys(p[1] for p in pairs))
+        m = self.get_distance_matrix(origins, destinations, profile)
+        o_idx = {pt: i for i, pt in enumerate(origins)}
+        d_idx = {pt: j for j, pt in enumerate(destinations)}
+
+        out: List[Optional[dict]] = []
+        for o, d in pairs:
+            km = m["distances_km"][o_idx[o]][d_idx[d]]
+            mins = m["durations_min"][o_idx[o]][d_idx[d]]
+            out.append(None if km is None or mins is None else {"distance_km": km, "duration_min": mins})
+        return out
+
     # =========================
     # 重量: ルート全体（GeoJSON）
     # =========================
     def calculate_full_itinerary_route(
-        self, waypoints: List[tuple[float, float]], profile: OSRMProfile, piston: bool = False
+        self,
+        waypoints: List[tuple[float, float]],
+        profile: OSRMProfile,
+        piston: bool = False,
+        detail: RouteDetail = "full",
     ) -> dict:
         """
         入力: waypoints=[(lat,lon), ...], profile="car"/"foot", piston=True/False
+        detail: "full"（全形状）/ "simplified"（表示用に OSRM 側で間引いた形状）
         戻り値: {"geojson": <FeatureCollection>, "distance_km": float, "duration_min": float}
         """
         if len(waypoints) < 2:
             raise ValueError("waypoints は 2 箇所以上が必要です。")
+        if detail == "distance":
+            raise ValueError("形状が不要な場合は get_distance_and_duration を使ってください。")
+
+        key, hit = self._route_lookup(waypoints, profile, piston, detail)
+        if hit is not None:
+            return hit
 
-        geojson, distance_km, duration_min = self.client.fetch_route(waypoints, profile, piston=piston)
-        return {"geojson": geojson, "distance_km": distance_km, "duration_min": duration_min}
+        geojson, distance_km, duration_min = self.client.fetch_route(waypoints, profile, piston=piston, detail=detail)
+        result = {"geojson": geojson, "distance_km": distance_km, "duration_min": duration_min}
+        self._route_remember(key, waypoints, profile, piston, detail, result)
+        return result
+
+    def _use_store(self, waypoints: List[tuple[float, float]], detail: RouteDetail) -> bool:
+        # 2 点間のレグは永続ストアも見る（多点ルートは組み合わせが多く再利用されにくいため対象外）
+        # ストアは全形状のみを保持する（間引いた形状は LRU/Redis のみ）
+        return self.store is not None and len(waypoints) == 2 and detail == "full"
+
+    def _route_lookup(
+        self, waypoints: List[tuple[float, float]], profile: OSRMProfile, piston: bool, detail: RouteDetail
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """(キャッシュキー, キャッシュ → 永続ストアのヒット) を返す。"""
+        extra = None if detail == "full" else detail
+        key = build_leg_key(profile, waypoints, piston=piston, extra=extra) if self.cache else None
+        if key:
+            hit = self.cache.get(key)
+            if hit is not None:
+                return key, hit
+        if self._use_store(waypoints, detail):
+            stored = self.store.get(profile, waypoints[0], waypoints[1], piston=piston)
+            if stored is not None:
+                if key:
+                    self.cache.set(key, stored)
+                return key, stored
+        return key, None
+
+    def _route_remember(
+        self,
+        key: Optional[str],
+        waypoints: List[tuple[float, float]],
+        profile: OSRMProfile,
+        piston: bool,
+        detail: RouteDetail,
+        result: Dict[str, Any],
+    ) -> None:
+        if key:
+            self.cache.set(key, result)
+        if self._use_store(waypoints, detail):
+            self.store.put(profile, waypoints[0], waypoints[1], result, piston=piston)
     
+    def calculate_route_legs(self, waypoints: List[tuple[float, float]], profile: OSRMProfile) -> List[Dict[str, Any]]:
+        """
+        waypoints の隣接 2 点（= レグ）毎の経路を、まとめて少ない /route で求める。
+        - キャッシュ / 永続ストアにあるレグはそれを使い、残りの連続区間を 1 回の多点 /route で取得して
+          OSRM の legs[] でレグ毎に分割する（分割したレグはキャッシュ / ストアに書き戻す）
+        戻り値: レグ毎の {"geojson", "distance_km", "duration_min"}（waypoints と同じ並び）
+        """
+        if len(waypoints) < 2:
+            raise ValueError("waypoints は 2 箇所以上が必要です。")
+        n = len(waypoints) - 1
+        out: List[Optional[Dict[str, Any]]] = [self._lookup_leg(waypoints[i], waypoints[i + 1], profile) for i in range(n)]
+
+        i = 0
+        while i < n:
+            if out[i] is not None:
+                i += 1
+                continue
+            j = i
+            while j + 1 < n and out[j + 1] is None:
+                j += 1
+            if i == j:
+                out[i] = self.calculate_full_itinerary_route([waypoints[i], waypoints[i + 1]], profile)
+            else:
+                pieces = self.client.fetch_route_legs(waypoints[i:j + 2], profile)
+                for k, (geojson, distance_km, duration_min) in enumerate(pieces):
+                    result = {"geojson": geojson, "distance_km": distance_km, "duration_min": duration_min}
+                    self._remember_leg(waypoints[i + k], waypoints[i + k + 1], profile, result)
+                    out[i + k] = result
+            i = j + 1
+        return [r for r in out if r is not None]
+
+    def _lookup_leg(
+        self, origin: tuple[float, float], dest: tuple[float, float], profile: OSRMProfile
+    ) -> Optional[Dict[str, Any]]:
+        """2 点間レグをキャッシュ → 永続ストアの順に引く（OSRM は叩かない）。"""
+        key = build_leg_key(profile, [origin, dest]) if self.cache else None
+        if key:
+            hit = self.cache.get(key)
+            if hit is not None:
+                return hit
+        if self.store is not None:
+            stored = self.store.get(profile, origin, dest)
+            if stored is not None:
+                if key:
+                    self.cache.set(key, stored)
+                return stored
+        return None
+
+    def _remember_leg(
+        self, origin: tuple[float, float], dest: tuple[float, float], profile: OSRMProfile, result: Dict[str, Any]
+    ) -> None:
+        if self.cache:
+            self.cache.set(build_leg_key(profile, [origin, dest]), result)
+        if self.store is not None:
+            self.store.put(profile, origin, dest, result)
+
+    def resolve_leg_access(
+        self,
+        db,
+        *,
+        dest: tuple[float, float],
+        dest_spot_type: str | None,
+        dest_tags: dict | None,
+        ap_max_km: float = 20.0,
+        dest_spot_id: int | None = None,
+    ) -> Tuple[bool, Optional[tuple]]:
+        """
+        calculate_hybrid_leg と同じ判断で (直行可否, 経由 AP) を返す。直行可 / AP なしの場合 AP は None。
+        AP は (id, name, ap_type, lat, lon)。
+        """
+        assignment = lookup_spot_access(db, dest_spot_id, ap_max_km=ap_max_km)
+        if assignment is not None:
+            car_ok, ap = assignment
+        else:
+            car_ok = is_car_direct_accessible(dest_spot_type, dest_tags)
+            ap = None if car_ok else find_nearest_access_point(db, lat=dest[0], lon=dest[1], max_km=ap_max_km)
+        return car_ok, (None if car_ok else (ap or None))
+
     def calculate_hybrid_leg(
         self,
         db,
@@ -65,41 +286,112 @@ class RoutingService:
         dest_tags: dict | None,
         ap_max_km: float = 20.0,
         piston: bool = False,
+        dest_spot_id: int | None = None,
     ) -> Dict[str, Any]:
-        car_ok = is_car_direct_accessible(dest_spot_type, dest_tags)
+        """
+        origin -> dest のハイブリッドレグ（直行 car / car→AP→foot）を返す。
+        - dest_spot_id があれば spot_access_assignments の事前割当（直行可否 + AP）を使い、
+          ルール評価と AP の近傍探索を省く。割当が無ければ従来通りその場で判定する。
+        結果は (直行可否, 経由 AP の id) も含めたキーでキャッシュする。
+        """
+        car_ok, ap, key, hit = self._hybrid_lookup(
+            db, origin=origin, dest=dest, dest_spot_type=dest_spot_type, dest_tags=dest_tags,
+            ap_max_km=ap_max_km, piston=piston, dest_spot_id=dest_spot_id,
+        )
+        if hit is not None:
+            return hit
 
+        leg = self._compute_hybrid_leg(
+            db, origin=origin, dest=dest, car_ok=car_ok, ap_max_km=ap_max_km, piston=piston, ap=ap
+        )
+        self._hybrid_remember(key, origin, dest, leg, piston)
+        return leg
+
+    def _hybrid_lookup(
+        self,
+        db,
+        *,
+        origin: tuple[float, float],
+        dest: tuple[float, float],
+        dest_spot_type: str | None,
+        dest_tags: dict | None,
+        ap_max_km: float,
+        piston: bool,
+        dest_spot_id: int | None,
+    ) -> Tuple[bool, Any, Optional[str], Optional[Dict[str, Any]]]:
+        """
+        ハイブリッドレグの (直行可否, AP, キャッシュキー, キャッシュ/ストアのヒット) を返す。
+        AP は事前割当が無ければここで近傍探索して確定させ、経由 AP の id をキャッシュキーに含める
+        （AP の追加・削除で経由先が変わった時に古いレグを返さない）。
+        """
+        car_ok, ap = self.resolve_leg_access(
+            db, dest=dest, dest_spot_type=dest_spot_type, dest_tags=dest_tags,
+            ap_max_km=ap_max_km, dest_spot_id=dest_spot_id,
+        )
+        via_ap_id = int(ap[0]) if ap else 0
+
+        key = None
+        if self.cache:
+            key = build_leg_key("hybrid", [origin, dest], piston=piston, extra=f"car{int(car_ok)}:via{via_ap_id}")
+            hit = self.cache.get(key)
+            if hit is not None:
+                return car_ok, ap, key, hit
+
+        # 経由 AP が確定しているので合成済みレグを永続ストアから引ける
+        if self.store is not None:
+            stored = self.store.get("hybrid", origin, dest, via_ap_id=via_ap_id, piston=piston)
+            if stored is not None:
+                if key:
+                    self.cache.set(key, stored)
+                return car_ok, ap, key, stored
+        return car_ok, ap, key, None
+
+    def _hybrid_remember(
+        self, key: Optional[str], origin: tuple[float, float], dest: tuple[float, float], leg: Dict[str, Any], piston: bool
+    ) -> None:
+        if key:
+            self.cache.set(key, leg)
+        if self.store is not None:
+            used_ap = leg.get("used_ap") or {}
+            self.store.put("hybrid", origin, dest, leg, via_ap_id=int(used_ap.get("id") or 0), piston=piston)
+
+    def _compute_hybrid_leg(
+        self,
+        db,
+        *,
+        origin: tuple[float, float],
+        dest: tuple[float, float],
+        car_ok: bool,
+        ap_max_km: float,
+        piston: bool,
+        ap: Any = _AP_UNRESOLVED,
+    ) -> Dict[str, Any]:
+        """
+        calculate_hybrid_leg の実計算部（キャッシュなし）。
+        ap: 事前割当済みの AP（None=AP なし）。未指定なら目的地の近傍 AP を探索する。
+        """
         # 1) 直行可: car をまず試し、ダメなら foot にフォールバック
         if car_ok:
-            try:
-                r = self.calculate_full_itinerary_route([origin, dest], profile="car", piston=piston)
-                r["used_ap"] = None            # ← 追加
-                return r
-            except OSRMNoRouteError:
-                r = self.calculate_full_itinerary_route([origin, dest], profile="foot", piston=piston)
-                r["used_ap"] = None            # ← 追加
-                return r
+            return self._car_or_foot(origin, dest, piston)
 
-        # 2) 直行不可: 目的地の近傍APを取得
-        ap = find_nearest_access_point(db, lat=dest[0], lon=dest[1], max_km=ap_max_km)
+        # 2) 直行不可: 目的地の近傍APを取得（事前割当があればそれを使う）
+        if ap is _AP_UNRESOLVED:
+            ap = find_nearest_access_point(db, lat=dest[0], lon=dest[1], max_km=ap_max_km)
         if not ap:
             # AP不在 → 車に挑戦、ダメなら徒歩
-            try:
-                r = self.calculate_full_itinerary_route([origin, dest], profile="car", piston=piston)
-                r["used_ap"] = None            # ← 追加
-                return r
-            except OSRMNoRouteError:
-                r = self.calculate_full_itinerary_route([origin, dest], profile="foot", piston=piston)
-                r["used_ap"] = None            # ← 追加
-                return r
+            return self._car_or_foot(origin, dest, piston)
 
         # APあり → ハイブリッド経路
-        ap_id, ap_name, ap_type, ap_lat, ap_lon = ap   # ← id も拾うのがおすすめ
-        ap_pt = (ap_lat, ap_lon)
-
+        ap_pt = (ap[3], ap[4])
         car_seg = self.calculate_full_itinerary_route([origin, ap_pt], profile="car", piston=piston)
         foot_seg = self.calculate_full_itinerary_route([ap_pt, dest],  profile="foot", piston=piston)
+        return self._compose_ap_leg(ap, car_seg, foot_seg)
 
-        merged = self._merge_features([car_seg["geojson"], foot_seg["geojson"]])
+    @classmethod
+    def _compose_ap_leg(cls, ap: tuple, car_seg: Dict[str, Any], foot_seg: Dict[str, Any]) -> Dict[str, Any]:
+        """car(origin→AP) と foot(AP→dest) を 1 レグに合成する。"""
+        ap_id, ap_name, ap_type, ap_lat, ap_lon = ap   # ← id も拾うのがおすすめ
+        merged = cls._merge_features([car_seg["geojson"], foot_seg["geojson"]])
         return {
             "geojson": merged,
             "distance_km": float(car_seg["distance_km"]) + float(foot_seg["distance_km"]),
@@ -108,6 +400,42 @@ class RoutingService:
             "used_ap": {"id": ap_id, "name": ap_name, "ap_type": ap_type, "latitude": ap_lat, "longitude": ap_lon},
         }
 
+    def _car_or_foot(self, origin: tuple[float, float], dest: tuple[float, float], piston: bool) -> Dict[str, Any]:
+        """
+        car の経路を返し、car が到達不能（OSRMNoRouteError）なら foot の経路を返す（used_ap=None）。
+        - 通常: car → foot を逐次に試す
+        - 投機モード: car がキャッシュに無ければ car / foot を同時に投げ、car が取れたら foot を
+          取り消す（実行中なら結果は捨てる。foot の結果はキャッシュに残るので無駄にはならない）
+        """
+        waypoints = [origin, dest]
+        hit = self._cached(waypoints, "car", piston) if self.speculative else None
+        if hit is not None:
+            r = hit
+        elif self.speculative:
+            executor = _speculative_executor()
+            car_f = executor.submit(self.calculate_full_itinerary_route, waypoints, "car", piston)
+            foot_f = executor.submit(self.calculate_full_itinerary_route, waypoints, "foot", piston)
+            try:
+                r = car_f.result()
+            except OSRMNoRouteError:
+                r = foot_f.result()
+            finally:
+                foot_f.cancel()
+        else:
+            try:
+                r = self.calculate_full_itinerary_route(waypoints, profile="car", piston=piston)
+            except OSRMNoRouteError:
+                r = self.calculate_full_itinerary_route(waypoints, profile="foot", piston=piston)
+        r["used_ap"] = None
+        return r
+
+    def _cached(
+        self, waypoints: List[tuple[float, float]], profile: OSRMProfile, piston: bool
+    ) -> Optional[Dict[str, Any]]:
+        """LegCache のみを引く（載っていれば OSRM を叩かないので投機は不要）。"""
+        if not self.cache:
+            return None
+        return self.cache.get(build_leg_key(profile, waypoints, piston=piston))
 
     @staticmethod
     def _merge_features(collections: list[dict]) -> dict:
@@ -123,6 +451,18 @@ class RoutingService:
             merged["features"].extend(feats)
         return merged
 
+    # ===================================
+    # 非同期ファサード
+    # ===================================
+    def async_facade(self, client: Any = None) -> "AsyncRoutingService":
+        """
+        このサービスのキャッシュ / 永続ストア / 投機設定を共有する非同期版を返す（async_service 参照）。
+        client 未指定なら AsyncOSRMClient を生成する（httpx が必要）。
+        """
+        from worker.app.services.routing.async_service import AsyncRoutingService
+
+        return AsyncRoutingService(self, client=client)
+
     # ===================================
     # 将来用: 現在地からのリルート（薄いラッパ）
     # ===================================
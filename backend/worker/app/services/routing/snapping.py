@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+OSRM スナップ（/nearest）結果と hint のキャッシュ
+- 全スポット / アクセスポイントについて car / foot の /nearest を並列に叩き、スナップ後の座標と
+  hint を osrm_snaps テーブルへ保存する（scripts/cache_osrm_nodes.py から実行）。
+- SnapIndex: osrm_snaps をプロセス内の dict に読み込み、OSRMClient が /route・/table の
+  hints パラメータを組み立てるのに使う。既知の地点は OSRM 側の最近傍探索が省略される。
+- hint は OSRM データセット（osrm-extract の結果）に紐づくため、OSRM_DATASET_VERSION 毎に保持する。
+  古い hint が残っていても OSRM はチェックサム不一致の hint を無視して通常どおりスナップする。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from shared.app.models import AccessPoint, OSRMSnap, Spot
+from worker.app.services.routing.leg_cache import OSRM_DATASET_VERSION
+
+logger = logging.getLogger(__name__)
+
+OSRM_USE_HINTS = os.getenv("OSRM_USE_HINTS", "true").strip().lower() in {"1", "true", "yes", "on"}
+# /nearest の同時実行数（HTTP 接続プールの OSRM_*_POOL_MAXSIZE 以下にする）
+OSRM_SNAP_WORKERS = int(os.getenv("OSRM_SNAP_WORKERS", "8"))
+# SnapIndex が osrm_snaps を読み直す間隔（秒）。DB エラー時もこの間隔で再試行する
+OSRM_SNAP_REFRESH_SEC = float(os.getenv("OSRM_SNAP_REFRESH_SEC", "600"))
+
+SNAP_PROFILES: Tuple[str, ...] = ("car", "foot")
+
+# OSRM の座標精度（1e-6 度）。hint は入力座標が一致する時だけ有効になるため同じ精度でキーにする
+_COORD_DECIMALS = 6
+
+SnapKey = Tuple[str, float, float]
+
+
+def _key(profile: str, pt: Tuple[float, float]) -> SnapKey:
+    return (profile, round(float(pt[0]), _COORD_DECIMALS), round(float(pt[1]), _COORD_DECIMALS))
+
+
+# ==================================================================
+# 構築: /nearest を並列実行して osrm_snaps を作り直す
+# ==================================================================
+def collect_snap_targets(db: Session) -> List[Dict[str, Any]]:
+    """スナップ対象の地点 [{"source", "source_id", "lat", "lon"}]（同一座標は 1 つにまとめる）。"""
+    targets: List[Dict[str, Any]] = []
+    seen = set()
+    sources = (
+        ("spot", select(Spot.id, Spot.latitude, Spot.longitude)),
+        ("access_point", select(AccessPoint.id, AccessPoint.latitude, AccessPoint.longitude)),
+    )
+    for source, stmt in sources:
+        for sid, lat, lon in db.execute(stmt).all():
+            if lat is None or lon is None:
+                continue
+            k = _key("", (lat, lon))
+            if k in seen:
+                continue
+            seen.add(k)
+            targets.append({"source": source, "source_id": int(sid), "lat": k[1], "lon": k[2]})
+    return targets
+
+
+def snap_points(
+    client: Any,
+    profile: str,
+    points: Sequence[Tuple[float, float]],
+    *,
+    max_workers: int = OSRM_SNAP_WORKERS,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    points の各点を client.fetch_nearest で並列にスナップする（入力と同じ順序で返す）。
+    失敗した点（道路が無い / 通信エラー）は None。
+    """
+
+    def _one(pt: Tuple[float, float]) -> Optional[Dict[str, Any]]:
+        try:
+            return client.fetch_nearest(pt, profile)
+        except Exception as e:
+            logger.debug("nearest failed %s %s: %s", profile, pt, e)
+            return None
+
+    if not points:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="osrm-snap") as ex:
+        return list(ex.map(_one, points))
+
+
+def rebuild_osrm_snaps(
+    db: Session,
+    client: Any,
+    *,
+    profiles: Sequence[str] = SNAP_PROFILES,
+    max_workers: int = OSRM_SNAP_WORKERS,
+    dataset_version: str = OSRM_DATASET_VERSION,
+) -> Dict[str, Any]:
+    """
+    全スポット / アクセスポイントをスナップし、profiles 分の osrm_snaps を作り直して commit する。
+    戻り値: {"points": int, "<profile>": 保存件数, "<profile>_failed": 失敗件数, ...}
+    """
+    targets = collect_snap_targets(db)
+    points = [(t["lat"], t["lon"]) for t in targets]
+    result: Dict[str, Any] = {"points": len(targets), "dataset_version": dataset_version}
+
+    for profile in profiles:
+        snaps = snap_points(client, profile, points, max_workers=max_workers)
+        rows = [
+            {
+                "profile": profile,
+                "lat": t["lat"],
+                "lon": t["lon"],
+                "osrm_dataset_version": dataset_version,
+                "snapped_lat": snap["lat"],
+                "snapped_lon": snap["lon"],
+                "snap_distance_m": snap.get("distance_m"),
+                "hint": snap["hint"],
+                "source": t["source"],
+                "source_id": t["source_id"],
+            }
+            for t, snap in zip(targets, snaps)
+            if snap and snap.get("hint")
+        ]
+        # 同じプロファイルの旧データ（旧データセット版を含む）は丸ごと置き換える
+        db.execute(delete(OSRMSnap).where(OSRMSnap.profile == profile))
+        if rows:
+            db.bulk_insert_mappings(OSRMSnap, rows)
+        result[profile] = len(rows)
+        result[f"{profile}_failed"] = len(targets) - len(rows)
+    db.commit()
+    return result
+
+
+# ==================================================================
+# 参照: プロセス内の hint 索引
+# ==================================================================
+class SnapIndex:
+    """
+    osrm_snaps（現行データセット版のみ）のプロセス内索引。
+    session_factory は引数なしで Session を返す callable。初回参照時と refresh_sec 毎に読み直す。
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        *,
+        dataset_version: str = OSRM_DATASET_VERSION,
+        refresh_sec: float = OSRM_SNAP_REFRESH_SEC,
+    ) -> None:
+        self._session_factory = session_factory
+        self.dataset_version = dataset_version
+        self.refresh_sec = refresh_sec
+        self._hints: Dict[SnapKey, str] = {}
+        self._next_load = 0.0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"loads": 0, "errors": 0, "hinted": 0, "rejected": 0}
+
+    def _maybe_load(self) -> None:
+        if time.monotonic() < self._next_load:
+            return
+        with self._lock:
+            if time.monotonic() < self._next_load:
+                return
+            self._next_load = time.monotonic() + self.refresh_sec
+            try:
+                with self._session_factory() as s:
+                    rows = s.execute(
+                        select(OSRMSnap.profile, OSRMSnap.lat, OSRMSnap.lon, OSRMSnap.hint)
+                        .where(OSRMSnap.osrm_dataset_version == self.dataset_version)
+                    ).all()
+            except Exception as e:
+                # テーブル未作成 / DB 停止中は hint なしで動く（次の refresh で再試行）
+                logger.debug("osrm_snaps load failed: %s", e)
+                self._stats["errors"] += 1
+                return
+            self._hints = {_key(r.profile, (r.lat, r.lon)): r.hint for r in rows}
+            self._stats["loads"] += 1
+
+    def hint_for(self, profile: str, pt: Tuple[float, float]) -> Optional[str]:
+        self._maybe_load()
+        return self._hints.get(_key(profile, pt))
+
+    def hints_param(self, profile: str, coords: Sequence[Tuple[float, float]]) -> Optional[str]:
+        """
+        OSRM の hints パラメータ（座標と同数を ; 区切り、未知の地点は空）を返す。
+        既知の地点が 1 つも無ければ None（パラメータ自体を付けない）。
+        """
+        self._maybe_load()
+        if not self._hints:
+            return None
+        hints = [self._hints.get(_key(profile, pt), "") for pt in coords]
+        if not any(hints):
+            return None
+        self._stats["hinted"] += 1
+        return ";".join(hints)
+
+    def mark_rejected(self) -> None:
+        """OSRM が hint を受け付けなかった（フォーマット不正等）。次回参照時に読み直す。"""
+        self._stats["rejected"] += 1
+        self._next_load = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        s: Dict[str, Any] = dict(self._stats)
+        s.update(size=len(self._hints), dataset_version=self.dataset_version)
+        return s
+
+
+_default_index: Optional[SnapIndex] = None
+_default_lock = threading.Lock()
+
+
+def get_snap_index() -> Optional[SnapIndex]:
+    """プロセス共有の SnapIndex を返す。OSRM_USE_HINTS=false なら None。"""
+    global _default_index
+    if not OSRM_USE_HINTS:
+        return None
+    if _default_index is None:
+        with _default_lock:
+            if _default_index is None:
+                from sqlalchemy.orm import sessionmaker
+                from shared.app.database import engine  # エンジン生成は初回利用時まで遅らせる
+
+                _default_index = SnapIndex(sessionmaker(bind=engine, autoflush=False, expire_on_commit=False))
+    return _default_index
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+スポット → アクセスポイント事前割当（spot_access_assignments）
+- rebuild_spot_access_assignments(): 全スポットについて直行可否（drive_rules）と最寄り AP を求めて表を作り直す
+  （scripts/load_spots.py / scripts/load_access_points.py の後に実行する）
+- lookup_spot_access(): ルーティング時に spot_id の主キー検索 1 回で割当を引く
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, inspect, insert, select
+from sqlalchemy.orm import Session
+
+from shared.app.models import Spot, SpotAccessAssignment
+from worker.app.services.navigation.geospatial_utils import haversine_distance_m
+from worker.app.services.routing.access_point_index import AccessPointIndex, APRow
+from worker.app.services.routing.access_points_repo import find_nearest_access_point_postgis
+from worker.app.services.routing.drive_rules import is_car_direct_accessible
+
+SPOT_AP_SEARCH_KM = float(os.getenv("SPOT_AP_SEARCH_KM", "20"))
+
+
+# テーブルの有無（プロセス内で 1 回だけ確認）。
+# マイグレーション前の DB で SELECT が失敗すると Postgres ではトランザクションごと壊れるため、事前に確かめる
+_table_available: Optional[bool] = None
+
+
+def _assignments_available(db: Any) -> bool:
+    global _table_available
+    if _table_available is None:
+        try:
+            _table_available = inspect(db.get_bind()).has_table(SpotAccessAssignment.__tablename__)
+        except Exception:
+            return False
+    return _table_available
+
+
+def rebuild_spot_access_assignments(db: Session, *, search_km: float = SPOT_AP_SEARCH_KM) -> int:
+    """
+    spot_access_assignments を全件作り直す。戻り値は書き込んだ行数。
+    - 最寄り AP はプロセス内索引で求め、索引が読めない場合は PostGIS KNN で 1 件ずつ求める
+    """
+    spots = db.execute(
+        select(Spot.id, Spot.spot_type, Spot.tags, Spot.latitude, Spot.longitude)
+    ).all()
+
+    index = AccessPointIndex(refresh_sec=math.inf)
+    use_index = index.ensure_fresh(db)
+
+    rows: List[Dict[str, Any]] = []
+    for sp in spots:
+        lat, lon = float(sp.latitude), float(sp.longitude)
+        car_direct = is_car_direct_accessible(sp.spot_type, sp.tags)
+        ap: Optional[APRow] = None
+        if not car_direct:
+            if use_index:
+                ap = index.nearest(lat, lon, max_km=search_km)
+            else:
+                ap = find_nearest_access_point_postgis(db, lat=lat, lon=lon, max_km=search_km)
+
+        row: Dict[str, Any] = {
+            "spot_id": int(sp.id),
+            "car_direct": bool(car_direct),
+            "access_point_id": None,
+            "ap_name": None,
+            "ap_type": None,
+            "ap_latitude": None,
+            "ap_longitude": None,
+            "ap_distance_km": None,
+            "ap_search_km": float(search_km),
+        }
+        if ap:
+            ap_id, ap_name, ap_type, ap_lat, ap_lon = ap
+            row.update(
+                access_point_id=int(ap_id),
+                ap_name=ap_name,
+                ap_type=str(ap_type),
+                ap_latitude=float(ap_lat),
+                ap_longitude=float(ap_lon),
+                ap_distance_km=haversine_distance_m(lat, lon, float(ap_lat), float(ap_lon)) / 1000.0,
+            )
+        rows.append(row)
+
+    db.execute(delete(SpotAccessAssignment))
+    if rows:
+        db.execute(insert(SpotAccessAssignment), rows)
+    db.commit()
+
+    global _table_available
+    _table_available = True
+    return len(rows)
+
+
+def lookup_spot_access(
+    db: Any, spot_id: Optional[int], *, ap_max_km: float
+) -> Optional[Tuple[bool, Optional[APRow]]]:
+    """
+    事前割当を返す: (car_direct, ap or None)。
+    - 行が無い / 問い合わせ半径が計算時の半径より広い / 取得に失敗 → None（呼び出し側で従来の判定を行う）
+    - ap_max_km より遠い AP は None として扱う
+    """
+    if spot_id is None or db is None or not _assignments_available(db):
+        return None
+    try:
+        row = db.get(SpotAccessAssignment, int(spot_id))
+    except Exception:
+        return None
+    if row is None or float(ap_max_km) > float(row.ap_search_km):
+        return None
+
+    ap: Optional[APRow] = None
+    if row.access_point_id is not None and row.ap_latitude is not None and row.ap_longitude is not None:
+        if row.ap_distance_km is None or float(row.ap_distance_km) <= float(ap_max_km):
+            ap = (int(row.access_point_id), row.ap_name, row.ap_type, float(row.ap_latitude), float(row.ap_longitude))
+    return bool(row.car_direct), ap
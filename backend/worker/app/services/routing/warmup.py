@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+人気スポット間レグの事前計算（夜間ウォームアップ）
+- stops への登場回数と混雑 MV（congestion_by_date_spot、今日以降の予定）で上位 N スポットを選び、
+  その組み合わせについて car / foot / hybrid のレグを計算してキャッシュ（LRU/Redis）と route_legs に載せる。
+- OSRM への実リクエストだけをトークンバケットで毎秒 ROUTE_WARMUP_RATE_PER_SEC 件に絞る
+  （キャッシュ/ストアに既にあるレグは OSRM を叩かないので枠を消費しない）。
+- 実行は shared.app.tasks.routing_warmup_popular_legs（Celery beat で夜間に起動）。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from shared.app.models import Spot
+from worker.app.services.navigation.geospatial_utils import haversine_distance_m
+
+logger = logging.getLogger(__name__)
+
+ROUTE_WARMUP_TOP_N = int(os.getenv("ROUTE_WARMUP_TOP_N", "30"))
+ROUTE_WARMUP_RATE_PER_SEC = float(os.getenv("ROUTE_WARMUP_RATE_PER_SEC", "5"))
+# 直線距離でこれより離れた組は事前計算しない（同じ計画に入りにくい）
+ROUTE_WARMUP_MAX_PAIR_KM = float(os.getenv("ROUTE_WARMUP_MAX_PAIR_KM", "60"))
+# 1 回の実行で計算するレグ数の上限（OSRM 負荷の上限保証）
+ROUTE_WARMUP_MAX_LEGS = int(os.getenv("ROUTE_WARMUP_MAX_LEGS", "5000"))
+
+_POPULAR_SQL = text("""
+    SELECT spot_id, SUM(n) AS score FROM (
+        SELECT spot_id, COUNT(*) AS n FROM stops GROUP BY spot_id
+        UNION ALL
+        SELECT spot_id, SUM(plan_count) AS n FROM congestion_by_date_spot
+        WHERE date >= CURRENT_DATE GROUP BY spot_id
+    ) t
+    GROUP BY spot_id
+    ORDER BY score DESC, spot_id ASC
+    LIMIT :n
+""")
+
+_POPULAR_STOPS_ONLY_SQL = text("""
+    SELECT spot_id, COUNT(*) AS score FROM stops
+    GROUP BY spot_id
+    ORDER BY score DESC, spot_id ASC
+    LIMIT :n
+""")
+
+
+class RateLimiter:
+    """単純なトークンバケット（スレッドセーフ）。acquire() は枠が空くまで待つ。"""
+
+    def __init__(
+        self,
+        rate_per_sec: float,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.rate = max(0.001, float(rate_per_sec))
+        self.capacity = max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class _ThrottledClient:
+    """OSRMClient の fetch_* 呼び出し毎に RateLimiter を通す薄いプロキシ。"""
+
+    def __init__(self, client: Any, limiter: RateLimiter) -> None:
+        self._client = client
+        self._limiter = limiter
+        self.requests = 0
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._client, name)
+        if not name.startswith("fetch_") or not callable(attr):
+            return attr
+
+        def _wrapped(*args: Any, **kwargs: Any) -> Any:
+            self._limiter.acquire()
+            self.requests += 1
+            return attr(*args, **kwargs)
+
+        return _wrapped
+
+
+def select_popular_spot_ids(db: Session, *, top_n: int = ROUTE_WARMUP_TOP_N) -> List[int]:
+    """stops と混雑 MV を合算した人気順の spot_id（MV が無ければ stops のみ）。"""
+    try:
+        rows = db.execute(_POPULAR_SQL, {"n": top_n}).fetchall()
+    except Exception:
+        db.rollback()
+        rows = db.execute(_POPULAR_STOPS_ONLY_SQL, {"n": top_n}).fetchall()
+    return [int(r[0]) for r in rows]
+
+
+def warm_popular_legs(
+    db: Session,
+    routing: Any,
+    spots: Sequence[Dict[str, Any]],
+    *,
+    rate_per_sec: float = ROUTE_WARMUP_RATE_PER_SEC,
+    max_pair_km: float = ROUTE_WARMUP_MAX_PAIR_KM,
+    max_legs: int = ROUTE_WARMUP_MAX_LEGS,
+    limiter: Optional[RateLimiter] = None,
+) -> Dict[str, Any]:
+    """
+    spots（人気順の {"id","lat","lon","spot_type","tags"}）の順序付き組について
+    car / foot / hybrid のレグを計算する。人気上位どうしの組から順に処理する。
+    routing.client はスロットル付きプロキシに差し替わるため、ウォームアップ専用の RoutingService を渡すこと。
+    戻り値: {"pairs": int, "legs": int, "errors": int, "osrm_requests": int}
+    """
+    throttled = _ThrottledClient(routing.client, limiter or RateLimiter(rate_per_sec))
+    routing.client = throttled
+
+    pairs = [
+        (i, j)
+        for i in range(len(spots))
+        for j in range(len(spots))
+        if i != j
+        and haversine_distance_m(spots[i]["lat"], spots[i]["lon"], spots[j]["lat"], spots[j]["lon"]) <= max_pair_km * 1000.0
+    ]
+    pairs.sort(key=lambda p: (p[0] + p[1], p[0]))
+
+    legs = errors = done_pairs = 0
+    for i, j in pairs:
+        if legs >= max_legs:
+            break
+        a, b = spots[i], spots[j]
+        origin, dest = (a["lat"], a["lon"]), (b["lat"], b["lon"])
+        jobs: List[Callable[[], Any]] = [
+            lambda: routing.calculate_full_itinerary_route([origin, dest], "car"),
+            lambda: routing.calculate_full_itinerary_route([origin, dest], "foot"),
+            lambda: routing.calculate_hybrid_leg(
+                db, origin=origin, dest=dest, dest_spot_type=b.get("spot_type"),
+                dest_tags=b.get("tags"), dest_spot_id=b["id"],
+            ),
+        ]
+        for job in jobs:
+            legs += 1
+            try:
+                job()
+            except Exception as e:  # 到達不能などは個別にスキップ
+                errors += 1
+                logger.debug("warmup leg failed %s -> %s: %s", a["id"], b["id"], e)
+        done_pairs += 1
+
+    return {"pairs": done_pairs, "legs": legs, "errors": errors, "osrm_requests": throttled.requests}
+
+
+def run_warmup(db: Session, routing: Any, *, top_n: int = ROUTE_WARMUP_TOP_N, **kwargs: Any) -> Dict[str, Any]:
+    """人気スポットを選んでウォームアップする（Celery タスクの本体）。"""
+    spot_ids = select_popular_spot_ids(db, top_n=top_n)
+    if len(spot_ids) < 2:
+        return {"spots": len(spot_ids), "pairs": 0, "legs": 0, "errors": 0, "osrm_requests": 0}
+
+    rows = db.execute(
+        select(Spot.id, Spot.latitude, Spot.longitude, Spot.spot_type, Spot.tags).where(Spot.id.in_(spot_ids))
+    ).all()
+    by_id = {
+        int(r.id): {"id": int(r.id), "lat": float(r.latitude), "lon": float(r.longitude),
+                    "spot_type": r.spot_type, "tags": r.tags}
+        for r in rows
+    }
+    spots = [by_id[sid] for sid in spot_ids if sid in by_id]
+
+    t0 = time.monotonic()
+    result = warm_popular_legs(db, routing, spots, **kwargs)
+    result.update(spots=len(spots), elapsed_sec=round(time.monotonic() - t0, 1))
+    return result
@@ -37,6 +37,7 @@ from shared.app.tasks import (
     TASK_NAV_REROUTE,
     RerouteTaskPayload
 )
+from shared.app.services.reroute_coalesce import is_superseded
 
 # 各サービス（Worker 側）
 from worker.app.services.voice.voice_service import VoiceService
@@ -337,6 +338,10 @@ def navigation_reroute(payload: dict) -> dict:
         # 不正payloadは再試行せず終了（呼び出し元で整合性を担保）
         return {"updated": False, "reason": "invalid_payload", "detail": e.errors()}
 
+    # 後勝ち合流：開始前に新しい要求が来ていれば計算しない（そちらのタスクが最新の起点で走る）
+    if is_superseded(data.session_id, data.seq):
+        return {"updated": False, "new_version": None, "reason": "superseded"}
+
     db = SessionLocal()
     try:
         result = reroute(
@@ -346,6 +351,7 @@ def navigation_reroute(payload: dict) -> dict:
             origin_lon=data.origin_lon,
             target_stop_id=data.target_stop_id,
             base_route_version=data.base_route_version,
+            seq=data.seq,
         )
         return result
     except Exception as exc: